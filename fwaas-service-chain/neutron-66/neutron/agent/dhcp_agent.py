@@ -15,6 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import itertools
 import os
 
 import eventlet
@@ -59,10 +61,19 @@ class DhcpAgent(manager.Manager):
                            "enable_isolated_metadata = True")),
         cfg.IntOpt('num_sync_threads', default=4,
                    help=_('Number of threads to use during sync process.')),
+        cfg.IntOpt('sync_networks_chunk_size', default=64,
+                   help=_("Number of networks fetched by each request of a "
+                          "full resync, 0 to fetch them all in a single "
+                          "request.")),
         cfg.StrOpt('metadata_proxy_socket',
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.FloatOpt('reload_allocations_delay', default=1.0,
+                     help=_("Number of seconds during which the port "
+                            "events of a network are merged into a single "
+                            "reload of its DHCP server, 0 to reload on "
+                            "each event.")),
     ]
 
     def __init__(self, host=None):
@@ -70,6 +81,8 @@ class DhcpAgent(manager.Manager):
         self.needs_resync = False
         self.conf = cfg.CONF
         self.cache = NetworkCache()
+        # ids of the networks whose allocations will be reloaded
+        self.pending_reloads = set()
         self.root_helper = config.get_root_helper(self.conf)
         self.dhcp_driver_cls = importutils.import_class(self.conf.dhcp_driver)
         ctx = context.get_admin_context_without_session()
@@ -150,8 +163,8 @@ class DhcpAgent(manager.Manager):
         known_network_ids = set(self.cache.get_network_ids())
 
         try:
-            active_networks = self.plugin_rpc.get_active_networks_info()
-            active_network_ids = set(network.id for network in active_networks)
+            active_network_ids, active_networks = self._get_active_networks()
+            active_network_ids = set(active_network_ids)
             for deleted_id in known_network_ids - active_network_ids:
                 try:
                     self.disable_dhcp_helper(deleted_id)
@@ -169,6 +182,38 @@ class DhcpAgent(manager.Manager):
             self.needs_resync = True
             LOG.exception(_('Unable to sync network state.'))
 
+    def _get_active_networks(self):
+        """Return the ids of the active networks and an iterable of them.
+
+        Unless sync_networks_chunk_size is 0, the networks are fetched in
+        chunks while they are iterated, so that the first ones are
+        configured while the next ones are fetched.
+        """
+        chunk_size = self.conf.sync_networks_chunk_size
+        if chunk_size > 0:
+            network_ids = self.plugin_rpc.get_active_network_ids()
+            try:
+                networks = self.plugin_rpc.get_networks_info(
+                    network_ids[:chunk_size])
+            except common.RemoteError as e:
+                if e.exc_type != 'UnsupportedRpcVersion':
+                    raise
+                LOG.warn(_("The server does not support get_networks_info, "
+                           "fetching all the networks at once"))
+            else:
+                return network_ids, itertools.chain(
+                    networks,
+                    self._iter_networks_info(network_ids[chunk_size:],
+                                             chunk_size))
+        networks = self.plugin_rpc.get_active_networks_info()
+        return [network.id for network in networks], networks
+
+    def _iter_networks_info(self, network_ids, chunk_size):
+        for i in xrange(0, len(network_ids), chunk_size):
+            for network in self.plugin_rpc.get_networks_info(
+                    network_ids[i:i + chunk_size]):
+                yield network
+
     def _periodic_resync_helper(self):
         """Resync the dhcp state at the configured interval."""
         while True:
@@ -252,6 +297,30 @@ class DhcpAgent(manager.Manager):
         else:
             self.disable_dhcp_helper(network.id)
 
+    def reload_allocations_helper(self, network_id):
+        """Reload the allocations of a network once its events settle.
+
+        The ports of the cache are updated as the events are received, the
+        events received within reload_allocations_delay seconds after the
+        first one are then applied by a single reload.
+        """
+        if self.conf.reload_allocations_delay <= 0:
+            self._reload_allocations(network_id)
+        elif network_id not in self.pending_reloads:
+            self.pending_reloads.add(network_id)
+            eventlet.spawn_after(self.conf.reload_allocations_delay,
+                                 self._delayed_reload_allocations, network_id)
+
+    def _reload_allocations(self, network_id):
+        network = self.cache.get_network_by_id(network_id)
+        if network:
+            self.call_driver('reload_allocations', network)
+
+    @utils.synchronized('dhcp-agent')
+    def _delayed_reload_allocations(self, network_id):
+        self.pending_reloads.discard(network_id)
+        self._reload_allocations(network_id)
+
     @utils.synchronized('dhcp-agent')
     def network_create_end(self, context, payload):
         """Handle the network.create.end notification event."""
@@ -296,7 +365,7 @@ class DhcpAgent(manager.Manager):
         network = self.cache.get_network_by_id(updated_port.network_id)
         if network:
             self.cache.put_port(updated_port)
-            self.call_driver('reload_allocations', network)
+            self.reload_allocations_helper(network.id)
 
     # Use the update handler for the port create event.
     port_create_end = port_update_end
@@ -306,9 +375,8 @@ class DhcpAgent(manager.Manager):
         """Handle the port.delete.end notification event."""
         port = self.cache.get_port_by_id(payload['port_id'])
         if port:
-            network = self.cache.get_network_by_id(port.network_id)
             self.cache.remove_port(port)
-            self.call_driver('reload_allocations', network)
+            self.reload_allocations_helper(port.network_id)
 
     def enable_isolated_metadata_proxy(self, network):
 
@@ -371,6 +439,7 @@ class DhcpPluginApi(proxy.RpcProxy):
         1.0 - Initial version.
         1.1 - Added get_active_networks_info, create_dhcp_port,
               and update_dhcp_port methods.
+        1.2 - Added get_networks_info.
 
     """
 
@@ -391,6 +460,23 @@ class DhcpPluginApi(proxy.RpcProxy):
                              topic=self.topic)
         return [dhcp.NetModel(self.use_namespaces, n) for n in networks]
 
+    def get_active_network_ids(self):
+        """Make a remote process call to retrieve the active network ids."""
+        return self.call(self.context,
+                         self.make_msg('get_active_networks',
+                                       host=self.host),
+                         topic=self.topic)
+
+    def get_networks_info(self, network_ids):
+        """Make a remote process call to retrieve the info of networks."""
+        networks = self.call(self.context,
+                             self.make_msg('get_networks_info',
+                                           network_ids=network_ids,
+                                           host=self.host),
+                             topic=self.topic,
+                             version='1.2')
+        return [dhcp.NetModel(self.use_namespaces, n) for n in networks]
+
     def get_network_info(self, network_id):
         """Make a remote process call to retrieve network info."""
         network = self.call(self.context,
@@ -453,12 +539,61 @@ class DhcpPluginApi(proxy.RpcProxy):
                          topic=self.topic)
 
 
+class NetworkPorts(object):
+    """Ports of a cached network, indexed by port id.
+
+    It replaces the list of ports of the network given to the cache: the
+    ports are iterated in the order they were added, but are looked up,
+    replaced and removed without walking all of them.
+    """
+    def __init__(self, ports=()):
+        self._ports = collections.OrderedDict(
+            (port.id, port) for port in ports)
+
+    def __iter__(self):
+        return self._ports.itervalues()
+
+    def __len__(self):
+        return len(self._ports)
+
+    def __contains__(self, port):
+        return self._ports.get(port.id) == port
+
+    def __getitem__(self, index):
+        return self._ports.values()[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def get(self, port_id):
+        return self._ports.get(port_id)
+
+    def put(self, port):
+        """Add or replace a port, return True if it was added."""
+        added = port.id not in self._ports
+        self._ports[port.id] = port
+        return added
+
+    append = put
+
+    def pop(self, port_id):
+        return self._ports.pop(port_id, None)
+
+
 class NetworkCache(object):
     """Agent cache of the current network state."""
     def __init__(self):
         self.cache = {}
         self.subnet_lookup = {}
         self.port_lookup = {}
+        self.num_subnets = 0
+        self.num_ports = 0
 
     def get_network_ids(self):
         return self.cache.keys()
@@ -477,6 +612,7 @@ class NetworkCache(object):
             self.remove(self.cache[network.id])
 
         self.cache[network.id] = network
+        network.ports = NetworkPorts(network.ports)
 
         for subnet in network.subnets:
             self.subnet_lookup[subnet.id] = network.id
@@ -484,6 +620,9 @@ class NetworkCache(object):
         for port in network.ports:
             self.port_lookup[port.id] = network.id
 
+        self.num_subnets += len(network.subnets)
+        self.num_ports += len(network.ports)
+
     def remove(self, network):
         del self.cache[network.id]
 
@@ -493,45 +632,33 @@ class NetworkCache(object):
         for port in network.ports:
             del self.port_lookup[port.id]
 
+        self.num_subnets -= len(network.subnets)
+        self.num_ports -= len(network.ports)
+
     def put_port(self, port):
         network = self.get_network_by_id(port.network_id)
-        for index in range(len(network.ports)):
-            if network.ports[index].id == port.id:
-                network.ports[index] = port
-                break
-        else:
-            network.ports.append(port)
+        if network.ports.put(port):
+            self.num_ports += 1
 
         self.port_lookup[port.id] = network.id
 
     def remove_port(self, port):
         network = self.get_network_by_port_id(port.id)
 
-        for index in range(len(network.ports)):
-            if network.ports[index] == port:
-                del network.ports[index]
-                del self.port_lookup[port.id]
-                break
+        if network.ports.get(port.id) == port:
+            network.ports.pop(port.id)
+            del self.port_lookup[port.id]
+            self.num_ports -= 1
 
     def get_port_by_id(self, port_id):
         network = self.get_network_by_port_id(port_id)
         if network:
-            for port in network.ports:
-                if port.id == port_id:
-                    return port
+            return network.ports.get(port_id)
 
     def get_state(self):
-        net_ids = self.get_network_ids()
-        num_nets = len(net_ids)
-        num_subnets = 0
-        num_ports = 0
-        for net_id in net_ids:
-            network = self.get_network_by_id(net_id)
-            num_subnets += len(network.subnets)
-            num_ports += len(network.ports)
-        return {'networks': num_nets,
-                'subnets': num_subnets,
-                'ports': num_ports}
+        return {'networks': len(self.cache),
+                'subnets': self.num_subnets,
+                'ports': self.num_ports}
 
 
 class DhcpAgentWithStateReport(DhcpAgent):
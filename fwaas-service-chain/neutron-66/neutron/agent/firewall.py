@@ -53,6 +53,12 @@ class FirewallDriver(object):
       if direction is egress:
         remote_group_id will be a list of dest_ip_prefix
       remote_group_id will also remaining membership update management
+
+    Drivers may also implement update_security_group_rules and
+    update_security_group_members, in which case the agent may only send
+    the provider rules in security_group_rules and let the driver build
+    the rules of the port from the rules and members of its security
+    groups.
     """
 
     def prepare_port_filter(self, port):
@@ -133,6 +139,12 @@ class NoopFirewallDriver(FirewallDriver):
     def filter_defer_apply_off(self):
         pass
 
+    def update_security_group_rules(self, sg_id, rules):
+        pass
+
+    def update_security_group_members(self, sg_id, ips):
+        pass
+
     @property
     def ports(self):
         return {}
@@ -13,7 +13,10 @@
 #    under the License.
 #
 
+import itertools
+
 import eventlet
+from eventlet import queue
 import netaddr
 from oslo.config import cfg
 
@@ -31,7 +34,6 @@ from neutron import context
 from neutron import manager
 from neutron.openstack.common import excutils
 from neutron.openstack.common import importutils
-from neutron.openstack.common import lockutils
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import loopingcall
 from neutron.openstack.common import periodic_task
@@ -39,6 +41,7 @@ from neutron.openstack.common import processutils
 from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.openstack.common import service
+from neutron.openstack.common import timeutils
 from neutron import service as neutron_service
 from neutron.services.firewall.agents.l3reference import firewall_l3_agent
 
@@ -46,9 +49,13 @@ LOG = logging.getLogger(__name__)
 NS_PREFIX = 'qrouter-'
 INTERNAL_DEV_PREFIX = 'qr-'
 EXTERNAL_DEV_PREFIX = 'qg-'
-RPC_LOOP_INTERVAL = 1
 FLOATING_IP_CIDR_SUFFIX = '/32'
 
+# Lower values are processed first
+PRIORITY_RPC = 0
+PRIORITY_SYNC_ROUTERS_TASK = 1
+DELETE_ROUTER = 1
+
 
 class L3PluginApi(proxy.RpcProxy):
     """Agent side of the l3 agent RPC API.
@@ -56,6 +63,7 @@ class L3PluginApi(proxy.RpcProxy):
     API version history:
         1.0 - Initial version.
         1.1 - Floating IP operational status updates
+        1.2 - Added get_router_ids
 
     """
 
@@ -73,6 +81,13 @@ class L3PluginApi(proxy.RpcProxy):
                                        router_ids=router_ids),
                          topic=self.topic)
 
+    def get_router_ids(self, context):
+        """Make a remote process call to retrieve the ids of the routers."""
+        return self.call(context,
+                         self.make_msg('get_router_ids', host=self.host),
+                         topic=self.topic,
+                         version='1.2')
+
     def get_external_network_id(self, context):
         """Make a remote process call to retrieve the external network id.
 
@@ -114,6 +129,17 @@ class RouterInfo(object):
             #FIXME(danwent): use_ipv6=True,
             namespace=self.ns_name)
         self.routes = []
+        # State last applied to the router, so that an update only
+        # changes what differs from it
+        self.snat_rules = []
+        # floating IP address -> fixed IP address, for the NAT rules
+        self.floating_ip_nat = {}
+        # floating IP cidrs configured on the gateway device, None when
+        # they have to be read from the device
+        self.floating_ip_cidrs = None
+        # floating IP id -> status last reported to the server
+        self.floating_ip_statuses = {}
+        self.devices_checked = False
 
     @property
     def router(self):
@@ -142,6 +168,102 @@ class RouterInfo(object):
         self._snat_action = None
 
 
+class RouterUpdate(object):
+    """A pending change of a router.
+
+    router is the router dict when it is already known, as for the updates
+    of a full sync, otherwise it is fetched from the server when the update
+    is processed. timestamp is the time the state of the router was read or
+    notified, it is used to discard updates older than the processed ones.
+    """
+
+    def __init__(self, router_id, priority, action=None, router=None,
+                 timestamp=None):
+        self.id = router_id
+        self.priority = priority
+        self.action = action
+        self.router = router
+        self.timestamp = timestamp or timeutils.utcnow()
+        # sequence number of the queue entry of this update
+        self.seq = None
+
+
+class RouterUpdateQueue(object):
+    """Priority queue of router updates with per-router coalescing.
+
+    At most one update is pending for each router: a new update replaces
+    the pending one and keeps the highest of their priorities. The updates
+    of a router being processed wait until done() is called for it, so that
+    two workers never process the same router at the same time.
+    """
+
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        # router id -> pending RouterUpdate
+        self._pending = {}
+        self._in_progress = set()
+        # router id -> timestamp of the last processed update
+        self._processed = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, router_id):
+        return router_id in self._pending
+
+    def get_pending(self, router_id):
+        return self._pending.get(router_id)
+
+    def _push(self, update):
+        update.seq = next(self._counter)
+        self._queue.put((update.priority, update.seq, update.id))
+
+    def add(self, update):
+        processed = self._processed.get(update.id)
+        if processed and update.timestamp < processed:
+            return
+        pending = self._pending.get(update.id)
+        if pending is None:
+            self._pending[update.id] = update
+            if update.id not in self._in_progress:
+                self._push(update)
+            return
+        queued_priority = pending.priority
+        priority = min(update.priority, pending.priority)
+        if update.timestamp >= pending.timestamp:
+            update.seq = pending.seq
+            self._pending[update.id] = update
+        else:
+            # the pending update carries a more recent state of the router
+            update = pending
+        update.priority = priority
+        if priority < queued_priority and update.id not in self._in_progress:
+            # the previous entry of the router is skipped by get()
+            self._push(update)
+
+    def get(self, block=True):
+        """Return the most urgent update and mark its router in progress.
+
+        Raise queue.Empty if block is False and no update is pending.
+        """
+        while True:
+            _priority, seq, router_id = self._queue.get(block)
+            update = self._pending.get(router_id)
+            if update is None or update.seq != seq:
+                continue
+            del self._pending[router_id]
+            self._in_progress.add(router_id)
+            return update
+
+    def done(self, update):
+        self._in_progress.discard(update.id)
+        self._processed[update.id] = update.timestamp
+        pending = self._pending.get(update.id)
+        if pending:
+            self._push(pending)
+
+
 class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     """Manager for L3NatAgent
 
@@ -185,6 +307,14 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.IntOpt('router_update_workers', default=8,
+                   help=_("Number of routers updated concurrently.")),
+        cfg.IntOpt('sync_routers_chunk_size', default=64,
+                   help=_("Number of routers fetched by each request of a "
+                          "full resync.")),
+        cfg.IntOpt('sync_routers_workers', default=4,
+                   help=_("Number of requests of a full resync sent "
+                          "concurrently.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -211,16 +341,12 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.context = context.get_admin_context_without_session()
         self.plugin_rpc = L3PluginApi(topics.L3PLUGIN, host)
         self.fullsync = True
-        self.updated_routers = set()
-        self.removed_routers = set()
+        self._queue = RouterUpdateQueue()
         self.sync_progress = False
 
         self._delete_stale_namespaces = (self.conf.use_namespaces and
                                          self.conf.router_delete_namespaces)
 
-        self.rpc_loop = loopingcall.FixedIntervalLoopingCall(
-            self._rpc_loop)
-        self.rpc_loop.start(interval=RPC_LOOP_INTERVAL)
         super(L3NATAgent, self).__init__(conf=self.conf)
 
         self.target_ex_net_id = None
@@ -241,13 +367,13 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             LOG.error(msg)
             raise SystemExit(msg)
 
-    def _cleanup_namespaces(self, routers):
+    def _cleanup_namespaces(self, router_ids):
         """Destroy stale router namespaces on host when L3 agent restarts
 
         This routine is called when self._delete_stale_namespaces is True.
 
-        The argument routers is the list of routers that are recorded in
-        the database as being hosted on this node.
+        The argument router_ids is the list of the ids of the routers that
+        are recorded in the database as being hosted on this node.
         """
         try:
             root_ip = ip_lib.IPWrapper(self.root_helper)
@@ -255,7 +381,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             host_namespaces = root_ip.get_namespaces(self.root_helper)
             router_namespaces = set(ns for ns in host_namespaces
                                     if ns.startswith(NS_PREFIX))
-            ns_to_ignore = set(NS_PREFIX + r['id'] for r in routers)
+            ns_to_ignore = set(NS_PREFIX + router_id
+                               for router_id in router_ids)
             ns_to_destroy = router_namespaces - ns_to_ignore
         except RuntimeError:
             LOG.exception(_('RuntimeError in obtaining router list '
@@ -437,7 +564,14 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self.internal_network_removed(ri, p['id'], p['ip_cidr'])
             ri.internal_ports.remove(p)
 
-        existing_devices = self._get_existing_devices(ri)
+        # Devices are only listed to find stale ones when the router is
+        # processed for the first time or when its ports change
+        gateway_changed = bool(ex_gw_port) != bool(ri.ex_gw_port)
+        if (not ri.devices_checked or new_ports or old_ports or
+                gateway_changed):
+            existing_devices = self._get_existing_devices(ri)
+        else:
+            existing_devices = []
         current_internal_devs = set([n for n in existing_devices
                                      if n.startswith(INTERNAL_DEV_PREFIX)])
         current_port_devs = set([self.get_internal_device_name(id) for
@@ -460,10 +594,12 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         if ex_gw_port_id:
             interface_name = self.get_external_device_name(ex_gw_port_id)
         if ex_gw_port and not ri.ex_gw_port:
+            ri.floating_ip_cidrs = None
             self._set_subnet_info(ex_gw_port)
             self.external_gateway_added(ri, ex_gw_port,
                                         interface_name, internal_cidrs)
         elif not ex_gw_port and ri.ex_gw_port:
+            ri.floating_ip_cidrs = None
             self.external_gateway_removed(ri, ri.ex_gw_port,
                                           interface_name, internal_cidrs)
 
@@ -477,6 +613,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                                bridge=self.conf.external_network_bridge,
                                namespace=ri.ns_name,
                                prefix=EXTERNAL_DEV_PREFIX)
+        ri.devices_checked = True
 
         # Process static routes for router
         self.routes_updated(ri)
@@ -506,9 +643,17 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             ri.floating_ips = set(fip_statuses.keys())
             for fip_id in existing_floating_ips - ri.floating_ips:
                 fip_statuses[fip_id] = l3_constants.FLOATINGIP_STATUS_DOWN
-            # Update floating IP status on the neutron server
-            self.plugin_rpc.update_floatingip_statuses(
-                self.context, ri.router_id, fip_statuses)
+            # Update on the neutron server the floating IP statuses which
+            # changed since the last report
+            changed_statuses = dict(
+                (fip_id, status) for fip_id, status in fip_statuses.items()
+                if ri.floating_ip_statuses.get(fip_id) != status)
+            if changed_statuses:
+                self.plugin_rpc.update_floatingip_statuses(
+                    self.context, ri.router_id, changed_statuses)
+            ri.floating_ip_statuses = dict(
+                (fip_id, status) for fip_id, status in fip_statuses.items()
+                if status != l3_constants.FLOATINGIP_STATUS_DOWN)
 
         # Update ex_gw_port and enable_snat on the router info cache
         ri.ex_gw_port = ex_gw_port
@@ -516,42 +661,51 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
 
     def _handle_router_snat_rules(self, ri, ex_gw_port, internal_cidrs,
                                   interface_name, action):
-        # Remove all the rules
-        # This is safe because if use_namespaces is set as False
-        # then the agent can only configure one router, otherwise
-        # each router's SNAT rules will be in their own namespace
-        ri.iptables_manager.ipv4['nat'].empty_chain('POSTROUTING')
-        ri.iptables_manager.ipv4['nat'].empty_chain('snat')
-
-        # Add back the jump to float-snat
-        ri.iptables_manager.ipv4['nat'].add_rule('snat', '-j $float-snat')
-
-        # And add them back if the action if add_rules
+        rules = []
         if action == 'add_rules' and ex_gw_port:
             # ex_gw_port should not be None in this case
             ex_gw_ip = ex_gw_port['fixed_ips'][0]['ip_address']
-            for rule in self.external_gateway_nat_rules(ex_gw_ip,
-                                                        internal_cidrs,
-                                                        interface_name):
-                ri.iptables_manager.ipv4['nat'].add_rule(*rule)
+            rules = self.external_gateway_nat_rules(ex_gw_ip,
+                                                    internal_cidrs,
+                                                    interface_name)
+        if rules == ri.snat_rules:
+            return
+
+        # Only the rules which changed are replaced. The jump to
+        # float-snat, added by the iptables manager, stays first in the
+        # snat chain.
+        nat = ri.iptables_manager.ipv4['nat']
+        for rule in ri.snat_rules:
+            if rule not in rules:
+                nat.remove_rule(*rule)
+        for rule in rules:
+            if rule not in ri.snat_rules:
+                nat.add_rule(*rule)
+        ri.snat_rules = rules
         ri.iptables_manager.apply()
 
     def process_router_floating_ip_nat_rules(self, ri):
         """Configure NAT rules for the router's floating IPs.
 
-        Configures iptables rules for the floating ips of the given router
+        Only the rules of the floating IPs added, removed or mapped to
+        another fixed IP since the last call are changed.
         """
-        # Clear out all iptables rules for floating ips
-        ri.iptables_manager.ipv4['nat'].clear_rules_by_tag('floating_ip')
+        floating_ip_nat = dict(
+            (fip['floating_ip_address'], fip['fixed_ip_address'])
+            for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []))
+        if floating_ip_nat == ri.floating_ip_nat:
+            return
 
-        # Loop once to ensure that floating ips are configured.
-        for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
-            # Rebuild iptables rules for the floating ip.
-            fixed = fip['fixed_ip_address']
-            fip_ip = fip['floating_ip_address']
-            for chain, rule in self.floating_forward_rules(fip_ip, fixed):
-                ri.iptables_manager.ipv4['nat'].add_rule(chain, rule,
-                                                         tag='floating_ip')
+        nat = ri.iptables_manager.ipv4['nat']
+        for fip_ip, fixed in ri.floating_ip_nat.items():
+            if floating_ip_nat.get(fip_ip) != fixed:
+                for chain, rule in self.floating_forward_rules(fip_ip, fixed):
+                    nat.remove_rule(chain, rule)
+        for fip_ip, fixed in floating_ip_nat.items():
+            if ri.floating_ip_nat.get(fip_ip) != fixed:
+                for chain, rule in self.floating_forward_rules(fip_ip, fixed):
+                    nat.add_rule(chain, rule, tag='floating_ip')
+        ri.floating_ip_nat = floating_ip_nat
 
         ri.iptables_manager.apply()
 
@@ -559,47 +713,68 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         """Configure IP addresses on router's external gateway interface.
 
         Ensures addresses for existing floating IPs and cleans up
-        those that should not longer be configured.
+        those that should not longer be configured. The addresses of the
+        device are only read when the ones configured by the previous call
+        are not known.
         """
         fip_statuses = {}
         interface_name = self.get_external_device_name(ex_gw_port['id'])
         device = ip_lib.IPDevice(interface_name, self.root_helper,
                                  namespace=ri.ns_name)
-        existing_cidrs = set([addr['cidr'] for addr in device.addr.list()])
+        if ri.floating_ip_cidrs is None:
+            existing_cidrs = set([addr['cidr']
+                                  for addr in device.addr.list()])
+        else:
+            existing_cidrs = ri.floating_ip_cidrs
+        # Unknown until all the changes are done
+        ri.floating_ip_cidrs = None
         new_cidrs = set()
+        added_fips = []
 
-        # Loop once to ensure that floating ips are configured.
+        # The addresses are added and removed by a single ip command
+        batch = ip_lib.IPBatch(self.root_helper, ri.ns_name)
+        batch_device = batch.device(interface_name)
         for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
-            fip_ip = fip['floating_ip_address']
-            ip_cidr = str(fip_ip) + FLOATING_IP_CIDR_SUFFIX
-
+            ip_cidr = str(fip['floating_ip_address']) + FLOATING_IP_CIDR_SUFFIX
             new_cidrs.add(ip_cidr)
-
+            fip_statuses[fip['id']] = l3_constants.FLOATINGIP_STATUS_ACTIVE
             if ip_cidr not in existing_cidrs:
                 net = netaddr.IPNetwork(ip_cidr)
-                try:
-                    device.addr.add(net.version, ip_cidr, str(net.broadcast))
-                except (processutils.UnknownArgumentError,
-                        processutils.ProcessExecutionError):
-                    # any exception occurred here should cause the floating IP
-                    # to be set in error state
+                batch_device.addr.add(net.version, ip_cidr, str(net.broadcast))
+                added_fips.append((fip, ip_cidr))
+
+        # Clean up addresses that no longer belong on the gateway interface.
+        for ip_cidr in existing_cidrs - new_cidrs:
+            if ip_cidr.endswith(FLOATING_IP_CIDR_SUFFIX):
+                net = netaddr.IPNetwork(ip_cidr)
+                batch_device.addr.delete(net.version, ip_cidr)
+
+        try:
+            batch.execute()
+            configured_cidrs = new_cidrs
+        except (RuntimeError, processutils.UnknownArgumentError,
+                processutils.ProcessExecutionError):
+            # The batch stops at the first failure, the floating IPs whose
+            # address is not configured are set in error state
+            LOG.warn(_("Unable to configure the floating IP addresses of "
+                       "router %s"), ri.router_id)
+            configured_cidrs = set([addr['cidr']
+                                    for addr in device.addr.list()])
+            for fip, ip_cidr in added_fips:
+                if ip_cidr not in configured_cidrs:
                     fip_statuses[fip['id']] = (
                         l3_constants.FLOATINGIP_STATUS_ERROR)
                     LOG.warn(_("Unable to configure IP address for "
                                "floating IP: %s"), fip['id'])
-                    continue
+
+        for fip, ip_cidr in added_fips:
+            if fip_statuses[fip['id']] == (
+                    l3_constants.FLOATINGIP_STATUS_ACTIVE):
                 # As GARP is processed in a distinct thread the call below
                 # won't raise an exception to be handled.
                 self._send_gratuitous_arp_packet(
-                    ri, interface_name, fip_ip)
-            fip_statuses[fip['id']] = (
-                l3_constants.FLOATINGIP_STATUS_ACTIVE)
-
-        # Clean up addresses that no longer belong on the gateway interface.
-        for ip_cidr in existing_cidrs - new_cidrs:
-            if ip_cidr.endswith(FLOATING_IP_CIDR_SUFFIX):
-                net = netaddr.IPNetwork(ip_cidr)
-                device.addr.delete(net.version, ip_cidr)
+                    ri, interface_name, fip['floating_ip_address'])
+        ri.floating_ip_cidrs = configured_cidrs
         return fip_statuses
 
     def _get_ex_gw_port(self, ri):
@@ -730,7 +905,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     def router_deleted(self, context, router_id):
         """Deal with router deletion RPC message."""
         LOG.debug(_('Got router deleted notification for %s'), router_id)
-        self.removed_routers.add(router_id)
+        self._queue.add(RouterUpdate(router_id, PRIORITY_RPC,
+                                     action=DELETE_ROUTER))
 
     def routers_updated(self, context, routers):
         """Deal with routers modification and creation RPC message."""
@@ -739,17 +915,19 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             # This is needed for backward compatibility
             if isinstance(routers[0], dict):
                 routers = [router['id'] for router in routers]
-            self.updated_routers.update(routers)
+            for router_id in routers:
+                self._queue.add(RouterUpdate(router_id, PRIORITY_RPC))
 
     def router_removed_from_agent(self, context, payload):
         LOG.debug(_('Got router removed from agent :%r'), payload)
-        self.removed_routers.add(payload['router_id'])
+        self._queue.add(RouterUpdate(payload['router_id'], PRIORITY_RPC,
+                                     action=DELETE_ROUTER))
 
     def router_added_to_agent(self, context, payload):
         LOG.debug(_('Got router added to agent :%r'), payload)
         self.routers_updated(context, payload)
 
-    def _process_routers(self, routers, all_routers=False):
+    def _process_routers(self, routers):
         pool = eventlet.GreenPool()
         if (self.conf.external_network_bridge and
             not ip_lib.device_exists(self.conf.external_network_bridge)):
@@ -758,16 +936,11 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             return
 
         target_ex_net_id = self._fetch_external_net_id()
-        # if routers are all the routers we have (They are from router sync on
-        # starting or when error occurs during running), we seek the
-        # routers which should be removed.
-        # If routers are from server side notification, we seek them
-        # from subset of incoming routers and ones we have now.
-        if all_routers:
-            prev_router_ids = set(self.router_info)
-        else:
-            prev_router_ids = set(self.router_info) & set(
-                [router['id'] for router in routers])
+        # The routers no longer hosted by the agent are removed by the
+        # updates of the full sync, only the incoming routers which are
+        # now admin down or filtered out are removed here.
+        prev_router_ids = set(self.router_info) & set(
+            [router['id'] for router in routers])
         cur_router_ids = set()
         for r in routers:
             if not r['admin_state_up']:
@@ -798,39 +971,97 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             pool.spawn_n(self._router_removed, router_id)
         pool.waitall()
 
-    @lockutils.synchronized('l3-agent', 'neutron-')
-    def _rpc_loop(self):
-        # _rpc_loop and _sync_routers_task will not be
-        # executed in the same time because of lock.
-        # so we can clear the value of updated_routers
-        # and removed_routers
+    def _process_router_update(self, update):
         try:
-            LOG.debug(_("Starting RPC loop for %d updated routers"),
-                      len(self.updated_routers))
-            if self.updated_routers:
-                router_ids = list(self.updated_routers)
-                self.updated_routers.clear()
-                routers = self.plugin_rpc.get_routers(
-                    self.context, router_ids)
-                self._process_routers(routers)
-            self._process_router_delete()
-            LOG.debug(_("RPC loop successfully completed"))
+            if update.action == DELETE_ROUTER:
+                self._router_removed(update.id)
+                return
+            router = update.router
+            if router is None:
+                routers = self.plugin_rpc.get_routers(self.context,
+                                                      [update.id])
+                if not routers:
+                    # The router is gone or no longer hosted by this agent
+                    if update.id in self.router_info:
+                        self._router_removed(update.id)
+                    return
+                router = routers[0]
+            self._process_routers([router])
         except Exception:
-            LOG.exception(_("Failed synchronizing routers"))
+            LOG.exception(_("Failed processing router %s"), update.id)
             self.fullsync = True
+        finally:
+            self._queue.done(update)
 
-    def _process_router_delete(self):
-        current_removed_routers = list(self.removed_routers)
-        for router_id in current_removed_routers:
-            self._router_removed(router_id)
-            self.removed_routers.remove(router_id)
+    def _process_next_router_update(self):
+        self._process_router_update(self._queue.get())
+
+    def _process_routers_loop(self):
+        LOG.debug(_("Starting _process_routers_loop"))
+        pool = eventlet.GreenPool(size=self.conf.router_update_workers)
+        while True:
+            # Blocks until a worker is free, so that each update is taken
+            # from the queue only when it can be processed
+            pool.spawn_n(self._process_next_router_update)
 
     def _router_ids(self):
         if not self.conf.use_namespaces:
             return [self.conf.router_id]
 
+    def _fetch_router_ids(self, context):
+        """Return the ids of the routers of the agent.
+
+        Return None if the server does not support get_router_ids.
+        """
+        router_ids = self._router_ids()
+        if router_ids is not None:
+            return router_ids
+        try:
+            return self.plugin_rpc.get_router_ids(context)
+        except rpc_common.RemoteError as e:
+            if e.exc_type != 'UnsupportedRpcVersion':
+                raise
+            LOG.warn(_("The server does not support get_router_ids, "
+                       "fetching all the routers at once"))
+
+    def _queue_routers(self, routers, timestamp):
+        for r in routers:
+            self._queue.add(RouterUpdate(r['id'],
+                                         PRIORITY_SYNC_ROUTERS_TASK,
+                                         router=r, timestamp=timestamp))
+
+    def _sync_routers_chunk(self, context, router_ids, timestamp):
+        try:
+            routers = self.plugin_rpc.get_routers(context, router_ids)
+        except Exception:
+            LOG.exception(_("Failed fetching routers %s"), router_ids)
+            # The routers are fetched one by one by the workers, which also
+            # remove the ones no longer hosted here
+            for router_id in router_ids:
+                self._queue.add(RouterUpdate(router_id,
+                                             PRIORITY_SYNC_ROUTERS_TASK,
+                                             timestamp=timestamp))
+            return
+        LOG.debug(_('Processing :%r'), routers)
+        self._queue_routers(routers, timestamp)
+        # The routers missing from the reply are admin down or no longer
+        # hosted here
+        missing_ids = set(router_ids) - set(r['id'] for r in routers)
+        for router_id in missing_ids & set(self.router_info):
+            self._queue.add(RouterUpdate(router_id,
+                                         PRIORITY_SYNC_ROUTERS_TASK,
+                                         action=DELETE_ROUTER,
+                                         timestamp=timestamp))
+
+    def _routers_synced(self, context):
+        """Full sync event, once all the routers have been queued.
+
+        Subclasses resync the state of their services here, so that an
+        update they missed is recovered by the next full sync.
+        """
+        pass
+
     @periodic_task.periodic_task
-    @lockutils.synchronized('l3-agent', 'neutron-')
     def _sync_routers_task(self, context):
         if self.services_sync:
             super(L3NATAgent, self).process_services_sync(context)
@@ -839,14 +1070,31 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         if not self.fullsync:
             return
         try:
-            router_ids = self._router_ids()
-            self.updated_routers.clear()
-            self.removed_routers.clear()
-            routers = self.plugin_rpc.get_routers(
-                context, router_ids)
-
-            LOG.debug(_('Processing :%r'), routers)
-            self._process_routers(routers, all_routers=True)
+            timestamp = timeutils.utcnow()
+            router_ids = self._fetch_router_ids(context)
+            if router_ids is None:
+                routers = self.plugin_rpc.get_routers(context)
+                router_ids = [r['id'] for r in routers]
+                self._queue_routers(routers, timestamp)
+            else:
+                # The routers are fetched in chunks, so that each reply
+                # is built by the server in a bounded time. The routers of
+                # a chunk are processed by the workers, along with the RPC
+                # updates which go first, while the next chunks are fetched.
+                chunk_size = max(self.conf.sync_routers_chunk_size, 1)
+                chunks = [router_ids[i:i + chunk_size]
+                          for i in xrange(0, len(router_ids), chunk_size)]
+                pool = eventlet.GreenPool(size=self.conf.sync_routers_workers)
+                for chunk in chunks:
+                    pool.spawn_n(self._sync_routers_chunk, context, chunk,
+                                 timestamp)
+                pool.waitall()
+            for router_id in set(self.router_info) - set(router_ids):
+                self._queue.add(RouterUpdate(router_id,
+                                             PRIORITY_SYNC_ROUTERS_TASK,
+                                             action=DELETE_ROUTER,
+                                             timestamp=timestamp))
+            self._routers_synced(context)
             self.fullsync = False
             LOG.debug(_("_sync_routers_task successfully completed"))
         except rpc_common.RPCException:
@@ -856,13 +1104,15 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         except Exception:
             LOG.exception(_("Failed synchronizing routers"))
             self.fullsync = True
+            return
 
         # Resync is not necessary for the cleanup of stale
         # namespaces.
         if self._delete_stale_namespaces:
-            self._cleanup_namespaces(routers)
+            self._cleanup_namespaces(router_ids)
 
     def after_start(self):
+        eventlet.spawn_n(self._process_routers_loop)
         LOG.info(_("L3 agent started"))
 
     def _update_routing_table(self, ri, operation, route):
@@ -17,6 +17,7 @@
 
 import abc
 import collections
+import hashlib
 import os
 import re
 import shutil
@@ -390,17 +391,33 @@ class Dnsmasq(DhcpLocalProcess):
             return
 
         self._release_unused_leases()
+        self._conf_files_changed = False
         self._output_hosts_file()
         self._output_addn_hosts_file()
         self._output_opts_file()
-        if self.active:
+        if not self._conf_files_changed:
+            # Each reload makes dnsmasq stop serving while it reads its files
+            LOG.debug(_('Allocations unchanged for network: %s'),
+                      self.network.id)
+        elif self.active:
             cmd = ['kill', '-HUP', self.pid]
             utils.execute(cmd, self.root_helper)
+            LOG.debug(_('Reloading allocations for network: %s'),
+                      self.network.id)
         else:
             LOG.debug(_('Pid %d is stale, relaunching dnsmasq'), self.pid)
-        LOG.debug(_('Reloading allocations for network: %s'), self.network.id)
         self.device_manager.update(self.network)
 
+    def _replace_conf_file(self, filename, data):
+        """Write a configuration file unless it already holds data."""
+        if os.path.exists(filename):
+            with open(filename) as f:
+                old_digest = hashlib.sha1(f.read()).hexdigest()
+            if old_digest == hashlib.sha1(data).hexdigest():
+                return
+        utils.replace_file(filename, data)
+        self._conf_files_changed = True
+
     def _iter_hosts(self):
         """Iterate over hosts.
 
@@ -463,7 +480,7 @@ class Dnsmasq(DhcpLocalProcess):
                 buf.write('%s,%s,%s\n' %
                           (port.mac_address, name, ip_address))
 
-        utils.replace_file(filename, buf.getvalue())
+        self._replace_conf_file(filename, buf.getvalue())
         LOG.debug(_('Done building host file %s'), filename)
         return filename
 
@@ -504,7 +521,7 @@ class Dnsmasq(DhcpLocalProcess):
             # order to obtain it in PTR responses.
             buf.write('%s\t%s %s\n' % (alloc.ip_address, fqdn, hostname))
         addn_hosts = self.get_conf_file_name('addn_hosts')
-        utils.replace_file(addn_hosts, buf.getvalue())
+        self._replace_conf_file(addn_hosts, buf.getvalue())
         return addn_hosts
 
     def _output_opts_file(self):
@@ -582,7 +599,7 @@ class Dnsmasq(DhcpLocalProcess):
                                                    ','.join(ips)))
 
         name = self.get_conf_file_name('opts')
-        utils.replace_file(name, '\n'.join(options))
+        self._replace_conf_file(name, '\n'.join(options))
         return name
 
     def _make_subnet_interface_ip_map(self):
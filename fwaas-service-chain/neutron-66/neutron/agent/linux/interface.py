@@ -86,20 +86,23 @@ class LinuxInterfaceDriver(object):
         for address in device.addr.list(scope='global', filters=['permanent']):
             previous[address['cidr']] = address['ip_version']
 
-        # add new addresses
-        for ip_cidr in ip_cidrs:
+        with ip_lib.IPBatch(self.root_helper, namespace) as batch:
+            batch_device = batch.device(device_name)
+            # add new addresses
+            for ip_cidr in ip_cidrs:
 
-            net = netaddr.IPNetwork(ip_cidr)
-            if ip_cidr in previous:
-                del previous[ip_cidr]
-                continue
+                net = netaddr.IPNetwork(ip_cidr)
+                if ip_cidr in previous:
+                    del previous[ip_cidr]
+                    continue
 
-            device.addr.add(net.version, ip_cidr, str(net.broadcast))
+                batch_device.addr.add(net.version, ip_cidr,
+                                      str(net.broadcast))
 
-        # clean up any old addresses
-        for ip_cidr, ip_version in previous.items():
-            if ip_cidr not in preserve_ips:
-                device.addr.delete(ip_version, ip_cidr)
+            # clean up any old addresses
+            for ip_cidr, ip_version in previous.items():
+                if ip_cidr not in preserve_ips:
+                    batch_device.addr.delete(ip_version, ip_cidr)
 
     def check_bridge_exists(self, bridge):
         if not ip_lib.device_exists(bridge):
@@ -173,16 +176,26 @@ class OVSInterfaceDriver(LinuxInterfaceDriver):
 
             if self.conf.ovs_use_veth:
                 # Create ns_dev in a namespace if one is configured.
-                root_dev, ns_dev = ip.add_veth(tap_name,
-                                               device_name,
-                                               namespace2=namespace)
-            else:
-                ns_dev = ip.device(device_name)
+                ip.add_veth(tap_name, device_name, namespace2=namespace)
+            elif namespace:
+                ip.ensure_namespace(namespace)
 
             internal = not self.conf.ovs_use_veth
             self._ovs_add_port(bridge, tap_name, port_id, mac_address,
                                internal=internal)
 
+            # The link settings are applied by a single ip command for
+            # each namespace
+            root_batch = ip_lib.IPBatch(self.root_helper)
+            ns_batch = ip_lib.IPBatch(self.root_helper, namespace)
+            if self.conf.ovs_use_veth:
+                root_dev = root_batch.device(tap_name)
+                ns_dev = ns_batch.device(device_name)
+            else:
+                # The interface created by ovs is moved to the namespace
+                # once configured
+                ns_dev = root_batch.device(device_name)
+
             ns_dev.link.set_address(mac_address)
 
             if self.conf.network_device_mtu:
@@ -190,14 +203,15 @@ class OVSInterfaceDriver(LinuxInterfaceDriver):
                 if self.conf.ovs_use_veth:
                     root_dev.link.set_mtu(self.conf.network_device_mtu)
 
-            # Add an interface created by ovs to the namespace.
             if not self.conf.ovs_use_veth and namespace:
-                namespace_obj = ip.ensure_namespace(namespace)
-                namespace_obj.add_device_to_namespace(ns_dev)
+                ns_dev.link.set_netns(namespace)
+                ns_dev = ns_batch.device(device_name)
 
             ns_dev.link.set_up()
             if self.conf.ovs_use_veth:
                 root_dev.link.set_up()
+            root_batch.execute()
+            ns_batch.execute()
         else:
             LOG.info(_("Device %s already exists"), device_name)
 
@@ -27,6 +27,16 @@ OPTS = [
                 help=_('Force ip_lib calls to use the root helper')),
 ]
 
+IP_BATCH_OPTS = [
+    cfg.BoolOpt('use_ip_batch', default=False,
+                help=_('Run the ip commands changing a namespace with one '
+                       'ip -batch process reading them on its standard '
+                       'input. neutron-rootwrap does not filter that input, '
+                       'only enable this with root_helper_daemon, which '
+                       'checks each command of a batch.')),
+]
+cfg.CONF.register_opts(IP_BATCH_OPTS, 'AGENT')
+
 
 LOOPBACK_DEVNAME = 'lo'
 # NOTE(ethuleau): depend of the version of iproute2, the vlan
@@ -37,6 +47,9 @@ VLAN_INTERFACE_DETAIL = ['vlan protocol 802.1q',
 
 
 class SubProcessBase(object):
+    # IPBatch queueing the commands run as root, if any
+    batch = None
+
     def __init__(self, root_helper=None, namespace=None):
         self.root_helper = root_helper
         self.namespace = namespace
@@ -185,13 +198,15 @@ class IPWrapper(SubProcessBase):
 
 
 class IPDevice(SubProcessBase):
-    def __init__(self, name, root_helper=None, namespace=None):
+    def __init__(self, name, root_helper=None, namespace=None, batch=None):
         super(IPDevice, self).__init__(root_helper=root_helper,
                                        namespace=namespace)
         self.name = name
+        self.batch = batch
         self.link = IpLinkCommand(self)
         self.addr = IpAddrCommand(self)
         self.route = IpRouteCommand(self)
+        self.neigh = IpNeighCommand(self)
 
     def __eq__(self, other):
         return (other is not None and self.name == other.name
@@ -211,6 +226,11 @@ class IpCommandBase(object):
         return self._parent._run(kwargs.get('options', []), self.COMMAND, args)
 
     def _as_root(self, *args, **kwargs):
+        batch = self._parent.batch
+        if (isinstance(batch, IPBatch) and
+                not kwargs.get('use_root_namespace', False)):
+            batch.add(self.COMMAND, args, kwargs.get('options', []))
+            return ''
         return self._parent._as_root(kwargs.get('options', []),
                                      self.COMMAND,
                                      args,
@@ -241,6 +261,11 @@ class IpLinkCommand(IpDeviceCommandBase):
     def set_netns(self, namespace):
         self._as_root('set', self.name, 'netns', namespace)
         self._parent.namespace = namespace
+        batch = self._parent.batch
+        if isinstance(batch, IPBatch) and batch.namespace != namespace:
+            # The device is not in the namespace of the batch anymore
+            batch.execute()
+            self._parent.batch = None
 
     def set_name(self, name):
         self._as_root('set', self.name, 'name', name)
@@ -439,6 +464,118 @@ class IpRouteCommand(IpDeviceCommandBase):
                                   'dev', device)
 
 
+class IpNeighCommand(IpDeviceCommandBase):
+    COMMAND = 'neigh'
+
+    def add(self, ip_version, ip_address, mac_address):
+        self._as_root('replace',
+                      ip_address,
+                      'lladdr',
+                      mac_address,
+                      'nud',
+                      'permanent',
+                      'dev',
+                      self.name,
+                      options=[ip_version])
+
+    def delete(self, ip_version, ip_address, mac_address):
+        self._as_root('del',
+                      ip_address,
+                      'lladdr',
+                      mac_address,
+                      'dev',
+                      self.name,
+                      options=[ip_version])
+
+
+class IPBatch(object):
+    """Run the ip commands changing a namespace with one ip process.
+
+    The link, addr, route and neigh commands of the devices returned by
+    device() are queued instead of being run, reads are not. When used as a
+    context manager, the queued commands are run by a single
+    'ip netns exec <namespace> ip -batch -' invocation when the block exits
+    without error, and dropped otherwise. Unless use_ip_batch is set, they
+    are run one by one instead:
+
+        with ip_lib.IPBatch(root_helper, namespace) as batch:
+            device = batch.device(name)
+            device.link.set_address(mac_address)
+            device.link.set_up()
+
+    The commands run in order and the batch stops at the first failing one,
+    raising RuntimeError as a single ip command would. Moving a device to
+    another namespace runs the commands queued so far, the later commands
+    of that device are run as they come.
+    """
+
+    def __init__(self, root_helper, namespace=None):
+        self.root_helper = root_helper
+        self.namespace = namespace
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        else:
+            self.commands = []
+
+    def device(self, name):
+        return IPDevice(name, self.root_helper, self.namespace, batch=self)
+
+    def add(self, command, args, options=None):
+        # The batch lines do not take options, so ip deduces the address
+        # family from the address of the command. A command whose family
+        # would be implicit is rejected instead of being run as IPv4.
+        ip_version = None
+        for arg in args:
+            address = str(arg).split('/')[0]
+            if netaddr.valid_ipv4(address, netaddr.INET_PTON):
+                ip_version = 4
+            elif netaddr.valid_ipv6(address):
+                ip_version = 6
+            else:
+                continue
+            break
+        for option in options or []:
+            if str(option) not in ('4', '6'):
+                raise ValueError(_("ip options %s can not be batched") %
+                                 options)
+            if int(option) != ip_version:
+                raise ValueError(_("ip %(command)s %(args)s has no IPv"
+                                   "%(version)s address to batch") %
+                                 {'command': command, 'args': args,
+                                  'version': option})
+        if ip_version is None and command in ('route', 'neigh'):
+            raise ValueError(_("The address family of ip %(command)s "
+                               "%(args)s is implicit") %
+                             {'command': command, 'args': args})
+        self.commands.append((options or [], command, args))
+
+    def execute(self):
+        if not self.commands:
+            return
+        if not self.root_helper:
+            raise exceptions.SudoRequired()
+        commands, self.commands = self.commands, []
+        if not cfg.CONF.AGENT.use_ip_batch:
+            ip = IPWrapper(self.root_helper, self.namespace)
+            for options, command, args in commands:
+                ip._as_root(options, command, args)
+            return
+        lines = [' '.join(str(arg) for arg in (command,) + args)
+                 for _options, command, args in commands]
+        cmd = ['ip', '-batch', '-']
+        if self.namespace:
+            cmd = ['ip', 'netns', 'exec', self.namespace] + cmd
+        return utils.execute(cmd,
+                             root_helper=self.root_helper,
+                             process_input='\n'.join(lines) + '\n')
+
+
 class IpNetnsCommand(IpCommandBase):
     COMMAND = 'netns'
 
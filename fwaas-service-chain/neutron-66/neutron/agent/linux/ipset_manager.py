@@ -0,0 +1,92 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.agent.linux import utils as linux_utils
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# ipset set names are limited to 31 characters by the kernel
+IPSET_NAME_MAX_LENGTH = 31
+IPSET_NAME_PREFIX = 'N'
+IPSET_FAMILY = {'IPv4': 'inet',
+                'IPv6': 'inet6'}
+
+
+def get_name(id, ethertype):
+    """Returns the ipset set name for a security group and ethertype."""
+    name = '%s%s%s' % (IPSET_NAME_PREFIX, ethertype, id)
+    return name[:IPSET_NAME_MAX_LENGTH]
+
+
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    Keeps track of the sets it created and of their members so that
+    membership changes can be pushed to the kernel as a delta, in a
+    single 'ipset restore' call, without touching any iptables rule.
+    """
+
+    def __init__(self, root_helper=None):
+        self.root_helper = root_helper
+        # set name -> set of members currently in the kernel set
+        self.ipset_sets = {}
+
+    def set_exists(self, set_name):
+        return set_name in self.ipset_sets
+
+    def set_members(self, set_name, ethertype, member_ips):
+        """Create the set if needed and sync its members with member_ips."""
+        member_ips = set(member_ips)
+        if not self.set_exists(set_name):
+            self._create_set(set_name, ethertype)
+        current_ips = self.ipset_sets[set_name]
+        to_add = member_ips - current_ips
+        to_del = current_ips - member_ips
+        if not to_add and not to_del:
+            return
+        lines = ['add %s %s' % (set_name, ip) for ip in sorted(to_add)]
+        lines += ['del %s %s' % (set_name, ip) for ip in sorted(to_del)]
+        LOG.debug(_("Updating ipset %(set)s: %(add)d added, "
+                    "%(del)d removed"),
+                  {'set': set_name, 'add': len(to_add), 'del': len(to_del)})
+        self._apply(['ipset', 'restore', '-exist'],
+                    process_input='\n'.join(lines) + '\n')
+        self.ipset_sets[set_name] = member_ips
+
+    def destroy(self, set_name):
+        """Destroy a set.
+
+        Must only be called once no iptables rule references the set.
+        """
+        if not self.set_exists(set_name):
+            return
+        self._apply(['ipset', 'destroy', set_name])
+        del self.ipset_sets[set_name]
+
+    def _create_set(self, set_name, ethertype):
+        # hash:net rather than hash:ip so that allowed address pairs
+        # given as CIDRs can be members too
+        self._apply(['ipset', 'create', '-exist', set_name, 'hash:net',
+                     'family', IPSET_FAMILY[ethertype]])
+        # the set may survive an agent restart, start from a clean state
+        self._apply(['ipset', 'flush', set_name])
+        self.ipset_sets[set_name] = set()
+
+    def _apply(self, cmd, process_input=None):
+        return linux_utils.execute(cmd, root_helper=self.root_helper,
+                                   process_input=process_input)
@@ -15,10 +15,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+
 import netaddr
 from oslo.config import cfg
 
 from neutron.agent import firewall
+from neutron.agent.linux import ipset_manager
 from neutron.agent.linux import iptables_manager
 from neutron.common import constants
 from neutron.openstack.common import log as logging
@@ -32,7 +35,26 @@ SPOOF_FILTER = 'spoof-filter'
 CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o',
                      SPOOF_FILTER: 's'}
+SG_CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'gi',
+                        EGRESS_DIRECTION: 'go'}
 LINUX_DEV_LEN = 14
+DIRECTION_IP_PREFIX = {INGRESS_DIRECTION: 'source_ip_prefix',
+                       EGRESS_DIRECTION: 'dest_ip_prefix'}
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
+
+iptables_firewall_opts = [
+    cfg.BoolOpt('enable_ipset', default=False,
+                help=_('Use ipset sets to match the members of remote '
+                       'security groups instead of one iptables rule '
+                       'per member address.')),
+    cfg.BoolOpt('shared_sg_chains', default=False,
+                help=_('Compile the rules of each set of security groups '
+                       'into one chain shared by all the ports using that '
+                       'set, instead of copying the rules into the chains '
+                       'of every port.')),
+]
+cfg.CONF.register_opts(iptables_firewall_opts, 'SECURITYGROUP')
 
 
 class IptablesFirewallDriver(firewall.FirewallDriver):
@@ -46,6 +68,19 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             use_ipv6=True)
         # list of port which has security group
         self.filtered_ports = {}
+        self.enable_ipset = cfg.CONF.SECURITYGROUP.enable_ipset
+        if self.enable_ipset:
+            self.ipset = ipset_manager.IpsetManager(
+                root_helper=cfg.CONF.AGENT.root_helper)
+        # names of the ipset sets referenced by the current rules
+        self._used_ipsets = set()
+        self.shared_sg_chains = cfg.CONF.SECURITYGROUP.shared_sg_chains
+        # names of the shared security group chains currently set up
+        self._sg_chains = set()
+        # security group rules and member ips, only filled when the
+        # agent gets compact security group information from the server
+        self.sg_rules = {}
+        self.sg_members = {}
         self._add_fallback_chain_v4v6()
         self._defer_apply = False
         self._pre_defer_filtered_ports = None
@@ -61,6 +96,15 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         # each security group has it own chains
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
+
+    def update_security_group_rules(self, sg_id, sg_rules):
+        LOG.debug(_("Update rules of security group (%s)"), sg_id)
+        self.sg_rules[sg_id] = sg_rules
+
+    def update_security_group_members(self, sg_id, sg_members):
+        LOG.debug(_("Update members of security group (%s)"), sg_id)
+        self.sg_members[sg_id] = sg_members
 
     def update_port_filter(self, port):
         LOG.debug(_("Updating device (%s) filter"), port['device'])
@@ -72,6 +116,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports[port['device']] = port
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
 
     def remove_port_filter(self, port):
         LOG.debug(_("Removing device (%s) filter"), port['device'])
@@ -83,6 +128,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports.pop(port['device'], None)
         self._setup_chains()
         self.iptables.apply()
+        self._remove_unused_ipsets()
 
     def _setup_chains(self):
         """Setup ingress and egress chain for a port."""
@@ -90,6 +136,13 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._setup_chains_apply(self.filtered_ports)
 
     def _setup_chains_apply(self, ports):
+        self._remove_unused_sg_info(ports)
+        if self.sg_rules:
+            ports = self._expand_sg_rules(ports)
+        if self.enable_ipset:
+            self._update_ipset_members(ports)
+        if self.shared_sg_chains:
+            self._setup_sg_chains(ports)
         self._add_chain_by_name_v4v6(SG_CHAIN)
         for port in ports.values():
             self._setup_chain(port, INGRESS_DIRECTION)
@@ -108,6 +161,138 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._remove_chain(port, EGRESS_DIRECTION)
             self._remove_chain(port, SPOOF_FILTER)
         self._remove_chain_by_name_v4v6(SG_CHAIN)
+        self._remove_sg_chains()
+
+    def _remove_unused_sg_info(self, ports):
+        """Forget the security groups the ports do not refer to any more."""
+        sg_ids = set()
+        for port in ports.values():
+            sg_ids.update(port.get('security_groups', []))
+        remote_group_ids = set(rule['remote_group_id']
+                               for sg_id in sg_ids
+                               for rule in self.sg_rules.get(sg_id, [])
+                               if rule.get('remote_group_id'))
+        for sg_id in set(self.sg_rules) - sg_ids:
+            del self.sg_rules[sg_id]
+        for sg_id in set(self.sg_members) - remote_group_ids:
+            del self.sg_members[sg_id]
+
+    def _expand_sg_rules(self, ports):
+        """Build the rules of each port from its security groups.
+
+        Ports described by compact security group information only carry
+        their provider rules, the rules of their security groups are added
+        here, remote_group_id rules being expanded into one rule per member
+        address as the server does for security_group_rules_for_devices.
+        """
+        expanded_ports = {}
+        for device, port in ports.iteritems():
+            rules = list(port.get('security_group_rules', []))
+            for sg_id in port.get('security_groups', []):
+                for rule in self.sg_rules.get(sg_id, []):
+                    remote_group_id = rule.get('remote_group_id')
+                    if not remote_group_id:
+                        rules.append(rule.copy())
+                        continue
+                    rules.extend(self._expand_remote_group_rule(
+                        port, rule, self.sg_members.get(remote_group_id, [])))
+            expanded_port = port.copy()
+            expanded_port['security_group_rules'] = rules
+            expanded_ports[device] = expanded_port
+        return expanded_ports
+
+    def _expand_remote_group_rule(self, port, rule, member_ips):
+        direction_ip_prefix = DIRECTION_IP_PREFIX[rule['direction']]
+        rules = []
+        for ip in member_ips:
+            if ip in port.get('fixed_ips', []):
+                continue
+            ip_network = netaddr.IPNetwork(ip)
+            if rule['ethertype'] != 'IPv%s' % ip_network.version:
+                continue
+            ip_rule = rule.copy()
+            ip_rule[direction_ip_prefix] = str(ip_network.cidr)
+            rules.append(ip_rule)
+        return rules
+
+    def _update_ipset_members(self, ports):
+        """Sync one ipset set per remote security group and ethertype.
+
+        The server expands each remote_group_id rule into one rule per
+        member address; the members are collected back here so that
+        the port chains only need a single set match per rule.
+        """
+        member_ips = {}
+        for port in ports.values():
+            for rule in port.get('security_group_rules', []):
+                remote_group_id = rule.get('remote_group_id')
+                if not remote_group_id:
+                    continue
+                ip_prefix = rule.get(DIRECTION_IP_PREFIX[rule['direction']])
+                if not ip_prefix:
+                    continue
+                set_name = ipset_manager.get_name(remote_group_id,
+                                                  rule['ethertype'])
+                member_ips.setdefault(
+                    (set_name, rule['ethertype']), set()).add(ip_prefix)
+        for (set_name, ethertype), ips in member_ips.items():
+            self.ipset.set_members(set_name, ethertype, ips)
+        self._used_ipsets = set(set_name for set_name, _e in member_ips)
+
+    def _remove_unused_ipsets(self):
+        # sets can only be destroyed once the rules referencing
+        # them have been removed from the kernel
+        if not self.enable_ipset or self._defer_apply:
+            return
+        for set_name in set(self.ipset.ipset_sets) - self._used_ipsets:
+            self.ipset.destroy(set_name)
+
+    def _setup_sg_chains(self, ports):
+        """Set up one chain per direction and set of security groups.
+
+        Ports using the same security groups share the chain, their own
+        chains only jump to it. Per port views of a group only differ by
+        the port's own address, which is left out of the remote group
+        members, so the shared chain is built from the union of them.
+        """
+        chain_rules = {}
+        seen = {}
+        for device in sorted(ports):
+            port = ports[device]
+            for direction in (INGRESS_DIRECTION, EGRESS_DIRECTION):
+                chain_name = self._sg_chain_name(port, direction)
+                rules = chain_rules.setdefault(chain_name, [])
+                seen_rules = seen.setdefault(chain_name, set())
+                for rule in self._select_sgr_by_direction(port, direction):
+                    if not rule.get('security_group_id'):
+                        continue
+                    key = tuple(sorted(rule.items()))
+                    if key not in seen_rules:
+                        seen_rules.add(key)
+                        rules.append(rule)
+        for chain_name in sorted(chain_rules):
+            ipv4_sg_rules, ipv6_sg_rules = self._split_sgr_by_ethertype(
+                chain_rules[chain_name])
+            self._add_chain_by_name_v4v6(chain_name)
+            self._add_rule_to_chain_v4v6(
+                chain_name,
+                self._convert_sg_rules(ipv4_sg_rules) + ['-j $sg-fallback'],
+                self._convert_sg_rules(ipv6_sg_rules) + ['-j $sg-fallback'])
+        self._sg_chains = set(chain_rules)
+
+    def _remove_sg_chains(self):
+        for chain_name in self._sg_chains:
+            self._remove_chain_by_name_v4v6(chain_name)
+        self._sg_chains = set()
+
+    def _sg_chain_name(self, port, direction):
+        sg_ids = set(port.get('security_groups') or [])
+        sg_ids.update(rule['security_group_id']
+                      for rule in port.get('security_group_rules', [])
+                      if rule.get('security_group_id'))
+        sg_hash = hashlib.sha1(','.join(sorted(sg_ids))).hexdigest()
+        return iptables_manager.get_chain_name(
+            '%s%s' % (SG_CHAIN_NAME_PREFIX[direction], sg_hash))
 
     def _setup_chain(self, port, DIRECTION):
         self._add_chain(port, DIRECTION)
@@ -253,6 +438,13 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         chain_name = self._port_chain_name(port, direction)
         # select rules for current direction
         security_group_rules = self._select_sgr_by_direction(port, direction)
+        fallback_chain = 'sg-fallback'
+        if self.shared_sg_chains:
+            # only the provider rules remain in the port chain, the rules
+            # of the security groups are in the shared chain
+            security_group_rules = [rule for rule in security_group_rules
+                                    if not rule.get('security_group_id')]
+            fallback_chain = self._sg_chain_name(port, direction)
         # split groups by ip version
         # for ipv4, iptables command is used
         # for ipv6, iptables6 command is used
@@ -268,17 +460,42 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         if direction == INGRESS_DIRECTION:
             ipv6_iptables_rule += self._accept_inbound_icmpv6()
         ipv4_iptables_rule += self._convert_sgr_to_iptables_rules(
-            ipv4_sg_rules)
+            ipv4_sg_rules, fallback_chain)
         ipv6_iptables_rule += self._convert_sgr_to_iptables_rules(
-            ipv6_sg_rules)
+            ipv6_sg_rules, fallback_chain)
         self._add_rule_to_chain_v4v6(chain_name,
                                      ipv4_iptables_rule,
                                      ipv6_iptables_rule)
 
-    def _convert_sgr_to_iptables_rules(self, security_group_rules):
+    def _collapse_remote_group_rules(self, security_group_rules):
+        """Merge the per member copies of each remote group rule."""
+        collapsed_rules = []
+        seen = set()
+        for rule in security_group_rules:
+            if rule.get('remote_group_id'):
+                rule = dict(rule)
+                rule.pop(DIRECTION_IP_PREFIX[rule['direction']], None)
+                key = tuple(sorted(rule.items()))
+                if key in seen:
+                    continue
+                seen.add(key)
+            collapsed_rules.append(rule)
+        return collapsed_rules
+
+    def _convert_sgr_to_iptables_rules(self, security_group_rules,
+                                       fallback_chain='sg-fallback'):
         iptables_rules = []
         self._drop_invalid_packets(iptables_rules)
         self._allow_established(iptables_rules)
+        iptables_rules += self._convert_sg_rules(security_group_rules)
+        iptables_rules += ['-j $%s' % fallback_chain]
+        return iptables_rules
+
+    def _convert_sg_rules(self, security_group_rules):
+        iptables_rules = []
+        if self.enable_ipset:
+            security_group_rules = self._collapse_remote_group_rules(
+                security_group_rules)
         for rule in security_group_rules:
             # These arguments MUST be in the format iptables-save will
             # display them: source/dest, protocol, sport, dport, target
@@ -297,11 +514,10 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                    rule.get('protocol'),
                                    rule.get('port_range_min'),
                                    rule.get('port_range_max'))
+            if self.enable_ipset:
+                args += self._ipset_match_arg(rule)
             args += ['-j RETURN']
             iptables_rules += [' '.join(args)]
-
-        iptables_rules += ['-j $sg-fallback']
-
         return iptables_rules
 
     def _drop_invalid_packets(self, iptables_rules):
@@ -351,6 +567,14 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             return ['-%s' % direction, ip_prefix]
         return []
 
+    def _ipset_match_arg(self, rule):
+        remote_group_id = rule.get('remote_group_id')
+        if not remote_group_id:
+            return []
+        set_name = ipset_manager.get_name(remote_group_id, rule['ethertype'])
+        return ['-m set', '--match-set', set_name,
+                IPSET_DIRECTION[rule['direction']]]
+
     def _port_chain_name(self, port, direction):
         return iptables_manager.get_chain_name(
             '%s%s' % (CHAIN_NAME_PREFIX[direction], port['device'][3:]))
@@ -368,6 +592,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._pre_defer_filtered_ports = None
             self._setup_chains_apply(self.filtered_ports)
             self.iptables.defer_apply_off()
+            self._remove_unused_ipsets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
@@ -24,6 +24,8 @@
 import inspect
 import os
 
+from oslo.config import cfg
+
 from neutron.agent.linux import utils as linux_utils
 from neutron.common import utils
 from neutron.openstack.common import lockutils
@@ -31,6 +33,15 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+iptables_opts = [
+    cfg.BoolOpt('iptables_differential_apply', default=False,
+                help=_('Only rewrite the wrapped chains which changed since '
+                       'the last successful apply, using iptables-restore '
+                       '--noflush, and skip tables which did not change. '
+                       'Packet counters of rewritten chains are reset.')),
+]
+cfg.CONF.register_opts(iptables_opts, 'AGENT')
+
 
 # NOTE(vish): Iptables supports chain names of up to 28 characters,  and we
 #             add up to 12 characters to binary_name which is used as a prefix,
@@ -284,6 +295,10 @@ class IptablesManager(object):
         self.namespace = namespace
         self.iptables_apply_deferred = False
         self.wrap_name = binary_name[:16]
+        self.differential_apply = cfg.CONF.AGENT.iptables_differential_apply
+        # Per command, the state of each table as of the last successful
+        # apply. Only maintained in differential apply mode.
+        self._applied_state = {}
 
         self.ipv4 = {'filter': IptablesTable(binary_name=self.wrap_name)}
         self.ipv6 = {'filter': IptablesTable(binary_name=self.wrap_name)}
@@ -377,29 +392,126 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        In differential apply mode, once a full apply succeeded, only the
+        wrapped chains which changed since are rewritten, and iptables-save
+        is not run at all.
+
         """
         s = [('iptables', self.ipv4)]
         if self.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            args = ['%s-save' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
-            all_tables = self.execute(args, root_helper=self.root_helper)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                    all_lines[start:end], table, table_name)
-
-            args = ['%s-restore' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
-            self.execute(args, process_input='\n'.join(all_lines),
-                         root_helper=self.root_helper)
+            if not self.differential_apply:
+                self._apply_all_tables(cmd, tables)
+                continue
+            states = dict((table_name, self._get_table_state(table))
+                          for table_name, table in tables.iteritems())
+            try:
+                if not self._apply_changed_chains(cmd, tables, states):
+                    self._apply_all_tables(cmd, tables)
+            except Exception:
+                # the kernel state is unknown, next apply must be a full one
+                self._applied_state.pop(cmd, None)
+                raise
+            self._applied_state[cmd] = states
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    def _apply_all_tables(self, cmd, tables):
+        args = ['%s-save' % (cmd,), '-c']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        all_tables = self.execute(args, root_helper=self.root_helper)
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                all_lines[start:end], table, table_name)
+
+        args = ['%s-restore' % (cmd,), '-c']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        self.execute(args, process_input='\n'.join(all_lines),
+                     root_helper=self.root_helper)
+
+    def _get_table_state(self, table):
+        """Return the rules of the table as they will be written.
+
+        Wrapped rules are grouped by chain, in the order they end up in
+        the kernel, top rules first. As in _modify_rules, only the last
+        occurrence of a duplicated rule is kept.
+        """
+        chains = dict((name, []) for name in table.chains)
+        unwrapped_rules = []
+        rules = ([rule for rule in table.rules if rule.top] +
+                 [rule for rule in table.rules if not rule.top])
+        seen_rules = set()
+        for rule in reversed(rules):
+            rule_str = str(rule).strip()
+            if rule_str in seen_rules:
+                continue
+            seen_rules.add(rule_str)
+            if rule.wrap:
+                chains[rule.chain].insert(0, rule_str)
+            else:
+                unwrapped_rules.insert(0, rule_str)
+        return {'chains': chains,
+                'unwrapped_chains': frozenset(table.unwrapped_chains),
+                'unwrapped_rules': unwrapped_rules}
+
+    def _apply_changed_chains(self, cmd, tables, states):
+        """Rewrite only the wrapped chains changed since the last apply.
+
+        Returns False when a full apply is needed instead: nothing was
+        applied yet, or chains or rules not owned by this manager changed.
+        """
+        applied_states = self._applied_state.get(cmd)
+        if applied_states is None or set(applied_states) != set(states):
+            return False
+        lines = []
+        for table_name, table in tables.iteritems():
+            old = applied_states[table_name]
+            new = states[table_name]
+            if old == new:
+                continue
+            if (table.remove_rules or table.remove_chains or
+                    old['unwrapped_chains'] != new['unwrapped_chains'] or
+                    old['unwrapped_rules'] != new['unwrapped_rules']):
+                return False
+            lines += self._get_changed_chains_lines(table_name,
+                                                    old['chains'],
+                                                    new['chains'])
+        if not lines:
+            LOG.debug(_("No change in %s tables, skipping apply"), cmd)
+            return True
+
+        args = ['%s-restore' % (cmd,), '-n']
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        self.execute(args, process_input='\n'.join(lines) + '\n',
+                     root_helper=self.root_helper)
+        return True
+
+    def _get_changed_chains_lines(self, table_name, old_chains, new_chains):
+        changed = sorted(name for name, rules in new_chains.iteritems()
+                         if old_chains.get(name) != rules)
+        removed = sorted(name for name in old_chains
+                         if name not in new_chains)
+        if not changed and not removed:
+            return []
+
+        def _wrap(name):
+            return '%s-%s' % (self.wrap_name, name)
+
+        # with --noflush, declaring an existing chain flushes it
+        lines = ['*%s' % table_name]
+        lines += [':%s - [0:0]' % _wrap(name) for name in changed + removed]
+        for name in changed:
+            lines += new_chains[name]
+        lines += ['-X %s' % _wrap(name) for name in removed]
+        lines += ['COMMIT']
+        return lines
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
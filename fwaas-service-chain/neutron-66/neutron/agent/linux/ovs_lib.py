@@ -20,6 +20,7 @@ import re
 from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import ovsdb_client
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 from neutron.openstack.common import excutils
@@ -35,11 +36,39 @@ OPTS = [
     cfg.IntOpt('ovs_vsctl_timeout',
                default=DEFAULT_OVS_VSCTL_TIMEOUT,
                help=_('Timeout in seconds for ovs-vsctl commands')),
+    cfg.StrOpt('ovsdb_interface',
+               default='vsctl',
+               help=_("How to read the OVS database: 'vsctl' runs ovs-vsctl "
+                      "for each read, 'native' answers reads from a local "
+                      "replica kept up to date over a persistent OVSDB "
+                      "connection. Changes are still made with ovs-vsctl.")),
+    cfg.StrOpt('ovsdb_connection',
+               default='unix:/var/run/openvswitch/db.sock',
+               help=_("The OVSDB connection used by the 'native' "
+                      "ovsdb_interface, 'unix:<path>' or 'tcp:<ip>:<port>'")),
 ]
 cfg.CONF.register_opts(OPTS)
 
 LOG = logging.getLogger(__name__)
 
+_ovsdb = None
+
+
+def get_ovsdb():
+    """Return the up to date OVSDB replica, None if reads use ovs-vsctl.
+
+    The replica is shared by all the bridges of the process. None is also
+    returned while the OVSDB connection is down.
+    """
+    global _ovsdb
+    if cfg.CONF.ovsdb_interface != 'native':
+        return
+    if _ovsdb is None:
+        _ovsdb = ovsdb_client.OvsdbClient(cfg.CONF.ovsdb_connection,
+                                          cfg.CONF.ovs_vsctl_timeout)
+    if _ovsdb.refresh():
+        return _ovsdb
+
 
 class VifPort:
     def __init__(self, port_name, ofport, vif_id, vif_mac, switch):
@@ -56,6 +85,81 @@ class VifPort:
                 self.switch.br_name)
 
 
+class BridgeSnapshot(object):
+    """State of the ports of a bridge, read at once.
+
+    Built by OVSBridge.get_snapshot() with a single OVSDB query, it answers
+    the get_vif_port_set(), get_port_tag_dict() and get_vif_port_by_id()
+    questions for the time of an agent polling iteration without reading
+    the database again.
+    """
+
+    def __init__(self, bridge, ports):
+        """Index the ports of a bridge.
+
+        :param bridge: the OVSBridge the snapshot was taken from.
+        :param ports: a dict for each port of the bridge holding its 'name'
+                      and 'tag', and the 'ofport' and 'external_ids' of the
+                      interface of the same name, if any.
+        """
+        self.bridge = bridge
+        self.ports_by_name = {}
+        self.vif_ports_by_id = {}
+        self.vif_ports_by_ofport = {}
+        for port in ports:
+            self.ports_by_name[port['name']] = port
+            vif_port = self._make_vif_port(port)
+            if vif_port:
+                self.vif_ports_by_id[vif_port.vif_id] = vif_port
+                self.vif_ports_by_ofport[vif_port.ofport] = vif_port
+
+    def _make_vif_port(self, port):
+        external_ids = port.get('external_ids') or {}
+        if "attached-mac" not in external_ids:
+            return
+        if "iface-id" in external_ids:
+            iface_id = external_ids["iface-id"]
+        elif "xs-vif-uuid" in external_ids:
+            # if this is a xenserver and iface-id is not automatically
+            # synced to OVS from XAPI, we grab it from XAPI directly
+            iface_id = self.bridge.get_xapi_iface_id(
+                external_ids["xs-vif-uuid"])
+        else:
+            return
+        # Do not consider VIFs which aren't yet ready, their ofport is []
+        ofport = port.get('ofport')
+        if not isinstance(ofport, int):
+            LOG.warn(_("Found not yet ready openvswitch port: %s"), port)
+            return
+        if ofport <= 0:
+            LOG.warn(_("Found failed openvswitch port: %s"), port)
+            return
+        return VifPort(port['name'], ofport, iface_id,
+                       external_ids["attached-mac"], self.bridge)
+
+    def get_port_name_list(self):
+        return sorted(self.ports_by_name)
+
+    def get_vif_port_set(self):
+        return set(self.vif_ports_by_id)
+
+    def get_vif_port_by_id(self, port_id):
+        return self.vif_ports_by_id.get(port_id)
+
+    def get_vif_port_by_ofport(self, ofport):
+        return self.vif_ports_by_ofport.get(ofport)
+
+    def get_port_tag_dict(self):
+        return dict((name, port['tag'])
+                    for name, port in self.ports_by_name.iteritems())
+
+    def get_port_tag(self, port_name):
+        """Return the tag of a port as db_get_val('Port', ..., 'tag')."""
+        port = self.ports_by_name.get(port_name)
+        if port is not None:
+            return _format_ovsdb_value(port['tag'])
+
+
 class BaseOVS(object):
 
     def __init__(self, root_helper):
@@ -73,6 +177,11 @@ class BaseOVS(object):
                           {'cmd': full_args, 'exception': e})
                 if not check_error:
                     ctxt.reraise = False
+        finally:
+            # Make the change visible to the next reads from the replica
+            ovsdb = get_ovsdb()
+            if ovsdb:
+                ovsdb.sync()
 
     def add_bridge(self, bridge_name):
         self.run_vsctl(["--", "--may-exist", "add-br", bridge_name])
@@ -82,6 +191,9 @@ class BaseOVS(object):
         self.run_vsctl(["--", "--if-exists", "del-br", bridge_name])
 
     def bridge_exists(self, bridge_name):
+        ovsdb = get_ovsdb()
+        if ovsdb:
+            return ovsdb.get_row('Bridge', bridge_name) is not None
         try:
             self.run_vsctl(['br-exists', bridge_name], check_error=True)
         except RuntimeError as e:
@@ -92,6 +204,9 @@ class BaseOVS(object):
         return True
 
     def get_bridge_name_for_port_name(self, port_name):
+        ovsdb = get_ovsdb()
+        if ovsdb:
+            return ovsdb.get_bridge_for_port(port_name)
         try:
             return self.run_vsctl(['port-to-br', port_name], check_error=True)
         except RuntimeError as e:
@@ -109,6 +224,11 @@ class OVSBridge(BaseOVS):
         self.br_name = br_name
         self.defer_apply_flows = False
         self.deferred_flows = {'add': '', 'mod': '', 'del': ''}
+        # Cookie set on the flows added or modified through this instance
+        self.flow_cookie = None
+        # Flows found on the bridge by start_flow_reconciliation that have
+        # not been added again since, indexed by _flow_key
+        self.stale_flows = None
 
     def set_controller(self, controller_names):
         vsctl_command = ['--', 'set-controller', self.br_name]
@@ -154,6 +274,15 @@ class OVSBridge(BaseOVS):
         args = ["set", table_name, record, "%s=%s" % (column, value)]
         self.run_vsctl(args)
 
+    def set_db_attributes(self, table_name, record, columns):
+        """Set several columns of a record at once.
+
+        :param columns: a list of (column, value) pairs.
+        """
+        args = ["set", table_name, record]
+        args += ["%s=%s" % (column, value) for column, value in columns]
+        self.run_vsctl(args)
+
     def clear_db_attribute(self, table_name, record, column):
         args = ["clear", table_name, record, column]
         self.run_vsctl(args)
@@ -174,6 +303,55 @@ class OVSBridge(BaseOVS):
     def remove_all_flows(self):
         self.run_ofctl("del-flows", [])
 
+    def dump_flows(self):
+        """Return the flows of the bridge.
+
+        Each flow is a dict with its cookie, table, priority, match (a
+        sorted tuple of fields) and actions.
+        """
+        output = self.run_ofctl("dump-flows", [])
+        if output is None:
+            return
+        return [_parse_flow_str(line) for line in output.splitlines()[1:]
+                if 'actions=' in line]
+
+    def set_flow_cookie(self, cookie):
+        self.flow_cookie = cookie
+
+    def start_flow_reconciliation(self):
+        """Keep the current flows while the flows are being set up again.
+
+        Flows added afterwards with the same match and actions as a flow
+        already on the bridge are not installed again, and the flows which
+        have not been added again are removed by cleanup_stale_flows, so
+        that the traffic is not interrupted while they are reprovisioned.
+        """
+        flows = self.dump_flows()
+        if flows is None:
+            LOG.warning(_("Unable to read the flows of bridge %s, removing "
+                          "them"), self.br_name)
+            self.remove_all_flows()
+            return
+        self.stale_flows = dict((_flow_key(flow), flow) for flow in flows
+                                if flow['cookie'] != self.flow_cookie)
+
+    def cleanup_stale_flows(self):
+        """Remove the flows left over by start_flow_reconciliation."""
+        stale_flows, self.stale_flows = self.stale_flows, None
+        if not stale_flows:
+            return
+        LOG.info(_("Removing %(count)d stale flows from bridge %(bridge)s"),
+                 {'count': len(stale_flows), 'bridge': self.br_name})
+        # A flow is only removed if it still has the cookie it had when the
+        # reconciliation started, not if it has been replaced since
+        flows = ''.join(
+            ','.join(('cookie=%s/-1' % flow['cookie'],
+                      'table=%s' % flow['table'],
+                      'priority=%s' % flow['priority']) +
+                     flow['match']) + '\n'
+            for flow in stale_flows.itervalues())
+        self.run_ofctl('del-flows', ['--strict', '-'], flows)
+
     def get_port_ofport(self, port_name):
         return self.db_get_val("Interface", port_name, "ofport")
 
@@ -182,13 +360,24 @@ class OVSBridge(BaseOVS):
                                self.br_name, 'datapath_id').strip('"')
 
     def add_flow(self, **kwargs):
+        if self.flow_cookie is not None:
+            kwargs.setdefault('cookie', self.flow_cookie)
         flow_str = _build_flow_expr_str(kwargs, 'add')
+        if self.stale_flows:
+            flow = _parse_flow_str(flow_str)
+            old_flow = self.stale_flows.pop(_flow_key(flow), None)
+            if (old_flow and
+                old_flow['actions'].lower() == flow['actions'].lower()):
+                # Already installed, keep the flow as it is
+                return
         if self.defer_apply_flows:
             self.deferred_flows['add'] += flow_str + '\n'
         else:
             self.run_ofctl("add-flow", [flow_str])
 
     def mod_flow(self, **kwargs):
+        if self.flow_cookie is not None:
+            kwargs.setdefault('cookie', self.flow_cookie)
         flow_str = _build_flow_expr_str(kwargs, 'mod')
         if self.defer_apply_flows:
             self.deferred_flows['mod'] += flow_str + '\n'
@@ -219,9 +408,8 @@ class OVSBridge(BaseOVS):
         self.defer_apply_flows = False
         self.deferred_flows = {'add': '', 'mod': '', 'del': ''}
 
-    def add_tunnel_port(self, port_name, remote_ip, local_ip,
-                        tunnel_type=p_const.TYPE_GRE,
-                        vxlan_udp_port=constants.VXLAN_UDP_PORT):
+    def _add_tunnel_port_args(self, port_name, remote_ip, local_ip,
+                              tunnel_type, vxlan_udp_port):
         vsctl_command = ["--", "--may-exist", "add-port", self.br_name,
                          port_name]
         vsctl_command.extend(["--", "set", "Interface", port_name,
@@ -234,16 +422,78 @@ class OVSBridge(BaseOVS):
                               "options:local_ip=%s" % local_ip,
                               "options:in_key=flow",
                               "options:out_key=flow"])
-        self.run_vsctl(vsctl_command)
+        return vsctl_command
+
+    def add_tunnel_port(self, port_name, remote_ip, local_ip,
+                        tunnel_type=p_const.TYPE_GRE,
+                        vxlan_udp_port=constants.VXLAN_UDP_PORT):
+        self.run_vsctl(self._add_tunnel_port_args(
+            port_name, remote_ip, local_ip, tunnel_type, vxlan_udp_port))
         return self.get_port_ofport(port_name)
 
+    def add_tunnel_ports(self, remote_ips, local_ip,
+                         tunnel_type=p_const.TYPE_GRE,
+                         vxlan_udp_port=constants.VXLAN_UDP_PORT):
+        """Add several tunnel ports in a single OVSDB transaction.
+
+        :param remote_ips: a dict mapping the names of the ports to the IP
+            addresses of their remote ends.
+        :returns: a dict mapping the names of the ports to their ofport, as
+            returned by get_port_ofport.
+        """
+        if not remote_ips:
+            return {}
+        vsctl_command = []
+        for port_name, remote_ip in sorted(remote_ips.items()):
+            vsctl_command.extend(self._add_tunnel_port_args(
+                port_name, remote_ip, local_ip, tunnel_type, vxlan_udp_port))
+        self.run_vsctl(vsctl_command)
+        return self.get_port_ofports(remote_ips.keys())
+
+    def get_port_ofports(self, port_names):
+        """Return a dict mapping the names of ports to their ofport.
+
+        The ofports of all the ports are read with a single query, ports
+        which do not exist are missing from the result.
+        """
+        ovsdb = get_ovsdb()
+        if ovsdb:
+            rows = [ovsdb.get_row('Interface', name) for name in port_names]
+            rows = [[row['name'], row['ofport']] for row in rows if row]
+        else:
+            args = ['--format=json', '--', '--columns=name,ofport', 'list',
+                    'Interface'] + sorted(port_names)
+            rows = [[row['name'], row['ofport']] for row in
+                    (_parse_vsctl_tables(self.run_vsctl(args)) or [[]])[0]]
+        return dict((name, _format_ovsdb_value(ofport))
+                    for name, ofport in rows)
+
     def add_patch_port(self, local_name, remote_name):
         self.run_vsctl(["add-port", self.br_name, local_name,
                         "--", "set", "Interface", local_name,
                         "type=patch", "options:peer=%s" % remote_name])
         return self.get_port_ofport(local_name)
 
+    def _get_monitored_ovsdb(self, table, column):
+        if column in ovsdb_client.MONITORED_COLUMNS.get(table, ()):
+            return get_ovsdb()
+
+    def _ovsdb_get(self, ovsdb, table, record, column, check_error):
+        row = ovsdb.get_row(table, record)
+        if row is None:
+            msg = (_("Record %(record)s not found in table %(table)s") %
+                   {'record': record, 'table': table})
+            if check_error:
+                raise RuntimeError(msg)
+            LOG.error(msg)
+            return
+        return row[column]
+
     def db_get_map(self, table, record, column, check_error=False):
+        ovsdb = self._get_monitored_ovsdb(table, column)
+        if ovsdb:
+            value = self._ovsdb_get(ovsdb, table, record, column, check_error)
+            return dict(value or {})
         output = self.run_vsctl(["get", table, record, column], check_error)
         if output:
             output_str = output.rstrip("\n\r")
@@ -251,6 +501,12 @@ class OVSBridge(BaseOVS):
         return {}
 
     def db_get_val(self, table, record, column, check_error=False):
+        ovsdb = self._get_monitored_ovsdb(table, column)
+        if ovsdb:
+            value = self._ovsdb_get(ovsdb, table, record, column, check_error)
+            if value is not None:
+                return _format_ovsdb_value(value)
+            return
         output = self.run_vsctl(["get", table, record, column], check_error)
         if output:
             return output.rstrip("\n\r")
@@ -266,6 +522,12 @@ class OVSBridge(BaseOVS):
         return ret
 
     def get_port_name_list(self):
+        ovsdb = get_ovsdb()
+        if ovsdb:
+            port_names = ovsdb.get_bridge_port_names(self.br_name)
+            if port_names is None:
+                raise RuntimeError(_("Bridge %s not found") % self.br_name)
+            return port_names
         res = self.run_vsctl(["list-ports", self.br_name], check_error=True)
         if res:
             return res.strip().split("\n")
@@ -309,23 +571,67 @@ class OVSBridge(BaseOVS):
 
         return edge_ports
 
+    def _list_rows(self, table, columns):
+        """Return the given columns of all the rows of a table.
+
+        Sets and maps are returned as lists and dicts.
+        """
+        ovsdb = get_ovsdb()
+        if ovsdb:
+            return [[row[column] for column in columns]
+                    for row in ovsdb.get_rows(table)]
+        args = ['--format=json', '--', '--columns=%s' % ','.join(columns),
+                'list', table]
+        result = self.run_vsctl(args, check_error=True)
+        if not result:
+            return []
+        return [[ovsdb_client.decode_value(value) for value in row]
+                for row in jsonutils.loads(result)['data']]
+
+    def get_snapshot(self):
+        """Return a BridgeSnapshot of the ports of the bridge."""
+        ovsdb = get_ovsdb()
+        if ovsdb:
+            bridge = ovsdb.get_row('Bridge', self.br_name)
+            if bridge is None:
+                raise RuntimeError(_("Bridge %s not found") % self.br_name)
+            port_rows = [ovsdb.get_row('Port', uuid)
+                         for uuid in ovsdb_client.as_list(bridge['ports'])]
+            ifaces = dict((row['name'], row)
+                          for row in ovsdb.get_rows('Interface'))
+        else:
+            args = ['--format=json',
+                    '--', '--columns=ports', 'list', 'Bridge', self.br_name,
+                    '--', '--columns=_uuid,name,tag', 'list', 'Port',
+                    '--', '--columns=name,ofport,external_ids',
+                    'list', 'Interface']
+            result = self.run_vsctl(args, check_error=True)
+            bridges, ports, ifaces = _parse_vsctl_tables(result)
+            port_uuids = set(ovsdb_client.as_list(bridges[0]['ports']))
+            port_rows = [row for row in ports if row['_uuid'] in port_uuids]
+            ifaces = dict((row['name'], row) for row in ifaces)
+        ports = []
+        for row in port_rows:
+            if not row or row['name'] == self.br_name:
+                # as with list-ports, the bridge local port is skipped
+                continue
+            iface = ifaces.get(row['name'], {})
+            ports.append({'name': row['name'], 'tag': row['tag'],
+                          'ofport': iface.get('ofport'),
+                          'external_ids': iface.get('external_ids')})
+        return BridgeSnapshot(self, ports)
+
     def get_vif_port_set(self):
         port_names = self.get_port_name_list()
         edge_ports = set()
-        args = ['--format=json', '--', '--columns=name,external_ids,ofport',
-                'list', 'Interface']
-        result = self.run_vsctl(args, check_error=True)
-        if not result:
-            return edge_ports
-        for row in jsonutils.loads(result)['data']:
-            name = row[0]
+        rows = self._list_rows('Interface', ['name', 'external_ids', 'ofport'])
+        for row in rows:
+            name, external_ids, ofport = row
             if name not in port_names:
                 continue
-            external_ids = dict(row[1][1])
             # Do not consider VIFs which aren't yet ready
             # This can happen when ofport values are either [] or ["set", []]
             # We will therefore consider only integer values for ofport
-            ofport = row[2]
             try:
                 int_ofport = int(ofport)
             except (ValueError, TypeError):
@@ -363,21 +669,37 @@ class OVSBridge(BaseOVS):
 
         """
         port_names = self.get_port_name_list()
-        args = ['--format=json', '--', '--columns=name,tag', 'list', 'Port']
-        result = self.run_vsctl(args, check_error=True)
         port_tag_dict = {}
-        if not result:
-            return port_tag_dict
-        for name, tag in jsonutils.loads(result)['data']:
+        # 'tag' is [] when it is not set
+        for name, tag in self._list_rows('Port', ['name', 'tag']):
             if name not in port_names:
                 continue
-            # 'tag' can be [u'set', []] or an integer
-            if isinstance(tag, list):
-                tag = tag[1]
             port_tag_dict[name] = tag
         return port_tag_dict
 
-    def get_vif_port_by_id(self, port_id):
+    def get_port_tags_and_other_config(self):
+        """Get a dict of port names and their tag and other_config.
+
+        e.g. {'patch-tun': ([], {}), 'tap1': (1, {'net_uuid': 'net1'})}
+
+        The other_config column is not monitored, it is read by ovs-vsctl.
+        """
+        port_names = set(self.get_port_name_list())
+        args = ['--format=json', '--', '--columns=name,tag,other_config',
+                'list', 'Port']
+        result = self.run_vsctl(args, check_error=True)
+        ports = (_parse_vsctl_tables(result) or [[]])[0]
+        return dict((port['name'], (port['tag'], port['other_config']))
+                    for port in ports if port['name'] in port_names)
+
+    def _find_interface_by_iface_id(self, port_id):
+        """Return the external_ids, name and ofport of a VIF interface."""
+        ovsdb = get_ovsdb()
+        if ovsdb:
+            for row in ovsdb.get_rows('Interface'):
+                if row['external_ids'].get('iface-id') == port_id:
+                    return row['external_ids'], row['name'], row['ofport']
+            return
         args = ['--format=json', '--', '--columns=external_ids,name,ofport',
                 'find', 'Interface',
                 'external_ids:iface-id="%s"' % port_id]
@@ -385,18 +707,26 @@ class OVSBridge(BaseOVS):
         if not result:
             return
         json_result = jsonutils.loads(result)
+        # Retrieve the indexes of the columns we're looking for
+        headings = json_result['headings']
+        ext_ids_idx = headings.index('external_ids')
+        name_idx = headings.index('name')
+        ofport_idx = headings.index('ofport')
+        # If data attribute is missing or empty the line below will raise
+        # an exeception which will be captured by the caller.
+        # We won't deal with the possibility of ovs-vsctl return multiple
+        # rows since the interface identifier is unique
+        data = json_result['data'][0]
+        ext_id_dict = dict((item[0], item[1]) for item in
+                           data[ext_ids_idx][1])
+        return ext_id_dict, data[name_idx], data[ofport_idx]
+
+    def get_vif_port_by_id(self, port_id):
         try:
-            # Retrieve the indexes of the columns we're looking for
-            headings = json_result['headings']
-            ext_ids_idx = headings.index('external_ids')
-            name_idx = headings.index('name')
-            ofport_idx = headings.index('ofport')
-            # If data attribute is missing or empty the line below will raise
-            # an exeception which will be captured in this block.
-            # We won't deal with the possibility of ovs-vsctl return multiple
-            # rows since the interface identifier is unique
-            data = json_result['data'][0]
-            port_name = data[name_idx]
+            iface = self._find_interface_by_iface_id(port_id)
+            if not iface:
+                return
+            ext_id_dict, port_name, ofport = iface
             switch = get_bridge_for_iface(self.root_helper, port_name)
             if switch != self.br_name:
                 LOG.info(_("Port: %(port_name)s is on %(switch)s,"
@@ -404,7 +734,6 @@ class OVSBridge(BaseOVS):
                                                     'switch': switch,
                                                     'br_name': self.br_name})
                 return
-            ofport = data[ofport_idx]
             # ofport must be integer otherwise return None
             if not isinstance(ofport, int) or ofport == -1:
                 LOG.warn(_("ofport: %(ofport)s for VIF: %(vif)s is not a "
@@ -412,8 +741,6 @@ class OVSBridge(BaseOVS):
                                                  'vif': port_id})
                 return
             # Find VIF's mac address in external ids
-            ext_id_dict = dict((item[0], item[1]) for item in
-                               data[ext_ids_idx][1])
             vif_mac = ext_id_dict['attached-mac']
             return VifPort(port_name, ofport, port_id, vif_mac, self)
         except Exception as e:
@@ -440,6 +767,12 @@ class OVSBridge(BaseOVS):
 
 
 def get_bridge_for_iface(root_helper, iface):
+    ovsdb = get_ovsdb()
+    if ovsdb:
+        bridge = ovsdb.get_bridge_for_interface(iface)
+        if not bridge:
+            LOG.error(_("Interface %s not found."), iface)
+        return bridge
     args = ["ovs-vsctl", "--timeout=%d" % cfg.CONF.ovs_vsctl_timeout,
             "iface-to-br", iface]
     try:
@@ -450,6 +783,9 @@ def get_bridge_for_iface(root_helper, iface):
 
 
 def get_bridges(root_helper):
+    ovsdb = get_ovsdb()
+    if ovsdb:
+        return sorted(row['name'] for row in ovsdb.get_rows('Bridge'))
     args = ["ovs-vsctl", "--timeout=%d" % cfg.CONF.ovs_vsctl_timeout,
             "list-br"]
     try:
@@ -489,6 +825,13 @@ def get_installed_kernel_version():
 
 
 def get_bridge_external_bridge_id(root_helper, bridge):
+    ovsdb = get_ovsdb()
+    if ovsdb:
+        row = ovsdb.get_row('Bridge', bridge)
+        if row is None:
+            LOG.error(_("Bridge %s not found."), bridge)
+            return
+        return row['external_ids'].get('bridge-id', '')
     args = ["ovs-vsctl", "--timeout=2", "br-get-external-id",
             bridge, "bridge-id"]
     try:
@@ -549,6 +892,94 @@ def check_ovs_vxlan_version(root_helper):
                                             'kernel', 'VXLAN')
 
 
+def check_ovs_arp_responder_version(root_helper):
+    """Return True if OVS can be used to answer ARP requests."""
+    installed_usr_version = get_installed_ovs_usr_version(root_helper)
+    LOG.debug(_("Checking OVS version for ARP responder support, installed "
+                "user version is %s"), installed_usr_version)
+    return bool(installed_usr_version) and (
+        dist_version.StrictVersion(installed_usr_version) >=
+        dist_version.StrictVersion(
+            constants.MINIMUM_OVS_ARP_RESPONDER_VERSION))
+
+
+def _parse_vsctl_tables(output):
+    """Parse the output of 'ovs-vsctl --format=json' list commands.
+
+    Return a list of rows, as dicts of decoded values, for each command.
+    """
+    tables = []
+    for table in ovsdb_client.JsonStream().feed(output or ''):
+        headings = table['headings']
+        tables.append([dict((column, ovsdb_client.decode_value(value))
+                            for column, value in zip(headings, row))
+                       for row in table['data']])
+    return tables
+
+
+# Flow fields printed by ovs-ofctl dump-flows which are not part of the flow
+FLOW_STATS_FIELDS = ('duration', 'n_packets', 'n_bytes', 'idle_age',
+                     'hard_age')
+# Flow fields which are not part of the match, with their default value
+FLOW_DEFAULTS = {'cookie': '0x0', 'table': '0', 'priority': '32768',
+                 'hard_timeout': '0', 'idle_timeout': '0'}
+
+
+def _parse_flow_str(flow_str):
+    """Parse a flow as returned by dump-flows or built for add-flow(s).
+
+    Fields are normalized so that the same flow parses equally from both.
+    """
+    fields, _sep, actions = flow_str.strip().partition('actions=')
+    flow = dict(FLOW_DEFAULTS)
+    match = []
+    for field in fields.replace(' ', ',').split(','):
+        name, _sep, value = field.partition('=')
+        if not name or name in FLOW_STATS_FIELDS:
+            continue
+        if name in FLOW_DEFAULTS:
+            flow[name] = value
+        else:
+            match.append(field)
+    if flow['cookie'].isdigit():
+        flow['cookie'] = hex(int(flow['cookie'])).rstrip('L')
+    flow['match'] = tuple(sorted(match))
+    flow['actions'] = actions
+    return flow
+
+
+def _flow_key(flow):
+    # ovs-ofctl does not print names and keywords in the case they were
+    # given, e.g. actions=normal is dumped as actions=NORMAL
+    return (flow['table'], flow['priority'],
+            tuple(sorted(field.lower() for field in flow['match'])))
+
+
+def _ovsdb_string_needs_quotes(value):
+    if not value or not (value[0].isalpha() or value[0] == '_'):
+        return True
+    if value in ('true', 'false'):
+        return True
+    return not all(c.isalpha() or c in '_-.' for c in value)
+
+
+def _format_ovsdb_value(value):
+    """Format a value of the replica the way 'ovs-vsctl get' prints it."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, basestring):
+        if _ovsdb_string_needs_quotes(value):
+            return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+        return value
+    if isinstance(value, list):
+        return '[%s]' % ', '.join(_format_ovsdb_value(v) for v in value)
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join(
+            '%s=%s' % (_format_ovsdb_value(k), _format_ovsdb_value(v))
+            for k, v in sorted(value.items()))
+    return str(value)
+
+
 def _build_flow_expr_str(flow_dict, cmd):
     flow_expr_arr = []
     actions = None
@@ -0,0 +1,335 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import select
+import socket
+import threading
+import time
+
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+OVSDB_DB_NAME = 'Open_vSwitch'
+# Columns mirrored in the local replica, for each monitored table
+MONITORED_COLUMNS = {
+    'Bridge': ['name', 'ports', 'datapath_id', 'external_ids'],
+    'Port': ['name', 'interfaces', 'tag'],
+    'Interface': ['name', 'ofport', 'external_ids', 'type'],
+}
+# Minimum number of seconds between two connection attempts
+RECONNECT_INTERVAL = 5
+RECV_SIZE = 65536
+
+
+class OvsdbError(RuntimeError):
+    pass
+
+
+# ValueError is raised on malformed JSON
+CONNECTION_ERRORS = (socket.error, IOError, ValueError, OvsdbError)
+
+
+def decode_value(value):
+    """Convert an OVSDB wire value to python.
+
+    Sets are returned as lists, maps as dicts and uuids as strings.
+    A set holding a single element may be sent as a bare atom.
+    """
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind == 'set':
+            return [decode_value(v) for v in data]
+        if kind == 'map':
+            return dict((decode_value(k), decode_value(v)) for k, v in data)
+        if kind in ('uuid', 'named-uuid'):
+            return data
+    return value
+
+
+def as_list(value):
+    """Return a decoded set column value as a list."""
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+class JsonStream(object):
+    """Split the byte stream of an OVSDB connection into JSON messages.
+
+    OVSDB JSON-RPC messages are simply concatenated on the wire, a message
+    is complete once the curly brackets opened by its first character are
+    balanced again.
+    """
+
+    def __init__(self):
+        self.buf = ''
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, data):
+        msgs = []
+        start = 0
+        scanned = len(self.buf)
+        self.buf += data
+        for i in xrange(scanned, len(self.buf)):
+            c = self.buf[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == '\\':
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c in '{[':
+                self.depth += 1
+            elif c in '}]':
+                self.depth -= 1
+                if not self.depth:
+                    msgs.append(jsonutils.loads(self.buf[start:i + 1]))
+                    start = i + 1
+        self.buf = self.buf[start:]
+        return msgs
+
+
+class OvsdbClient(object):
+    """Persistent OVSDB JSON-RPC connection with a local table replica.
+
+    The client monitors the tables of MONITORED_COLUMNS and applies the
+    updates pushed by ovsdb-server to its in-memory copy, so that reads do
+    not need to run any ovs-vsctl command. refresh() must be called before
+    reading to apply the pending updates, and sync() after a change made
+    through another connection to make sure it has been received.
+    """
+
+    def __init__(self, connection, timeout):
+        self.connection = connection
+        self.timeout = timeout
+        self.sock = None
+        self.stream = None
+        # messages received but not handled yet
+        self.pending = collections.deque()
+        # table name -> row uuid -> row
+        self.tables = {}
+        # table name -> row name -> row uuid
+        self.names = {}
+        # child row uuid -> parent row uuid, for Port and Interface rows
+        self.parents = {}
+        self.parents_dirty = True
+        self.next_id = 0
+        self.next_connect = 0
+        self.lock = threading.RLock()
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def _create_socket(self):
+        proto, _sep, address = self.connection.partition(':')
+        if proto == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        elif proto == 'tcp':
+            host, _sep, port = address.rpartition(':')
+            address = (host, int(port))
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        else:
+            raise OvsdbError(_("Unsupported OVSDB connection %s") %
+                             self.connection)
+        sock.settimeout(self.timeout)
+        sock.connect(address)
+        return sock
+
+    def connect(self):
+        with self.lock:
+            self.close()
+            self.next_connect = time.time() + RECONNECT_INTERVAL
+            self.sock = self._create_socket()
+            self.stream = JsonStream()
+            self.tables = dict((table, {}) for table in MONITORED_COLUMNS)
+            self.names = dict((table, {}) for table in MONITORED_COLUMNS)
+            self.parents_dirty = True
+            try:
+                monitor_requests = dict(
+                    (table, {'columns': columns})
+                    for table, columns in MONITORED_COLUMNS.iteritems())
+                self._apply_updates(self._call(
+                    'monitor', [OVSDB_DB_NAME, None, monitor_requests]))
+            except Exception:
+                self.close()
+                raise
+            LOG.info(_("Connected to OVSDB at %s"), self.connection)
+
+    def close(self):
+        with self.lock:
+            if self.sock:
+                self.sock.close()
+            self.sock = None
+            self.stream = None
+            self.pending.clear()
+
+    def refresh(self):
+        """Apply pending updates, connecting if needed.
+
+        Return False if the replica could not be brought up to date.
+        """
+        with self.lock:
+            try:
+                if self.sock:
+                    while True:
+                        while self.pending:
+                            self._handle_message(self.pending.popleft())
+                        if not select.select([self.sock], [], [], 0)[0]:
+                            return True
+                        self._recv()
+                if time.time() >= self.next_connect:
+                    self.connect()
+                    return True
+            except CONNECTION_ERRORS as e:
+                self._connection_failed(e)
+            return False
+
+    def sync(self):
+        """Wait until the changes already committed have been received.
+
+        ovsdb-server sends the monitor updates of a transaction before it
+        answers any later request on the same connection.
+        """
+        with self.lock:
+            if not self.refresh():
+                return False
+            try:
+                self._call('echo', [])
+                return True
+            except CONNECTION_ERRORS as e:
+                self._connection_failed(e)
+            return False
+
+    def _connection_failed(self, error):
+        LOG.warn(_("OVSDB connection to %(connection)s failed: %(error)s"),
+                 {'connection': self.connection, 'error': error})
+        self.close()
+
+    def _send(self, msg):
+        self.sock.sendall(jsonutils.dumps(msg))
+
+    def _recv(self):
+        data = self.sock.recv(RECV_SIZE)
+        if not data:
+            raise IOError(_("connection closed by the server"))
+        self.pending.extend(self.stream.feed(data))
+
+    def _call(self, method, params):
+        self.next_id += 1
+        request_id = self.next_id
+        self._send({'method': method, 'params': params, 'id': request_id})
+        while True:
+            while not self.pending:
+                self._recv()
+            msg = self.pending.popleft()
+            if 'method' in msg or msg.get('id') != request_id:
+                self._handle_message(msg)
+                continue
+            if msg.get('error'):
+                raise OvsdbError(_("OVSDB %(method)s failed: %(error)s") %
+                                 {'method': method, 'error': msg['error']})
+            return msg.get('result')
+
+    def _handle_message(self, msg):
+        method = msg.get('method')
+        if method == 'update':
+            self._apply_updates(msg['params'][1])
+        elif method == 'echo':
+            self._send({'result': msg['params'], 'error': None,
+                        'id': msg['id']})
+        else:
+            LOG.debug(_("Ignoring unexpected OVSDB message %s"), msg)
+
+    def _apply_updates(self, table_updates):
+        for table, row_updates in table_updates.iteritems():
+            rows = self.tables.setdefault(table, {})
+            names = self.names.setdefault(table, {})
+            for uuid, row_update in row_updates.iteritems():
+                old = rows.pop(uuid, None)
+                # A row with the same name may have been inserted by the
+                # same update, before or after this one is handled
+                if old is not None and names.get(old.get('name')) == uuid:
+                    del names[old.get('name')]
+                new = row_update.get('new')
+                if new is not None:
+                    row = dict((column, decode_value(value))
+                               for column, value in new.iteritems())
+                    row['_uuid'] = uuid
+                    rows[uuid] = row
+                    names[row.get('name')] = uuid
+            if table in ('Bridge', 'Port'):
+                self.parents_dirty = True
+
+    def _update_parents(self):
+        if not self.parents_dirty:
+            return
+        self.parents = {}
+        for table, column in (('Bridge', 'ports'), ('Port', 'interfaces')):
+            for uuid, row in self.tables.get(table, {}).iteritems():
+                for child in as_list(row.get(column, [])):
+                    self.parents[child] = uuid
+        self.parents_dirty = False
+
+    def get_row(self, table, record):
+        """Return the row of table named or identified by record."""
+        rows = self.tables.get(table, {})
+        uuid = self.names.get(table, {}).get(record, record)
+        return rows.get(uuid)
+
+    def get_rows(self, table):
+        return self.tables.get(table, {}).values()
+
+    def get_bridge_port_names(self, br_name):
+        """Return the names of the ports of a bridge, None if it is unknown.
+
+        As with ovs-vsctl list-ports, the bridge local port is not listed.
+        """
+        bridge = self.get_row('Bridge', br_name)
+        if bridge is None:
+            return
+        ports = self.tables.get('Port', {})
+        names = [ports[uuid]['name'] for uuid in as_list(bridge['ports'])
+                 if uuid in ports]
+        return sorted(name for name in names if name != br_name)
+
+    def get_bridge_for_port(self, port_name):
+        port = self.get_row('Port', port_name)
+        if port is not None:
+            return self._get_parent_name('Bridge', port['_uuid'])
+
+    def get_bridge_for_interface(self, iface_name):
+        iface = self.get_row('Interface', iface_name)
+        if iface is not None:
+            self._update_parents()
+            port_uuid = self.parents.get(iface['_uuid'])
+            if port_uuid:
+                return self._get_parent_name('Bridge', port_uuid)
+
+    def _get_parent_name(self, table, uuid):
+        self._update_parents()
+        parent = self.tables.get(table, {}).get(self.parents.get(uuid))
+        if parent is not None:
+            return parent['name']
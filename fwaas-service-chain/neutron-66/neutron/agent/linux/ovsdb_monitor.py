@@ -17,6 +17,8 @@
 import eventlet
 
 from neutron.agent.linux import async_process
+from neutron.agent.linux import ovsdb_client
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 
 
@@ -67,17 +69,26 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
     The has_updates() method indicates whether changes to the ovsdb
     Interface table have been detected since the monitor started or
     since the previous access.
+
+    The changes themselves are returned by get_events(), in the order they
+    were received, as dicts holding the 'name', 'ofport' and 'external_ids'
+    of the interface and an 'action' among 'added', 'removed' and
+    'modified'. 'modified' events also list the 'changed' columns.
     """
 
     def __init__(self, root_helper=None, respawn_interval=None):
         super(SimpleInterfaceMonitor, self).__init__(
             'Interface',
-            columns=['name', 'ofport'],
+            columns=['name', 'ofport', 'external_ids'],
             format='json',
             root_helper=root_helper,
             respawn_interval=respawn_interval,
         )
         self.data_received = False
+        self.new_events = []
+        # Events may have been lost until the first full scan done after
+        # the monitor became active
+        self.events_missed = True
 
     @property
     def is_active(self):
@@ -94,7 +105,62 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
         the absence of updates at the expense of potential false
         positives.
         """
-        return bool(list(self.iter_stdout())) or not self.is_active
+        return bool(self.process_events()) or not self.is_active
+
+    def process_events(self):
+        """Parse the received output into interface events.
+
+        Return the number of output lines processed.
+        """
+        lines = list(self.iter_stdout())
+        for line in lines:
+            try:
+                output = jsonutils.loads(line)
+                headings = output['headings']
+                rows = output['data']
+            except (ValueError, KeyError, TypeError):
+                LOG.warn(_("Unable to parse ovsdb monitor output: %s"), line)
+                self.events_missed = True
+                continue
+            old_rows = {}
+            for data in rows:
+                row = dict(zip(headings, data))
+                uuid = row.pop('row')
+                action = row.pop('action')
+                if action == 'old':
+                    # only the changed columns are filled
+                    old_rows[uuid] = row
+                    continue
+                event = dict((column, ovsdb_client.decode_value(value))
+                             for column, value in row.iteritems())
+                if action in ('initial', 'insert'):
+                    event['action'] = 'added'
+                elif action == 'delete':
+                    event['action'] = 'removed'
+                else:
+                    event['action'] = 'modified'
+                    event['changed'] = [
+                        column for column, value in
+                        old_rows.pop(uuid, {}).iteritems() if value != '']
+                self.new_events.append(event)
+        return len(lines)
+
+    def get_events(self):
+        """Return the interface events received since the previous call.
+
+        None is returned when events may have been missed, because the
+        monitor is not active or has been restarted: the caller must then
+        scan all the interfaces instead.
+        """
+        self.process_events()
+        events, self.new_events = self.new_events, []
+        if not self.is_active:
+            self.events_missed = True
+            return
+        if self.events_missed:
+            self.events_missed = False
+            return
+        return events
 
     def start(self, block=False, timeout=5):
         super(SimpleInterfaceMonitor, self).start()
@@ -105,6 +171,7 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
 
     def _kill(self, *args, **kwargs):
         self.data_received = False
+        self.events_missed = True
         super(SimpleInterfaceMonitor, self)._kill(*args, **kwargs)
 
     def _read_stdout(self):
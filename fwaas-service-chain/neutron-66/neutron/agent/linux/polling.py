@@ -56,6 +56,13 @@ class BasePollingManager(object):
     def _is_polling_required(self):
         raise NotImplemented
 
+    def get_events(self):
+        """Return the interface events since the previous polling.
+
+        None means that the caller must scan all the interfaces.
+        """
+        return
+
     @property
     def is_polling_required(self):
         # Always consume the updates to minimize polling.
@@ -100,6 +107,7 @@ class InterfacePollingMinimizer(BasePollingManager):
         self._monitor = ovsdb_monitor.SimpleInterfaceMonitor(
             root_helper=root_helper,
             respawn_interval=ovsdb_monitor_respawn_interval)
+        self._full_scan_required = True
 
     def start(self):
         self._monitor.start()
@@ -107,8 +115,23 @@ class InterfacePollingMinimizer(BasePollingManager):
     def stop(self):
         self._monitor.stop()
 
+    def force_polling(self):
+        super(InterfacePollingMinimizer, self).force_polling()
+        self._full_scan_required = True
+
+    def polling_completed(self):
+        super(InterfacePollingMinimizer, self).polling_completed()
+        self._full_scan_required = False
+
     def _is_polling_required(self):
         # Maximize the chances of update detection having a chance to
         # collect output.
         eventlet.sleep()
         return self._monitor.has_updates
+
+    def get_events(self):
+        # The monitor events are consumed even when they are not used, a
+        # full scan covers them
+        events = self._monitor.get_events()
+        if not self._full_scan_required:
+            return events
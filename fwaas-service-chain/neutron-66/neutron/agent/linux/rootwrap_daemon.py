@@ -0,0 +1,394 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-lived privileged helper running the commands of an agent.
+
+Running each privileged command through sudo and neutron-rootwrap starts a
+new python interpreter and parses the rootwrap configuration every time.
+The daemon is started once per agent, as root, with the rootwrap
+configuration file and checks the commands against the same filters.
+
+The daemon creates a unix socket in a private directory, owned by the user
+who started it through sudo, and writes its path and a random key on its
+standard output. It exits when its standard input is closed, which happens
+when the agent exits.
+
+Each message is a JSON document preceded by its length. A client first
+sends {"key": <key>}, then requests made of a list of commands:
+    {"commands": [{"cmd": [...], "stdin": <data or null>}, ...]}
+which are answered with one result for each command:
+    {"results": [{"returncode": ..., "stdout": ..., "stderr": ...}, ...]}
+Byte strings are sent as latin-1 decoded strings. A command rejected by
+the filters gets the return code of neutron-rootwrap for that case.
+
+The filters only see the arguments of the commands. The commands an
+'ip -batch -' reads on its standard input are checked by the daemon, only
+link, addr, route and neigh commands are accepted.
+"""
+
+import os
+import re
+import shlex
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+
+from eventlet.green import subprocess as green_subprocess
+from oslo.config import cfg
+
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Return codes of neutron-rootwrap
+RC_UNAUTHORIZED = 99
+RC_NOEXECFOUND = 96
+
+# Commands ip -batch may read on its standard input
+IP_BATCH_COMMANDS = frozenset(['link', 'addr', 'route', 'neigh'])
+# Quotes, escapes and comments would change how ip splits the lines
+IP_BATCH_WORD = re.compile(r'^[\w.:/@%+-]+$')
+
+HEADER = struct.Struct('!I')
+# Biggest message accepted, iptables-save outputs can be large
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+
+class RootwrapDaemonError(Exception):
+    pass
+
+
+def _encode(data):
+    if data is None:
+        return None
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    return data.decode('latin-1')
+
+
+def _decode(data):
+    if data is None:
+        return None
+    return data.encode('latin-1')
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise RootwrapDaemonError(_("Connection closed"))
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def send_message(sock, msg):
+    data = jsonutils.dumps(msg)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    size = HEADER.unpack(_recv_exactly(sock, HEADER.size))[0]
+    if size > MAX_MESSAGE_SIZE:
+        raise RootwrapDaemonError(_("Message too big: %d bytes") % size)
+    return jsonutils.loads(_recv_exactly(sock, size))
+
+
+def _subprocess_setup():
+    # Python installs a SIGPIPE handler by default. This is usually not what
+    # non-Python subprocesses expect.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def _is_ip_option(arg, option, min_length):
+    # ip accepts abbreviated options, with one or two leading dashes
+    if arg.startswith('--'):
+        arg = arg[1:]
+    return len(arg) >= min_length and option.startswith(arg)
+
+
+def check_ip_batch(userargs, process_input):
+    """Return whether an ip command reading a batch may be run.
+
+    A batch must be read from the standard input, and only be made of
+    link, addr, route and neigh commands. The commands other than ip are
+    left to the filters.
+    """
+    if userargs[:3] == ['ip', 'netns', 'exec']:
+        userargs = userargs[4:]
+    if not userargs or os.path.basename(userargs[0]) != 'ip':
+        return True
+    args = userargs[1:]
+    if not [arg for arg in args
+            if _is_ip_option(arg, '-batch', 2) or
+            _is_ip_option(arg, '-force', 3)]:
+        return True
+    if args != ['-batch', '-']:
+        return False
+    for line in (process_input or '').splitlines():
+        words = line.split()
+        if words and (words[0] not in IP_BATCH_COMMANDS or
+                      not all(IP_BATCH_WORD.match(word) for word in words)):
+            return False
+    return True
+
+
+def run_command(cmd, env, process_input):
+    """Run a command and return its return code, stdout and stderr."""
+    obj = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           preexec_fn=_subprocess_setup, env=env)
+    stdout, stderr = obj.communicate(process_input)
+    return obj.returncode, stdout, stderr
+
+
+class RootwrapDaemon(object):
+    """Server side, running as root.
+
+    filters and exec_dirs are those of the rootwrap configuration, runner
+    is called with the command, its environment and input to run it.
+    """
+
+    def __init__(self, filters, exec_dirs, key, runner=run_command):
+        self.filters = filters
+        self.exec_dirs = exec_dirs
+        self.key = key
+        self.runner = runner
+        self.listener = None
+        self.running = False
+
+    def run_command(self, userargs, process_input):
+        # Imported here as only the daemon needs the rootwrap filters
+        from oslo.rootwrap import wrapper
+
+        if not check_ip_batch(userargs, process_input):
+            return (RC_UNAUTHORIZED, '',
+                    "Unauthorized command: %s (ip batch rejected)\n" %
+                    ' '.join(userargs))
+        try:
+            filtermatch = wrapper.match_filter(self.filters, userargs,
+                                               exec_dirs=self.exec_dirs)
+            command = filtermatch.get_command(userargs,
+                                              exec_dirs=self.exec_dirs)
+            env = filtermatch.get_environment(userargs)
+        except wrapper.FilterMatchNotExecutable as exc:
+            return (RC_NOEXECFOUND, '',
+                    "Executable not found: %s (filter match = %s)\n" %
+                    (exc.match.exec_path, exc.match.name))
+        except wrapper.NoFilterMatched:
+            return (RC_UNAUTHORIZED, '',
+                    "Unauthorized command: %s (no filter matched)\n" %
+                    ' '.join(userargs))
+        try:
+            return self.runner(command, env, process_input)
+        except OSError as e:
+            return (RC_NOEXECFOUND, '', "%s\n" % e)
+
+    def handle_request(self, request):
+        results = []
+        for command in request['commands']:
+            userargs = [str(arg) for arg in command['cmd']]
+            returncode, stdout, stderr = self.run_command(
+                userargs, _decode(command.get('stdin')))
+            results.append({'returncode': returncode,
+                            'stdout': _encode(stdout),
+                            'stderr': _encode(stderr)})
+        return {'results': results}
+
+    def _serve(self, conn):
+        try:
+            if recv_message(conn).get('key') != self.key:
+                return
+            send_message(conn, {'authenticated': True})
+            while self.running:
+                send_message(conn, self.handle_request(recv_message(conn)))
+        except (RootwrapDaemonError, socket.error, ValueError, KeyError):
+            pass
+        finally:
+            conn.close()
+
+    def start(self, path):
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(64)
+        self.running = True
+        thread = threading.Thread(target=self._accept_loop)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.listener:
+            self.listener.shutdown(socket.SHUT_RDWR)
+            self.listener.close()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _addr = self.listener.accept()
+            except socket.error:
+                continue
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+
+def main():
+    """Entry point of neutron-rootwrap-daemon, run as root."""
+    from oslo.rootwrap import wrapper
+    from six import moves
+
+    if len(sys.argv) != 2:
+        sys.stderr.write("Usage: %s <rootwrap config file>\n" % sys.argv[0])
+        sys.exit(1)
+    rawconfig = moves.configparser.RawConfigParser()
+    rawconfig.read(sys.argv[1])
+    config = wrapper.RootwrapConfig(rawconfig)
+    filters = wrapper.load_filters(config.filters_path)
+
+    temp_dir = tempfile.mkdtemp(prefix='neutron-rootwrap-')
+    try:
+        # Only the user running the agent can connect
+        if 'SUDO_UID' in os.environ:
+            os.chown(temp_dir, int(os.environ['SUDO_UID']),
+                     int(os.environ.get('SUDO_GID', -1)))
+        path = os.path.join(temp_dir, 'rootwrap.sock')
+        daemon = RootwrapDaemon(filters, config.exec_dirs,
+                                uuid.uuid4().hex)
+        daemon.start(path)
+        if 'SUDO_UID' in os.environ:
+            os.chown(path, int(os.environ['SUDO_UID']),
+                     int(os.environ.get('SUDO_GID', -1)))
+        sys.stdout.write('%s\n%s\n' % (path, daemon.key))
+        sys.stdout.flush()
+        # Wait for the agent to exit
+        while sys.stdin.read(4096):
+            pass
+        daemon.stop()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class RootwrapDaemonClient(object):
+    """Client of the daemon, used by the agents.
+
+    The daemon is started on the first call. Connections are kept open
+    and reused, one being used by a single caller at a time.
+    """
+
+    def __init__(self, daemon_cmd):
+        self.daemon_cmd = daemon_cmd
+        self.process = None
+        self.path = None
+        self.key = None
+        self.idle_connections = []
+        self.lock = threading.Lock()
+
+    def _start_daemon(self):
+        cmd = shlex.split(self.daemon_cmd)
+        LOG.info(_("Starting rootwrap daemon: %s"), cmd)
+        self.process = green_subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE)
+        self.path = self.process.stdout.readline().strip()
+        self.key = self.process.stdout.readline().strip()
+        if not self.path or not self.key:
+            self.process = None
+            raise RootwrapDaemonError(_("Rootwrap daemon %s failed to "
+                                        "start") % self.daemon_cmd)
+
+    def _connect(self):
+        with self.lock:
+            if self.idle_connections:
+                return self.idle_connections.pop()
+            if self.process is None:
+                self._start_daemon()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            send_message(sock, {'key': self.key})
+            if not recv_message(sock).get('authenticated'):
+                raise RootwrapDaemonError(_("Rootwrap daemon refused the "
+                                            "connection"))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def connect(self):
+        """Return a connection to the daemon, starting it if needed.
+
+        Raise RootwrapDaemonError if the daemon cannot be used, in which
+        case no command was sent.
+        """
+        try:
+            return self._connect()
+        except (OSError, socket.error, ValueError) as e:
+            raise RootwrapDaemonError(e)
+
+    def execute(self, commands, sock=None):
+        """Run commands, a list of (cmd, process_input) tuples.
+
+        Return a list of (returncode, stdout, stderr) tuples.
+        """
+        sock = sock or self.connect()
+        try:
+            send_message(sock, {'commands': [
+                {'cmd': [str(arg) for arg in cmd],
+                 'stdin': _encode(process_input)}
+                for cmd, process_input in commands]})
+            results = recv_message(sock)['results']
+        except Exception:
+            sock.close()
+            raise
+        with self.lock:
+            self.idle_connections.append(sock)
+        return [(result['returncode'], _decode(result['stdout']),
+                 _decode(result['stderr'])) for result in results]
+
+
+_client = None
+_client_failed = False
+
+
+def get_client():
+    """Return the client of the configured daemon, None if there is none."""
+    global _client
+    try:
+        daemon_cmd = cfg.CONF.AGENT.root_helper_daemon
+    except (cfg.NoSuchOptError, cfg.NoSuchGroupError):
+        return
+    if not daemon_cmd or _client_failed:
+        return
+    if _client is None or _client.daemon_cmd != daemon_cmd:
+        _client = RootwrapDaemonClient(daemon_cmd)
+    return _client
+
+
+def disable_client(error):
+    """Fall back to the root helper after a failure to use the daemon."""
+    global _client_failed
+    LOG.error(_("Unable to use the rootwrap daemon, falling back to the "
+                "root helper: %s"), error)
+    _client_failed = True
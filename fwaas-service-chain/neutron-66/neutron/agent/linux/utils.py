@@ -27,6 +27,7 @@ import tempfile
 from eventlet.green import subprocess
 from eventlet import greenthread
 
+from neutron.agent.linux import rootwrap_daemon
 from neutron.common import utils
 from neutron.openstack.common import excutils
 from neutron.openstack.common import log as logging
@@ -59,20 +60,49 @@ def create_process(cmd, root_helper=None, addl_env=None):
     return obj, cmd
 
 
+def _execute_with_daemon(client, cmd, process_input):
+    """Run a command through the rootwrap daemon.
+
+    Return None when the daemon cannot be used, the command was not sent.
+    """
+    try:
+        sock = client.connect()
+    except rootwrap_daemon.RootwrapDaemonError as e:
+        rootwrap_daemon.disable_client(e)
+        return
+    try:
+        return client.execute([(cmd, process_input)], sock=sock)[0]
+    except Exception as e:
+        raise RuntimeError(_("Rootwrap daemon failed to run %(cmd)s: "
+                             "%(error)s") % {'cmd': cmd, 'error': e})
+
+
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
     try:
-        obj, cmd = create_process(cmd, root_helper=root_helper,
-                                  addl_env=addl_env)
-        _stdout, _stderr = (process_input and
-                            obj.communicate(process_input) or
-                            obj.communicate())
-        obj.stdin.close()
+        result = None
+        # The daemon does not pass an environment to the commands, as
+        # sudo does not either
+        client = root_helper and not addl_env and rootwrap_daemon.get_client()
+        if client:
+            cmd = map(str, cmd)
+            LOG.debug(_("Running command (rootwrap daemon): %s"), cmd)
+            result = _execute_with_daemon(client, cmd, process_input)
+        if result:
+            returncode, _stdout, _stderr = result
+        else:
+            obj, cmd = create_process(cmd, root_helper=root_helper,
+                                      addl_env=addl_env)
+            _stdout, _stderr = (process_input and
+                                obj.communicate(process_input) or
+                                obj.communicate())
+            obj.stdin.close()
+            returncode = obj.returncode
         m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                        'stdout': _stdout, 'stderr': _stderr}
         LOG.debug(m)
-        if obj.returncode and check_exit_code:
+        if returncode and check_exit_code:
             raise RuntimeError(m)
     finally:
         # NOTE(termie): this appears to be necessary to let the subprocess
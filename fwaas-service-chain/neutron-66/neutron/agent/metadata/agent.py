@@ -16,12 +16,15 @@
 #
 # @author: Mark McClain, DreamHost
 
+import collections
 import hashlib
 import hmac
 import os
 import socket
+import time
 
 import eventlet
+from eventlet import pools
 import httplib2
 from neutronclient.v2_0 import client
 from oslo.config import cfg
@@ -44,6 +47,92 @@ from neutron import wsgi
 LOG = logging.getLogger(__name__)
 
 
+class LookupCache(object):
+    """Cache of the results of the lookups made by the metadata proxy.
+
+    Entries expire ttl seconds after they were added. When the cache is
+    full, the least recently used entry is evicted. A size or ttl of 0
+    disables the cache.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        # key -> (expiration time, value), least recently used first
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the value of key, None if it is unknown or expired."""
+        entry = self.entries.pop(key, None)
+        if entry is not None and entry[0] > time.time():
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+
+    def put(self, key, value):
+        if self.size < 1 or self.ttl <= 0:
+            return
+        self.entries.pop(key, None)
+        while len(self.entries) >= self.size:
+            self.entries.popitem(last=False)
+        self.entries[key] = (time.time() + self.ttl, value)
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries)}
+
+
+class HttpConnectionPool(pools.Pool):
+    """Bounded pool of keep-alive HTTP connections.
+
+    Each item is an httplib2.Http object, which keeps its connections open
+    between requests. Green threads wait for a free item when max_size
+    requests are running. An item is replaced by a new one after
+    max_requests requests, after a failed request, or when it was idle for
+    more than idle_timeout seconds, as the server may have closed its
+    connection in the meantime.
+    """
+
+    def __init__(self, max_size, max_requests, idle_timeout):
+        self.max_requests = max_requests
+        self.idle_timeout = idle_timeout
+        super(HttpConnectionPool, self).__init__(max_size=max_size)
+
+    def create(self):
+        http = httplib2.Http()
+        http.request_count = 0
+        http.last_used = time.time()
+        return http
+
+    def _close(self, http):
+        for conn in http.connections.values():
+            conn.close()
+        http.connections.clear()
+
+    def request(self, url, **kwargs):
+        """Send a request with a pooled connection like httplib2 does."""
+        http = self.get()
+        healthy = False
+        try:
+            if time.time() - http.last_used > self.idle_timeout:
+                self._close(http)
+            resp, content = http.request(url, **kwargs)
+            http.request_count += 1
+            http.last_used = time.time()
+            healthy = (http.request_count < self.max_requests and
+                       resp.get('connection') != 'close')
+            return resp, content
+        finally:
+            if not healthy:
+                self._close(http)
+                http = self.create()
+            self.put(http)
+
+
 class MetadataProxyHandler(object):
     OPTS = [
         cfg.StrOpt('admin_user',
@@ -79,12 +168,34 @@ class MetadataProxyHandler(object):
         cfg.StrOpt('metadata_proxy_shared_secret',
                    default='',
                    help=_('Shared secret to sign instance-id request'),
-                   secret=True)
+                   secret=True),
+        cfg.IntOpt('lookup_cache_size', default=1024,
+                   help=_("Maximum number of router networks and instance "
+                          "ids cached by the metadata proxy, 0 to disable "
+                          "the cache.")),
+        cfg.IntOpt('lookup_cache_ttl', default=5,
+                   help=_("Number of seconds the router networks and the "
+                          "instance ids are cached by the metadata proxy.")),
+        cfg.IntOpt('nova_metadata_pool_size', default=32,
+                   help=_("Maximum number of connections to the Nova "
+                          "metadata server kept open by each metadata "
+                          "proxy process.")),
+        cfg.IntOpt('nova_metadata_max_requests_per_connection', default=100,
+                   help=_("Number of requests sent to the Nova metadata "
+                          "server on a connection before it is closed.")),
+        cfg.IntOpt('nova_metadata_idle_timeout', default=30,
+                   help=_("Number of seconds after which an idle connection "
+                          "to the Nova metadata server is not reused."))
     ]
 
     def __init__(self, conf):
         self.conf = conf
         self.auth_info = {}
+        self.cache = LookupCache(conf.lookup_cache_size, conf.lookup_cache_ttl)
+        self.http_pool = HttpConnectionPool(
+            conf.nova_metadata_pool_size,
+            conf.nova_metadata_max_requests_per_connection,
+            conf.nova_metadata_idle_timeout)
 
     def _get_neutron_client(self):
         qclient = client.Client(
@@ -120,29 +231,43 @@ class MetadataProxyHandler(object):
             return webob.exc.HTTPInternalServerError(explanation=unicode(msg))
 
     def _get_instance_and_tenant_id(self, req):
-        qclient = self._get_neutron_client()
-
         remote_address = req.headers.get('X-Forwarded-For')
         network_id = req.headers.get('X-Neutron-Network-ID')
         router_id = req.headers.get('X-Neutron-Router-ID')
 
+        # The client is only created when neutron-server has to be queried
+        qclient = None
         if network_id:
             networks = [network_id]
         else:
-            internal_ports = qclient.list_ports(
-                device_id=router_id,
-                device_owner=n_const.DEVICE_OWNER_ROUTER_INTF)['ports']
-
-            networks = [p['network_id'] for p in internal_ports]
-
-        ports = qclient.list_ports(
-            network_id=networks,
-            fixed_ips=['ip_address=%s' % remote_address])['ports']
-
-        self.auth_info = qclient.get_auth_info()
-        if len(ports) == 1:
-            return ports[0]['device_id'], ports[0]['tenant_id']
-        return None, None
+            networks = self.cache.get(('router', router_id))
+            if networks is None:
+                qclient = self._get_neutron_client()
+                internal_ports = qclient.list_ports(
+                    device_id=router_id,
+                    device_owner=n_const.DEVICE_OWNER_ROUTER_INTF)['ports']
+
+                networks = [p['network_id'] for p in internal_ports]
+                if networks:
+                    self.cache.put(('router', router_id), networks)
+
+        key = ('address', tuple(sorted(networks)), remote_address)
+        ids = self.cache.get(key)
+        if ids is None:
+            if qclient is None:
+                qclient = self._get_neutron_client()
+            ports = qclient.list_ports(
+                network_id=networks,
+                fixed_ips=['ip_address=%s' % remote_address])['ports']
+            # Failed lookups are not cached, the port of a booting instance
+            # may not be created yet
+            if len(ports) == 1:
+                ids = ports[0]['device_id'], ports[0]['tenant_id']
+                self.cache.put(key, ids)
+
+        if qclient is not None:
+            self.auth_info = qclient.get_auth_info()
+        return ids or (None, None)
 
     def _proxy_request(self, instance_id, tenant_id, req):
         headers = {
@@ -160,9 +285,9 @@ class MetadataProxyHandler(object):
             req.query_string,
             ''))
 
-        h = httplib2.Http()
-        resp, content = h.request(url, method=req.method, headers=headers,
-                                  body=req.body)
+        resp, content = self.http_pool.request(url, method=req.method,
+                                               headers=headers,
+                                               body=req.body)
 
         if resp.status == 200:
             LOG.debug(str(resp))
@@ -260,6 +385,7 @@ class UnixDomainMetadataProxy(object):
 
     def __init__(self, conf):
         self.conf = conf
+        self.handler = None
 
         dirname = os.path.dirname(cfg.CONF.metadata_proxy_socket)
         if os.path.isdir(dirname):
@@ -295,6 +421,11 @@ class UnixDomainMetadataProxy(object):
             self.heartbeat.start(interval=report_interval)
 
     def _report_state(self):
+        # The requests are served by this process unless there are workers,
+        # which each have their own cache
+        if self.handler and self.conf.metadata_workers < 1:
+            self.agent_state['configurations']['lookup_cache'] = (
+                self.handler.cache.get_stats())
         try:
             self.state_rpc.report_state(
                 self.context,
@@ -313,7 +444,8 @@ class UnixDomainMetadataProxy(object):
 
     def run(self):
         server = UnixDomainWSGIServer('neutron-metadata-agent')
-        server.start(MetadataProxyHandler(self.conf),
+        self.handler = MetadataProxyHandler(self.conf)
+        server.start(self.handler,
                      self.conf.metadata_proxy_socket,
                      workers=self.conf.metadata_workers,
                      backlog=self.conf.metadata_backlog)
@@ -21,6 +21,7 @@ from neutron.common import topics
 
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import rpc
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.openstack.common import timeutils
 
@@ -79,14 +80,41 @@ class PluginApi(proxy.RpcProxy):
 
     API version history:
         1.0 - Initial version.
+        1.3 - get_devices_details_list, update_devices_up and
+              update_devices_down.
 
     '''
 
     BASE_RPC_API_VERSION = '1.1'
+    BULK_RPC_API_VERSION = '1.3'
 
     def __init__(self, topic):
         super(PluginApi, self).__init__(
             topic=topic, default_version=self.BASE_RPC_API_VERSION)
+        # Cleared once the server turned out not to support the bulk calls
+        self.bulk_rpc_supported = True
+
+    def _bulk_call(self, context, method, **kwargs):
+        """Call a bulk method.
+
+        bulk_rpc_supported is cleared if the server does not implement it.
+        """
+        if not self.bulk_rpc_supported:
+            return
+        try:
+            return self.call(context, self.make_msg(method, **kwargs),
+                             version=self.BULK_RPC_API_VERSION,
+                             topic=self.topic)
+        except rpc_common.RemoteError as e:
+            if e.exc_type not in ('UnsupportedRpcVersion', 'AttributeError'):
+                raise
+        except (rpc_common.UnsupportedRpcVersion, AttributeError):
+            # depending on allowed_rpc_exception_modules, the server
+            # exception may be raised as is
+            pass
+        LOG.warning(_("Bulk device RPC calls are not supported by the "
+                      "server, falling back to one call per device"))
+        self.bulk_rpc_supported = False
 
     def get_device_details(self, context, device, agent_id):
         return self.call(context,
@@ -94,6 +122,29 @@ class PluginApi(proxy.RpcProxy):
                                        agent_id=agent_id),
                          topic=self.topic)
 
+    def get_devices_details_list(self, context, devices, agent_id):
+        res = self._bulk_call(context, 'get_devices_details_list',
+                              devices=devices, agent_id=agent_id)
+        if not self.bulk_rpc_supported:
+            res = [self.get_device_details(context, device, agent_id)
+                   for device in devices]
+        return res
+
+    def update_devices_down(self, context, devices, agent_id, host=None):
+        res = self._bulk_call(context, 'update_devices_down',
+                              devices=devices, agent_id=agent_id, host=host)
+        if not self.bulk_rpc_supported:
+            res = [self.update_device_down(context, device, agent_id, host)
+                   for device in devices]
+        return res
+
+    def update_devices_up(self, context, devices, agent_id, host=None):
+        self._bulk_call(context, 'update_devices_up',
+                        devices=devices, agent_id=agent_id, host=host)
+        if not self.bulk_rpc_supported:
+            for device in devices:
+                self.update_device_up(context, device, agent_id, host)
+
     def update_device_down(self, context, device, agent_id, host=None):
         return self.call(context,
                          self.make_msg('update_device_down', device=device,
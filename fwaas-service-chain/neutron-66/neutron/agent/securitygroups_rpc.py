@@ -21,9 +21,12 @@ from oslo.config import cfg
 from neutron.common import topics
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
+from neutron.openstack.common.rpc import common as rpc_common
 
 LOG = logging.getLogger(__name__)
 SG_RPC_VERSION = "1.1"
+# security_group_info_for_devices is only available from this version
+SG_INFO_RPC_VERSION = "1.2"
 
 security_group_opts = [
     cfg.StrOpt(
@@ -84,6 +87,15 @@ class SecurityGroupServerRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self.topic)
 
+    def security_group_info_for_devices(self, context, devices):
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version=SG_INFO_RPC_VERSION,
+                         topic=self.topic)
+
 
 class SecurityGroupAgentRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent
@@ -113,13 +125,17 @@ class SecurityGroupAgentRpcCallbackMixin(object):
         """Callback for security group member update.
 
         :param security_groups: list of updated security_groups
+        :param sg_member_delta: optional, addresses added to and removed
+                                from each updated security group
         """
         security_groups = kwargs.get('security_groups', [])
+        sg_member_delta = kwargs.get('sg_member_delta')
         LOG.debug(
             _("Security group member updated on remote: %s"), security_groups)
         if not self.sg_agent:
             return self._security_groups_agent_not_set()
-        self.sg_agent.security_groups_member_updated(security_groups)
+        self.sg_agent.security_groups_member_updated(security_groups,
+                                                     sg_member_delta)
 
     def security_groups_provider_updated(self, context, **kwargs):
         """Callback for security group provider update."""
@@ -146,13 +162,59 @@ class SecurityGroupAgentRpcMixin(object):
         self.devices_to_refilter = set()
         # Flag raised when a global refresh is needed
         self.global_refresh_firewall = False
+        # Devices whose filters only need to be rebuilt from the security
+        # group information the firewall already holds, when deferred
+        self.devices_to_reapply = set()
+        # Whether security_group_info_for_devices can be used, unknown
+        # until the server has been asked
+        self._use_enhanced_rpc = None
+        # Member addresses of the remote security groups given to the
+        # firewall, patched by member updates carrying a delta
+        self.sg_members = {}
+
+    @property
+    def use_enhanced_rpc(self):
+        if self._use_enhanced_rpc is None:
+            self._use_enhanced_rpc = self._check_enhanced_rpc_is_supported()
+        return self._use_enhanced_rpc
+
+    def _check_enhanced_rpc_is_supported(self):
+        if not hasattr(self.firewall, 'update_security_group_rules'):
+            return False
+        try:
+            sg_info = self.plugin_rpc.security_group_info_for_devices(
+                self.context, devices=[])
+        except (rpc_common.RemoteError, AttributeError):
+            LOG.warning(_("Security group info RPC is not supported by the "
+                          "server, falling back to security group rules "
+                          "RPC"))
+            return False
+        return isinstance(sg_info, dict)
+
+    def _get_devices_info(self, device_ids):
+        """Return the devices and update the firewall security groups.
+
+        With the security group info RPC, the rules of each security group
+        and the members of each remote group are sent once and handed to
+        the firewall, which builds the rules of each device from them.
+        """
+        if not self.use_enhanced_rpc:
+            return self.plugin_rpc.security_group_rules_for_devices(
+                self.context, list(device_ids))
+        sg_info = self.plugin_rpc.security_group_info_for_devices(
+            self.context, list(device_ids))
+        for sg_id, sg_rules in sg_info['security_groups'].items():
+            self.firewall.update_security_group_rules(sg_id, sg_rules)
+        for sg_id, member_ips in sg_info['sg_member_ips'].items():
+            self.sg_members[sg_id] = set(member_ips)
+            self.firewall.update_security_group_members(sg_id, member_ips)
+        return sg_info['devices']
 
     def prepare_devices_filter(self, device_ids):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, list(device_ids))
+        devices = self._get_devices_info(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 self.firewall.prepare_port_filter(device)
@@ -164,19 +226,57 @@ class SecurityGroupAgentRpcMixin(object):
             security_groups,
             'security_groups')
 
-    def security_groups_member_updated(self, security_groups):
+    def security_groups_member_updated(self, security_groups,
+                                       sg_member_delta=None):
         LOG.info(_("Security group "
                    "member updated %r"), security_groups)
+        if sg_member_delta and self.use_enhanced_rpc:
+            self._security_group_members_changed(sg_member_delta)
+            return
         self._security_group_updated(
             security_groups,
             'security_group_source_groups')
 
-    def _security_group_updated(self, security_groups, attribute):
+    def _security_group_members_changed(self, sg_member_delta):
+        """Patch the members of the security groups held by the firewall.
+
+        Only the devices using the groups as remote groups have their
+        filters rebuilt, from the firewall's own state, without asking
+        the server for their rules again.
+        """
+        updated_sgs = []
+        for sg_id, delta in sg_member_delta.items():
+            members = self.sg_members.get(sg_id)
+            if members is None:
+                # no filtered device uses it as a remote group
+                continue
+            members.update(delta.get('added', []))
+            members.difference_update(delta.get('removed', []))
+            self.firewall.update_security_group_members(sg_id,
+                                                        sorted(members))
+            updated_sgs.append(sg_id)
+        devices = self._get_devices_for_security_groups(
+            updated_sgs, 'security_group_source_groups')
+        if devices:
+            if self.defer_refresh_firewall:
+                LOG.debug(_("Adding %s devices to the list of devices "
+                            "for which firewall needs to be reapplied"),
+                          devices)
+                self.devices_to_reapply |= set(devices)
+            else:
+                self.reapply_firewall(devices)
+
+    def _get_devices_for_security_groups(self, security_groups, attribute):
         devices = []
         sec_grp_set = set(security_groups)
         for device in self.firewall.ports.values():
             if sec_grp_set & set(device.get(attribute, [])):
                 devices.append(device['device'])
+        return devices
+
+    def _security_group_updated(self, security_groups, attribute):
+        devices = self._get_devices_for_security_groups(security_groups,
+                                                        attribute)
         if devices:
             if self.defer_refresh_firewall:
                 LOG.debug(_("Adding %s devices to the list of devices "
@@ -206,6 +306,13 @@ class SecurityGroupAgentRpcMixin(object):
                 if not device:
                     continue
                 self.firewall.remove_port_filter(device)
+        # forget the members of the groups no filtered device refers to
+        remote_group_ids = set()
+        for device in self.firewall.ports.values():
+            remote_group_ids.update(
+                device.get('security_group_source_groups', []))
+        for sg_id in set(self.sg_members) - remote_group_ids:
+            del self.sg_members[sg_id]
 
     def refresh_firewall(self, device_ids=None):
         LOG.info(_("Refresh firewall rules"))
@@ -214,15 +321,26 @@ class SecurityGroupAgentRpcMixin(object):
             if not device_ids:
                 LOG.info(_("No ports here to refresh firewall"))
                 return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, device_ids)
+        devices = self._get_devices_info(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 LOG.debug(_("Update port filter for %s"), device['device'])
                 self.firewall.update_port_filter(device)
 
+    def reapply_firewall(self, device_ids):
+        """Rebuild the filters of devices without asking the server."""
+        LOG.info(_("Reapply firewall rules"))
+        with self.firewall.defer_apply():
+            for device_id in device_ids:
+                device = self.firewall.ports.get(device_id)
+                if not device:
+                    continue
+                LOG.debug(_("Update port filter for %s"), device_id)
+                self.firewall.update_port_filter(device)
+
     def firewall_refresh_needed(self):
-        return self.global_refresh_firewall or self.devices_to_refilter
+        return (self.global_refresh_firewall or self.devices_to_refilter or
+                self.devices_to_reapply)
 
     def setup_port_filters(self, new_devices, updated_devices):
         """Configure port filters for devices.
@@ -242,8 +360,10 @@ class SecurityGroupAgentRpcMixin(object):
         # These data structures are cleared here in order to avoid
         # losing updates occurring during firewall refresh
         devices_to_refilter = self.devices_to_refilter
+        devices_to_reapply = self.devices_to_reapply
         global_refresh_firewall = self.global_refresh_firewall
         self.devices_to_refilter = set()
+        self.devices_to_reapply = set()
         self.global_refresh_firewall = False
         # TODO(salv-orlando): Avoid if possible ever performing the global
         # refresh providing a precise list of devices for which firewall
@@ -260,6 +380,12 @@ class SecurityGroupAgentRpcMixin(object):
                 LOG.debug(_("Refreshing firewall for %d devices"),
                           len(updated_devices))
                 self.refresh_firewall(updated_devices)
+            # Devices refreshed above already got the latest members
+            devices_to_reapply -= new_devices | updated_devices
+            if devices_to_reapply:
+                LOG.debug(_("Reapplying firewall for %d devices"),
+                          len(devices_to_reapply))
+                self.reapply_firewall(devices_to_reapply)
 
 
 class SecurityGroupAgentRpcApiMixin(object):
@@ -279,13 +405,22 @@ class SecurityGroupAgentRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self._get_security_group_topic())
 
-    def security_groups_member_updated(self, context, security_groups):
-        """Notify member updated security groups."""
+    def security_groups_member_updated(self, context, security_groups,
+                                       sg_member_delta=None):
+        """Notify member updated security groups.
+
+        sg_member_delta optionally gives the addresses added to and removed
+        from each group, as {sg_id: {'added': [ip], 'removed': [ip]}}.
+        Agents which do not know about it just ignore it.
+        """
         if not security_groups:
             return
+        kwargs = {'security_groups': security_groups}
+        if sg_member_delta:
+            kwargs['sg_member_delta'] = sg_member_delta
         self.fanout_cast(context,
                          self.make_msg('security_groups_member_updated',
-                                       security_groups=security_groups),
+                                       **kwargs),
                          version=SG_RPC_VERSION,
                          topic=self._get_security_group_topic())
 
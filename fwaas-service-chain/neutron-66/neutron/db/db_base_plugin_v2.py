@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
 import random
 
 import netaddr
@@ -382,10 +383,29 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             return {'ip_address': ip_address, 'subnet_id': subnet['id']}
         raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
 
+    @staticmethod
+    def _get_free_ranges(first, last, allocations):
+        """Yield the (first, last) ranges of free addresses of a pool.
+
+        The pool goes from first to last and allocations is the sorted list
+        of the allocated addresses, all of them as integers, so that only
+        the allocations within the pool are visited.
+        """
+        for i in xrange(bisect.bisect_left(allocations, first),
+                        len(allocations)):
+            ip = allocations[i]
+            if ip > last:
+                break
+            if ip > first:
+                yield first, ip - 1
+            first = max(first, ip + 1)
+        if first <= last:
+            yield first, last
+
     @staticmethod
     def _rebuild_availability_ranges(context, subnets):
         ip_qry = context.session.query(
-            models_v2.IPAllocation).with_lockmode('update')
+            models_v2.IPAllocation.ip_address).with_lockmode('update')
         # PostgreSQL does not support select...for update with an outer join.
         # No join is needed here.
         pool_qry = context.session.query(
@@ -395,36 +415,26 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             LOG.debug(_("Rebuilding availability ranges for subnet %s")
                       % subnet)
 
-            # Create a set of all currently allocated addresses
-            ip_qry_results = ip_qry.filter_by(subnet_id=subnet['id'])
-            allocations = netaddr.IPSet([netaddr.IPAddress(i['ip_address'])
-                                        for i in ip_qry_results])
+            # The free ranges are computed on integers, without building
+            # the set of all the addresses of the pools
+            allocations = sorted(
+                int(netaddr.IPAddress(ip_address))
+                for ip_address, in ip_qry.filter_by(subnet_id=subnet['id']))
 
             for pool in pool_qry.filter_by(subnet_id=subnet['id']):
-                # Create a set of all addresses in the pool
-                poolset = netaddr.IPSet(netaddr.iter_iprange(pool['first_ip'],
-                                                             pool['last_ip']))
-
-                # Use set difference to find free addresses in the pool
-                available = poolset - allocations
-
-                # Generator compacts an ip set into contiguous ranges
-                def ipset_to_ranges(ipset):
-                    first, last = None, None
-                    for cidr in ipset.iter_cidrs():
-                        if last and last + 1 != cidr.first:
-                            yield netaddr.IPRange(first, last)
-                            first = None
-                        first, last = first if first else cidr.first, cidr.last
-                    if first:
-                        yield netaddr.IPRange(first, last)
+                first_ip = netaddr.IPAddress(pool['first_ip'])
+                last_ip = netaddr.IPAddress(pool['last_ip'])
+                free_ranges = NeutronDbPluginV2._get_free_ranges(
+                    int(first_ip), int(last_ip), allocations)
 
                 # Write the ranges to the db
-                for range in ipset_to_ranges(available):
+                for first, last in free_ranges:
                     available_range = models_v2.IPAvailabilityRange(
                         allocation_pool_id=pool['id'],
-                        first_ip=str(netaddr.IPAddress(range.first)),
-                        last_ip=str(netaddr.IPAddress(range.last)))
+                        first_ip=str(netaddr.IPAddress(first,
+                                                       first_ip.version)),
+                        last_ip=str(netaddr.IPAddress(last,
+                                                      first_ip.version)))
                     context.session.add(available_range)
 
     @staticmethod
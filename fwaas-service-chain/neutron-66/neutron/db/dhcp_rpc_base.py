@@ -75,11 +75,34 @@ class DhcpRpcCallbackMixin(object):
                 LOG.warn(_("Port for network %(net_id)s could not be created: "
                            "%(reason)s") % {"net_id": network_id, 'reason': e})
 
+    def _get_networks_info(self, context, plugin, networks):
+        """Add their DHCP enabled subnets and their ports to networks."""
+        networks_by_id = {}
+        for network in networks:
+            network['subnets'] = []
+            network['ports'] = []
+            networks_by_id[network['id']] = network
+        network_ids = networks_by_id.keys()
+        ports = plugin.get_ports(context,
+                                 filters={'network_id': network_ids})
+        subnets = plugin.get_subnets(context,
+                                     filters={'network_id': network_ids,
+                                              'enable_dhcp': [True]})
+
+        for subnet in subnets:
+            networks_by_id[subnet['network_id']]['subnets'].append(subnet)
+        for port in ports:
+            networks_by_id[port['network_id']]['ports'].append(port)
+
+        return networks
+
     def get_active_networks(self, context, **kwargs):
         """Retrieve and return a list of the active network ids."""
-        # NOTE(arosen): This method is no longer used by the DHCP agent but is
-        # left so that neutron-dhcp-agents will still continue to work if
-        # neutron-server is upgraded and not the agent.
+        # NOTE(arosen): This method is no longer used by the DHCP agent to
+        # get the networks, but is left so that neutron-dhcp-agents will still
+        # continue to work if neutron-server is upgraded and not the agent.
+        # Agents fetching the networks in chunks use it again to get their
+        # ids before calling get_networks_info.
         host = kwargs.get('host')
         LOG.debug(_('get_active_networks requested from %s'), host)
         nets = self._get_active_networks(context, **kwargs)
@@ -91,18 +114,20 @@ class DhcpRpcCallbackMixin(object):
         LOG.debug(_('get_active_networks_info from %s'), host)
         networks = self._get_active_networks(context, **kwargs)
         plugin = manager.NeutronManager.get_plugin()
-        filters = {'network_id': [network['id'] for network in networks]}
-        ports = plugin.get_ports(context, filters=filters)
-        filters['enable_dhcp'] = [True]
-        subnets = plugin.get_subnets(context, filters=filters)
+        return self._get_networks_info(context, plugin, networks)
 
-        for network in networks:
-            network['subnets'] = [subnet for subnet in subnets
-                                  if subnet['network_id'] == network['id']]
-            network['ports'] = [port for port in ports
-                                if port['network_id'] == network['id']]
+    def get_networks_info(self, context, **kwargs):
+        """Return the networks/subnets/ports of the given networks.
 
-        return networks
+        Networks which no longer exist are not returned.
+        """
+        network_ids = kwargs.get('network_ids')
+        host = kwargs.get('host')
+        LOG.debug(_('get_networks_info for %(count)d networks from '
+                    '%(host)s'), {'count': len(network_ids), 'host': host})
+        plugin = manager.NeutronManager.get_plugin()
+        networks = plugin.get_networks(context, filters={'id': network_ids})
+        return self._get_networks_info(context, plugin, networks)
 
     def get_network_info(self, context, **kwargs):
         """Retrieve and return a extended information about a network."""
@@ -796,7 +796,11 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         filters = {'id': router_ids} if router_ids else {}
         if active is not None:
             filters['admin_state_up'] = [active]
-        router_dicts = self.get_routers(context, filters=filters)
+        # The gateway ports are loaded along with the routers rather than
+        # one query per router by _make_router_dict
+        query = self._get_collection_query(context, Router, filters=filters)
+        query = query.options(orm.joinedload('gw_port'))
+        router_dicts = [self._make_router_dict(router) for router in query]
         gw_port_ids = []
         if not router_dicts:
             return []
@@ -862,39 +866,43 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             subnet_id_ports_dict[fixed_ip['subnet_id']] = my_ports
         if not subnet_id_ports_dict:
             return
-        filters = {'id': subnet_id_ports_dict.keys()}
-        fields = ['id', 'cidr', 'gateway_ip']
-        subnet_dicts = self._core_plugin.get_subnets(context, filters, fields)
-        for subnet_dict in subnet_dicts:
-            ports = subnet_id_ports_dict.get(subnet_dict['id'], [])
-            for port in ports:
+        # Only the columns needed are queried, so that the relationships of
+        # the subnets are not loaded one subnet at a time
+        query = context.session.query(models_v2.Subnet.id,
+                                      models_v2.Subnet.cidr,
+                                      models_v2.Subnet.gateway_ip)
+        query = query.filter(
+            models_v2.Subnet.id.in_(subnet_id_ports_dict.keys()))
+        for subnet_id, cidr, gateway_ip in query:
+            for port in subnet_id_ports_dict[subnet_id]:
                 # TODO(gongysh) stash the subnet into fixed_ips
                 # to make the payload smaller.
-                port['subnet'] = {'id': subnet_dict['id'],
-                                  'cidr': subnet_dict['cidr'],
-                                  'gateway_ip': subnet_dict['gateway_ip']}
+                port['subnet'] = {'id': subnet_id,
+                                  'cidr': cidr,
+                                  'gateway_ip': gateway_ip}
 
     def _process_sync_data(self, routers, interfaces, floating_ips):
-        routers_dict = {}
-        for router in routers:
-            routers_dict[router['id']] = router
+        routers_dict = dict((router['id'], router) for router in routers)
         for floating_ip in floating_ips:
             router = routers_dict.get(floating_ip['router_id'])
             if router:
-                router_floatingips = router.get(l3_constants.FLOATINGIP_KEY,
-                                                [])
-                router_floatingips.append(floating_ip)
-                router[l3_constants.FLOATINGIP_KEY] = router_floatingips
+                router.setdefault(l3_constants.FLOATINGIP_KEY,
+                                  []).append(floating_ip)
         for interface in interfaces:
             router = routers_dict.get(interface['device_id'])
             if router:
-                router_interfaces = router.get(l3_constants.INTERFACE_KEY, [])
-                router_interfaces.append(interface)
-                router[l3_constants.INTERFACE_KEY] = router_interfaces
-        return routers_dict.values()
+                router.setdefault(l3_constants.INTERFACE_KEY,
+                                  []).append(interface)
+        return routers
 
     def get_sync_data(self, context, router_ids=None, active=None):
-        """Query routers and their related floating_ips, interfaces."""
+        """Query routers and their related floating_ips, interfaces.
+
+        The number of queries does not depend on the number of routers:
+        the gateway ports are loaded along with the routers, and the
+        floating IPs, the interfaces and the subnets of the ports are
+        each loaded by a single query.
+        """
         with context.session.begin(subtransactions=True):
             routers = self._get_sync_routers(context,
                                              router_ids=router_ids,
@@ -21,6 +21,7 @@ from neutron.common import ipv6_utils as ipv6
 from neutron.common import utils
 from neutron.db import models_v2
 from neutron.db import securitygroups_db as sg_db
+from neutron.extensions import allowedaddresspairs as addr_pair
 from neutron.extensions import securitygroup as ext_sg
 from neutron.openstack.common import log as logging
 
@@ -34,6 +35,38 @@ IP_MASK = {q_const.IPv4: 32,
 DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 
+MEMBER_ADDED = 'added'
+MEMBER_REMOVED = 'removed'
+
+
+def _select_ips_for_remote_group(context, remote_group_ids):
+    ips_by_group = {}
+    if not remote_group_ids:
+        return ips_by_group
+    for remote_group_id in remote_group_ids:
+        ips_by_group[remote_group_id] = []
+
+    ip_port = models_v2.IPAllocation.port_id
+    sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
+    sg_binding_sgid = sg_db.SecurityGroupPortBinding.security_group_id
+
+    query = context.session.query(sg_binding_sgid,
+                                  models_v2.Port,
+                                  models_v2.IPAllocation.ip_address)
+    query = query.join(models_v2.IPAllocation,
+                       ip_port == sg_binding_port)
+    query = query.join(models_v2.Port,
+                       ip_port == models_v2.Port.id)
+    query = query.filter(sg_binding_sgid.in_(remote_group_ids))
+    for security_group_id, port, ip_address in query:
+        ips_by_group[security_group_id].append(ip_address)
+        # if there are allowed_address_pairs add them
+        if getattr(port, 'allowed_address_pairs', None):
+            for address_pair in port.allowed_address_pairs:
+                ips_by_group[security_group_id].append(
+                    address_pair['ip_address'])
+    return ips_by_group
+
 
 class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
 
@@ -105,7 +138,8 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
             need_notify = True
         return need_notify
 
-    def notify_security_groups_member_updated(self, context, port):
+    def notify_security_groups_member_updated(self, context, port,
+                                              member_change=None):
         """Notify update event of security group members.
 
         The agent setups the iptables rule to allow
@@ -115,12 +149,40 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         security_groups_provider_updated() just notifies that an event
         occurs and the plugin agent fetches the update provider
         rule in the other RPC call (security_group_rules_for_devices).
+
+        member_change is MEMBER_ADDED when the port has been created and
+        MEMBER_REMOVED when it has been deleted. The addresses which joined
+        or left its security groups are then sent along so that the agents
+        can patch the members they hold instead of refreshing the firewall
+        of every device using the groups.
         """
         if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
             self.notifier.security_groups_provider_updated(context)
         else:
+            sg_member_delta = None
+            if member_change:
+                sg_member_delta = self._get_security_group_member_delta(
+                    context, port, member_change)
             self.notifier.security_groups_member_updated(
-                context, port.get(ext_sg.SECURITYGROUPS))
+                context, port.get(ext_sg.SECURITYGROUPS),
+                sg_member_delta=sg_member_delta)
+
+    def _get_security_group_member_delta(self, context, port, member_change):
+        sg_ids = port.get(ext_sg.SECURITYGROUPS) or []
+        port_ips = set(ip['ip_address'] for ip in port.get('fixed_ips', []))
+        port_ips.update(pair['ip_address'] for pair in
+                        port.get(addr_pair.ADDRESS_PAIRS) or [])
+        if member_change == MEMBER_REMOVED:
+            # another port of the group may still use the same address,
+            # e.g. a virtual ip set in the allowed address pairs
+            remaining_ips = _select_ips_for_remote_group(context, sg_ids)
+        sg_member_delta = {}
+        for sg_id in sg_ids:
+            changed_ips = port_ips
+            if member_change == MEMBER_REMOVED:
+                changed_ips = port_ips - set(remaining_ips[sg_id])
+            sg_member_delta[sg_id] = {member_change: sorted(changed_ips)}
+        return sg_member_delta
 
 
 class SecurityGroupServerRpcCallbackMixin(object):
@@ -138,7 +200,31 @@ class SecurityGroupServerRpcCallbackMixin(object):
         :returns: port correspond to the devices with security group rules
         """
         devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        return self._security_group_rules_for_ports(context, ports)
+
+    def security_group_info_for_devices(self, context, **kwargs):
+        """Return security group information for requested devices.
+
+        Unlike security_group_rules_for_devices, the rules of each security
+        group are only sent once and remote_group_id rules are not expanded:
+        the agent builds the rules of each port from this information.
+
+        :params devices: list of devices
+        :returns:
+        sg_info{
+          'security_groups': {sg_id: [rule1, rule2]}
+          'sg_member_ips': {sg_id: [ip1, ip2]}
+          'devices': {device_id: {device_info}}
+        }
+        The rules of each device only contain the provider rules, its
+        security groups are listed in its 'security_groups' attribute.
+        """
+        devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        return self.security_group_info_for_ports(context, ports)
 
+    def _get_ports_for_devices(self, devices):
         ports = {}
         for device in devices:
             port = self.get_port_from_device(device)
@@ -147,7 +233,64 @@ class SecurityGroupServerRpcCallbackMixin(object):
             if port['device_owner'].startswith('network:'):
                 continue
             ports[port['id']] = port
-        return self._security_group_rules_for_ports(context, ports)
+        return ports
+
+    def security_group_info_for_ports(self, context, ports):
+        sg_info = {'devices': ports,
+                   'security_groups': {},
+                   'sg_member_ips': {}}
+        if not ports:
+            return sg_info
+
+        sg_ids_by_port = self._select_sg_ids_for_ports(context, ports)
+        sg_ids = set()
+        for port_id, port in ports.iteritems():
+            port['security_groups'] = sg_ids_by_port.get(port_id, [])
+            sg_ids.update(port['security_groups'])
+        rules_by_sg = sg_info['security_groups']
+        for sg_id in sg_ids:
+            rules_by_sg[sg_id] = []
+
+        remote_group_ids = set()
+        for rule_in_db in self._select_rules_for_security_groups(context,
+                                                                 sg_ids):
+            rule_dict = self._make_agent_rule_dict(rule_in_db)
+            rules_by_sg[rule_in_db['security_group_id']].append(rule_dict)
+            if rule_dict.get('remote_group_id'):
+                remote_group_ids.add(rule_dict['remote_group_id'])
+
+        for port in ports.values():
+            port['security_group_source_groups'] = list(set(
+                rule['remote_group_id']
+                for sg_id in port['security_groups']
+                for rule in rules_by_sg[sg_id]
+                if rule.get('remote_group_id')))
+
+        ips = self._select_ips_for_remote_group(context, remote_group_ids)
+        for remote_group_id, member_ips in ips.iteritems():
+            sg_info['sg_member_ips'][remote_group_id] = sorted(
+                set(member_ips))
+
+        self._apply_provider_rule(context, ports)
+        return sg_info
+
+    def _select_sg_ids_for_ports(self, context, ports):
+        sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
+        sg_binding_sgid = sg_db.SecurityGroupPortBinding.security_group_id
+        query = context.session.query(sg_binding_port, sg_binding_sgid)
+        query = query.filter(sg_binding_port.in_(ports.keys()))
+        sg_ids_by_port = {}
+        for port_id, sg_id in query:
+            sg_ids_by_port.setdefault(port_id, []).append(sg_id)
+        return sg_ids_by_port
+
+    def _select_rules_for_security_groups(self, context, sg_ids):
+        if not sg_ids:
+            return []
+        sgr_sgid = sg_db.SecurityGroupRule.security_group_id
+        query = context.session.query(sg_db.SecurityGroupRule)
+        query = query.filter(sgr_sgid.in_(sg_ids))
+        return query.all()
 
     def _select_rules_for_ports(self, context, ports):
         if not ports:
@@ -165,32 +308,7 @@ class SecurityGroupServerRpcCallbackMixin(object):
         return query.all()
 
     def _select_ips_for_remote_group(self, context, remote_group_ids):
-        ips_by_group = {}
-        if not remote_group_ids:
-            return ips_by_group
-        for remote_group_id in remote_group_ids:
-            ips_by_group[remote_group_id] = []
-
-        ip_port = models_v2.IPAllocation.port_id
-        sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
-        sg_binding_sgid = sg_db.SecurityGroupPortBinding.security_group_id
-
-        query = context.session.query(sg_binding_sgid,
-                                      models_v2.Port,
-                                      models_v2.IPAllocation.ip_address)
-        query = query.join(models_v2.IPAllocation,
-                           ip_port == sg_binding_port)
-        query = query.join(models_v2.Port,
-                           ip_port == models_v2.Port.id)
-        query = query.filter(sg_binding_sgid.in_(remote_group_ids))
-        for security_group_id, port, ip_address in query:
-            ips_by_group[security_group_id].append(ip_address)
-            # if there are allowed_address_pairs add them
-            if getattr(port, 'allowed_address_pairs', None):
-                for address_pair in port.allowed_address_pairs:
-                    ips_by_group[security_group_id].append(
-                        address_pair['ip_address'])
-        return ips_by_group
+        return _select_ips_for_remote_group(context, remote_group_ids)
 
     def _select_remote_group_ids(self, ports):
         remote_group_ids = []
@@ -355,20 +473,24 @@ class SecurityGroupServerRpcCallbackMixin(object):
         for (binding, rule_in_db) in rules_in_db:
             port_id = binding['port_id']
             port = ports[port_id]
-            direction = rule_in_db['direction']
-            rule_dict = {
-                'security_group_id': rule_in_db['security_group_id'],
-                'direction': direction,
-                'ethertype': rule_in_db['ethertype'],
-            }
-            for key in ('protocol', 'port_range_min', 'port_range_max',
-                        'remote_ip_prefix', 'remote_group_id'):
-                if rule_in_db.get(key):
-                    if key == 'remote_ip_prefix':
-                        direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
-                        rule_dict[direction_ip_prefix] = rule_in_db[key]
-                        continue
-                    rule_dict[key] = rule_in_db[key]
+            rule_dict = self._make_agent_rule_dict(rule_in_db)
             port['security_group_rules'].append(rule_dict)
         self._apply_provider_rule(context, ports)
         return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+    def _make_agent_rule_dict(self, rule_in_db):
+        direction = rule_in_db['direction']
+        rule_dict = {
+            'security_group_id': rule_in_db['security_group_id'],
+            'direction': direction,
+            'ethertype': rule_in_db['ethertype'],
+        }
+        for key in ('protocol', 'port_range_min', 'port_range_max',
+                    'remote_ip_prefix', 'remote_group_id'):
+            if rule_in_db.get(key):
+                if key == 'remote_ip_prefix':
+                    direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
+                    rule_dict[direction_ip_prefix] = rule_in_db[key]
+                    continue
+                rule_dict[key] = rule_in_db[key]
+        return rule_dict
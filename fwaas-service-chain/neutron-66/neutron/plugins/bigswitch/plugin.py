@@ -117,7 +117,9 @@ class AgentNotifierApi(rpc.proxy.RpcProxy,
 class RestProxyCallbacks(sg_rpc_base.SecurityGroupServerRpcCallbackMixin,
                          dhcp_rpc_base.DhcpRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    # history
+    #   1.2 Support get_networks_info
+    RPC_API_VERSION = '1.2'
 
     def create_rpc_dispatcher(self):
         return q_rpc.PluginRpcDispatcher([self,
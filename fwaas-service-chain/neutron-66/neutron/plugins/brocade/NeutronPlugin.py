@@ -86,7 +86,9 @@ class BridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                          sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
     """Agent callback."""
 
-    RPC_API_VERSION = '1.1'
+    # history
+    #   1.2 Support get_networks_info
+    RPC_API_VERSION = '1.2'
     # Device names start with "tap"
     # history
     #   1.1 Support Security Group RPC
@@ -62,8 +62,9 @@ class N1kvRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
 
     """Class to handle agent RPC calls."""
 
-    # Set RPC API version to 1.1 by default.
-    RPC_API_VERSION = '1.1'
+    # history
+    #   1.2 Support get_networks_info
+    RPC_API_VERSION = '1.2'
 
     def create_rpc_dispatcher(self):
         """Get the rpc dispatcher for this rpc manager.
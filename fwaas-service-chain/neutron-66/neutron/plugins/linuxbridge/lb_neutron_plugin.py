@@ -62,7 +62,8 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
 
     # history
     #   1.1 Support Security Group RPC
-    RPC_API_VERSION = '1.1'
+    #   1.2 Support security_group_info_for_devices and get_networks_info
+    RPC_API_VERSION = '1.2'
     # Device names start with "tap"
     TAP_PREFIX_LEN = 3
 
@@ -488,7 +489,8 @@ class LinuxBridgePluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                                                          port)
             self._process_port_create_security_group(
                 context, port, sgids)
-        self.notify_security_groups_member_updated(context, port)
+        self.notify_security_groups_member_updated(
+            context, port, member_change=sg_db_rpc.MEMBER_ADDED)
         return port
 
     def update_port(self, context, id, port):
@@ -529,7 +531,8 @@ class LinuxBridgePluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             self._delete_port_security_group_bindings(context, id)
             super(LinuxBridgePluginV2, self).delete_port(context, id)
 
-        self.notify_security_groups_member_updated(context, port)
+        self.notify_security_groups_member_updated(
+            context, port, member_change=sg_db_rpc.MEMBER_REMOVED)
 
     def _notify_port_updated(self, context, port):
         binding = db.get_network_binding(context.session,
@@ -178,7 +178,9 @@ def _check_resource_exists(func, id, name, raise_exc=False):
 
 
 class MidoRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin):
-    RPC_API_VERSION = '1.1'
+    # history
+    #   1.2 Support get_networks_info
+    RPC_API_VERSION = '1.2'
 
     def create_rpc_dispatcher(self):
         """Get the rpc dispatcher for this manager.
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
 from neutron.db import api as db_api
@@ -45,15 +46,31 @@ def add_network_segment(session, network_id, segment):
               'network_id': record.network_id})
 
 
+def _make_segment_dict(record):
+    return {api.ID: record.id,
+            api.NETWORK_TYPE: record.network_type,
+            api.PHYSICAL_NETWORK: record.physical_network,
+            api.SEGMENTATION_ID: record.segmentation_id}
+
+
 def get_network_segments(session, network_id):
     with session.begin(subtransactions=True):
         records = (session.query(models.NetworkSegment).
                    filter_by(network_id=network_id))
-        return [{api.ID: record.id,
-                 api.NETWORK_TYPE: record.network_type,
-                 api.PHYSICAL_NETWORK: record.physical_network,
-                 api.SEGMENTATION_ID: record.segmentation_id}
-                for record in records]
+        return [_make_segment_dict(record) for record in records]
+
+
+def get_networks_segments(session, network_ids):
+    """Get the segments of several networks, keyed by network id."""
+    segments = dict((network_id, []) for network_id in network_ids)
+    if not network_ids:
+        return segments
+    with session.begin(subtransactions=True):
+        records = (session.query(models.NetworkSegment).
+                   filter(models.NetworkSegment.network_id.in_(network_ids)))
+        for record in records:
+            segments[record.network_id].append(_make_segment_dict(record))
+    return segments
 
 
 def ensure_port_binding(session, port_id):
@@ -87,6 +104,47 @@ def get_port(session, port_id):
             return
 
 
+def get_ports_and_bindings(session, port_ids):
+    """Get port records and their binding for several ports at once.
+
+    As with get_port, each port_id may only be the beginning of the id of
+    the port. The result is keyed by the requested port_ids, the binding
+    is None for ports which have none yet.
+    """
+    ports = {}
+    if not port_ids:
+        return ports
+    full_ids = set(port_id for port_id in port_ids
+                   if uuidutils.is_uuid_like(port_id))
+    prefixes = set(port_ids) - full_ids
+    criteria = [models_v2.Port.id.startswith(prefix) for prefix in prefixes]
+    if full_ids:
+        criteria.append(models_v2.Port.id.in_(full_ids))
+
+    with session.begin(subtransactions=True):
+        query = session.query(models_v2.Port, models.PortBinding)
+        query = query.outerjoin(
+            models.PortBinding,
+            models_v2.Port.id == models.PortBinding.port_id)
+        query = query.filter(sa.or_(*criteria))
+        prefix_lengths = set(len(prefix) for prefix in prefixes)
+        matches = {}
+        for port, binding in query:
+            if port.id in full_ids:
+                ports[port.id] = (port, binding)
+            for length in prefix_lengths:
+                if port.id[:length] in prefixes:
+                    matches.setdefault(port.id[:length], []).append(
+                        (port, binding))
+    for prefix, records in matches.iteritems():
+        if len(records) > 1:
+            LOG.error(_("Multiple ports have port_id starting with %s"),
+                      prefix)
+            continue
+        ports[prefix] = records[0]
+    return ports
+
+
 def get_port_from_device_mac(device_mac):
     LOG.debug(_("get_port_from_device_mac() called for mac %s"), device_mac)
     session = db_api.get_session()
@@ -650,7 +650,8 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
                 LOG.error(_("mechanism_manager.create_port_postcommit "
                             "failed, deleting port '%s'"), result['id'])
                 self.delete_port(context, result['id'])
-        self.notify_security_groups_member_updated(context, result)
+        self.notify_security_groups_member_updated(
+            context, result, member_change=sg_db_rpc.MEMBER_ADDED)
         return result
 
     def update_port(self, context, id, port):
@@ -747,7 +748,8 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             # delete the port.  Ideally we'd notify the caller of the
             # fact that an error occurred.
             LOG.error(_("mechanism_manager.delete_port_postcommit failed"))
-        self.notify_security_groups_member_updated(context, port)
+        self.notify_security_groups_member_updated(
+            context, port, member_change=sg_db_rpc.MEMBER_REMOVED)
 
     def update_port_status(self, context, port_id, status):
         updated = False
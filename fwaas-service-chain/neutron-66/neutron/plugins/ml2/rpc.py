@@ -41,10 +41,13 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                    sg_db_rpc.SecurityGroupServerRpcCallbackMixin,
                    type_tunnel.TunnelRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.3'
     # history
     #   1.0 Initial version (from openvswitch/linuxbridge)
     #   1.1 Support Security Group RPC
+    #   1.2 Support security_group_info_for_devices and get_networks_info
+    #   1.3 Support get_devices_details_list, update_devices_up and
+    #       update_devices_down
 
     def __init__(self, notifier, type_manager):
         # REVISIT(kmestery): This depends on the first three super classes
@@ -105,54 +108,94 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                 return {'device': device}
 
             segments = db.get_network_segments(session, port.network_id)
-            if not segments:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s has network %(network_id)s with "
-                              "no segments"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id})
-                return {'device': device}
-
             binding = db.ensure_port_binding(session, port.id)
-            if not binding.segment:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s on network %(network_id)s not "
-                              "bound, vif_type: %(vif_type)s"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id,
-                             'vif_type': binding.vif_type})
-                return {'device': device}
+            return self._get_device_details(rpc_context, agent_id, device,
+                                            port, segments, binding)
 
-            segment = self._find_segment(segments, binding.segment)
-            if not segment:
-                LOG.warning(_("Device %(device)s requested by agent "
-                              "%(agent_id)s on network %(network_id)s "
-                              "invalid segment, vif_type: %(vif_type)s"),
-                            {'device': device,
-                             'agent_id': agent_id,
-                             'network_id': port.network_id,
-                             'vif_type': binding.vif_type})
-                return {'device': device}
+    def get_devices_details_list(self, rpc_context, **kwargs):
+        """Agent requests the details of several devices.
+
+        The ports, their bindings and the segments of their networks are
+        read with one query each, whatever the number of devices.
+        """
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        LOG.debug(_("Details of %(count)d devices requested by agent "
+                    "%(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        port_ids = dict((device, self._device_to_port_id(device))
+                        for device in devices)
+
+        session = db_api.get_session()
+        with session.begin(subtransactions=True):
+            ports = db.get_ports_and_bindings(session, port_ids.values())
+            segments = db.get_networks_segments(
+                session, set(port.network_id for port, _b in ports.values()))
+            devices_details = []
+            for device in devices:
+                port, binding = ports.get(port_ids[device], (None, None))
+                if not port:
+                    LOG.warning(_("Device %(device)s requested by agent "
+                                  "%(agent_id)s not found in database"),
+                                {'device': device, 'agent_id': agent_id})
+                    devices_details.append({'device': device})
+                    continue
+                if not binding:
+                    binding = db.ensure_port_binding(session, port.id)
+                devices_details.append(self._get_device_details(
+                    rpc_context, agent_id, device, port,
+                    segments[port.network_id], binding))
+            return devices_details
+
+    def _get_device_details(self, rpc_context, agent_id, device, port,
+                            segments, binding):
+        if not segments:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s has network %(network_id)s with "
+                          "no segments"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id})
+            return {'device': device}
+
+        if not binding.segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s not "
+                          "bound, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
 
-            new_status = (q_const.PORT_STATUS_BUILD if port.admin_state_up
-                          else q_const.PORT_STATUS_DOWN)
-            if port.status != new_status:
-                plugin = manager.NeutronManager.get_plugin()
-                plugin.update_port_status(rpc_context,
-                                          port_id,
-                                          new_status)
-                port.status = new_status
-            entry = {'device': device,
-                     'network_id': port.network_id,
-                     'port_id': port.id,
-                     'admin_state_up': port.admin_state_up,
-                     'network_type': segment[api.NETWORK_TYPE],
-                     'segmentation_id': segment[api.SEGMENTATION_ID],
-                     'physical_network': segment[api.PHYSICAL_NETWORK]}
-            LOG.debug(_("Returning: %s"), entry)
-            return entry
+        segment = self._find_segment(segments, binding.segment)
+        if not segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s "
+                          "invalid segment, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
+
+        new_status = (q_const.PORT_STATUS_BUILD if port.admin_state_up
+                      else q_const.PORT_STATUS_DOWN)
+        if port.status != new_status:
+            plugin = manager.NeutronManager.get_plugin()
+            plugin.update_port_status(rpc_context,
+                                      port.id,
+                                      new_status)
+            port.status = new_status
+        entry = {'device': device,
+                 'network_id': port.network_id,
+                 'port_id': port.id,
+                 'admin_state_up': port.admin_state_up,
+                 'network_type': segment[api.NETWORK_TYPE],
+                 'segmentation_id': segment[api.SEGMENTATION_ID],
+                 'physical_network': segment[api.PHYSICAL_NETWORK]}
+        LOG.debug(_("Returning: %s"), entry)
+        return entry
 
     def _find_segment(self, segments, segment_id):
         for segment in segments:
@@ -202,6 +245,66 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
         plugin.update_port_status(rpc_context, port_id,
                                   q_const.PORT_STATUS_ACTIVE)
 
+    def _get_ports_bound_to_host(self, devices, host):
+        """Map the devices to their port id, skipping foreign ones.
+
+        The bindings of all the ports are read with a single query, ports
+        not bound to the given host are left out.
+        """
+        port_ids = dict((device, self._device_to_port_id(device))
+                        for device in devices)
+        if not host:
+            return port_ids
+        session = db_api.get_session()
+        ports = db.get_ports_and_bindings(session, port_ids.values())
+        bound_port_ids = {}
+        for device, port_id in port_ids.iteritems():
+            port, binding = ports.get(port_id, (None, None))
+            if not binding or binding.host != host:
+                LOG.debug(_("Device %(device)s not bound to the"
+                            " agent host %(host)s"),
+                          {'device': device, 'host': host})
+                continue
+            bound_port_ids[device] = port_id
+        return bound_port_ids
+
+    def update_devices_down(self, rpc_context, **kwargs):
+        """Devices no longer exist on agent.
+
+        Returns, for each device, whether its port still exists.
+        """
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        host = kwargs.get('host')
+        LOG.debug(_("%(count)d devices no longer exist at agent "
+                    "%(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids = self._get_ports_bound_to_host(devices, host)
+        devices_down = []
+        for device in devices:
+            port_exists = True
+            if device in port_ids:
+                port_exists = plugin.update_port_status(
+                    rpc_context, port_ids[device], q_const.PORT_STATUS_DOWN)
+            devices_down.append({'device': device,
+                                 'exists': port_exists})
+        return devices_down
+
+    def update_devices_up(self, rpc_context, **kwargs):
+        """Devices are up on agent."""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        host = kwargs.get('host')
+        LOG.debug(_("%(count)d devices up at agent %(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids = self._get_ports_bound_to_host(devices, host)
+        for device in devices:
+            if device in port_ids:
+                plugin.update_port_status(rpc_context, port_ids[device],
+                                          q_const.PORT_STATUS_ACTIVE)
+
 
 class AgentNotifierApi(proxy.RpcProxy,
                        sg_rpc.SecurityGroupAgentRpcApiMixin,
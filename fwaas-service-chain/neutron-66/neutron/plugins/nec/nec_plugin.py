@@ -678,8 +678,8 @@ class NECPluginV2AgentNotifierApi(proxy.RpcProxy,
 
 
 class DhcpRpcCallback(dhcp_rpc_base.DhcpRpcCallbackMixin):
-    # DhcpPluginApi BASE_RPC_API_VERSION
-    RPC_API_VERSION = '1.1'
+    # DhcpPluginApi get_networks_info version
+    RPC_API_VERSION = '1.2'
 
 
 class L3RpcCallback(l3_rpc_base.L3RpcCallbackMixin):
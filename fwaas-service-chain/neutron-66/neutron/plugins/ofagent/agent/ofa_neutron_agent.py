@@ -1065,21 +1065,22 @@ class OFANeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                     self.tun_br_ofports[tunnel_type].pop(remote_ip, None)
 
     def treat_devices_added(self, devices):
-        resync = False
         self.sg_agent.prepare_devices_filter(devices)
         for device in devices:
             LOG.info(_("Port %s added"), device)
-            try:
-                details = self.plugin_rpc.get_device_details(self.context,
-                                                             device,
-                                                             self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-            port = self.int_br.get_vif_port_by_id(details['device'])
+        try:
+            devices_details_list = self.plugin_rpc.get_devices_details_list(
+                self.context, list(devices), self.agent_id)
+        except Exception as e:
+            LOG.debug(_("Unable to get port details for "
+                        "%(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        devices_up = []
+        for details in devices_details_list:
+            device = details['device']
+            port = self.int_br.get_vif_port_by_id(device)
             if 'port_id' in details:
                 LOG.info(_("Port %(device)s updated. Details: %(details)s"),
                          {'device': device, 'details': details})
@@ -1091,75 +1092,81 @@ class OFANeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                                     details['admin_state_up'])
 
                 # update plugin about port status
-                self.plugin_rpc.update_device_up(self.context,
-                                                 device,
-                                                 self.agent_id,
-                                                 cfg.CONF.host)
+                devices_up.append(device)
             else:
                 LOG.debug(_("Device %s not defined on plugin"), device)
                 if (port and int(port.ofport) != -1):
                     self.port_dead(port)
-        return resync
+        if devices_up:
+            try:
+                self.plugin_rpc.update_devices_up(self.context,
+                                                  devices_up,
+                                                  self.agent_id,
+                                                  cfg.CONF.host)
+            except Exception as e:
+                LOG.debug(_("Unable to update status of ports "
+                            "%(devices)s: %(e)s"),
+                          {'devices': devices_up, 'e': e})
+                return True
+        return False
 
     def treat_ancillary_devices_added(self, devices):
-        resync = False
         for device in devices:
             LOG.info(_("Ancillary Port %s added"), device)
-            try:
-                self.plugin_rpc.get_device_details(self.context, device,
-                                                   self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-
+        try:
+            self.plugin_rpc.get_devices_details_list(self.context,
+                                                     list(devices),
+                                                     self.agent_id)
             # update plugin about port status
-            self.plugin_rpc.update_device_up(self.context,
-                                             device,
-                                             self.agent_id,
-                                             cfg.CONF.host)
-        return resync
+            self.plugin_rpc.update_devices_up(self.context,
+                                              list(devices),
+                                              self.agent_id,
+                                              cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("Unable to get port details for "
+                        "%(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        return False
 
     def treat_devices_removed(self, devices):
-        resync = False
         self.sg_agent.remove_devices_filter(devices)
         for device in devices:
             LOG.info(_("Attachment %s removed"), device)
-            try:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
+        try:
+            self.plugin_rpc.update_devices_down(self.context,
+                                                list(devices),
+                                                self.agent_id,
+                                                cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("port_removed failed for %(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        for device in devices:
             self.port_unbound(device)
-        return resync
+        return False
 
     def treat_ancillary_devices_removed(self, devices):
-        resync = False
         for device in devices:
             LOG.info(_("Attachment %s removed"), device)
-            try:
-                details = self.plugin_rpc.update_device_down(self.context,
-                                                             device,
-                                                             self.agent_id,
-                                                             cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
+        try:
+            devices_down = self.plugin_rpc.update_devices_down(
+                self.context, list(devices), self.agent_id, cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("port_removed failed for %(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        for details in devices_down:
             if details['exists']:
-                LOG.info(_("Port %s updated."), device)
+                LOG.info(_("Port %s updated."), details['device'])
                 # Nothing to do regarding local networking
             else:
-                LOG.debug(_("Device %s not defined on plugin"), device)
-        return resync
+                LOG.debug(_("Device %s not defined on plugin"),
+                          details['device'])
+        return False
 
     def process_network_ports(self, port_info):
         resync_add = False
@@ -17,6 +17,7 @@
 import signal
 import sys
 import time
+import uuid
 
 import eventlet
 import netaddr
@@ -48,6 +49,9 @@ LOG = logging.getLogger(__name__)
 # A placeholder for dead vlans.
 DEAD_VLAN_TAG = str(q_const.MAX_VLAN_TAG + 1)
 
+# Flow cookies are 64 bits long
+UINT64_BITMASK = (1 << 64) - 1
+
 
 # A class to represent a VIF (i.e., a port that has 'iface-id' and 'vif-mac'
 # attributes set).
@@ -63,6 +67,9 @@ class LocalVLANMapping:
         self.vif_ports = vif_ports
         # set of tunnel ports on which packets should be flooded
         self.tun_ofports = set()
+        # remote MAC addresses with a unicast flow, and the tunnel port
+        # used to reach them
+        self.tun_ucast_ofports = {}
 
     def __str__(self):
         return ("lv-id = %s type = %s phys-net = %s phys-id = %s" %
@@ -150,7 +157,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                  bridge_mappings, root_helper,
                  polling_interval, tunnel_types=None,
                  veth_mtu=None, l2_population=False,
-                 minimize_polling=False,
+                 arp_responder=False, minimize_polling=False,
                  ovsdb_monitor_respawn_interval=(
                      constants.DEFAULT_OVSDBMON_RESPAWN)):
         '''Constructor.
@@ -165,6 +172,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                the agent. If set, will automatically set enable_tunneling to
                True.
         :param veth_mtu: MTU size for veth interfaces.
+        :param l2_population: Optional, whether to use l2population.
+        :param arp_responder: Optional, whether to answer the ARP requests
+               for the l2population remote ports in the tunnel bridge.
         :param minimize_polling: Optional, whether to minimize polling by
                monitoring ovsdb for interface changes.
         :param ovsdb_monitor_respawn_interval: Optional, when using polling
@@ -175,8 +185,16 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         self.root_helper = root_helper
         self.available_local_vlans = set(xrange(q_const.MIN_VLAN_TAG,
                                                 q_const.MAX_VLAN_TAG))
+        # Local VLANs of the ports tagged by the previous run of the agent,
+        # and the ones of them known to belong to a network
+        self.reserved_local_vlans = set()
+        self.local_vlan_hints = {}
         self.tunnel_types = tunnel_types or []
         self.l2_pop = l2_population
+        if arp_responder and not l2_population:
+            LOG.warning(_("The ARP responder requires l2population, it is "
+                          "disabled"))
+        self.arp_responder_enabled = arp_responder and l2_population
         self.agent_state = {
             'binary': 'neutron-openvswitch-agent',
             'host': cfg.CONF.host,
@@ -184,12 +202,24 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             'configurations': {'bridge_mappings': bridge_mappings,
                                'tunnel_types': self.tunnel_types,
                                'tunneling_ip': local_ip,
-                               'l2_population': self.l2_pop},
+                               'l2_population': self.l2_pop,
+                               'arp_responder_enabled':
+                               self.arp_responder_enabled},
             'agent_type': q_const.AGENT_TYPE_OVS,
             'start_flag': True}
 
         # Keep track of int_br's device count for use by _report_state()
         self.int_br_device_count = 0
+        # State of int_br read once per rpc_loop iteration
+        self.int_br_snapshot = None
+        # Cookie of the flows installed by this run of the agent, the flows
+        # of the previous runs are removed once the agent is in sync
+        self.flow_cookie = '0x%x' % (uuid.uuid4().int & UINT64_BITMASK)
+        self.stale_flows_cleanup_needed = True
+        # With l2population, the tunnelled networks whose fdb entries were
+        # not received yet, and until when the stale flows are kept for them
+        self.fdb_pending_networks = set()
+        self.stale_flows_deadline = None
 
         self.int_br = ovs_lib.OVSBridge(integ_br, self.root_helper)
         self.setup_rpc()
@@ -232,6 +262,15 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             except SystemError:
                 LOG.exception(_("Agent terminated"))
                 raise SystemExit(1)
+        if (self.arp_responder_enabled and
+                not ovs_lib.check_ovs_arp_responder_version(
+                    self.root_helper)):
+            LOG.warning(_("The ARP responder requires Open vSwitch "
+                          "%s or newer, it is disabled"),
+                        constants.MINIMUM_OVS_ARP_RESPONDER_VERSION)
+            self.arp_responder_enabled = False
+            self.agent_state['configurations']['arp_responder_enabled'] = (
+                False)
 
     def _report_state(self):
         # How many devices are likely used by a VM
@@ -328,7 +367,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             agent_ports = values.get('ports')
             agent_ports.pop(self.local_ip, None)
             if len(agent_ports):
+                self.fdb_pending_networks.discard(network_id)
                 self.tun_br.defer_apply_on()
+                flood_ofports = set(lvm.tun_ofports)
                 for agent_ip, ports in agent_ports.items():
                     # Ensure we have a tunnel port with this remote agent
                     ofport = self.tun_br_ofports[
@@ -344,6 +385,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                             continue
                     for port in ports:
                         self._add_fdb_flow(port, agent_ip, lvm, ofport)
+                # The flood flow is only written once for the whole update
+                if lvm.tun_ofports != flood_ofports:
+                    self._set_flood_flow(lvm)
                 self.tun_br.defer_apply_off()
 
     def fdb_remove(self, context, fdb_entries):
@@ -357,6 +401,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             agent_ports.pop(self.local_ip, None)
             if len(agent_ports):
                 self.tun_br.defer_apply_on()
+                flood_ofports = set(lvm.tun_ofports)
                 for agent_ip, ports in agent_ports.items():
                     ofport = self.tun_br_ofports[
                         lvm.network_type].get(agent_ip)
@@ -364,46 +409,109 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                         continue
                     for port in ports:
                         self._del_fdb_flow(port, agent_ip, lvm, ofport)
+                if lvm.tun_ofports != flood_ofports:
+                    self._set_flood_flow(lvm)
+                    # Check if the tunnel ports are still used
+                    for ofport in flood_ofports - lvm.tun_ofports:
+                        self.cleanup_tunnel_port(ofport, lvm.network_type)
                 self.tun_br.defer_apply_off()
 
-    def _add_fdb_flow(self, port_info, agent_ip, lvm, ofport):
-        if port_info == q_const.FLOODING_ENTRY:
-            lvm.tun_ofports.add(ofport)
+    def _set_flood_flow(self, lvm):
+        if lvm.tun_ofports:
             ofports = ','.join(lvm.tun_ofports)
             self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
                                  dl_vlan=lvm.vlan,
                                  actions="strip_vlan,set_tunnel:%s,"
                                  "output:%s" % (lvm.segmentation_id, ofports))
         else:
-            # TODO(feleouet): add ARP responder entry
+            # This local vlan doesn't require any more tunelling
+            self.tun_br.delete_flows(table=constants.FLOOD_TO_TUN,
+                                     dl_vlan=lvm.vlan)
+
+    def _add_fdb_flow(self, port_info, agent_ip, lvm, ofport):
+        if port_info == q_const.FLOODING_ENTRY:
+            lvm.tun_ofports.add(ofport)
+        else:
+            mac = port_info[0]
+            self._set_arp_responder('add', lvm.vlan, mac, port_info[1])
+            if lvm.tun_ucast_ofports.get(mac) == ofport:
+                # Already installed, e.g. for another IP of the port
+                return
+            lvm.tun_ucast_ofports[mac] = ofport
             self.tun_br.add_flow(table=constants.UCAST_TO_TUN,
                                  priority=2,
                                  dl_vlan=lvm.vlan,
-                                 dl_dst=port_info[0],
+                                 dl_dst=mac,
                                  actions="strip_vlan,set_tunnel:%s,output:%s" %
                                  (lvm.segmentation_id, ofport))
 
     def _del_fdb_flow(self, port_info, agent_ip, lvm, ofport):
         if port_info == q_const.FLOODING_ENTRY:
-            lvm.tun_ofports.remove(ofport)
-            if len(lvm.tun_ofports) > 0:
-                ofports = ','.join(lvm.tun_ofports)
-                self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
-                                     dl_vlan=lvm.vlan,
-                                     actions="strip_vlan,"
-                                     "set_tunnel:%s,output:%s" %
-                                     (lvm.segmentation_id, ofports))
-            else:
-                # This local vlan doesn't require any more tunelling
-                self.tun_br.delete_flows(table=constants.FLOOD_TO_TUN,
-                                         dl_vlan=lvm.vlan)
-            # Check if this tunnel port is still used
-            self.cleanup_tunnel_port(ofport, lvm.network_type)
+            lvm.tun_ofports.discard(ofport)
         else:
-            #TODO(feleouet): remove ARP responder entry
+            mac = port_info[0]
+            owner = lvm.tun_ucast_ofports.get(mac)
+            if owner is not None and owner != ofport:
+                # The address moved to another agent, which now owns both
+                # its unicast flow and its ARP responder entry
+                return
+            self._set_arp_responder('remove', lvm.vlan, mac, port_info[1])
+            if owner is None:
+                # Already removed, e.g. for another IP of the port
+                return
+            del lvm.tun_ucast_ofports[mac]
             self.tun_br.delete_flows(table=constants.UCAST_TO_TUN,
                                      dl_vlan=lvm.vlan,
-                                     dl_dst=port_info[0])
+                                     dl_dst=mac)
+
+    def _fdb_chg_ip(self, context, fdb_entries):
+        '''Update the ARP responder entries of ports which changed IPs.'''
+        LOG.debug(_("update chg_ip received"))
+        if not self.arp_responder_enabled:
+            return
+        self.tun_br.defer_apply_on()
+        for network_id, agent_ports in fdb_entries.items():
+            lvm = self.local_vlan_map.get(network_id)
+            if not lvm:
+                continue
+            for agent_ip, state in agent_ports.items():
+                if agent_ip == self.local_ip:
+                    continue
+                for mac, ip in state.get('after', []):
+                    self._set_arp_responder('add', lvm.vlan, mac, ip)
+                for mac, ip in state.get('before', []):
+                    self._set_arp_responder('remove', lvm.vlan, mac, ip)
+        self.tun_br.defer_apply_off()
+
+    def _set_arp_responder(self, action, lvid, mac_str, ip_str):
+        '''Add or remove the ARP responder entry of a remote port.
+
+        :param action: 'add' or 'remove'
+        :param lvid: the local VLAN of the network of the port.
+        :param mac_str: the MAC address of the port.
+        :param ip_str: the IP address of the port.
+        '''
+        if not self.arp_responder_enabled:
+            return
+        ip = netaddr.IPAddress(ip_str)
+        if ip.version != 4:
+            # IPv6 neighbour discovery is not handled
+            return
+        if action == 'add':
+            mac = netaddr.EUI(mac_str, dialect=netaddr.mac_unix)
+            actions = constants.ARP_RESPONDER_ACTIONS % {'mac': mac,
+                                                         'ip': ip}
+            self.tun_br.add_flow(table=constants.ARP_RESPONDER,
+                                 priority=1,
+                                 proto='arp',
+                                 dl_vlan=lvid,
+                                 nw_dst='%s' % ip,
+                                 actions=actions)
+        elif action == 'remove':
+            self.tun_br.delete_flows(table=constants.ARP_RESPONDER,
+                                     proto='arp',
+                                     dl_vlan=lvid,
+                                     nw_dst='%s' % ip)
 
     def fdb_update(self, context, fdb_entries):
         LOG.debug(_("fdb_update received"))
@@ -433,10 +541,15 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         :param segmentation_id: the VID for 'vlan' or tunnel ID for 'tunnel'
         '''
 
-        if not self.available_local_vlans:
+        lvid = self.local_vlan_hints.pop(net_uuid, None)
+        if lvid is not None:
+            # The local VLAN of the network before the agent restarted
+            self.reserved_local_vlans.discard(lvid)
+        elif not self.available_local_vlans:
             LOG.error(_("No local VLAN available for net-id=%s"), net_uuid)
             return
-        lvid = self.available_local_vlans.pop()
+        else:
+            lvid = self.available_local_vlans.pop()
         LOG.info(_("Assigning %(vlan_id)s as local vlan for "
                    "net-id=%(net_uuid)s"),
                  {'vlan_id': lvid, 'net_uuid': net_uuid})
@@ -461,6 +574,10 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                                      tun_id=segmentation_id,
                                      actions="mod_vlan_vid:%s,resubmit(,%s)" %
                                      (lvid, constants.LEARN_FROM_TUN))
+                if self.l2_pop and self.stale_flows_cleanup_needed:
+                    # the flows towards the tunnels are only set up again
+                    # when the fdb entries of the network are received
+                    self.fdb_pending_networks.add(net_uuid)
             else:
                 LOG.error(_("Cannot provision %(network_type)s network for "
                           "net-id=%(net_uuid)s - tunneling disabled"),
@@ -526,6 +643,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         if lvm is None:
             LOG.debug(_("Network %s not used on agent."), net_uuid)
             return
+        self.fdb_pending_networks.discard(net_uuid)
 
         LOG.info(_("Reclaiming vlan = %(vlan_id)s from net-id = %(net_uuid)s"),
                  {'vlan_id': lvm.vlan,
@@ -591,10 +709,14 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         lvm = self.local_vlan_map[net_uuid]
         lvm.vif_ports[port.vif_id] = port
         # Do not bind a port if it's already bound
-        cur_tag = self.int_br.db_get_val("Port", port.port_name, "tag")
+        cur_tag = self._get_port_tag(port.port_name)
         if cur_tag != str(lvm.vlan):
-            self.int_br.set_db_attribute("Port", port.port_name, "tag",
-                                         str(lvm.vlan))
+            # The network is stored along with the tag, so that it gets the
+            # same local VLAN when the agent restarts
+            self.int_br.set_db_attributes(
+                "Port", port.port_name,
+                [("tag", str(lvm.vlan)),
+                 ("other_config:net_uuid", net_uuid)])
             if port.ofport != -1:
                 self.int_br.delete_flows(in_port=port.ofport)
 
@@ -627,7 +749,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         :param port: a ovs_lib.VifPort object.
         '''
         # Don't kill a port if it's already dead
-        cur_tag = self.int_br.db_get_val("Port", port.port_name, "tag")
+        cur_tag = self._get_port_tag(port.port_name)
         if cur_tag != DEAD_VLAN_TAG:
             self.int_br.set_db_attribute("Port", port.port_name, "tag",
                                          DEAD_VLAN_TAG)
@@ -637,15 +759,96 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
     def setup_integration_br(self):
         '''Setup the integration bridge.
 
-        Create patch ports and remove all existing flows.
+        Create patch ports and reset the existing flows.
 
         :param bridge_name: the name of the integration bridge.
         :returns: the integration bridge
         '''
-        self.int_br.delete_port(cfg.CONF.OVS.int_peer_patch_port)
-        self.int_br.remove_all_flows()
+        if cfg.CONF.AGENT.drop_flows_on_start or not self.tunnel_types:
+            self.int_br.delete_port(cfg.CONF.OVS.int_peer_patch_port)
+        self._setup_bridge_flows(self.int_br)
         # switch all traffic using L2 learning
         self.int_br.add_flow(priority=1, actions="normal")
+        self._restore_local_vlans()
+
+    def _restore_local_vlans(self):
+        '''Reserve the local VLANs of the ports tagged by the previous run.
+
+        The flows kept from the previous run match on the local VLANs it
+        assigned. A network gets its local VLAN back, found from the tag of
+        its ports and the net_uuid stored with it by port_bound. The tags
+        of the other ports are not assigned until the stale flows are
+        removed, so that no port is switched in another network meanwhile.
+        '''
+        port_configs = self.int_br.get_port_tags_and_other_config()
+        hinted_vlans = set()
+        for _port_name, (tag, other_config) in sorted(port_configs.items()):
+            if (not isinstance(tag, int) or
+                    not q_const.MIN_VLAN_TAG <= tag < q_const.MAX_VLAN_TAG):
+                # not tagged or dead
+                continue
+            self.available_local_vlans.discard(tag)
+            self.reserved_local_vlans.add(tag)
+            net_uuid = other_config.get('net_uuid')
+            if (net_uuid and net_uuid not in self.local_vlan_hints and
+                    tag not in hinted_vlans):
+                self.local_vlan_hints[net_uuid] = tag
+                hinted_vlans.add(tag)
+        if self.reserved_local_vlans:
+            LOG.info(_("Restored the local VLANs of %(count)d networks, "
+                       "%(reserved)d local VLANs are reserved until the "
+                       "agent is in sync"),
+                     {'count': len(self.local_vlan_hints),
+                      'reserved': len(self.reserved_local_vlans)})
+
+    def _release_local_vlans(self):
+        '''Release the reserved local VLANs not assigned again.'''
+        self.available_local_vlans.update(self.reserved_local_vlans)
+        self.reserved_local_vlans = set()
+        self.local_vlan_hints = {}
+
+    def _setup_bridge_flows(self, br):
+        '''Prepare a bridge for the installation of the agent flows.
+
+        Unless drop_flows_on_start is set, the flows of the previous run of
+        the agent are kept until cleanup_stale_flows is called.
+        '''
+        br.set_flow_cookie(self.flow_cookie)
+        if cfg.CONF.AGENT.drop_flows_on_start:
+            br.remove_all_flows()
+        else:
+            br.start_flow_reconciliation()
+
+    def cleanup_stale_flows(self):
+        '''Remove the flows not set up again since the agent started.'''
+        bridges = [self.int_br] + self.phys_brs.values()
+        if self.enable_tunneling:
+            bridges.append(self.tun_br)
+        for br in bridges:
+            br.cleanup_stale_flows()
+        # The flows of the reserved local VLANs are gone now
+        self._release_local_vlans()
+        self.fdb_pending_networks = set()
+        self.stale_flows_cleanup_needed = False
+
+    def _fdb_entries_received(self):
+        '''Whether the l2population fdb entries of the networks are in.
+
+        They are sent once the ports are reported up, so the flows
+        towards the tunnels are kept until they arrive for every
+        tunnelled network, or until l2pop_stale_flows_timeout expired.
+        '''
+        if not self.fdb_pending_networks:
+            return True
+        now = time.time()
+        if self.stale_flows_deadline is None:
+            self.stale_flows_deadline = (
+                now + cfg.CONF.AGENT.l2pop_stale_flows_timeout)
+        if now < self.stale_flows_deadline:
+            return False
+        LOG.info(_("No fdb entries received for networks %s, removing the "
+                   "stale flows"), list(self.fdb_pending_networks))
+        return True
 
     def setup_ancillary_bridges(self, integ_br, tun_br):
         '''Setup ancillary bridges - for example br-ex.'''
@@ -682,7 +885,10 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         :param tun_br: the name of the tunnel bridge.
         '''
         self.tun_br = ovs_lib.OVSBridge(tun_br, self.root_helper)
-        self.tun_br.reset_bridge()
+        if cfg.CONF.AGENT.drop_flows_on_start:
+            self.tun_br.reset_bridge()
+        else:
+            self.tun_br.create()
         self.patch_tun_ofport = self.int_br.add_patch_port(
             cfg.CONF.OVS.int_peer_patch_port, cfg.CONF.OVS.tun_peer_patch_port)
         self.patch_int_ofport = self.tun_br.add_patch_port(
@@ -693,7 +899,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                         "of OVS does not support tunnels or patch ports. "
                         "Agent terminated!"))
             exit(1)
-        self.tun_br.remove_all_flows()
+        self._setup_bridge_flows(self.tun_br)
 
         # Table 0 (default) will sort incoming traffic depending on in_port
         self.tun_br.add_flow(priority=1,
@@ -742,6 +948,19 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                              priority=0,
                              actions="resubmit(,%s)" %
                              constants.FLOOD_TO_TUN)
+        if self.arp_responder_enabled:
+            # ARP broadcast requests are answered locally in table
+            # ARP_RESPONDER when the target is known, and flooded otherwise
+            self.tun_br.add_flow(table=constants.PATCH_LV_TO_TUN,
+                                 priority=2,
+                                 proto='arp',
+                                 dl_dst="ff:ff:ff:ff:ff:ff",
+                                 actions="resubmit(,%s)" %
+                                 constants.ARP_RESPONDER)
+            self.tun_br.add_flow(table=constants.ARP_RESPONDER,
+                                 priority=0,
+                                 actions="resubmit(,%s)" %
+                                 constants.FLOOD_TO_TUN)
         # FLOOD_TO_TUN will handle flooding in tunnels based on lvid,
         # for now, add a default drop action
         self.tun_br.add_flow(table=constants.FLOOD_TO_TUN,
@@ -774,25 +993,39 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                            'bridge': bridge})
                 sys.exit(1)
             br = ovs_lib.OVSBridge(bridge, self.root_helper)
-            br.remove_all_flows()
+            self._setup_bridge_flows(br)
             br.add_flow(priority=1, actions="normal")
             self.phys_brs[physical_network] = br
 
             # create veth to patch physical bridge with integration bridge
             int_veth_name = constants.VETH_INTEGRATION_PREFIX + bridge
-            self.int_br.delete_port(int_veth_name)
             phys_veth_name = constants.VETH_PHYSICAL_PREFIX + bridge
-            br.delete_port(phys_veth_name)
-            if ip_lib.device_exists(int_veth_name, self.root_helper):
-                ip_lib.IPDevice(int_veth_name, self.root_helper).link.delete()
-                # Give udev a chance to process its rules here, to avoid
-                # race conditions between commands launched by udev rules
-                # and the subsequent call to ip_wrapper.add_veth
-                utils.execute(['/sbin/udevadm', 'settle', '--timeout=10'])
-            int_veth, phys_veth = ip_wrapper.add_veth(int_veth_name,
-                                                      phys_veth_name)
-            self.int_ofports[physical_network] = self.int_br.add_port(int_veth)
-            self.phys_ofports[physical_network] = br.add_port(phys_veth)
+            int_ofport = phys_ofport = None
+            if not cfg.CONF.AGENT.drop_flows_on_start:
+                # Keep the veth of the previous run, recreating it would
+                # interrupt the traffic of the physical network
+                int_ofport = self._get_veth_ofport(self.int_br, int_veth_name)
+                phys_ofport = self._get_veth_ofport(br, phys_veth_name)
+            if int_ofport and phys_ofport:
+                int_veth = ip_lib.IPDevice(int_veth_name, self.root_helper)
+                phys_veth = ip_lib.IPDevice(phys_veth_name, self.root_helper)
+            else:
+                self.int_br.delete_port(int_veth_name)
+                br.delete_port(phys_veth_name)
+                if ip_lib.device_exists(int_veth_name, self.root_helper):
+                    ip_lib.IPDevice(int_veth_name,
+                                    self.root_helper).link.delete()
+                    # Give udev a chance to process its rules here, to avoid
+                    # race conditions between commands launched by udev
+                    # rules and the subsequent call to ip_wrapper.add_veth
+                    utils.execute(['/sbin/udevadm', 'settle',
+                                   '--timeout=10'])
+                int_veth, phys_veth = ip_wrapper.add_veth(int_veth_name,
+                                                          phys_veth_name)
+                int_ofport = self.int_br.add_port(int_veth)
+                phys_ofport = br.add_port(phys_veth)
+            self.int_ofports[physical_network] = int_ofport
+            self.phys_ofports[physical_network] = phys_ofport
 
             # block all untranslated traffic over veth between bridges
             self.int_br.add_flow(priority=2,
@@ -811,8 +1044,77 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 int_veth.link.set_mtu(self.veth_mtu)
                 phys_veth.link.set_mtu(self.veth_mtu)
 
+    def _get_veth_ofport(self, br, port_name):
+        '''Return the ofport of a port of a bridge if it is usable.'''
+        ofport = br.get_port_ofport(port_name)
+        try:
+            if int(ofport) > 0:
+                return ofport
+        except (TypeError, ValueError):
+            pass
+
+    def _get_port_tag(self, port_name):
+        if self.int_br_snapshot:
+            return self.int_br_snapshot.get_port_tag(port_name)
+        return self.int_br.db_get_val("Port", port_name, "tag")
+
+    def _get_vif_port_by_id(self, port_id):
+        if self.int_br_snapshot:
+            return self.int_br_snapshot.get_vif_port_by_id(port_id)
+        return self.int_br.get_vif_port_by_id(port_id)
+
     def scan_ports(self, registered_ports, updated_ports=None):
-        cur_ports = self.int_br.get_vif_port_set()
+        self.int_br_snapshot = self.int_br.get_snapshot()
+        cur_ports = self.int_br_snapshot.get_vif_port_set()
+        return self._get_port_info(registered_ports, cur_ports, updated_ports)
+
+    def process_port_events(self, events, registered_ports,
+                            updated_ports=None):
+        """Compute the port changes from ovsdb monitor interface events.
+
+        Unlike scan_ports(), only the interfaces reported by the events are
+        looked at, the other registered ports are assumed unchanged.
+        """
+        self.int_br_snapshot = self.int_br.get_snapshot()
+        cur_ports = set(registered_ports)
+        if updated_ports is None:
+            updated_ports = set()
+        # port id -> name of the interfaces which might be new VIF ports
+        candidates = {}
+        for event in events:
+            external_ids = event.get('external_ids') or {}
+            if 'attached-mac' not in external_ids:
+                continue
+            if 'iface-id' in external_ids:
+                port_id = external_ids['iface-id']
+            elif 'xs-vif-uuid' in external_ids:
+                port_id = self.int_br.get_xapi_iface_id(
+                    external_ids['xs-vif-uuid'])
+            else:
+                continue
+            candidates.pop(port_id, None)
+            ofport = event.get('ofport')
+            if (event['action'] == 'removed' or
+                    not isinstance(ofport, int) or ofport <= 0):
+                # Gone, or not yet ready or failed as for get_vif_port_set
+                cur_ports.discard(port_id)
+                continue
+            candidates[port_id] = event['name']
+            if (event['action'] == 'modified' and
+                    'ofport' in event.get('changed', [])):
+                # The interface has been replugged
+                updated_ports.add(port_id)
+        if candidates:
+            # The monitor reports the interfaces of all bridges
+            int_br_ports = set(self.int_br_snapshot.get_port_name_list())
+            for port_id, name in candidates.iteritems():
+                if name in int_br_ports:
+                    cur_ports.add(port_id)
+                else:
+                    cur_ports.discard(port_id)
+        return self._get_port_info(registered_ports, cur_ports, updated_ports)
+
+    def _get_port_info(self, registered_ports, cur_ports, updated_ports):
         self.int_br_device_count = len(cur_ports)
         port_info = {'current': cur_ports}
         if updated_ports is None:
@@ -844,19 +1146,22 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         The returned value is a set of port ids of the ports concerned by a
         vlan tag loss.
         """
-        port_tags = self.int_br.get_port_tag_dict()
+        if self.int_br_snapshot:
+            port_tags = self.int_br_snapshot.get_port_tag_dict()
+        else:
+            port_tags = self.int_br.get_port_tag_dict()
         changed_ports = set()
         for lvm in self.local_vlan_map.values():
-            for port in registered_ports:
+            for port, vif_port in lvm.vif_ports.iteritems():
                 if (
-                    port in lvm.vif_ports
-                    and lvm.vif_ports[port].port_name in port_tags
-                    and port_tags[lvm.vif_ports[port].port_name] != lvm.vlan
+                    port in registered_ports
+                    and vif_port.port_name in port_tags
+                    and port_tags[vif_port.port_name] != lvm.vlan
                 ):
                     LOG.info(
                         _("Port '%(port_name)s' has lost "
                             "its vlan tag '%(vlan_tag)d'!"),
-                        {'port_name': lvm.vif_ports[port].port_name,
+                        {'port_name': vif_port.port_name,
                          'vlan_tag': lvm.vlan}
                     )
                     changed_ports.add(port)
@@ -899,6 +1204,46 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                                              self.local_ip,
                                              tunnel_type,
                                              self.vxlan_udp_port)
+        if not self._setup_tunnel_flow(ofport, remote_ip, tunnel_type):
+            return 0
+        if not self.l2_pop:
+            self._update_tunnel_flood_flows(tunnel_type)
+        return ofport
+
+    def setup_tunnel_ports(self, remote_ips, tunnel_type):
+        '''Set up several tunnel ports at once.
+
+        The missing tunnel ports are created in a single OVSDB transaction
+        and their flows installed in a single batch.
+
+        :param remote_ips: a dict mapping the names of the tunnel ports to
+            the IP addresses of the remote endpoints.
+        :param tunnel_type: the type of the tunnels.
+        '''
+        known_ips = self.tun_br_ofports[tunnel_type]
+        remote_ips = dict((port_name, remote_ip)
+                          for port_name, remote_ip in remote_ips.iteritems()
+                          if remote_ip not in known_ips)
+        if not remote_ips:
+            return
+        ofports = self.tun_br.add_tunnel_ports(remote_ips,
+                                               self.local_ip,
+                                               tunnel_type,
+                                               self.vxlan_udp_port)
+        self.tun_br.defer_apply_on()
+        added = False
+        for port_name, remote_ip in remote_ips.iteritems():
+            added |= self._setup_tunnel_flow(ofports.get(port_name),
+                                             remote_ip, tunnel_type)
+        if added and not self.l2_pop:
+            self._update_tunnel_flood_flows(tunnel_type)
+        self.tun_br.defer_apply_off()
+
+    def _setup_tunnel_flow(self, ofport, remote_ip, tunnel_type):
+        '''Register a new tunnel port and add its input flow.
+
+        Return False if the tunnel port could not be created.
+        '''
         ofport_int = -1
         try:
             ofport_int = int(ofport)
@@ -908,7 +1253,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         if ofport_int < 0:
             LOG.error(_("Failed to set-up %(type)s tunnel port to %(ip)s"),
                       {'type': tunnel_type, 'ip': remote_ip})
-            return 0
+            return False
 
         self.tun_br_ofports[tunnel_type][remote_ip] = ofport
         # Add flow in default table to resubmit to the right
@@ -917,10 +1262,12 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                              in_port=ofport,
                              actions="resubmit(,%s)" %
                              constants.TUN_TABLE[tunnel_type])
+        return True
 
+    def _update_tunnel_flood_flows(self, tunnel_type):
         ofports = ','.join(self.tun_br_ofports[tunnel_type].values())
-        if ofports and not self.l2_pop:
-            # Update flooding flows to include the new tunnel
+        if ofports:
+            # Update flooding flows to include the new tunnels
             for network_id, vlan_mapping in self.local_vlan_map.iteritems():
                 if vlan_mapping.network_type == tunnel_type:
                     self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
@@ -929,7 +1276,6 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                                          "set_tunnel:%s,output:%s" %
                                          (vlan_mapping.segmentation_id,
                                           ofports))
-        return ofport
 
     def cleanup_tunnel_port(self, tun_ofport, tunnel_type):
         # Check if this tunnel port is still used
@@ -947,9 +1293,21 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
 
     def treat_devices_added_or_updated(self, devices):
         resync = False
-        for device in devices:
+        try:
+            devices_details_list = self.plugin_rpc.get_devices_details_list(
+                self.context, list(devices), self.agent_id)
+        except Exception as e:
+            LOG.debug(_("Unable to get port details for "
+                        "%(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        devices_up = []
+        devices_down = []
+        for details in devices_details_list:
+            device = details['device']
             LOG.debug(_("Processing port %s"), device)
-            port = self.int_br.get_vif_port_by_id(device)
+            port = self._get_vif_port_by_id(device)
             if not port:
                 # The port has disappeared and should not be processed
                 # There is no need to put the port DOWN in the plugin as
@@ -957,18 +1315,6 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 LOG.info(_("Port %s was not found on the integration bridge "
                            "and will therefore not be processed"), device)
                 continue
-            try:
-                # TODO(salv-orlando): Provide bulk API for retrieving
-                # details for all devices in one call
-                details = self.plugin_rpc.get_device_details(self.context,
-                                                             device,
-                                                             self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
             if 'port_id' in details:
                 LOG.info(_("Port %(device)s updated. Details: %(details)s"),
                          {'device': device, 'details': details})
@@ -981,78 +1327,86 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 # update plugin about port status
                 if details.get('admin_state_up'):
                     LOG.debug(_("Setting status for %s to UP"), device)
-                    self.plugin_rpc.update_device_up(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+                    devices_up.append(device)
                 else:
                     LOG.debug(_("Setting status for %s to DOWN"), device)
-                    self.plugin_rpc.update_device_down(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+                    devices_down.append(device)
                 LOG.info(_("Configuration for device %s completed."), device)
             else:
                 LOG.warn(_("Device %s not defined on plugin"), device)
                 if (port and port.ofport != -1):
                     self.port_dead(port)
+        try:
+            if devices_up:
+                self.plugin_rpc.update_devices_up(
+                    self.context, devices_up, self.agent_id, cfg.CONF.host)
+            if devices_down:
+                self.plugin_rpc.update_devices_down(
+                    self.context, devices_down, self.agent_id, cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("Unable to update status of ports "
+                        "%(devices)s: %(e)s"),
+                      {'devices': devices_up + devices_down, 'e': e})
+            resync = True
         return resync
 
     def treat_ancillary_devices_added(self, devices):
-        resync = False
         for device in devices:
             LOG.info(_("Ancillary Port %s added"), device)
-            try:
-                self.plugin_rpc.get_device_details(self.context, device,
-                                                   self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-
+        try:
+            self.plugin_rpc.get_devices_details_list(self.context,
+                                                     list(devices),
+                                                     self.agent_id)
             # update plugin about port status
-            self.plugin_rpc.update_device_up(self.context,
-                                             device,
-                                             self.agent_id,
-                                             cfg.CONF.host)
-        return resync
+            self.plugin_rpc.update_devices_up(self.context,
+                                              list(devices),
+                                              self.agent_id,
+                                              cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("Unable to get port details for "
+                        "%(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        return False
 
     def treat_devices_removed(self, devices):
-        resync = False
         self.sg_agent.remove_devices_filter(devices)
         for device in devices:
             LOG.info(_("Attachment %s removed"), device)
-            try:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
+        try:
+            self.plugin_rpc.update_devices_down(self.context,
+                                                list(devices),
+                                                self.agent_id,
+                                                cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("port_removed failed for %(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        for device in devices:
             self.port_unbound(device)
-        return resync
+        return False
 
     def treat_ancillary_devices_removed(self, devices):
-        resync = False
         for device in devices:
             LOG.info(_("Attachment %s removed"), device)
-            try:
-                details = self.plugin_rpc.update_device_down(self.context,
-                                                             device,
-                                                             self.agent_id,
-                                                             cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
+        try:
+            devices_down = self.plugin_rpc.update_devices_down(
+                self.context, list(devices), self.agent_id, cfg.CONF.host)
+        except Exception as e:
+            LOG.debug(_("port_removed failed for %(devices)s: %(e)s"),
+                      {'devices': devices, 'e': e})
+            # resync is needed
+            return True
+        for details in devices_down:
             if details['exists']:
-                LOG.info(_("Port %s updated."), device)
+                LOG.info(_("Port %s updated."), details['device'])
                 # Nothing to do regarding local networking
             else:
-                LOG.debug(_("Device %s not defined on plugin"), device)
-        return resync
+                LOG.debug(_("Device %s not defined on plugin"),
+                          details['device'])
+        return False
 
     def process_network_ports(self, port_info):
         resync_a = False
@@ -1134,6 +1488,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                                                       tunnel_type)
                 if not self.l2_pop:
                     tunnels = details['tunnels']
+                    remote_ips = {}
                     for tunnel in tunnels:
                         if self.local_ip != tunnel['ip_address']:
                             tunnel_id = tunnel.get('id')
@@ -1146,9 +1501,8 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                                 continue
                             tun_name = '%s-%s' % (tunnel_type,
                                                   tunnel_id or remote_ip_hex)
-                            self.setup_tunnel_port(tun_name,
-                                                   tunnel['ip_address'],
-                                                   tunnel_type)
+                            remote_ips[tun_name] = remote_ip
+                    self.setup_tunnel_ports(remote_ips, tunnel_type)
         except Exception as e:
             LOG.debug(_("Unable to sync tunnel IP %(local_ip)s: %(e)s"),
                       {'local_ip': self.local_ip, 'e': e})
@@ -1209,7 +1563,12 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                     # between these two statements, this will be thread-safe
                     updated_ports_copy = self.updated_ports
                     self.updated_ports = set()
-                    port_info = self.scan_ports(ports, updated_ports_copy)
+                    events = polling_manager.get_events()
+                    if events is None:
+                        port_info = self.scan_ports(ports, updated_ports_copy)
+                    else:
+                        port_info = self.process_port_events(
+                            events, ports, updated_ports_copy)
                     ports = port_info['current']
                     LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d - "
                                 "port information retrieved. "
@@ -1265,6 +1624,15 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                     # Put the ports back in self.updated_port
                     self.updated_ports |= updated_ports_copy
                     sync = True
+                finally:
+                    # The snapshot is only valid for this iteration
+                    self.int_br_snapshot = None
+            # Once all the ports and tunnels have been set up again, the
+            # flows left over from the previous run can be removed
+            if (self.stale_flows_cleanup_needed and not sync and
+                    not (self.enable_tunneling and tunnel_sync) and
+                    self._fdb_entries_received()):
+                self.cleanup_stale_flows()
 
             # sleep till end of polling interval
             elapsed = (time.time() - start)
@@ -1318,6 +1686,7 @@ def create_agent_config_map(config):
         tunnel_types=config.AGENT.tunnel_types,
         veth_mtu=config.AGENT.veth_mtu,
         l2_population=config.AGENT.l2_population,
+        arp_responder=config.AGENT.arp_responder,
     )
 
     # If enable_tunneling is TRUE, set tunnel_type to default to GRE
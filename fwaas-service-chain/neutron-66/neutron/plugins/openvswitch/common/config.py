@@ -80,6 +80,20 @@ agent_opts = [
     cfg.BoolOpt('l2_population', default=False,
                 help=_("Use ml2 l2population mechanism driver to learn "
                        "remote mac and IPs and improve tunnel scalability")),
+    cfg.BoolOpt('arp_responder', default=False,
+                help=_("Answer the ARP requests for the remote ports locally "
+                       "in the tunnel bridge, using the addresses learnt "
+                       "through l2population, instead of flooding them in "
+                       "the tunnels. Requires l2_population.")),
+    cfg.BoolOpt('drop_flows_on_start', default=False,
+                help=_("Remove all the flows of the bridges when the agent "
+                       "starts instead of replacing them in place. Traffic "
+                       "is interrupted until the flows are set up again.")),
+    cfg.IntOpt('l2pop_stale_flows_timeout', default=60,
+               help=_("With l2_population, the maximum number of seconds "
+                      "the flows of the previous run of the agent are kept "
+                      "once it is in sync, waiting for the fdb entries of "
+                      "its tunnelled networks.")),
 ]
 
 
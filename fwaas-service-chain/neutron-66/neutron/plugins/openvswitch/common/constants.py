@@ -33,6 +33,9 @@ VETH_PHYSICAL_PREFIX = 'phy-'
 # The minimum version of OVS which supports VXLAN tunneling
 MINIMUM_OVS_VXLAN_VERSION = "1.10"
 
+# The minimum version of OVS which can rewrite ARP packets into replies
+MINIMUM_OVS_ARP_RESPONDER_VERSION = "2.1"
+
 # The first version of the Linux kernel with converged VXLAN code for OVS
 MINIMUM_LINUX_KERNEL_OVS_VXLAN = "3.13.0"
 
@@ -46,9 +49,21 @@ VXLAN_TUN_TO_LV = 3
 LEARN_FROM_TUN = 10
 UCAST_TO_TUN = 20
 FLOOD_TO_TUN = 21
+ARP_RESPONDER = 22
 # Map tunnel types to tables number
 TUN_TABLE = {p_const.TYPE_GRE: GRE_TUN_TO_LV,
              p_const.TYPE_VXLAN: VXLAN_TUN_TO_LV}
 
+# Turn an ARP request into the reply of the ARP responder entry for its
+# target, and send it back on the port it came from
+ARP_RESPONDER_ACTIONS = ('move:NXM_OF_ETH_SRC[]->NXM_OF_ETH_DST[],'
+                         'mod_dl_src:%(mac)s,'
+                         'load:0x2->NXM_OF_ARP_OP[],'
+                         'move:NXM_NX_ARP_SHA[]->NXM_NX_ARP_THA[],'
+                         'move:NXM_OF_ARP_SPA[]->NXM_OF_ARP_TPA[],'
+                         'load:%(mac)#x->NXM_NX_ARP_SHA[],'
+                         'load:%(ip)#x->NXM_OF_ARP_SPA[],'
+                         'in_port')
+
 # The default respawn interval for the ovsdb monitor
 DEFAULT_OVSDBMON_RESPAWN = 30
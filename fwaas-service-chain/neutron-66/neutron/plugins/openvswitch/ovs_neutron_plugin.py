@@ -66,8 +66,9 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
     # history
     #   1.0 Initial version
     #   1.1 Support Security Group RPC
+    #   1.2 Support security_group_info_for_devices and get_networks_info
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
 
     def __init__(self, notifier, tunnel_type):
         self.notifier = notifier
@@ -576,7 +577,8 @@ class OVSNeutronPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                 self._process_create_allowed_address_pairs(
                     context, port,
                     port_data.get(addr_pair.ADDRESS_PAIRS)))
-        self.notify_security_groups_member_updated(context, port)
+        self.notify_security_groups_member_updated(
+            context, port, member_change=sg_db_rpc.MEMBER_ADDED)
         return port
 
     def update_port(self, context, id, port):
@@ -632,4 +634,5 @@ class OVSNeutronPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
             self._delete_port_security_group_bindings(context, id)
             super(OVSNeutronPluginV2, self).delete_port(context, id)
 
-        self.notify_security_groups_member_updated(context, port)
+        self.notify_security_groups_member_updated(
+            context, port, member_change=sg_db_rpc.MEMBER_REMOVED)
@@ -37,7 +37,7 @@ from neutron.plugins.common import constants
 
 class L3RouterPluginRpcCallbacks(l3_rpc_base.L3RpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
 
     def create_rpc_dispatcher(self):
         """Get the rpc dispatcher for this manager.
@@ -91,14 +91,13 @@ class VPNAgent(l3_agent.L3NATAgentWithStateReport):
         :param router_id: router_id
         :param chain: a string of chain name
         :param rule: a string of rule
-        :param top: unused
-            needed to have same argument with add_nat_rule
+        :param top: must be the same as when the rule was added
         """
         router_info = self.router_info.get(router_id)
         if not router_info:
             return
         router_info.iptables_manager.ipv4['nat'].remove_rule(
-            chain, rule)
+            chain, rule, top=top)
 
     def iptables_apply(self, router_id):
         """Apply IPtables.
@@ -132,15 +131,28 @@ class VPNAgent(l3_agent.L3NATAgentWithStateReport):
         for device in self.devices:
             device.destroy_router(router_id)
 
-    def _process_routers(self, routers, all_routers=False):
+    def _process_routers(self, routers):
         """Router sync event.
 
         This method overwrites parent class method.
         :param routers: list of routers
         """
-        super(VPNAgent, self)._process_routers(routers, all_routers)
+        super(VPNAgent, self)._process_routers(routers)
+        for device in self.devices:
+            for router in routers:
+                device.sync_router(self.context, router)
+
+    def _routers_synced(self, context):
+        """Full router sync event.
+
+        This method overwrites parent class method.
+        The VPN services are fetched again, the router updates only
+        use the ones fetched by the last sync.
+        :param context: context object for RPC call
+        """
+        super(VPNAgent, self)._routers_synced(context)
         for device in self.devices:
-            device.sync(self.context, routers)
+            device.sync(self.context, [])
 
 
 def main():
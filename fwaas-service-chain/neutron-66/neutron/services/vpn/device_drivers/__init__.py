@@ -29,6 +29,13 @@ class DeviceDriver(object):
     def sync(self, context, processes):
         pass
 
+    def sync_router(self, context, router):
+        """Sync the VPN service of a router processed by the agent.
+
+        Drivers which can not sync a single router run a full sync.
+        """
+        self.sync(context, [router])
+
     @abc.abstractmethod
     def create_router(self, process_id):
         pass
@@ -500,6 +500,10 @@ class IPsecDriver(device_drivers.DeviceDriver):
 
         self.processes = {}
         self.process_status_cache = {}
+        # router id -> vpnservice, as of the last get_vpn_services_on_host
+        self.vpnservices = None
+        # router id -> nat rules set up for its vpnservice
+        self.nat_rules = {}
 
         self.conn.create_consumer(
             node_topic,
@@ -515,24 +519,39 @@ class IPsecDriver(device_drivers.DeviceDriver):
     def create_rpc_dispatcher(self):
         return q_rpc.PluginRpcDispatcher([self])
 
-    def _update_nat(self, vpnservice, func):
-        """Setting up nat rule in iptables.
-
-        We need to setup nat rule for ipsec packet.
-        :param vpnservice: vpnservices
-        :param func: self.add_nat_rule or self.remove_nat_rule
-        """
+    def _get_nat_rules(self, vpnservice):
         local_cidr = vpnservice['subnet']['cidr']
-        router_id = vpnservice['router_id']
+        rules = []
         for ipsec_site_connection in vpnservice['ipsec_site_connections']:
             for peer_cidr in ipsec_site_connection['peer_cidrs']:
-                func(
-                    router_id,
-                    'POSTROUTING',
-                    '-s %s -d %s -m policy '
-                    '--dir out --pol ipsec '
-                    '-j ACCEPT ' % (local_cidr, peer_cidr),
-                    top=True)
+                rule = ('POSTROUTING',
+                        '-s %s -d %s -m policy '
+                        '--dir out --pol ipsec '
+                        '-j ACCEPT ' % (local_cidr, peer_cidr))
+                if rule not in rules:
+                    rules.append(rule)
+        return rules
+
+    def _update_nat(self, router_id, vpnservice):
+        """Setting up nat rule in iptables.
+
+        We need to setup nat rule for ipsec packet. Only the rules which
+        changed since the last update of the router are added or removed.
+        :param router_id: router id
+        :param vpnservice: vpnservice of the router, None to remove its rules
+        """
+        rules = self._get_nat_rules(vpnservice) if vpnservice else []
+        old_rules = self.nat_rules.pop(router_id, [])
+        if rules:
+            self.nat_rules[router_id] = rules
+        if rules == old_rules:
+            return
+        for chain, rule in old_rules:
+            if (chain, rule) not in rules:
+                self.agent.remove_nat_rule(router_id, chain, rule, top=True)
+        for chain, rule in rules:
+            if (chain, rule) not in old_rules:
+                self.agent.add_nat_rule(router_id, chain, rule, top=True)
         self.agent.iptables_apply(router_id)
 
     def vpnservice_updated(self, context, **kwargs):
@@ -576,7 +595,9 @@ class IPsecDriver(device_drivers.DeviceDriver):
             # In case of vpnservice is created
             # before router's namespace
             process = self.processes[process_id]
-            self._update_nat(process.vpnservice, self.agent.add_nat_rule)
+            # the rules set up in a previous namespace are gone
+            self.nat_rules.pop(process_id, None)
+            self._update_nat(process_id, process.vpnservice)
             process.enable()
 
     def destroy_router(self, process_id):
@@ -588,9 +609,7 @@ class IPsecDriver(device_drivers.DeviceDriver):
         if process_id in self.processes:
             process = self.processes[process_id]
             process.disable()
-            vpnservice = process.vpnservice
-            if vpnservice:
-                self._update_nat(vpnservice, self.agent.remove_nat_rule)
+            self._update_nat(process_id, None)
             del self.processes[process_id]
 
     def get_process_status_cache(self, process):
@@ -659,6 +678,36 @@ class IPsecDriver(device_drivers.DeviceDriver):
                 context,
                 status_changed_vpn_services)
 
+    def _fetch_vpnservices(self, context):
+        vpnservices = self.agent_rpc.get_vpn_services_on_host(
+            context, self.host)
+        self.vpnservices = dict((vpnservice['router_id'], vpnservice)
+                                for vpnservice in vpnservices)
+        return vpnservices
+
+    @lockutils.synchronized('vpn-agent', 'neutron-')
+    def sync_router(self, context, router):
+        """Sync the VPN service of a router processed by the agent.
+
+        :param context: context object for RPC call
+        :param router: the processed router
+
+        The service is taken from the ones fetched by the last sync, which
+        is run on each vpnservice_updated, so that processing all the
+        routers does not fetch and update every service once per router.
+        """
+        if self.vpnservices is None:
+            self._fetch_vpnservices(context)
+        router_id = router['id']
+        vpnservice = self.vpnservices.get(router_id)
+        if vpnservice:
+            process = self.ensure_process(router_id, vpnservice=vpnservice)
+            self._update_nat(router_id, vpnservice)
+            process.update()
+        else:
+            self.ensure_process(router_id)
+            self.destroy_router(router_id)
+
     @lockutils.synchronized('vpn-agent', 'neutron-')
     def sync(self, context, routers):
         """Sync status with server side.
@@ -676,14 +725,13 @@ class IPsecDriver(device_drivers.DeviceDriver):
         In order to handle, these failure cases,
         This driver takes simple sync strategies.
         """
-        vpnservices = self.agent_rpc.get_vpn_services_on_host(
-            context, self.host)
+        vpnservices = self._fetch_vpnservices(context)
         router_ids = [vpnservice['router_id'] for vpnservice in vpnservices]
         # Ensure the ipsec process is enabled
         for vpnservice in vpnservices:
             process = self.ensure_process(vpnservice['router_id'],
                                           vpnservice=vpnservice)
-            self._update_nat(vpnservice, self.agent.add_nat_rule)
+            self._update_nat(vpnservice['router_id'], vpnservice)
             process.update()
 
         # Delete any IPSec processes that are
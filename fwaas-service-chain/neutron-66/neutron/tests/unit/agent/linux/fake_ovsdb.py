@@ -0,0 +1,222 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process OVSDB server for the tests of the OVSDB JSON-RPC client.
+
+It speaks enough of the protocol for ovsdb_client.OvsdbClient: 'monitor'
+and 'echo' requests. Rows are given in the OVSDB wire format and are
+changed with add_row, update_row and delete_row, which push the updates
+to the monitoring connections like ovsdb-server does.
+"""
+
+import contextlib
+import os
+import socket
+import threading
+
+from neutron.agent.linux import ovsdb_client
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import uuidutils
+
+
+def ovs_set(*atoms):
+    return ['set', list(atoms)]
+
+
+def ovs_map(mapping):
+    return ['map', [[k, v] for k, v in sorted(mapping.items())]]
+
+
+def ovs_uuid_set(*uuids):
+    return ovs_set(*[['uuid', uuid] for uuid in uuids])
+
+
+class FakeOvsdbServer(object):
+
+    def __init__(self, path):
+        self.path = path
+        # table name -> row uuid -> row in the wire format
+        self.tables = {}
+        # connection -> monitored columns for each table
+        self.monitors = {}
+        self.requests = []
+        # connection -> updates not sent yet, within a transaction
+        self.pending_updates = None
+        self.lock = threading.RLock()
+        self.running = False
+        self.listener = None
+
+    def start(self):
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(5)
+        self.listener.settimeout(0.05)
+        self.running = True
+        self._start_thread(self._accept_loop)
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            for conn in self.monitors.keys():
+                conn.close()
+            self.monitors = {}
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _addr = self.listener.accept()
+            except (socket.timeout, socket.error, AttributeError):
+                continue
+            conn.settimeout(0.05)
+            self._start_thread(self._serve, conn)
+
+    def _serve(self, conn):
+        stream = ovsdb_client.JsonStream()
+        while self.running:
+            try:
+                data = conn.recv(ovsdb_client.RECV_SIZE)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            if not data:
+                break
+            for msg in stream.feed(data):
+                self._handle_request(conn, msg)
+        with self.lock:
+            self.monitors.pop(conn, None)
+        conn.close()
+
+    def _send(self, conn, msg):
+        try:
+            conn.sendall(jsonutils.dumps(msg))
+        except socket.error:
+            pass
+
+    def _handle_request(self, conn, msg):
+        with self.lock:
+            self.requests.append(msg.get('method'))
+            if msg.get('method') == 'monitor':
+                columns = dict((table, request['columns'])
+                               for table, request in msg['params'][2].items())
+                self.monitors[conn] = columns
+                updates = {}
+                for table, rows in self.tables.items():
+                    for uuid, row in rows.items():
+                        self._add_row_update(updates, columns, table, uuid,
+                                             new=row)
+                result, error = updates, None
+            elif msg.get('method') == 'echo':
+                result, error = msg['params'], None
+            else:
+                result, error = None, 'unknown method'
+            self._send(conn, {'result': result, 'error': error,
+                              'id': msg.get('id')})
+
+    def _add_row_update(self, updates, columns, table, uuid,
+                        old=None, new=None):
+        if table not in columns:
+            return
+        row_update = {}
+        if old is not None:
+            row_update['old'] = dict((c, v) for c, v in old.items()
+                                     if c in columns[table])
+        if new is not None:
+            row_update['new'] = dict((c, v) for c, v in new.items()
+                                     if c in columns[table])
+        updates.setdefault(table, {})[uuid] = row_update
+
+    def _notify(self, table, uuid, old=None, new=None):
+        for conn, columns in self.monitors.items():
+            if self.pending_updates is not None:
+                updates = self.pending_updates.setdefault(conn, {})
+            else:
+                updates = {}
+            self._add_row_update(updates, columns, table, uuid, old, new)
+            if updates and self.pending_updates is None:
+                self._send(conn, {'method': 'update',
+                                  'params': [None, updates], 'id': None})
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Send the changes made within the block in a single update."""
+        with self.lock:
+            self.pending_updates = {}
+            try:
+                yield
+            finally:
+                pending_updates, self.pending_updates = (
+                    self.pending_updates, None)
+                for conn, updates in pending_updates.items():
+                    if updates:
+                        self._send(conn, {'method': 'update',
+                                          'params': [None, updates],
+                                          'id': None})
+
+    def add_row(self, table, row, uuid=None):
+        uuid = uuid or uuidutils.generate_uuid()
+        with self.lock:
+            self.tables.setdefault(table, {})[uuid] = dict(row)
+            self._notify(table, uuid, new=row)
+        return uuid
+
+    def update_row(self, table, uuid, **columns):
+        with self.lock:
+            row = self.tables[table][uuid]
+            old = dict((c, row.get(c)) for c in columns)
+            row.update(columns)
+            self._notify(table, uuid, old=old, new=row)
+
+    def delete_row(self, table, uuid):
+        with self.lock:
+            row = self.tables[table].pop(uuid)
+            self._notify(table, uuid, old=row)
+
+    def add_bridge(self, name, datapath_id='0000000000000001',
+                   external_ids=None):
+        return self.add_row('Bridge',
+                            {'name': name, 'ports': ovs_uuid_set(),
+                             'datapath_id': datapath_id,
+                             'external_ids': ovs_map(external_ids or {})})
+
+    def add_port(self, br_uuid, name, ofport=None, external_ids=None,
+                 tag=None):
+        """Add a port with a single interface to a bridge."""
+        with self.lock:
+            iface_uuid = self.add_row(
+                'Interface',
+                {'name': name,
+                 'ofport': ofport if ofport is not None else ovs_set(),
+                 'external_ids': ovs_map(external_ids or {}),
+                 'type': ''})
+            port_uuid = self.add_row(
+                'Port',
+                {'name': name, 'interfaces': ['uuid', iface_uuid],
+                 'tag': tag if tag is not None else ovs_set()})
+            ports = self.tables['Bridge'][br_uuid]['ports'][1]
+            self.update_row('Bridge', br_uuid,
+                            ports=ovs_set(*(ports + [['uuid', port_uuid]])))
+        return port_uuid, iface_uuid
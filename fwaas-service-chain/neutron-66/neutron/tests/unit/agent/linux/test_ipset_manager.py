@@ -0,0 +1,80 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ipset_manager
+from neutron.tests import base
+
+FAKE_SG_ID = 'fake-sg-id-0123456789-0123456789'
+FAKE_SET_NAME = ipset_manager.get_name(FAKE_SG_ID, 'IPv4')
+
+
+class TestIpsetManager(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestIpsetManager, self).setUp()
+        self.execute = mock.patch.object(
+            ipset_manager.linux_utils, 'execute').start()
+        self.ipset = ipset_manager.IpsetManager(root_helper='sudo')
+
+    def test_get_name_is_truncated(self):
+        self.assertEqual(ipset_manager.IPSET_NAME_MAX_LENGTH,
+                         len(FAKE_SET_NAME))
+        self.assertTrue(FAKE_SET_NAME.startswith('NIPv4fake-sg-id'))
+
+    def test_set_members_creates_set(self):
+        self.ipset.set_members(FAKE_SET_NAME, 'IPv4', ['10.0.0.2/32'])
+        self.execute.assert_has_calls([
+            mock.call(['ipset', 'create', '-exist', FAKE_SET_NAME,
+                       'hash:net', 'family', 'inet'],
+                      root_helper='sudo', process_input=None),
+            mock.call(['ipset', 'flush', FAKE_SET_NAME],
+                      root_helper='sudo', process_input=None),
+            mock.call(['ipset', 'restore', '-exist'],
+                      root_helper='sudo',
+                      process_input='add %s 10.0.0.2/32\n' % FAKE_SET_NAME)])
+        self.assertTrue(self.ipset.set_exists(FAKE_SET_NAME))
+
+    def test_set_members_applies_delta(self):
+        self.ipset.set_members(FAKE_SET_NAME, 'IPv4',
+                               ['10.0.0.2/32', '10.0.0.3/32'])
+        self.execute.reset_mock()
+        self.ipset.set_members(FAKE_SET_NAME, 'IPv4',
+                               ['10.0.0.3/32', '10.0.0.4/32'])
+        self.execute.assert_called_once_with(
+            ['ipset', 'restore', '-exist'], root_helper='sudo',
+            process_input='add %(set)s 10.0.0.4/32\n'
+                          'del %(set)s 10.0.0.2/32\n' % {'set': FAKE_SET_NAME})
+
+    def test_set_members_unchanged_does_nothing(self):
+        self.ipset.set_members(FAKE_SET_NAME, 'IPv4', ['10.0.0.2/32'])
+        self.execute.reset_mock()
+        self.ipset.set_members(FAKE_SET_NAME, 'IPv4', ['10.0.0.2/32'])
+        self.assertFalse(self.execute.called)
+
+    def test_destroy(self):
+        self.ipset.set_members(FAKE_SET_NAME, 'IPv4', [])
+        self.execute.reset_mock()
+        self.ipset.destroy(FAKE_SET_NAME)
+        self.execute.assert_called_once_with(
+            ['ipset', 'destroy', FAKE_SET_NAME], root_helper='sudo',
+            process_input=None)
+        self.assertFalse(self.ipset.set_exists(FAKE_SET_NAME))
+
+    def test_destroy_unknown_set(self):
+        self.ipset.destroy(FAKE_SET_NAME)
+        self.assertFalse(self.execute.called)
@@ -16,6 +16,8 @@ try:
     from collections import OrderedDict
 except ImportError:
     from ordereddict import OrderedDict
+import os
+
 import mock
 from oslo.config import cfg
 import testtools
@@ -28,6 +30,7 @@ from neutron.openstack.common import uuidutils
 from neutron.plugins.openvswitch.common import constants
 from neutron.tests import base
 from neutron.tests import tools
+from neutron.tests.unit.agent.linux import fake_ovsdb
 
 OVS_LINUX_KERN_VERS_WITHOUT_VXLAN = "3.12.0"
 
@@ -404,6 +407,70 @@ class OVS_Lib_Test(base.BaseTestCase):
             mock.call('del-flows', ['-'], 'deleted_flow_1\n')
         ])
 
+    def test_dump_flows(self):
+        self.execute.return_value = (
+            'NXST_FLOW reply (xid=0x4):\n'
+            ' cookie=0x1f, duration=4.5s, table=0, n_packets=3, '
+            'n_bytes=180, idle_age=4, priority=2,in_port=1 actions=drop\n'
+            ' cookie=0x0, duration=4.5s, table=21, n_packets=0, '
+            'n_bytes=0, idle_age=4, dl_vlan=1 actions=NORMAL\n')
+        self.assertEqual(
+            [{'cookie': '0x1f', 'table': '0', 'priority': '2',
+              'hard_timeout': '0', 'idle_timeout': '0',
+              'match': ('in_port=1',), 'actions': 'drop'},
+             {'cookie': '0x0', 'table': '21', 'priority': '32768',
+              'hard_timeout': '0', 'idle_timeout': '0',
+              'match': ('dl_vlan=1',), 'actions': 'NORMAL'}],
+            self.br.dump_flows())
+
+    def test_add_flow_with_cookie(self):
+        self.br.set_flow_cookie('0x1f')
+        self.br.add_flow(priority=1, actions='normal')
+        self.execute.assert_called_once_with(
+            ["ovs-ofctl", "add-flow", self.BR_NAME,
+             "hard_timeout=0,idle_timeout=0,priority=1,cookie=0x1f,"
+             "actions=normal"],
+            process_input=None,
+            root_helper=self.root_helper)
+
+    def test_flow_reconciliation(self):
+        self.br.set_flow_cookie('0x2')
+        self.execute.return_value = (
+            'NXST_FLOW reply (xid=0x4):\n'
+            ' cookie=0x1, duration=4.5s, table=0, n_packets=0, n_bytes=0, '
+            'idle_age=4, priority=1 actions=NORMAL\n'
+            ' cookie=0x1, duration=4.5s, table=0, n_packets=0, n_bytes=0, '
+            'idle_age=4, priority=2 actions=drop\n'
+            ' cookie=0x0, duration=4.5s, table=0, n_packets=0, n_bytes=0, '
+            'idle_age=4, priority=3 actions=drop\n')
+        self.br.start_flow_reconciliation()
+        self.execute.reset_mock()
+
+        # The same flow is kept, a modified one is replaced
+        self.br.add_flow(priority=1, actions='normal')
+        self.br.add_flow(priority=2, actions='normal')
+        self.br.cleanup_stale_flows()
+        self.br.cleanup_stale_flows()
+
+        self.execute.assert_has_calls([
+            mock.call(["ovs-ofctl", "add-flow", self.BR_NAME,
+                       "hard_timeout=0,idle_timeout=0,priority=2,"
+                       "cookie=0x2,actions=normal"],
+                      process_input=None, root_helper=self.root_helper),
+            mock.call(["ovs-ofctl", "del-flows", self.BR_NAME,
+                       "--strict", "-"],
+                      process_input="cookie=0x0/-1,table=0,priority=3\n",
+                      root_helper=self.root_helper)])
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_flow_reconciliation_fails_to_dump_flows(self):
+        self.execute.side_effect = [RuntimeError(), None]
+        self.br.start_flow_reconciliation()
+        self.execute.assert_called_with(
+            ["ovs-ofctl", "del-flows", self.BR_NAME],
+            process_input=None, root_helper=self.root_helper)
+        self.assertIsNone(self.br.stale_flows)
+
     def test_add_tunnel_port(self):
         pname = "tap99"
         local_ip = "1.1.1.1"
@@ -432,6 +499,42 @@ class OVS_Lib_Test(base.BaseTestCase):
 
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
+    def test_add_tunnel_ports(self):
+        local_ip = "1.1.1.1"
+        command = ["ovs-vsctl", self.TO]
+        for pname, remote_ip in (("gre-1", "9.9.9.9"), ("gre-2", "8.8.8.8")):
+            command.extend(["--", "--may-exist", "add-port", self.BR_NAME,
+                            pname])
+            command.extend(["--", "set", "Interface", pname])
+            command.extend(["type=gre", "options:remote_ip=" + remote_ip,
+                            "options:local_ip=" + local_ip,
+                            "options:in_key=flow",
+                            "options:out_key=flow"])
+        list_result = jsonutils.dumps(
+            {'headings': ['name', 'ofport'],
+             'data': [['gre-1', 6], ['gre-2', ['set', []]]]})
+        # Each element is a tuple of (expected mock call, return_value)
+        expected_calls_and_values = [
+            (mock.call(command, root_helper=self.root_helper), None),
+            (mock.call(["ovs-vsctl", self.TO, "--format=json", "--",
+                        "--columns=name,ofport", "list", "Interface",
+                        "gre-1", "gre-2"],
+                       root_helper=self.root_helper),
+             list_result),
+        ]
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.assertEqual(
+            {'gre-1': '6', 'gre-2': '[]'},
+            self.br.add_tunnel_ports({'gre-1': '9.9.9.9',
+                                      'gre-2': '8.8.8.8'}, local_ip))
+
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
+    def test_add_tunnel_ports_empty(self):
+        self.assertEqual({}, self.br.add_tunnel_ports({}, '1.1.1.1'))
+        self.assertFalse(self.execute.called)
+
     def test_add_patch_port(self):
         pname = "tap99"
         peer = "bar10"
@@ -518,6 +621,57 @@ class OVS_Lib_Test(base.BaseTestCase):
                                     type(cell))
         return jsonutils.dumps(r)
 
+    def test_get_snapshot(self):
+        mac = 'aa:bb:cc:dd:ee:ff'
+        bridge_data = [[['set', [['uuid', 'u0'], ['uuid', 'u1'],
+                                 ['uuid', 'u2'], ['uuid', 'u3']]]]]
+        port_data = [
+            [['uuid', 'u0'], self.BR_NAME, ['set', []]],
+            [['uuid', 'u1'], 'tap1', 1],
+            [['uuid', 'u2'], 'tap2', ['set', []]],
+            [['uuid', 'u3'], 'patch-tun', ['set', []]],
+            # on another bridge
+            [['uuid', 'u4'], 'tap4', 2],
+        ]
+        iface_data = [
+            [self.BR_NAME, 65534, {}],
+            ['tap1', 5, {'iface-id': 'id1', 'attached-mac': mac}],
+            # not yet ready
+            ['tap2', ['set', []], {'iface-id': 'id2', 'attached-mac': mac}],
+            ['patch-tun', 1, {}],
+            ['tap4', 7, {'iface-id': 'id4', 'attached-mac': mac}],
+        ]
+        output = '\n'.join([
+            self._encode_ovs_json(['ports'], bridge_data),
+            self._encode_ovs_json(['_uuid', 'name', 'tag'], port_data),
+            self._encode_ovs_json(['name', 'ofport', 'external_ids'],
+                                  iface_data)])
+        self.execute.return_value = output
+
+        snapshot = self.br.get_snapshot()
+
+        self.execute.assert_called_once_with(
+            ["ovs-vsctl", self.TO, "--format=json",
+             "--", "--columns=ports", "list", "Bridge", self.BR_NAME,
+             "--", "--columns=_uuid,name,tag", "list", "Port",
+             "--", "--columns=name,ofport,external_ids", "list", "Interface"],
+            root_helper=self.root_helper)
+        self.assertEqual(['patch-tun', 'tap1', 'tap2'],
+                         snapshot.get_port_name_list())
+        self.assertEqual(set(['id1']), snapshot.get_vif_port_set())
+        self.assertEqual({'tap1': 1, 'tap2': [], 'patch-tun': []},
+                         snapshot.get_port_tag_dict())
+        self.assertEqual('1', snapshot.get_port_tag('tap1'))
+        self.assertEqual('[]', snapshot.get_port_tag('tap2'))
+        self.assertIsNone(snapshot.get_port_tag('tap4'))
+        vif_port = snapshot.get_vif_port_by_id('id1')
+        self.assertEqual(('tap1', 5, mac, self.br),
+                         (vif_port.port_name, vif_port.ofport,
+                          vif_port.vif_mac, vif_port.switch))
+        self.assertEqual(vif_port, snapshot.get_vif_port_by_ofport(5))
+        self.assertIsNone(snapshot.get_vif_port_by_id('id2'))
+        self.assertIsNone(snapshot.get_vif_port_by_id('id4'))
+
     def _test_get_vif_port_set(self, is_xen):
         if is_xen:
             id_key = 'xs-vif-uuid'
@@ -644,6 +798,39 @@ class OVS_Lib_Test(base.BaseTestCase):
              u'tape1400310-e6': 1}
         )
 
+    def test_set_db_attributes(self):
+        pname = "tap77"
+        self.br.set_db_attributes("Port", pname,
+                                  [("tag", 1), ("other_config:net_uuid", "n")])
+        self.execute.assert_called_once_with(
+            ["ovs-vsctl", self.TO, "set", "Port", pname, "tag=1",
+             "other_config:net_uuid=n"],
+            root_helper=self.root_helper)
+
+    def test_get_port_tags_and_other_config(self):
+        headings = ['name', 'tag', 'other_config']
+        data = [
+            ['patch-tun', set(), {}],
+            ['tap1', 1, {'net_uuid': 'net1'}],
+            ['tap-other-br', 2, {}],
+        ]
+        expected_calls_and_values = [
+            (mock.call(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
+                       root_helper=self.root_helper),
+             'patch-tun\ntap1'),
+            (mock.call(["ovs-vsctl", self.TO, "--format=json",
+                        "--", "--columns=name,tag,other_config",
+                        "list", "Port"],
+                       root_helper=self.root_helper),
+             self._encode_ovs_json(headings, data)),
+        ]
+        tools.setup_mock_calls(self.execute, expected_calls_and_values)
+
+        self.assertEqual({'patch-tun': ([], {}),
+                          'tap1': (1, {'net_uuid': 'net1'})},
+                         self.br.get_port_tags_and_other_config())
+        tools.verify_mock_calls(self.execute, expected_calls_and_values)
+
     def test_clear_db_attribute(self):
         pname = "tap77"
         self.br.clear_db_attribute("Port", pname, "tag")
@@ -868,3 +1055,103 @@ class OVS_Lib_Test(base.BaseTestCase):
         min_kernel_ver = constants.MINIMUM_LINUX_KERNEL_OVS_VXLAN
         self._check_ovs_vxlan_version(min_vxlan_ver, min_vxlan_ver,
                                       min_kernel_ver, expecting_ok=True)
+
+
+class OVS_Lib_Native_Test(base.BaseTestCase):
+    """Reads served by the OVSDB replica of the 'native' ovsdb_interface."""
+
+    def setUp(self):
+        super(OVS_Lib_Native_Test, self).setUp()
+        path = os.path.join(self.temp_dir, 'db.sock')
+        self.server = fake_ovsdb.FakeOvsdbServer(path)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        cfg.CONF.set_override('ovsdb_interface', 'native')
+        cfg.CONF.set_override('ovsdb_connection', 'unix:%s' % path)
+        mock.patch.object(ovs_lib, '_ovsdb', None).start()
+        self.addCleanup(lambda: ovs_lib._ovsdb and ovs_lib._ovsdb.close())
+
+        br_uuid = self.server.add_bridge(
+            'br-int', external_ids={'bridge-id': 'br-int'})
+        self.server.add_bridge('br-ex')
+        self.server.add_port(br_uuid, 'tap1', ofport=1, tag=1,
+                             external_ids={
+                                 'iface-id': 'id1',
+                                 'attached-mac': 'aa:bb:cc:dd:ee:01'})
+        self.server.add_port(br_uuid, 'tap2',
+                             external_ids={
+                                 'iface-id': 'id2',
+                                 'attached-mac': 'aa:bb:cc:dd:ee:02'})
+        self.server.add_port(br_uuid, 'patch-tun', ofport=3)
+
+        self.root_helper = 'sudo'
+        self.br = ovs_lib.OVSBridge('br-int', self.root_helper)
+        self.execute = mock.patch.object(
+            utils, "execute", spec=utils.execute).start()
+
+    def test_reads_do_not_run_vsctl(self):
+        self.assertEqual(['patch-tun', 'tap1', 'tap2'],
+                         self.br.get_port_name_list())
+        self.assertEqual(set(['id1']), self.br.get_vif_port_set())
+        self.assertEqual({'tap1': 1, 'tap2': [], 'patch-tun': []},
+                         self.br.get_port_tag_dict())
+        self.assertEqual(['br-ex', 'br-int'],
+                         ovs_lib.get_bridges(self.root_helper))
+        self.assertEqual('br-int', ovs_lib.get_bridge_external_bridge_id(
+            self.root_helper, 'br-int'))
+        self.assertTrue(self.br.bridge_exists('br-ex'))
+        self.assertFalse(self.br.bridge_exists('br-foo'))
+        self.assertFalse(self.execute.called)
+
+    def test_get_port_ofports(self):
+        self.assertEqual({'tap1': '1', 'tap2': '[]'},
+                         self.br.get_port_ofports(['tap1', 'tap2', 'tap3']))
+        self.assertFalse(self.execute.called)
+
+    def test_db_get_val_formats_like_vsctl(self):
+        self.assertEqual('1', self.br.db_get_val('Port', 'tap1', 'tag'))
+        self.assertEqual('[]', self.br.db_get_val('Port', 'tap2', 'tag'))
+        self.assertEqual('"0000000000000001"',
+                         self.br.db_get_val('Bridge', 'br-int',
+                                            'datapath_id'))
+        self.assertEqual('0000000000000001', self.br.get_datapath_id())
+        self.assertEqual({'iface-id': 'id1',
+                          'attached-mac': 'aa:bb:cc:dd:ee:01'},
+                         self.br.db_get_map('Interface', 'tap1',
+                                            'external_ids'))
+        self.assertIsNone(self.br.db_get_val('Port', 'tap9', 'tag'))
+        self.assertRaises(RuntimeError, self.br.db_get_val,
+                          'Port', 'tap9', 'tag', check_error=True)
+        self.assertFalse(self.execute.called)
+
+    def test_db_get_val_unmonitored_column_runs_vsctl(self):
+        self.execute.return_value = '{rx_bytes=1}\n'
+        self.assertEqual({'rx_bytes': '1'}, self.br.get_port_stats('tap1'))
+        self.execute.assert_called_once_with(
+            ["ovs-vsctl", "--timeout=10", "get", "Interface", "tap1",
+             "statistics"], root_helper=self.root_helper)
+
+    def test_get_vif_port_by_id(self):
+        vif_port = self.br.get_vif_port_by_id('id1')
+        self.assertEqual('tap1', vif_port.port_name)
+        self.assertEqual(1, vif_port.ofport)
+        self.assertEqual('aa:bb:cc:dd:ee:01', vif_port.vif_mac)
+        # no ofport yet
+        self.assertIsNone(self.br.get_vif_port_by_id('id2'))
+        self.assertIsNone(self.br.get_vif_port_by_id('id3'))
+        self.assertFalse(self.execute.called)
+
+    def test_get_snapshot(self):
+        snapshot = self.br.get_snapshot()
+        self.assertEqual(['patch-tun', 'tap1', 'tap2'],
+                         snapshot.get_port_name_list())
+        self.assertEqual(set(['id1']), snapshot.get_vif_port_set())
+        self.assertEqual('1', snapshot.get_port_tag('tap1'))
+        self.assertEqual('tap1', snapshot.get_vif_port_by_id('id1').port_name)
+        self.assertFalse(self.execute.called)
+
+    def test_falls_back_to_vsctl_without_ovsdb(self):
+        self.server.stop()
+        self.execute.return_value = 'br-int\n'
+        self.assertEqual(['br-int'], ovs_lib.get_bridges(self.root_helper))
+        self.assertTrue(self.execute.called)
@@ -0,0 +1,159 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import os
+
+import mock
+
+from neutron.agent.linux import ovsdb_client
+from neutron.tests import base
+from neutron.tests.unit.agent.linux import fake_ovsdb
+
+
+class TestJsonStream(base.BaseTestCase):
+
+    def test_feed_splits_messages(self):
+        stream = ovsdb_client.JsonStream()
+        self.assertEqual([{'id': 1}, {'id': 2}],
+                         stream.feed('{"id": 1}{"id": 2}'))
+
+    def test_feed_partial_message(self):
+        stream = ovsdb_client.JsonStream()
+        self.assertEqual([], stream.feed('{"params": ["a}'))
+        self.assertEqual([{'params': ['a}"{', 'b']}],
+                         stream.feed('\\"{", "b"]}'))
+
+
+class TestDecodeValue(base.BaseTestCase):
+
+    def test_decode_value(self):
+        self.assertEqual(1, ovsdb_client.decode_value(1))
+        self.assertEqual([], ovsdb_client.decode_value(['set', []]))
+        self.assertEqual({'a': 'b'},
+                         ovsdb_client.decode_value(['map', [['a', 'b']]]))
+        self.assertEqual(['u1', 'u2'],
+                         ovsdb_client.decode_value(
+                             ['set', [['uuid', 'u1'], ['uuid', 'u2']]]))
+
+
+class TestApplyUpdates(base.BaseTestCase):
+
+    def test_delete_after_insert_with_same_name(self):
+        client = ovsdb_client.OvsdbClient('unix:/fake', 5)
+        client._apply_updates({'Interface': {'u1': {'new': {'name': 'tap'}}}})
+        # The deletion of the old row is handled after the insertion
+        client._apply_updates({'Interface': collections.OrderedDict([
+            ('u2', {'new': {'name': 'tap'}}),
+            ('u1', {'old': {'name': 'tap'}})])})
+        self.assertEqual('u2', client.get_row('Interface', 'tap')['_uuid'])
+
+
+class TestOvsdbClient(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOvsdbClient, self).setUp()
+        path = os.path.join(self.temp_dir, 'db.sock')
+        self.server = fake_ovsdb.FakeOvsdbServer(path)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.br_uuid = self.server.add_bridge('br-int')
+        self.server.add_port(self.br_uuid, 'tap1', ofport=1,
+                             external_ids={'iface-id': 'id1'}, tag=1)
+        self.client = ovsdb_client.OvsdbClient('unix:%s' % path, 5)
+        self.addCleanup(self.client.close)
+
+    def test_refresh_connects_and_loads_replica(self):
+        self.assertTrue(self.client.refresh())
+        self.assertTrue(self.client.connected)
+        self.assertEqual(['tap1'],
+                         self.client.get_bridge_port_names('br-int'))
+        iface = self.client.get_row('Interface', 'tap1')
+        self.assertEqual(1, iface['ofport'])
+        self.assertEqual({'iface-id': 'id1'}, iface['external_ids'])
+        self.assertEqual('br-int', self.client.get_bridge_for_port('tap1'))
+        self.assertEqual('br-int',
+                         self.client.get_bridge_for_interface('tap1'))
+
+    def test_sync_applies_updates(self):
+        self.client.refresh()
+        port_uuid, iface_uuid = self.server.add_port(self.br_uuid, 'tap2')
+        self.server.update_row('Interface', iface_uuid, ofport=2)
+        self.assertTrue(self.client.sync())
+        self.assertEqual(['tap1', 'tap2'],
+                         self.client.get_bridge_port_names('br-int'))
+        self.assertEqual(2, self.client.get_row('Interface', 'tap2')['ofport'])
+
+        self.server.update_row('Bridge', self.br_uuid,
+                               ports=fake_ovsdb.ovs_uuid_set())
+        self.server.delete_row('Port', port_uuid)
+        self.server.delete_row('Interface', iface_uuid)
+        self.assertTrue(self.client.sync())
+        self.assertEqual([], self.client.get_bridge_port_names('br-int'))
+        self.assertIsNone(self.client.get_row('Interface', 'tap2'))
+        self.assertIsNone(self.client.get_bridge_for_interface('tap2'))
+
+    def test_sync_replaced_port_with_same_name(self):
+        self.client.refresh()
+        old_port = self.client.get_row('Port', 'tap1')['_uuid']
+        old_iface = self.client.get_row('Interface', 'tap1')['_uuid']
+        # Like ovs-vsctl --if-exists del-port tap1 -- add-port br-int tap1
+        with self.server.transaction():
+            self.server.update_row('Bridge', self.br_uuid,
+                                   ports=fake_ovsdb.ovs_uuid_set())
+            self.server.delete_row('Port', old_port)
+            self.server.delete_row('Interface', old_iface)
+            port_uuid, iface_uuid = self.server.add_port(
+                self.br_uuid, 'tap1', ofport=2,
+                external_ids={'iface-id': 'id2'})
+        self.assertTrue(self.client.sync())
+        iface = self.client.get_row('Interface', 'tap1')
+        self.assertEqual(iface_uuid, iface['_uuid'])
+        self.assertEqual({'iface-id': 'id2'}, iface['external_ids'])
+        self.assertEqual(port_uuid,
+                         self.client.get_row('Port', 'tap1')['_uuid'])
+        self.assertEqual('br-int',
+                         self.client.get_bridge_for_interface('tap1'))
+
+    def test_reads_do_not_send_requests(self):
+        self.client.refresh()
+        self.client.get_bridge_port_names('br-int')
+        self.client.refresh()
+        self.assertEqual(['monitor'], self.server.requests)
+
+    def test_unknown_bridge(self):
+        self.client.refresh()
+        self.assertIsNone(self.client.get_bridge_port_names('br-ex'))
+        self.assertIsNone(self.client.get_bridge_for_port('br-ex'))
+
+    def test_refresh_fails_without_server(self):
+        self.server.stop()
+        self.assertFalse(self.client.refresh())
+        self.assertFalse(self.client.connected)
+
+    def test_refresh_throttles_reconnection(self):
+        self.server.stop()
+        with mock.patch.object(self.client, '_create_socket',
+                               side_effect=IOError()) as create_socket:
+            self.assertFalse(self.client.refresh())
+            self.assertFalse(self.client.refresh())
+        self.assertEqual(1, create_socket.call_count)
+
+    def test_sync_fails_on_lost_connection(self):
+        self.client.refresh()
+        self.server.stop()
+        self.assertFalse(self.client.sync())
+        self.assertFalse(self.client.connected)
@@ -18,6 +18,7 @@ import eventlet.event
 import mock
 
 from neutron.agent.linux import ovsdb_monitor
+from neutron.openstack.common import jsonutils
 from neutron.tests import base
 
 
@@ -110,3 +111,60 @@ class TestSimpleInterfaceMonitor(base.BaseTestCase):
                 return_value=output):
             self.monitor._read_stdout()
         self.assertFalse(self.monitor.data_received)
+
+    def _set_output(self, *updates):
+        headings = ['row', 'action', 'name', 'ofport', 'external_ids']
+        lines = [jsonutils.dumps({'headings': headings, 'data': data})
+                 for data in updates]
+        return mock.patch.object(self.monitor, 'iter_stdout',
+                                 return_value=iter(lines))
+
+    def _set_active(self):
+        self.monitor.data_received = True
+        self.monitor._kill_event = eventlet.event.Event()
+
+    def test_process_events(self):
+        ext_ids = ['map', [['iface-id', 'id1']]]
+        with self._set_output(
+                [['u1', 'insert', 'tap1', ['set', []], ext_ids]],
+                [['u1', 'old', '', ['set', []], ''],
+                 ['u1', 'new', 'tap1', 1, ext_ids]],
+                [['u1', 'delete', 'tap1', 1, ext_ids]]):
+            self.assertEqual(3, self.monitor.process_events())
+        ext_ids = {'iface-id': 'id1'}
+        self.assertEqual(
+            [{'action': 'added', 'name': 'tap1', 'ofport': [],
+              'external_ids': ext_ids},
+             {'action': 'modified', 'name': 'tap1', 'ofport': 1,
+              'external_ids': ext_ids, 'changed': ['ofport']},
+             {'action': 'removed', 'name': 'tap1', 'ofport': 1,
+              'external_ids': ext_ids}],
+            self.monitor.new_events)
+
+    def test_get_events_returns_none_until_events_are_reliable(self):
+        update = [['u1', 'insert', 'tap1', 1, ['map', []]]]
+        with self._set_output(update):
+            # not active
+            self.assertIsNone(self.monitor.get_events())
+        self._set_active()
+        with self._set_output(update):
+            # events before the call may have been missed
+            self.assertIsNone(self.monitor.get_events())
+        with self._set_output(update):
+            events = self.monitor.get_events()
+        self.assertEqual(['tap1'], [event['name'] for event in events])
+        self.assertEqual([], self.monitor.get_events())
+
+    def test_get_events_returns_none_after_unparsable_output(self):
+        self._set_active()
+        self.monitor.events_missed = False
+        with mock.patch.object(self.monitor, 'iter_stdout',
+                               return_value=iter(['garbage'])):
+            self.assertIsNone(self.monitor.get_events())
+
+    def test__kill_sets_events_missed(self):
+        self.monitor.events_missed = False
+        with mock.patch(
+                'neutron.agent.linux.ovsdb_monitor.OvsdbMonitor._kill'):
+            self.monitor._kill()
+        self.assertTrue(self.monitor.events_missed)
@@ -86,6 +86,10 @@ class TestAlwaysPoll(base.BaseTestCase):
         pm = polling.AlwaysPoll()
         self.assertTrue(pm.is_polling_required)
 
+    def test_get_events_requires_full_scan(self):
+        pm = polling.AlwaysPoll()
+        self.assertIsNone(pm.get_events())
+
 
 class TestInterfacePollingMinimizer(base.BaseTestCase):
 
@@ -114,3 +118,14 @@ class TestInterfacePollingMinimizer(base.BaseTestCase):
     def test__is_polling_required_returns_when_updates_are_present(self):
         with self.mock_has_updates(True):
             self.assertTrue(self.pm._is_polling_required())
+
+    def test_get_events_requires_full_scan_until_polling_completed(self):
+        with mock.patch.object(self.pm._monitor, 'get_events',
+                               return_value=[]) as get_events:
+            self.assertIsNone(self.pm.get_events())
+            self.pm.polling_completed()
+            self.assertEqual([], self.pm.get_events())
+            self.pm.force_polling()
+            self.assertIsNone(self.pm.get_events())
+        # the monitor events are always consumed
+        self.assertEqual(3, get_events.call_count)
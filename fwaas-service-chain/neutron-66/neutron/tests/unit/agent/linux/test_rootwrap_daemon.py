@@ -0,0 +1,170 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+
+import mock
+from oslo.config import cfg
+from oslo.rootwrap import filters
+
+from neutron.agent.common import config
+from neutron.agent.linux import rootwrap_daemon
+from neutron.agent.linux import utils
+from neutron.tests import base
+
+
+class FakeRunner(object):
+    """Record the commands instead of running them."""
+
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, cmd, env, process_input):
+        self.commands.append((cmd, process_input))
+        if cmd[0] == '/bin/false':
+            return 1, '', 'failed\n'
+        return 0, process_input or ' '.join(cmd[1:]), ''
+
+
+class TestRootwrapDaemon(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRootwrapDaemon, self).setUp()
+        self.runner = FakeRunner()
+        self.daemon = rootwrap_daemon.RootwrapDaemon(
+            [filters.CommandFilter('/bin/cat', 'root'),
+             filters.CommandFilter('/bin/echo', 'root'),
+             filters.CommandFilter('/bin/false', 'root'),
+             filters.IpFilter('ip', 'root'),
+             filters.IpNetnsExecFilter('ip', 'root')],
+            ['/bin', '/sbin'], 'secret', runner=self.runner)
+        path = os.path.join(self.temp_dir, 'rootwrap.sock')
+        self.daemon.start(path)
+        self.addCleanup(self.daemon.stop)
+        self.client = rootwrap_daemon.RootwrapDaemonClient('fake-daemon')
+        self.client.process = mock.Mock()
+        self.client.path = path
+        self.client.key = 'secret'
+
+    def test_execute_batch(self):
+        results = self.client.execute([(['echo', 'a'], None),
+                                       (['false'], None),
+                                       (['cat'], 'input')])
+        self.assertEqual([(0, 'a', ''), (1, '', 'failed\n'),
+                          (0, 'input', '')], results)
+        self.assertEqual([(['/bin/echo', 'a'], None),
+                          (['/bin/false'], None),
+                          (['/bin/cat'], 'input')], self.runner.commands)
+
+    def test_execute_unauthorized_command(self):
+        [(returncode, stdout, stderr)] = self.client.execute(
+            [(['rm', '-rf', '/'], None)])
+        self.assertEqual(rootwrap_daemon.RC_UNAUTHORIZED, returncode)
+        self.assertIn('Unauthorized command', stderr)
+        self.assertEqual([], self.runner.commands)
+
+    def test_execute_ip_batch(self):
+        batch = 'link set tap0 up\naddr del fd00::2/64 dev tap0\n'
+        [(returncode, stdout, stderr)] = self.client.execute(
+            [(['ip', 'netns', 'exec', 'ns', 'ip', '-batch', '-'], batch)])
+        self.assertEqual(0, returncode)
+        self.assertEqual(1, len(self.runner.commands))
+
+    def test_execute_unauthorized_ip_batch(self):
+        for cmd, batch in (
+                (['ip', '-batch', '-'], 'netns exec ns rm -rf /\n'),
+                (['ip', 'netns', 'exec', 'ns', 'ip', '-batch', '-'],
+                 'link set tap0 up\nnetns exec ns rm -rf /\n'),
+                (['ip', '-batch', '-'], 'link set "tap0\\\nnetns" up\n'),
+                (['ip', '-b', '/tmp/batch'], None),
+                (['ip', '--ba', '-'], 'netns exec ns rm -rf /\n'),
+                (['ip', '-force', '-batch', '-'], 'link set tap0 up\n')):
+            [(returncode, stdout, stderr)] = self.client.execute(
+                [(cmd, batch)])
+            self.assertEqual(rootwrap_daemon.RC_UNAUTHORIZED, returncode)
+            self.assertIn('ip batch rejected', stderr)
+        self.assertEqual([], self.runner.commands)
+
+    def test_execute_binary_data(self):
+        data = ''.join(chr(i) for i in range(256))
+        self.assertEqual([(0, data, '')],
+                         self.client.execute([(['cat'], data)]))
+
+    def test_connection_is_reused(self):
+        self.client.execute([(['echo', 'a'], None)])
+        with mock.patch.object(socket, 'socket') as sock:
+            self.client.execute([(['echo', 'b'], None)])
+        self.assertFalse(sock.called)
+        self.assertEqual(1, len(self.client.idle_connections))
+
+    def test_wrong_key_is_refused(self):
+        self.client.key = 'wrong'
+        self.assertRaises(rootwrap_daemon.RootwrapDaemonError,
+                          self.client.connect)
+        self.assertEqual([], self.runner.commands)
+
+    def test_start_daemon_failure(self):
+        client = rootwrap_daemon.RootwrapDaemonClient('fake-daemon')
+        with mock.patch.object(rootwrap_daemon.green_subprocess,
+                               'Popen') as popen:
+            popen.return_value.stdout.readline.return_value = ''
+            self.assertRaises(rootwrap_daemon.RootwrapDaemonError,
+                              client.connect)
+        self.assertIsNone(client.process)
+
+
+class TestExecuteWithRootwrapDaemon(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestExecuteWithRootwrapDaemon, self).setUp()
+        config.register_root_helper(cfg.CONF)
+        cfg.CONF.set_override('root_helper_daemon', 'fake-daemon', 'AGENT')
+        self.client = mock.Mock()
+        self.client.daemon_cmd = 'fake-daemon'
+        mock.patch.object(rootwrap_daemon, '_client', self.client).start()
+        mock.patch.object(rootwrap_daemon, '_client_failed', False).start()
+        self.popen = mock.patch.object(utils, 'create_process').start()
+
+    def test_execute_uses_daemon(self):
+        self.client.execute.return_value = [(0, 'out', '')]
+        self.assertEqual('out', utils.execute(['ip', 'link'], 'sudo',
+                                              process_input='in'))
+        self.client.execute.assert_called_once_with(
+            [(['ip', 'link'], 'in')], sock=self.client.connect.return_value)
+        self.assertFalse(self.popen.called)
+
+    def test_execute_raises_on_daemon_error_code(self):
+        self.client.execute.return_value = [(1, '', 'error')]
+        self.assertRaises(RuntimeError, utils.execute, ['ip', 'link'],
+                          'sudo')
+
+    def test_execute_without_root_helper_does_not_use_daemon(self):
+        self.popen.return_value = (mock.Mock(returncode=0), ['ls'])
+        self.popen.return_value[0].communicate.return_value = ('out', '')
+        utils.execute(['ls'])
+        self.assertFalse(self.client.connect.called)
+
+    def test_execute_falls_back_when_daemon_unavailable(self):
+        self.client.connect.side_effect = (
+            rootwrap_daemon.RootwrapDaemonError())
+        self.popen.return_value = (mock.Mock(returncode=0), ['ip', 'link'])
+        self.popen.return_value[0].communicate.return_value = ('out', '')
+        self.assertEqual('out', utils.execute(['ip', 'link'], 'sudo'))
+        self.popen.assert_called_once_with(['ip', 'link'],
+                                           root_helper='sudo',
+                                           addl_env=None)
+        self.assertIsNone(rootwrap_daemon.get_client())
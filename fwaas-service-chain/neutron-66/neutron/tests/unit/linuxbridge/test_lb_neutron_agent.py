@@ -160,6 +160,49 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
                     agent.daemon_loop()
                 self.assertEqual(3, log.call_count)
 
+    def test_treat_devices_added_uses_bulk_rpc(self):
+        agent = linuxbridge_neutron_agent.LinuxBridgeNeutronAgentRPC({},
+                                                                     0,
+                                                                     None)
+        details_list = [{'device': device,
+                         'port_id': 'port_%s' % device,
+                         'network_id': 'net_id',
+                         'network_type': p_const.TYPE_VLAN,
+                         'physical_network': 'physnet1',
+                         'segmentation_id': 7,
+                         'admin_state_up': True}
+                        for device in ('tap1', 'tap2')]
+        with contextlib.nested(
+            mock.patch.object(agent.plugin_rpc, 'get_devices_details_list',
+                              return_value=details_list),
+            mock.patch.object(agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(agent.plugin_rpc, 'update_devices_down'),
+            mock.patch.object(agent.br_mgr, 'add_interface',
+                              side_effect=[True, False]),
+            mock.patch.object(agent, 'prepare_devices_filter')
+        ) as (get_details, devices_up, devices_down, add_interface,
+              prepare_filter):
+            self.assertFalse(agent.treat_devices_added(['tap1', 'tap2']))
+        get_details.assert_called_once_with(agent.context,
+                                            ['tap1', 'tap2'], agent.agent_id)
+        devices_up.assert_called_once_with(agent.context, ['tap1'],
+                                           agent.agent_id, cfg.CONF.host)
+        devices_down.assert_called_once_with(agent.context, ['tap2'],
+                                             agent.agent_id, cfg.CONF.host)
+
+    def test_treat_devices_removed_failed(self):
+        agent = linuxbridge_neutron_agent.LinuxBridgeNeutronAgentRPC({},
+                                                                     0,
+                                                                     None)
+        with contextlib.nested(
+            mock.patch.object(agent.plugin_rpc, 'update_devices_down',
+                              side_effect=Exception()),
+            mock.patch.object(agent.br_mgr, 'remove_empty_bridges'),
+            mock.patch.object(agent, 'remove_devices_filter')
+        ) as (devices_down, remove_empty_bridges, remove_filter):
+            self.assertTrue(agent.treat_devices_removed(['tap1']))
+        self.assertTrue(remove_empty_bridges.called)
+
 
 class TestLinuxBridgeManager(base.BaseTestCase):
     def setUp(self):
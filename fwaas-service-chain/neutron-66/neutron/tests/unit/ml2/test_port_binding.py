@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron import context
@@ -69,6 +71,56 @@ class PortBindingTestCase(test_plugin.NeutronDbPluginV2TestCase):
             else:
                 self.assertNotIn('network_type', details)
 
+    def test_get_devices_details_list(self):
+        host_arg = {portbindings.HOST_ID: "host-ovs-no_filter"}
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.port(subnet=subnet, name='name1',
+                          arg_list=(portbindings.HOST_ID,), **host_arg),
+                self.port(subnet=subnet, name='name2')) as (port1, port2):
+                port1_id = port1['port']['id']
+                port2_id = port2['port']['id']
+                devices = [port1_id, 'tap%s' % port2_id[:11], 'unknown']
+                neutron_context = context.get_admin_context()
+                details_list = self.plugin.callbacks.get_devices_details_list(
+                    neutron_context, agent_id="theAgentId", devices=devices)
+                self.assertEqual(devices, [d['device'] for d in details_list])
+                self.assertEqual(port1_id, details_list[0]['port_id'])
+                self.assertEqual('local', details_list[0]['network_type'])
+                # unbound port
+                self.assertNotIn('port_id', details_list[1])
+                self.assertNotIn('port_id', details_list[2])
+
+    def test_update_devices_up_and_down(self):
+        host_arg = {portbindings.HOST_ID: "host-ovs-no_filter"}
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.port(subnet=subnet, name='name1',
+                          arg_list=(portbindings.HOST_ID,), **host_arg),
+                self.port(subnet=subnet, name='name2')) as (port1, port2):
+                port1_id = port1['port']['id']
+                port2_id = port2['port']['id']
+                neutron_context = context.get_admin_context()
+                self.plugin.callbacks.update_devices_up(
+                    neutron_context, agent_id="theAgentId",
+                    devices=[port1_id, port2_id], host="host-ovs-no_filter")
+                self.assertEqual(
+                    'ACTIVE', self.plugin.get_port(neutron_context,
+                                                   port1_id)['status'])
+                # not bound to the agent host
+                self.assertEqual(
+                    'DOWN', self.plugin.get_port(neutron_context,
+                                                 port2_id)['status'])
+                devices_down = self.plugin.callbacks.update_devices_down(
+                    neutron_context, agent_id="theAgentId",
+                    devices=[port1_id, 'unknown'])
+                self.assertEqual([{'device': port1_id, 'exists': True},
+                                  {'device': 'unknown', 'exists': False}],
+                                 devices_down)
+                self.assertEqual(
+                    'DOWN', self.plugin.get_port(neutron_context,
+                                                 port1_id)['status'])
+
     def test_unbound(self):
         self._test_port_binding("",
                                 portbindings.VIF_TYPE_UNBOUND,
@@ -23,6 +23,7 @@ from neutron.agent import rpc as agent_rpc
 from neutron.common import topics
 from neutron.openstack.common import context
 from neutron.openstack.common import rpc
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.plugins.ml2.drivers import type_tunnel
 from neutron.plugins.ml2 import rpc as plugin_rpc
 from neutron.tests import base
@@ -30,11 +31,12 @@ from neutron.tests import base
 
 class RpcApiTestCase(base.BaseTestCase):
 
-    def _test_rpc_api(self, rpcapi, topic, method, rpc_method, **kwargs):
+    def _test_rpc_api(self, rpcapi, topic, method, rpc_method,
+                      version=None, **kwargs):
         ctxt = context.RequestContext('fake_user', 'fake_project')
         expected_retval = 'foo' if method == 'call' else None
         expected_msg = rpcapi.make_msg(method, **kwargs)
-        expected_msg['version'] = rpcapi.BASE_RPC_API_VERSION
+        expected_msg['version'] = version or rpcapi.BASE_RPC_API_VERSION
         if rpc_method == 'cast' and method == 'run_instance':
             kwargs['call'] = False
 
@@ -110,3 +112,50 @@ class RpcApiTestCase(base.BaseTestCase):
                            device='fake_device',
                            agent_id='fake_agent_id',
                            host='fake_host')
+
+    def test_devices_details_list(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_rpc_api(rpcapi, topics.PLUGIN,
+                           'get_devices_details_list', rpc_method='call',
+                           version=rpcapi.BULK_RPC_API_VERSION,
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id')
+
+    def test_update_devices_down(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_rpc_api(rpcapi, topics.PLUGIN,
+                           'update_devices_down', rpc_method='call',
+                           version=rpcapi.BULK_RPC_API_VERSION,
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id',
+                           host='fake_host')
+
+    def test_update_devices_up(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_rpc_api(rpcapi, topics.PLUGIN,
+                           'update_devices_up', rpc_method='call',
+                           version=rpcapi.BULK_RPC_API_VERSION,
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id',
+                           host='fake_host')
+
+    def test_devices_details_list_falls_back_on_old_server(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        with mock.patch.object(rpcapi, 'call') as call:
+            call.side_effect = [
+                rpc_common.RemoteError('UnsupportedRpcVersion'),
+                'details1', 'details2', 'details3']
+            self.assertEqual(
+                ['details1', 'details2'],
+                rpcapi.get_devices_details_list(
+                    ctxt, ['fake_device1', 'fake_device2'], 'fake_agent_id'))
+            self.assertFalse(rpcapi.bulk_rpc_supported)
+            # the bulk call is not attempted anymore
+            self.assertEqual(
+                ['details3'],
+                rpcapi.get_devices_details_list(
+                    ctxt, ['fake_device3'], 'fake_agent_id'))
+        self.assertEqual(4, call.call_count)
+        self.assertEqual('get_device_details',
+                         call.call_args[0][1]['method'])
@@ -288,7 +288,8 @@ class TestOFANeutronAgent(OFAAgentTestCase):
         self.assertEqual(expected, actual)
 
     def test_treat_devices_added_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
+        with mock.patch.object(self.agent.plugin_rpc,
+                               'get_devices_details_list',
                                side_effect=Exception()):
             self.assertTrue(self.agent.treat_devices_added([{}]))
 
@@ -301,11 +302,12 @@ class TestOFANeutronAgent(OFAAgentTestCase):
         :returns: whether the named function was called
         """
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
-                              return_value=details),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=port),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
             mock.patch.object(self.agent, func_name)
         ) as (get_dev_fn, get_vif_func, upd_dev_up, func):
             self.assertFalse(self.agent.treat_devices_added([{}]))
@@ -331,16 +333,16 @@ class TestOFANeutronAgent(OFAAgentTestCase):
                                                        'treat_vif_port'))
 
     def test_treat_devices_removed_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                side_effect=Exception()):
             self.assertTrue(self.agent.treat_devices_removed([{}]))
 
     def _mock_treat_devices_removed(self, port_exists):
-        details = dict(exists=port_exists)
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        details = [dict(device='123', exists=port_exists)]
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                return_value=details):
             with mock.patch.object(self.agent, 'port_unbound') as port_unbound:
-                self.assertFalse(self.agent.treat_devices_removed([{}]))
+                self.assertFalse(self.agent.treat_devices_removed(['123']))
         self.assertTrue(port_unbound.called)
 
     def test_treat_devices_removed_unbinds_port(self):
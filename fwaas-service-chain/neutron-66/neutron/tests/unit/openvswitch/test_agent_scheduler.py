@@ -748,6 +748,26 @@ class OvsAgentSchedulerTestCase(OvsAgentSchedulerTestCaseBase):
             self.assertIn(router_ids[0], [r['id'] for r in ret_a])
             self.assertIn(router_ids[2], [r['id'] for r in ret_a])
 
+    def test_rpc_get_router_ids(self):
+        l3_rpc = l3_rpc_base.L3RpcCallbackMixin()
+        self._register_agent_states()
+
+        # No routers
+        self.assertEqual([], l3_rpc.get_router_ids(self.adminContext,
+                                                   host=L3_HOSTA))
+
+        with contextlib.nested(self.router(),
+                               self.router()) as routers:
+            router_ids = [r['router']['id'] for r in routers]
+            # The routers are scheduled to the agent
+            ret_a = l3_rpc.get_router_ids(self.adminContext, host=L3_HOSTA)
+            self.assertEqual(set(router_ids), set(ret_a))
+            ret_b = l3_rpc.get_router_ids(self.adminContext, host=L3_HOSTB)
+            self.assertEqual([], ret_b)
+            host_routers = self._list_routers_hosted_by_l3_agent(
+                self._get_agent_id(constants.AGENT_TYPE_L3, L3_HOSTA))
+            self.assertEqual(2, len(host_routers['routers']))
+
     def test_router_auto_schedule_for_specified_routers(self):
 
         def _sync_router_with_ids(router_ids, exp_synced, exp_hosted, host_id):
@@ -18,6 +18,7 @@ import contextlib
 import sys
 
 import mock
+import netaddr
 from oslo.config import cfg
 import testtools
 
@@ -134,7 +135,7 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                     old_local_vlan, None, None, None))
         with contextlib.nested(
             mock.patch('neutron.agent.linux.ovs_lib.OVSBridge.'
-                       'set_db_attribute', return_value=True),
+                       'set_db_attributes', return_value=True),
             mock.patch('neutron.agent.linux.ovs_lib.OVSBridge.'
                        'db_get_val', return_value=str(old_local_vlan)),
             mock.patch.object(self.agent.int_br, 'delete_flows')
@@ -143,7 +144,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         get_ovs_db_func.assert_called_once_with("Port", mock.ANY, "tag")
         if new_local_vlan != old_local_vlan:
             set_ovs_db_func.assert_called_once_with(
-                "Port", mock.ANY, "tag", str(new_local_vlan))
+                "Port", mock.ANY, [("tag", str(new_local_vlan)),
+                                   ("other_config:net_uuid", net_uuid)])
             if ofport != -1:
                 delete_flows_func.assert_called_once_with(in_port=port.ofport)
             else:
@@ -161,6 +163,50 @@ class TestOvsNeutronAgent(base.BaseTestCase):
     def test_port_bound_does_not_rewire_if_already_bound(self):
         self._mock_port_bound(ofport=-1, new_local_vlan=1, old_local_vlan=1)
 
+    def test_restart_restores_local_vlans(self):
+        port_configs = {
+            'tap1': (5, {'net_uuid': 'net1'}),
+            'tap2': (5, {'net_uuid': 'net1'}),
+            'tap3': (7, {'net_uuid': 'net2'}),
+            'tap4': (9, {}),
+            'tap5': (int(ovs_neutron_agent.DEAD_VLAN_TAG), {}),
+            'patch-tun': ([], {})}
+        with mock.patch.object(self.agent.int_br,
+                               'get_port_tags_and_other_config',
+                               return_value=port_configs):
+            self.agent._restore_local_vlans()
+        self.agent.enable_tunneling = True
+        self.agent.tun_br_ofports[p_const.TYPE_GRE] = {'1.1.1.1': '8'}
+
+        port = mock.Mock()
+        port.port_name = 'tap1'
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'db_get_val',
+                              return_value='5'),
+            mock.patch.object(self.agent.int_br, 'set_db_attributes')
+        ) as (db_get_val, set_db_attributes):
+            self.agent.port_bound(port, 'net1', p_const.TYPE_GRE, None, 101)
+        self.agent.provision_local_vlan('net3', p_const.TYPE_GRE, None, 103)
+
+        # net1 gets its local VLAN back and its port is not tagged again, so
+        # the flows kept from the previous run are still the ones of net1
+        self.assertEqual(5, self.agent.local_vlan_map['net1'].vlan)
+        self.assertFalse(set_db_attributes.called)
+        self.agent.tun_br.mod_flow.assert_any_call(
+            table=constants.FLOOD_TO_TUN, dl_vlan=5,
+            actions='strip_vlan,set_tunnel:101,output:8')
+        self.agent.tun_br.add_flow.assert_any_call(
+            table=constants.TUN_TABLE[p_const.TYPE_GRE], priority=1,
+            tun_id=101,
+            actions='mod_vlan_vid:5,resubmit(,%s)' % constants.LEARN_FROM_TUN)
+        # the local VLANs of the previous run are not given to net3
+        self.assertNotIn(self.agent.local_vlan_map['net3'].vlan, (5, 7, 9))
+
+        self.agent.cleanup_stale_flows()
+        self.assertTrue(set([7, 9]) <= self.agent.available_local_vlans)
+        self.assertNotIn(5, self.agent.available_local_vlans)
+        self.assertEqual({}, self.agent.local_vlan_hints)
+
     def _test_port_dead(self, cur_tag=None):
         port = mock.Mock()
         port.ofport = 1
@@ -192,12 +238,11 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                         updated_ports=None, port_tags_dict=None):
         if port_tags_dict is None:  # Because empty dicts evaluate as False.
             port_tags_dict = {}
-        with contextlib.nested(
-            mock.patch.object(self.agent.int_br, 'get_vif_port_set',
-                              return_value=vif_port_set),
-            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
-                              return_value=port_tags_dict)
-        ):
+        snapshot = mock.Mock()
+        snapshot.get_vif_port_set.return_value = vif_port_set
+        snapshot.get_port_tag_dict.return_value = port_tags_dict
+        with mock.patch.object(self.agent.int_br, 'get_snapshot',
+                               return_value=snapshot):
             return self.agent.scan_ports(registered_ports, updated_ports)
 
     def test_scan_ports_returns_current_only_for_unchanged_ports(self):
@@ -250,6 +295,140 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                       updated_ports)
         self.assertEqual(expected, actual)
 
+    def _event(self, action, name, port_id, ofport=1, changed=None):
+        event = {'action': action, 'name': name, 'ofport': ofport,
+                 'external_ids': {'iface-id': port_id,
+                                  'attached-mac': 'aa:bb:cc:dd:ee:ff'}}
+        if changed is not None:
+            event['changed'] = changed
+        return event
+
+    def mock_process_port_events(self, events, registered_ports,
+                                 updated_ports=None, int_br_ports=()):
+        snapshot = mock.Mock()
+        snapshot.get_port_name_list.return_value = list(int_br_ports)
+        snapshot.get_port_tag_dict.return_value = {}
+        with mock.patch.object(self.agent.int_br, 'get_snapshot',
+                               return_value=snapshot):
+            port_info = self.agent.process_port_events(
+                events, registered_ports, updated_ports)
+        self.assertFalse(snapshot.get_vif_port_set.called)
+        return port_info
+
+    def test_process_port_events_without_events(self):
+        registered_ports = set(['id1', 'id2'])
+        actual = self.mock_process_port_events([], registered_ports,
+                                               set(['id2']))
+        self.assertEqual({'current': registered_ports,
+                          'updated': set(['id2'])}, actual)
+
+    def test_process_port_events_returns_port_changes(self):
+        events = [self._event('added', 'tap3', 'id3'),
+                  self._event('removed', 'tap2', 'id2'),
+                  # on another bridge
+                  self._event('added', 'tap4', 'id4'),
+                  # not ready yet
+                  self._event('added', 'tap5', 'id5', ofport=[]),
+                  # removed and replugged
+                  self._event('removed', 'tap1', 'id1'),
+                  self._event('added', 'tap1', 'id1')]
+        actual = self.mock_process_port_events(
+            events, set(['id1', 'id2']),
+            int_br_ports=['tap1', 'tap3', 'tap5'])
+        self.assertEqual({'current': set(['id1', 'id3']),
+                          'added': set(['id3']),
+                          'removed': set(['id2'])}, actual)
+
+    def test_process_port_events_returns_replugged_ports_as_updated(self):
+        events = [self._event('modified', 'tap1', 'id1', ofport=5,
+                              changed=['ofport']),
+                  self._event('modified', 'tap2', 'id2',
+                              changed=['external_ids']),
+                  self._event('modified', 'tap3', 'id3', ofport=-1,
+                              changed=['ofport'])]
+        actual = self.mock_process_port_events(
+            events, set(['id1', 'id2', 'id3']),
+            int_br_ports=['tap1', 'tap2', 'tap3'])
+        self.assertEqual({'current': set(['id1', 'id2']),
+                          'added': set(),
+                          'removed': set(['id3']),
+                          'updated': set(['id1'])}, actual)
+
+    def test_rpc_loop_uses_polling_manager_events(self):
+        polling_manager = mock.Mock()
+        polling_manager.get_events.return_value = []
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'scan_ports'),
+            mock.patch.object(self.agent, 'process_port_events',
+                              return_value={'current': set()}),
+            mock.patch.object(self.agent, 'process_network_ports'),
+            mock.patch.object(ovs_neutron_agent.time, 'sleep',
+                              side_effect=RuntimeError)
+        ) as (scan_ports, process_port_events, process_network_ports,
+              sleep):
+            self.assertRaises(RuntimeError, self.agent.rpc_loop,
+                              polling_manager=polling_manager)
+        self.assertFalse(scan_ports.called)
+        process_port_events.assert_called_once_with([], set(), set())
+
+    def _test_rpc_loop_cleanup_stale_flows(self, sync):
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'scan_ports',
+                              return_value={'current': set(),
+                                            'added': set(['id1'])}),
+            mock.patch.object(self.agent, 'process_network_ports',
+                              return_value=sync),
+            mock.patch.object(self.agent, 'cleanup_stale_flows'),
+            mock.patch.object(ovs_neutron_agent.time, 'sleep',
+                              side_effect=RuntimeError)
+        ) as (scan_ports, process_network_ports, cleanup_stale_flows,
+              sleep):
+            self.assertRaises(RuntimeError, self.agent.rpc_loop)
+        return cleanup_stale_flows.called
+
+    def test_rpc_loop_cleanup_stale_flows_once_in_sync(self):
+        self.assertTrue(self._test_rpc_loop_cleanup_stale_flows(False))
+
+    def test_rpc_loop_keeps_stale_flows_until_in_sync(self):
+        self.assertFalse(self._test_rpc_loop_cleanup_stale_flows(True))
+
+    def test_rpc_loop_keeps_stale_flows_until_fdb_received(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.fdb_pending_networks = set(['net1'])
+        with mock.patch.object(ovs_neutron_agent.time, 'time',
+                               return_value=100):
+            self.assertFalse(self._test_rpc_loop_cleanup_stale_flows(False))
+        with mock.patch.object(self.agent, 'tun_br'):
+            self.agent.fdb_add(None, {'net1': {'ports': {'2.2.2.2': []}}})
+        self.assertTrue(self._test_rpc_loop_cleanup_stale_flows(False))
+
+    def test_rpc_loop_cleanup_stale_flows_after_fdb_timeout(self):
+        cfg.CONF.set_override('l2pop_stale_flows_timeout', 10, 'AGENT')
+        self.agent.fdb_pending_networks = set(['net1'])
+        with mock.patch.object(ovs_neutron_agent.time, 'time',
+                               return_value=100):
+            self.assertFalse(self._test_rpc_loop_cleanup_stale_flows(False))
+        with mock.patch.object(ovs_neutron_agent.time, 'time',
+                               return_value=110):
+            self.assertTrue(self._test_rpc_loop_cleanup_stale_flows(False))
+
+    def test_provision_local_vlan_waits_for_fdb_entries(self):
+        self.agent.enable_tunneling = True
+        self.agent.l2_pop = True
+        with mock.patch.object(self.agent, 'tun_br'):
+            self.agent.provision_local_vlan('net1', 'gre', None, 1)
+        self.assertEqual(set(['net1']), self.agent.fdb_pending_networks)
+        with mock.patch.object(self.agent.int_br, 'cleanup_stale_flows'):
+            self.agent.cleanup_stale_flows()
+        self.assertEqual(set(), self.agent.fdb_pending_networks)
+
+    def test_cleanup_stale_flows(self):
+        with mock.patch.object(self.agent.int_br,
+                               'cleanup_stale_flows') as cleanup:
+            self.agent.cleanup_stale_flows()
+        cleanup.assert_called_once_with()
+        self.assertFalse(self.agent.stale_flows_cleanup_needed)
+
     def test_update_ports_returns_changed_vlan(self):
         br = ovs_lib.OVSBridge('br-int', 'sudo')
         mac = "ca:fe:de:ad:be:ef"
@@ -271,7 +450,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
 
     def test_treat_devices_added_returns_true_for_missing_device(self):
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
                               side_effect=Exception()),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=mock.Mock())):
@@ -286,17 +466,50 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         :returns: whether the named function was called
         """
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
-                              return_value=details),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=port),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, func_name)
         ) as (get_dev_fn, get_vif_func, upd_dev_up, upd_dev_down, func):
             self.assertFalse(self.agent.treat_devices_added_or_updated([{}]))
         return func.called
 
+    def test_treat_devices_added_updated_uses_snapshot(self):
+        port = ovs_lib.VifPort('tap1', 1, 'id1', 'aa:bb:cc:dd:ee:ff',
+                               self.agent.int_br)
+        snapshot = ovs_lib.BridgeSnapshot(
+            self.agent.int_br,
+            [{'name': 'tap1', 'tag': 1, 'ofport': 1,
+              'external_ids': {'iface-id': 'id1',
+                               'attached-mac': 'aa:bb:cc:dd:ee:ff'}}])
+        details = {'device': 'id1', 'port_id': 'id1', 'network_id': 'net1',
+                   'network_type': 'local', 'physical_network': None,
+                   'segmentation_id': None, 'admin_state_up': True}
+        lvm = ovs_neutron_agent.LocalVLANMapping(1, 'local', None, None)
+        self.agent.int_br_snapshot = snapshot
+        with contextlib.nested(
+            mock.patch.dict(self.agent.local_vlan_map, {'net1': lvm}),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id'),
+            mock.patch.object(self.agent.int_br, 'db_get_val'),
+            mock.patch.object(self.agent.int_br, 'set_db_attribute')
+        ) as (local_vlan_map, get_dev_fn, upd_dev_up, get_vif_port_by_id,
+              db_get_val, set_db_attribute):
+            self.assertFalse(
+                self.agent.treat_devices_added_or_updated(['id1']))
+        self.assertFalse(get_vif_port_by_id.called)
+        self.assertFalse(db_get_val.called)
+        # already bound to the local vlan
+        self.assertFalse(set_db_attribute.called)
+        self.assertEqual(port.port_name, lvm.vif_ports['id1'].port_name)
+
     def test_treat_devices_added_updated_ignores_invalid_ofport(self):
         port = mock.Mock()
         port.ofport = -1
@@ -311,11 +524,19 @@ class TestOvsNeutronAgent(base.BaseTestCase):
 
     def test_treat_devices_added_does_not_process_missing_port(self):
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details'),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[{'device': '123',
+                                             'port_id': '123'}]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
-                              return_value=None)
-        ) as (get_dev_fn, get_vif_func):
-            self.assertFalse(get_dev_fn.called)
+                              return_value=None),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent, 'treat_vif_port')
+        ) as (get_dev_fn, get_vif_func, upd_dev_up, treat_vif_port):
+            self.assertFalse(
+                self.agent.treat_devices_added_or_updated(['123']))
+            self.assertFalse(treat_vif_port.called)
+            self.assertFalse(upd_dev_up.called)
 
     def test_treat_devices_added__updated_updates_known_port(self):
         details = mock.MagicMock()
@@ -332,30 +553,59 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                              'segmentation_id': 'bar',
                              'network_type': 'baz'}
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
-                              return_value=fake_details_dict),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[fake_details_dict]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=mock.MagicMock()),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, 'treat_vif_port')
         ) as (get_dev_fn, get_vif_func, upd_dev_up,
               upd_dev_down, treat_vif_port):
             self.assertFalse(self.agent.treat_devices_added_or_updated([{}]))
             self.assertTrue(treat_vif_port.called)
-            self.assertTrue(upd_dev_down.called)
+            upd_dev_down.assert_called_once_with(
+                self.agent.context, ['xxx'], self.agent.agent_id,
+                cfg.CONF.host)
+            self.assertFalse(upd_dev_up.called)
+
+    def test_treat_devices_added_updates_ports_up_in_bulk(self):
+        details_list = [{'admin_state_up': True,
+                         'port_id': device,
+                         'device': device,
+                         'network_id': 'yyy',
+                         'physical_network': 'foo',
+                         'segmentation_id': 'bar',
+                         'network_type': 'baz'} for device in ('a', 'b')]
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=details_list),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent, 'treat_vif_port')
+        ) as (get_dev_fn, get_vif_func, upd_dev_up, treat_vif_port):
+            self.assertFalse(
+                self.agent.treat_devices_added_or_updated(['a', 'b']))
+            get_dev_fn.assert_called_once_with(
+                self.agent.context, ['a', 'b'], self.agent.agent_id)
+            upd_dev_up.assert_called_once_with(
+                self.agent.context, ['a', 'b'], self.agent.agent_id,
+                cfg.CONF.host)
 
     def test_treat_devices_removed_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                side_effect=Exception()):
             self.assertTrue(self.agent.treat_devices_removed([{}]))
 
     def _mock_treat_devices_removed(self, port_exists):
-        details = dict(exists=port_exists)
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        details = [dict(device='123', exists=port_exists)]
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                return_value=details):
             with mock.patch.object(self.agent, 'port_unbound') as port_unbound:
-                self.assertFalse(self.agent.treat_devices_removed([{}]))
+                self.assertFalse(self.agent.treat_devices_removed(['123']))
         self.assertTrue(port_unbound.called)
 
     def test_treat_devices_removed_unbinds_port(self):
@@ -439,6 +689,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             mock.patch.object(ovs_lib.OVSBridge, "add_flow"),
             mock.patch.object(ovs_lib.OVSBridge, "add_port"),
             mock.patch.object(ovs_lib.OVSBridge, "delete_port"),
+            mock.patch.object(ovs_lib.OVSBridge, "get_port_ofport",
+                              return_value='[]'),
             mock.patch.object(self.agent.int_br, "add_port"),
             mock.patch.object(self.agent.int_br, "delete_port"),
             mock.patch.object(ip_lib.IPWrapper, "add_veth"),
@@ -446,7 +698,7 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             mock.patch.object(ip_lib.IpLinkCommand, "set_up"),
             mock.patch.object(ip_lib.IpLinkCommand, "set_mtu")
         ) as (devex_fn, sysexit_fn, utilsexec_fn, remflows_fn, ovs_addfl_fn,
-              ovs_addport_fn, ovs_delport_fn, br_addport_fn,
+              ovs_addport_fn, ovs_delport_fn, get_ofport_fn, br_addport_fn,
               br_delport_fn, addveth_fn, linkdel_fn, linkset_fn, linkmtu_fn):
             devex_fn.return_value = True
             parent = mock.MagicMock()
@@ -470,6 +722,33 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.assertEqual(self.agent.phys_ofports["physnet1"],
                              "int_ofport")
 
+    def test_setup_physical_bridges_keeps_veth(self):
+        with contextlib.nested(
+            mock.patch.object(ip_lib, "device_exists", return_value=True),
+            mock.patch.object(utils, "execute"),
+            mock.patch.object(ovs_lib.OVSBridge, "start_flow_reconciliation"),
+            mock.patch.object(ovs_lib.OVSBridge, "add_flow"),
+            mock.patch.object(ovs_lib.OVSBridge, "add_port"),
+            mock.patch.object(ovs_lib.OVSBridge, "delete_port"),
+            mock.patch.object(ovs_lib.OVSBridge, "get_port_ofport",
+                              side_effect=lambda name: {'int-br-eth': '3',
+                                                        'phy-br-eth': '4'}[
+                                                            name]),
+            mock.patch.object(ip_lib.IPWrapper, "add_veth"),
+            mock.patch.object(ip_lib.IpLinkCommand, "delete"),
+            mock.patch.object(ip_lib.IpLinkCommand, "set_up"),
+        ) as (devex_fn, utilsexec_fn, reconcile_fn, addfl_fn, addport_fn,
+              delport_fn, get_ofport_fn, addveth_fn, linkdel_fn, linkset_fn):
+            self.agent.setup_physical_bridges({"physnet1": "br-eth"})
+        self.assertFalse(delport_fn.called)
+        self.assertFalse(linkdel_fn.called)
+        self.assertFalse(addveth_fn.called)
+        self.assertFalse(addport_fn.called)
+        self.assertEqual('3', self.agent.int_ofports["physnet1"])
+        self.assertEqual('4', self.agent.phys_ofports["physnet1"])
+        addfl_fn.assert_any_call(priority=2, in_port='3', actions="drop")
+        addfl_fn.assert_any_call(priority=2, in_port='4', actions="drop")
+
     def test_port_unbound(self):
         with mock.patch.object(self.agent, "reclaim_local_vlan") as reclvl_fn:
             self.agent.enable_tunneling = True
@@ -544,17 +823,39 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         self._check_ovs_vxlan_version(min_vxlan_ver, install_ver,
                                       min_kernel_ver, expecting_ok=False)
 
+    def _check_ovs_arp_responder_version(self, installed_usr_version):
+        self.agent.tunnel_types = []
+        self.agent.arp_responder_enabled = True
+        with mock.patch.object(ovs_lib, 'get_installed_ovs_usr_version',
+                               return_value=installed_usr_version):
+            self.agent._check_ovs_version()
+        return self.agent.arp_responder_enabled
+
+    def test_check_arp_responder_minimum_version(self):
+        self.assertTrue(self._check_ovs_arp_responder_version(
+            constants.MINIMUM_OVS_ARP_RESPONDER_VERSION))
+
+    def test_check_arp_responder_old_version(self):
+        self.assertFalse(self._check_ovs_arp_responder_version('2.0'))
+        self.assertFalse(self.agent.agent_state['configurations'][
+            'arp_responder_enabled'])
+
+    def test_check_arp_responder_unknown_version(self):
+        self.assertFalse(self._check_ovs_arp_responder_version(None))
+
     def _prepare_l2_pop_ofports(self):
         lvm1 = mock.Mock()
         lvm1.network_type = 'gre'
         lvm1.vlan = 'vlan1'
         lvm1.segmentation_id = 'seg1'
         lvm1.tun_ofports = set(['1'])
+        lvm1.tun_ucast_ofports = {}
         lvm2 = mock.Mock()
         lvm2.network_type = 'gre'
         lvm2.vlan = 'vlan2'
         lvm2.segmentation_id = 'seg2'
         lvm2.tun_ofports = set(['1', '2'])
+        lvm2.tun_ucast_ofports = {'mac': '2'}
         self.agent.local_vlan_map = {'net1': lvm1, 'net2': lvm2}
         self.agent.tun_br_ofports = {'gre':
                                      {'1.1.1.1': '1', '2.2.2.2': '2'}}
@@ -642,6 +943,68 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                            actions='strip_vlan,'
                                            'set_tunnel:seg2,output:1')
 
+    def test_fdb_add_flows_coalesced(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.tun_br_ofports['gre']['3.3.3.3'] = '3'
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun1',
+                      'ports':
+                      {'2.2.2.2': [['mac2', 'ip2'], ['mac2', 'ip3'],
+                                   n_const.FLOODING_ENTRY],
+                       '3.3.3.3': [['mac3', 'ip4'],
+                                   n_const.FLOODING_ENTRY]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+            mock.patch.object(self.agent.tun_br, 'mod_flow'),
+        ) as (add_flow_fn, mod_flow_fn):
+            self.agent.fdb_add(None, fdb_entry)
+            # Entries already installed are skipped
+            self.agent.fdb_add(None, fdb_entry)
+        self.assertEqual(2, add_flow_fn.call_count)
+        self.assertEqual(set(['1', '2', '3']),
+                         self.agent.local_vlan_map['net1'].tun_ofports)
+        mod_flow_fn.assert_called_once_with(
+            table=constants.FLOOD_TO_TUN, dl_vlan='vlan1',
+            actions='strip_vlan,set_tunnel:seg1,output:%s' %
+            ','.join(self.agent.local_vlan_map['net1'].tun_ofports))
+
+    def test_fdb_del_flows_coalesced(self):
+        self._prepare_l2_pop_ofports()
+        fdb_entry = {'net2':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun2',
+                      'ports':
+                      {'1.1.1.1': [n_const.FLOODING_ENTRY],
+                       '2.2.2.2': [['mac', 'ip1'], ['mac', 'ip2'],
+                                   n_const.FLOODING_ENTRY]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'mod_flow'),
+            mock.patch.object(self.agent.tun_br, 'delete_flows'),
+            mock.patch.object(self.agent, 'cleanup_tunnel_port')
+        ) as (mod_flow_fn, del_flow_fn, clean_tun_fn):
+            self.agent.fdb_remove(None, fdb_entry)
+        self.assertFalse(mod_flow_fn.called)
+        del_flow_fn.assert_has_calls([
+            mock.call(table=constants.UCAST_TO_TUN, dl_vlan='vlan2',
+                      dl_dst='mac'),
+            mock.call(table=constants.FLOOD_TO_TUN, dl_vlan='vlan2')])
+        self.assertEqual(2, del_flow_fn.call_count)
+        clean_tun_fn.assert_has_calls([mock.call('1', 'gre'),
+                                       mock.call('2', 'gre')],
+                                      any_order=True)
+
+    def test_fdb_del_flow_of_moved_port(self):
+        self._prepare_l2_pop_ofports()
+        fdb_entry = {'net2':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun2',
+                      'ports': {'1.1.1.1': [['mac', 'ip']]}}}
+        with mock.patch.object(self.agent.tun_br,
+                               'delete_flows') as del_flow_fn:
+            self.agent.fdb_remove(None, fdb_entry)
+        self.assertFalse(del_flow_fn.called)
+
     def test_fdb_add_port(self):
         self._prepare_l2_pop_ofports()
         fdb_entry = {'net1':
@@ -672,6 +1035,116 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.agent.fdb_remove(None, fdb_entry)
             del_port_fn.assert_called_once_with('gre-02020202')
 
+    def test_fdb_add_flows_arp_responder(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.arp_responder_enabled = True
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun1',
+                      'ports':
+                      {'1.1.1.1':
+                       [['fa:16:3e:00:00:01', '10.0.0.1'],
+                        ['fa:16:3e:00:00:01', 'fd00::1']]}}}
+        with mock.patch.object(self.agent.tun_br,
+                               'add_flow') as add_flow_fn:
+            self.agent.fdb_add(None, fdb_entry)
+        actions = constants.ARP_RESPONDER_ACTIONS % {
+            'mac': netaddr.EUI('fa:16:3e:00:00:01',
+                               dialect=netaddr.mac_unix),
+            'ip': netaddr.IPAddress('10.0.0.1')}
+        self.assertIn('load:0xfa163e000001->NXM_NX_ARP_SHA[]', actions)
+        self.assertIn('load:0xa000001->NXM_OF_ARP_SPA[]', actions)
+        add_flow_fn.assert_any_call(table=constants.ARP_RESPONDER,
+                                    priority=1,
+                                    proto='arp',
+                                    dl_vlan='vlan1',
+                                    nw_dst='10.0.0.1',
+                                    actions=actions)
+        arp_flows = [c for c in add_flow_fn.call_args_list
+                     if c[1]['table'] == constants.ARP_RESPONDER]
+        self.assertEqual(1, len(arp_flows))
+
+    def test_fdb_del_flows_arp_responder(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.arp_responder_enabled = True
+        fdb_entry = {'net2':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun2',
+                      'ports':
+                      {'2.2.2.2': [['fa:16:3e:00:00:01', '10.0.0.1']]}}}
+        with mock.patch.object(self.agent.tun_br,
+                               'delete_flows') as del_flow_fn:
+            self.agent.fdb_remove(None, fdb_entry)
+        del_flow_fn.assert_any_call(table=constants.ARP_RESPONDER,
+                                    proto='arp',
+                                    dl_vlan='vlan2',
+                                    nw_dst='10.0.0.1')
+
+    def test_fdb_del_flows_arp_responder_of_moved_port(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.arp_responder_enabled = True
+        fdb_entry = {'net2':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun2',
+                      'ports': {'1.1.1.1': [['mac', '10.0.0.1']]}}}
+        with mock.patch.object(self.agent.tun_br,
+                               'delete_flows') as del_flow_fn:
+            self.agent.fdb_remove(None, fdb_entry)
+        self.assertFalse(del_flow_fn.called)
+        self.assertEqual({'mac': '2'},
+                         self.agent.local_vlan_map['net2'].tun_ucast_ofports)
+
+    def test_fdb_del_flows_arp_responder_all_ips(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.arp_responder_enabled = True
+        fdb_entry = {'net2':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun2',
+                      'ports': {'2.2.2.2': [['mac', '10.0.0.1'],
+                                            ['mac', '10.0.0.2']]}}}
+        with mock.patch.object(self.agent.tun_br,
+                               'delete_flows') as del_flow_fn:
+            self.agent.fdb_remove(None, fdb_entry)
+        for ip in ('10.0.0.1', '10.0.0.2'):
+            del_flow_fn.assert_any_call(table=constants.ARP_RESPONDER,
+                                        proto='arp',
+                                        dl_vlan='vlan2',
+                                        nw_dst=ip)
+
+    def test_fdb_update_chg_ip(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.arp_responder_enabled = True
+        fdb_entries = {'chg_ip':
+                       {'net1':
+                        {'1.1.1.1':
+                         {'before': [['fa:16:3e:00:00:01', '10.0.0.1']],
+                          'after': [['fa:16:3e:00:00:01', '10.0.0.2']]}}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+            mock.patch.object(self.agent.tun_br, 'delete_flows')
+        ) as (add_flow_fn, del_flow_fn):
+            self.agent.fdb_update(None, fdb_entries)
+        add_flow_fn.assert_called_once_with(table=constants.ARP_RESPONDER,
+                                            priority=1,
+                                            proto='arp',
+                                            dl_vlan='vlan1',
+                                            nw_dst='10.0.0.2',
+                                            actions=mock.ANY)
+        del_flow_fn.assert_called_once_with(table=constants.ARP_RESPONDER,
+                                            proto='arp',
+                                            dl_vlan='vlan1',
+                                            nw_dst='10.0.0.1')
+
+    def test_fdb_update_chg_ip_arp_responder_disabled(self):
+        self._prepare_l2_pop_ofports()
+        fdb_entries = {'chg_ip':
+                       {'net1':
+                        {'1.1.1.1':
+                         {'after': [['fa:16:3e:00:00:01', '10.0.0.2']]}}}}
+        with mock.patch.object(self.agent.tun_br, 'add_flow') as add_flow_fn:
+            self.agent.fdb_update(None, fdb_entries)
+        self.assertFalse(add_flow_fn.called)
+
     def test_recl_lv_port_to_preserve(self):
         self._prepare_l2_pop_ofports()
         self.agent.l2_pop = True
@@ -744,25 +1217,24 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
                               return_value=fake_tunnel_details),
-            mock.patch.object(self.agent, 'setup_tunnel_port')
-        ) as (tunnel_sync_rpc_fn, setup_tunnel_port_fn):
+            mock.patch.object(self.agent, 'setup_tunnel_ports')
+        ) as (tunnel_sync_rpc_fn, setup_tunnel_ports_fn):
             self.agent.tunnel_types = ['gre']
             self.agent.tunnel_sync()
-            expected_calls = [mock.call('gre-42', '100.101.102.103', 'gre')]
-            setup_tunnel_port_fn.assert_has_calls(expected_calls)
+            setup_tunnel_ports_fn.assert_called_once_with(
+                {'gre-42': '100.101.102.103'}, 'gre')
 
     def test_tunnel_sync_with_ml2_plugin(self):
         fake_tunnel_details = {'tunnels': [{'ip_address': '100.101.31.15'}]}
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
                               return_value=fake_tunnel_details),
-            mock.patch.object(self.agent, 'setup_tunnel_port')
-        ) as (tunnel_sync_rpc_fn, setup_tunnel_port_fn):
+            mock.patch.object(self.agent, 'setup_tunnel_ports')
+        ) as (tunnel_sync_rpc_fn, setup_tunnel_ports_fn):
             self.agent.tunnel_types = ['vxlan']
             self.agent.tunnel_sync()
-            expected_calls = [mock.call('vxlan-64651f0f',
-                                        '100.101.31.15', 'vxlan')]
-            setup_tunnel_port_fn.assert_has_calls(expected_calls)
+            setup_tunnel_ports_fn.assert_called_once_with(
+                {'vxlan-64651f0f': '100.101.31.15'}, 'vxlan')
 
     def test_tunnel_sync_invalid_ip_address(self):
         fake_tunnel_details = {'tunnels': [{'ip_address': '300.300.300.300'},
@@ -770,13 +1242,52 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
                               return_value=fake_tunnel_details),
-            mock.patch.object(self.agent, 'setup_tunnel_port')
-        ) as (tunnel_sync_rpc_fn, setup_tunnel_port_fn):
+            mock.patch.object(self.agent, 'setup_tunnel_ports')
+        ) as (tunnel_sync_rpc_fn, setup_tunnel_ports_fn):
             self.agent.tunnel_types = ['vxlan']
             self.agent.tunnel_sync()
-            setup_tunnel_port_fn.assert_called_once_with('vxlan-64646464',
-                                                         '100.100.100.100',
-                                                         'vxlan')
+            setup_tunnel_ports_fn.assert_called_once_with(
+                {'vxlan-64646464': '100.100.100.100'}, 'vxlan')
+
+    def test_setup_tunnel_ports(self):
+        self.agent.l2_pop = False
+        self.agent.tun_br_ofports = {'gre': {'1.1.1.1': '1'}}
+        lvm = ovs_neutron_agent.LocalVLANMapping(1, 'gre', None, 'seg1')
+        self.agent.local_vlan_map = {'net1': lvm}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'add_tunnel_ports',
+                              return_value={'gre-2': '2', 'gre-3': '-1'}),
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+            mock.patch.object(self.agent.tun_br, 'mod_flow'),
+            mock.patch.object(self.agent.tun_br, 'defer_apply_on'),
+            mock.patch.object(self.agent.tun_br, 'defer_apply_off'),
+            mock.patch.object(ovs_neutron_agent.LOG, 'error')
+        ) as (add_tunnel_ports_fn, add_flow_fn, mod_flow_fn, defer_on_fn,
+              defer_off_fn, log_error_fn):
+            self.agent.setup_tunnel_ports({'gre-1': '1.1.1.1',
+                                           'gre-2': '2.2.2.2',
+                                           'gre-3': '3.3.3.3'}, 'gre')
+        add_tunnel_ports_fn.assert_called_once_with(
+            {'gre-2': '2.2.2.2', 'gre-3': '3.3.3.3'},
+            self.agent.local_ip, 'gre', self.agent.vxlan_udp_port)
+        add_flow_fn.assert_called_once_with(priority=1, in_port='2',
+                                            actions='resubmit(,2)')
+        mod_flow_fn.assert_called_once_with(
+            table=constants.FLOOD_TO_TUN, dl_vlan=1,
+            actions='strip_vlan,set_tunnel:seg1,output:%s' %
+            ','.join(self.agent.tun_br_ofports['gre'].values()))
+        self.assertEqual({'1.1.1.1': '1', '2.2.2.2': '2'},
+                         self.agent.tun_br_ofports['gre'])
+        self.assertEqual(1, log_error_fn.call_count)
+        defer_on_fn.assert_called_once_with()
+        defer_off_fn.assert_called_once_with()
+
+    def test_setup_tunnel_ports_all_known(self):
+        self.agent.tun_br_ofports = {'gre': {'1.1.1.1': '1'}}
+        with mock.patch.object(self.agent.tun_br,
+                               'add_tunnel_ports') as add_tunnel_ports_fn:
+            self.agent.setup_tunnel_ports({'gre-1': '1.1.1.1'}, 'gre')
+        self.assertFalse(add_tunnel_ports_fn.called)
 
     def test_tunnel_update(self):
         kwargs = {'tunnel_ip': '10.10.10.10',
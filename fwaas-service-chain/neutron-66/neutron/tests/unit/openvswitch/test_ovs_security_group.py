@@ -93,6 +93,26 @@ class TestOpenvswitchSecurityGroups(OpenvswitchSecurityGroupsTestCase,
                                      port_dict['fixed_ips'])
                     self._delete('ports', port_id)
 
+    def test_security_group_member_delta_notified(self):
+        with self.network() as n:
+            with self.subnet(n):
+                with self.security_group() as sg:
+                    sg_id = sg['security_group']['id']
+                    res = self._create_port(self.fmt, n['network']['id'],
+                                            security_groups=[sg_id])
+                    port = self.deserialize(self.fmt, res)
+                    ip = port['port']['fixed_ips'][0]['ip_address']
+                    self.notifier.security_groups_member_updated.\
+                        assert_called_once_with(
+                            mock.ANY, [sg_id],
+                            sg_member_delta={sg_id: {'added': [ip]}})
+                    self.notifier.reset_mock()
+                    self._delete('ports', port['port']['id'])
+                    self.notifier.security_groups_member_updated.\
+                        assert_called_once_with(
+                            mock.ANY, [sg_id],
+                            sg_member_delta={sg_id: {'removed': [ip]}})
+
     def test_security_group_get_port_from_device_with_no_port(self):
         plugin = manager.NeutronManager.get_plugin()
         port_dict = plugin.callbacks.get_port_from_device('bad_device_id')
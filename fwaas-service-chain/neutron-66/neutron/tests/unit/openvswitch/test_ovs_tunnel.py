@@ -100,24 +100,29 @@ class TunnelTest(base.BaseTestCase):
 
         self.mock_int_bridge = self.ovs_bridges[self.INT_BRIDGE]
         self.mock_int_bridge.get_local_port_mac.return_value = '000000000001'
+        self.mock_int_bridge.get_port_tags_and_other_config.return_value = {}
         self.mock_int_bridge_expected = [
             mock.call.get_local_port_mac(),
-            mock.call.delete_port('patch-tun'),
-            mock.call.remove_all_flows(),
+            mock.call.set_flow_cookie(mock.ANY),
+            mock.call.start_flow_reconciliation(),
             mock.call.add_flow(priority=1, actions='normal'),
+            mock.call.get_port_tags_and_other_config(),
         ]
 
         self.mock_map_tun_bridge = self.ovs_bridges[self.MAP_TUN_BRIDGE]
         self.mock_map_tun_bridge.br_name = self.MAP_TUN_BRIDGE
         self.mock_map_tun_bridge.add_port.return_value = None
         self.mock_map_tun_bridge_expected = [
-            mock.call.remove_all_flows(),
+            mock.call.set_flow_cookie(mock.ANY),
+            mock.call.start_flow_reconciliation(),
             mock.call.add_flow(priority=1, actions='normal'),
+            mock.call.get_port_ofport('phy-tunnel_bridge_mapping'),
             mock.call.delete_port('phy-tunnel_bridge_mapping'),
             mock.call.add_port(self.intb),
         ]
         self.mock_int_bridge.add_port.return_value = None
         self.mock_int_bridge_expected += [
+            mock.call.get_port_ofport('int-tunnel_bridge_mapping'),
             mock.call.delete_port('int-tunnel_bridge_mapping'),
             mock.call.add_port(self.inta)
         ]
@@ -133,7 +138,7 @@ class TunnelTest(base.BaseTestCase):
 
         self.mock_tun_bridge = self.ovs_bridges[self.TUN_BRIDGE]
         self.mock_tun_bridge_expected = [
-            mock.call.reset_bridge(),
+            mock.call.create(),
             mock.call.add_patch_port('patch-int', 'patch-tun'),
         ]
         self.mock_int_bridge_expected += [
@@ -143,7 +148,8 @@ class TunnelTest(base.BaseTestCase):
         self.mock_tun_bridge.add_patch_port.return_value = self.INT_OFPORT
 
         self.mock_tun_bridge_expected += [
-            mock.call.remove_all_flows(),
+            mock.call.set_flow_cookie(mock.ANY),
+            mock.call.start_flow_reconciliation(),
             mock.call.add_flow(priority=1,
                                in_port=self.INT_OFPORT,
                                actions="resubmit(,%s)" %
@@ -247,6 +253,67 @@ class TunnelTest(base.BaseTestCase):
                                           self.VETH_MTU)
         self._verify_mock_calls()
 
+    def test_construct_drop_flows_on_start(self):
+        cfg.CONF.set_override('drop_flows_on_start', True, 'AGENT')
+        reconcile = mock.call.start_flow_reconciliation()
+        for expected in (self.mock_int_bridge_expected,
+                         self.mock_map_tun_bridge_expected,
+                         self.mock_tun_bridge_expected):
+            expected[expected.index(reconcile)] = (
+                mock.call.remove_all_flows())
+        self.mock_int_bridge_expected.insert(
+            1, mock.call.delete_port('patch-tun'))
+        self.mock_tun_bridge_expected[0] = mock.call.reset_bridge()
+        # the veth of the physical bridge is always recreated
+        self.mock_int_bridge_expected.remove(
+            mock.call.get_port_ofport('int-tunnel_bridge_mapping'))
+        self.mock_map_tun_bridge_expected.remove(
+            mock.call.get_port_ofport('phy-tunnel_bridge_mapping'))
+
+        ovs_neutron_agent.OVSNeutronAgent(self.INT_BRIDGE,
+                                          self.TUN_BRIDGE,
+                                          '10.0.0.1', self.NET_MAPPING,
+                                          'sudo', 2, ['gre'],
+                                          self.VETH_MTU)
+        self._verify_mock_calls()
+
+    def test_construct_arp_responder(self):
+        self.mock_tun_bridge_expected.insert(
+            -1, mock.call.add_flow(table=constants.PATCH_LV_TO_TUN,
+                                   priority=2,
+                                   proto='arp',
+                                   dl_dst="ff:ff:ff:ff:ff:ff",
+                                   actions="resubmit(,%s)" %
+                                   constants.ARP_RESPONDER))
+        self.mock_tun_bridge_expected.insert(
+            -1, mock.call.add_flow(table=constants.ARP_RESPONDER,
+                                   priority=0,
+                                   actions="resubmit(,%s)" %
+                                   constants.FLOOD_TO_TUN))
+
+        with mock.patch.object(ovs_lib, 'check_ovs_arp_responder_version',
+                               return_value=True):
+            a = ovs_neutron_agent.OVSNeutronAgent(self.INT_BRIDGE,
+                                                  self.TUN_BRIDGE,
+                                                  '10.0.0.1',
+                                                  self.NET_MAPPING,
+                                                  'sudo', 2, ['gre'],
+                                                  self.VETH_MTU,
+                                                  l2_population=True,
+                                                  arp_responder=True)
+        self.assertTrue(a.arp_responder_enabled)
+        self._verify_mock_calls()
+
+    def test_construct_arp_responder_without_l2pop(self):
+        a = ovs_neutron_agent.OVSNeutronAgent(self.INT_BRIDGE,
+                                              self.TUN_BRIDGE,
+                                              '10.0.0.1', self.NET_MAPPING,
+                                              'sudo', 2, ['gre'],
+                                              self.VETH_MTU,
+                                              arp_responder=True)
+        self.assertFalse(a.arp_responder_enabled)
+        self._verify_mock_calls()
+
     def test_construct_vxlan(self):
         with mock.patch.object(ovs_lib, 'get_installed_ovs_klm_version',
                                return_value="1.10") as klm_ver:
@@ -424,8 +491,10 @@ class TunnelTest(base.BaseTestCase):
     def test_port_bound(self):
         self.mock_int_bridge_expected += [
             mock.call.db_get_val('Port', VIF_PORT.port_name, 'tag'),
-            mock.call.set_db_attribute('Port', VIF_PORT.port_name,
-                                       'tag', str(LVM.vlan)),
+            mock.call.set_db_attributes('Port', VIF_PORT.port_name,
+                                        [('tag', str(LVM.vlan)),
+                                         ('other_config:net_uuid',
+                                          NET_UUID)]),
             mock.call.delete_flows(in_port=VIF_PORT.ofport)
         ]
 
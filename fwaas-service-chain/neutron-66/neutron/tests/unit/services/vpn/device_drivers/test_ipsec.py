@@ -191,6 +191,52 @@ class TestIPsecDeviceDriver(base.BaseTestCase):
         self.driver.sync(context, [{'id': process_id}])
         self.assertNotIn(process_id, self.driver.processes)
 
+    def test_sync_router(self):
+        self.driver.agent_rpc.get_vpn_services_on_host.return_value = [
+            FAKE_VPN_SERVICE]
+        context = mock.Mock()
+        with mock.patch.object(self.driver,
+                               'ensure_process') as ensure_process:
+            ensure_process.side_effect = self.fake_ensure_process
+            self.driver.sync_router(context, {'id': FAKE_ROUTER_ID})
+            self.driver.sync_router(context, {'id': FAKE_ROUTER_ID})
+        self.driver.agent_rpc.get_vpn_services_on_host.assert_called_once_with(
+            context, FAKE_HOST)
+        process = self.driver.processes[FAKE_ROUTER_ID]
+        self.assertEqual(2, process.update.call_count)
+        self.agent.iptables_apply.assert_called_with(FAKE_ROUTER_ID)
+        self.assertFalse(self.driver.agent_rpc.update_status.called)
+
+    def test_sync_router_only_updates_its_service(self):
+        other_router_id = _uuid()
+        other_process = mock.Mock()
+        self.driver.processes = {other_router_id: other_process}
+        self.driver.vpnservices = {FAKE_ROUTER_ID: FAKE_VPN_SERVICE,
+                                   other_router_id: FAKE_VPN_SERVICE}
+        with mock.patch.object(self.driver,
+                               'ensure_process') as ensure_process:
+            self.driver.sync_router(mock.Mock(), {'id': FAKE_ROUTER_ID})
+        ensure_process.assert_called_once_with(
+            FAKE_ROUTER_ID, vpnservice=FAKE_VPN_SERVICE)
+        self.assertFalse(other_process.update.called)
+        self.assertFalse(
+            self.driver.agent_rpc.get_vpn_services_on_host.called)
+
+    def test_sync_router_removed_service(self):
+        process = mock.Mock()
+        process.vpnservice = FAKE_VPN_SERVICE
+        self.driver.processes = {FAKE_ROUTER_ID: process}
+        self.driver.vpnservices = {}
+        self.driver.sync_router(mock.Mock(), {'id': FAKE_ROUTER_ID})
+        process.disable.assert_called_once_with()
+        self.assertNotIn(FAKE_ROUTER_ID, self.driver.processes)
+
+    def test_sync_updates_vpnservices(self):
+        self.driver.agent_rpc.get_vpn_services_on_host.return_value = []
+        self.driver.vpnservices = {FAKE_ROUTER_ID: FAKE_VPN_SERVICE}
+        self.driver.sync(mock.Mock(), [])
+        self.assertEqual({}, self.driver.vpnservices)
+
     def test_status_updated_on_connection_admin_down(self):
         self.driver.process_status_cache = {
             '1': {
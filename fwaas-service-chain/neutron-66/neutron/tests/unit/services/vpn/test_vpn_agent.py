@@ -25,6 +25,7 @@ from neutron.common import config as base_config
 from neutron.openstack.common import uuidutils
 from neutron.services.vpn import agent
 from neutron.services.vpn import device_drivers
+from neutron.services.vpn.device_drivers import ipsec
 from neutron.tests import base
 
 _uuid = uuidutils.generate_uuid
@@ -129,7 +130,7 @@ class TestVPNAgent(base.BaseTestCase):
         self.agent.router_info = {router_id: ri}
         self.agent.remove_nat_rule(router_id, 'fake_chain', 'fake_rule')
         iptables.remove_rule.assert_called_once_with(
-            'fake_chain', 'fake_rule')
+            'fake_chain', 'fake_rule', top=False)
 
     def test_remove_rule_with_no_router(self):
         self.agent.router_info = {}
@@ -149,6 +150,39 @@ class TestVPNAgent(base.BaseTestCase):
         self.agent.iptables_apply(router_id)
         iptables.apply.assert_called_once_with()
 
+    def _ipsec_nat_rules(self, ri):
+        return [rule.rule for rule in ri.iptables_manager.ipv4['nat'].rules
+                if '--pol ipsec' in rule.rule]
+
+    def test_ipsec_nat_rules_updates(self):
+        mock.patch('neutron.openstack.common.rpc.create_connection').start()
+        router_id = _uuid()
+        router = {'id': router_id}
+        ri = l3_agent.RouterInfo(router_id, self.conf.root_helper,
+                                 self.conf.use_namespaces, None)
+        self.agent.router_info = {router_id: ri}
+        device = ipsec.OpenSwanDriver(self.agent, self.fake_host)
+        mock.patch.object(device, 'create_process').start()
+        vpnservice = {'router_id': router_id,
+                      'subnet': {'cidr': '10.0.0.0/24'},
+                      'ipsec_site_connections': [
+                          {'peer_cidrs': ['20.0.0.0/24']}]}
+        device.vpnservices = {router_id: vpnservice}
+        for _i in range(3):
+            device.sync_router(self.agent.context, router)
+        self.assertEqual(['-s 10.0.0.0/24 -d 20.0.0.0/24 -m policy '
+                          '--dir out --pol ipsec -j ACCEPT '],
+                         self._ipsec_nat_rules(ri))
+        vpnservice['ipsec_site_connections'] = [
+            {'peer_cidrs': ['30.0.0.0/24']}]
+        device.sync_router(self.agent.context, router)
+        self.assertEqual(['-s 10.0.0.0/24 -d 30.0.0.0/24 -m policy '
+                          '--dir out --pol ipsec -j ACCEPT '],
+                         self._ipsec_nat_rules(ri))
+        device.vpnservices = {}
+        device.sync_router(self.agent.context, router)
+        self.assertEqual([], self._ipsec_nat_rules(ri))
+
     def test_iptables_apply_with_no_router(self):
         #Should do nothing
         self.agent.router_info = {}
@@ -192,5 +226,15 @@ class TestVPNAgent(base.BaseTestCase):
 
         device = mock.Mock()
         self.agent.devices = [device]
-        self.agent._process_routers(routers, False)
-        device.sync.assert_called_once_with(mock.ANY, routers)
+        self.agent._process_routers(routers)
+        device.sync_router.assert_called_once_with(mock.ANY, routers[0])
+        self.assertFalse(device.sync.called)
+
+    def test_sync_routers_task_syncs_devices(self):
+        self.plugin_api.get_router_ids.return_value = []
+        device = mock.Mock()
+        self.agent.devices = [device]
+        self.agent.fullsync = True
+        self.agent._sync_routers_task(self.agent.context)
+        device.sync.assert_called_once_with(mock.ANY, [])
+        self.assertFalse(self.agent.fullsync)
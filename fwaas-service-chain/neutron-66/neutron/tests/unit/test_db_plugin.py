@@ -20,6 +20,7 @@ import copy
 import os
 
 import mock
+import netaddr
 from oslo.config import cfg
 from testtools import matchers
 import webob.exc
@@ -3772,13 +3773,13 @@ class TestNeutronDbPluginV2(base.BaseTestCase):
                   'first_ip': '192.168.1.100',
                   'last_ip': '192.168.1.120'}]
 
-        allocations = [{'ip_address': '192.168.1.3'},
-                       {'ip_address': '192.168.1.78'},
-                       {'ip_address': '192.168.1.7'},
-                       {'ip_address': '192.168.1.110'},
-                       {'ip_address': '192.168.1.11'},
-                       {'ip_address': '192.168.1.4'},
-                       {'ip_address': '192.168.1.111'}]
+        allocations = [('192.168.1.3',),
+                       ('192.168.1.78',),
+                       ('192.168.1.7',),
+                       ('192.168.1.110',),
+                       ('192.168.1.11',),
+                       ('192.168.1.4',),
+                       ('192.168.1.111',)]
 
         ip_qry = mock.Mock()
         ip_qry.with_lockmode.return_value = ip_qry
@@ -3790,9 +3791,9 @@ class TestNeutronDbPluginV2(base.BaseTestCase):
         pool_qry.filter_by.return_value = pools
 
         def return_queries_side_effect(*args, **kwargs):
-            if args[0] == models_v2.IPAllocation:
+            if args[0] is models_v2.IPAllocation.ip_address:
                 return ip_qry
-            if args[0] == models_v2.IPAllocationPool:
+            if args[0] is models_v2.IPAllocationPool:
                 return pool_qry
 
         context = mock.Mock()
@@ -3811,6 +3812,45 @@ class TestNeutronDbPluginV2(base.BaseTestCase):
                           ['b', '192.168.1.100', '192.168.1.109'],
                           ['b', '192.168.1.112', '192.168.1.120']], actual)
 
+    def _get_free_ranges(self, first, last, allocations):
+        return list(db_base_plugin_v2.NeutronDbPluginV2._get_free_ranges(
+            first, last, allocations))
+
+    def test_get_free_ranges(self):
+        self.assertEqual([(10, 19)], self._get_free_ranges(10, 19, []))
+        self.assertEqual([(10, 19)],
+                         self._get_free_ranges(10, 19, [1, 9, 20, 30]))
+        self.assertEqual([(11, 14), (16, 18)],
+                         self._get_free_ranges(10, 19, [10, 15, 15, 19]))
+        self.assertEqual([], self._get_free_ranges(10, 12, [10, 11, 12]))
+
+    def test_get_free_ranges_large_pool(self):
+        first = int(netaddr.IPAddress('10.0.0.2'))
+        last = int(netaddr.IPAddress('10.0.255.254'))
+        allocations = range(first, last + 1, 2)
+        free_ranges = self._get_free_ranges(first, last, allocations)
+        self.assertEqual(len(allocations) - 1, len(free_ranges))
+        self.assertEqual((first + 1, first + 1), free_ranges[0])
+
+    def test_rebuild_availability_ranges_ipv6(self):
+        pools = [{'id': 'a', 'first_ip': '::2', 'last_ip': '::ffff'}]
+        ip_qry = mock.Mock()
+        ip_qry.with_lockmode.return_value = ip_qry
+        ip_qry.filter_by.return_value = [('::5',)]
+        pool_qry = mock.Mock()
+        pool_qry.options.return_value = pool_qry
+        pool_qry.with_lockmode.return_value = pool_qry
+        pool_qry.filter_by.return_value = pools
+        context = mock.Mock()
+        context.session.query.side_effect = [ip_qry, pool_qry]
+
+        db_base_plugin_v2.NeutronDbPluginV2._rebuild_availability_ranges(
+            context, [mock.MagicMock()])
+
+        actual = [[args[0].first_ip, args[0].last_ip]
+                  for _name, args, _kwargs in context.session.add.mock_calls]
+        self.assertEqual([['::2', '::4'], ['::6', '::ffff']], actual)
+
 
 class NeutronDbPluginV2AsMixinTestCase(base.BaseTestCase):
     """Tests for NeutronDbPluginV2 as Mixin.
@@ -47,6 +47,43 @@ class TestDhcpRpcCallbackMixin(base.BaseTestCase):
 
         self.assertEqual(len(self.log.mock_calls), 1)
 
+    def test_get_active_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='a'), dict(id='b')]
+        self.plugin.get_ports.return_value = [
+            dict(id='p1', network_id='a'), dict(id='p2', network_id='b'),
+            dict(id='p3', network_id='a')]
+        self.plugin.get_subnets.return_value = [
+            dict(id='s1', network_id='b')]
+
+        networks = self.callbacks.get_active_networks_info(mock.Mock(),
+                                                           host='host')
+
+        self.assertEqual(
+            [dict(id='a', subnets=[],
+                  ports=[dict(id='p1', network_id='a'),
+                         dict(id='p3', network_id='a')]),
+             dict(id='b', subnets=[dict(id='s1', network_id='b')],
+                  ports=[dict(id='p2', network_id='b')])],
+            networks)
+        self.plugin.get_subnets.assert_called_once_with(
+            mock.ANY, filters=dict(network_id=mock.ANY, enable_dhcp=[True]))
+
+    def test_get_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='a')]
+        self.plugin.get_ports.return_value = [dict(id='p1', network_id='a')]
+        self.plugin.get_subnets.return_value = []
+
+        networks = self.callbacks.get_networks_info(
+            mock.Mock(), network_ids=['a', 'deleted'], host='host')
+
+        self.assertEqual([dict(id='a', subnets=[],
+                               ports=[dict(id='p1', network_id='a')])],
+                         networks)
+        self.plugin.get_networks.assert_called_once_with(
+            mock.ANY, filters=dict(id=['a', 'deleted']))
+        self.plugin.get_ports.assert_called_once_with(
+            mock.ANY, filters=dict(network_id=['a']))
+
     def _test__port_action_with_failures(self, exc=None, action=None):
         port = {
             'network_id': 'foo_network_id',
@@ -249,7 +249,9 @@ class TestDhcpAgent(base.BaseTestCase):
     def _test_sync_state_helper(self, known_networks, active_networks):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
-            mock_plugin.get_active_networks_info.return_value = active_networks
+            mock_plugin.get_active_network_ids.return_value = [
+                getattr(network, 'id', network) for network in active_networks]
+            mock_plugin.get_networks_info.return_value = active_networks
             plug.return_value = mock_plugin
 
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
@@ -297,10 +299,76 @@ class TestDhcpAgent(base.BaseTestCase):
             self._test_sync_state_helper(known_networks, active_networks)
             w.assert_called_once_with()
 
+    def _test_sync_state_networks(self, network_ids, get_networks_info):
+        networks = [dhcp.NetModel(True, dict(id=network_id,
+                                             admin_state_up=True,
+                                             subnets=[], ports=[]))
+                    for network_id in network_ids]
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_network_ids.return_value = network_ids
+            mock_plugin.get_networks_info.side_effect = get_networks_info
+            mock_plugin.get_active_networks_info.return_value = networks
+            plug.return_value = mock_plugin
+
+            agent = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(
+                    agent, 'safe_configure_dhcp_for_network') as configure:
+                agent.sync_state()
+            self.assertEqual(network_ids,
+                             [args[0].id for args, _kwargs in
+                              configure.call_args_list])
+            self.assertFalse(agent.needs_resync)
+            return mock_plugin
+
+    def test_sync_state_in_chunks(self):
+        cfg.CONF.set_override('sync_networks_chunk_size', 2)
+
+        def get_networks_info(network_ids):
+            return [dhcp.NetModel(True, dict(id=network_id,
+                                             admin_state_up=True,
+                                             subnets=[], ports=[]))
+                    for network_id in network_ids]
+
+        mock_plugin = self._test_sync_state_networks(
+            ['1', '2', '3', '4', '5'], get_networks_info)
+        self.assertEqual([mock.call(['1', '2']), mock.call(['3', '4']),
+                          mock.call(['5'])],
+                         mock_plugin.get_networks_info.mock_calls)
+        self.assertFalse(mock_plugin.get_active_networks_info.called)
+
+    def test_sync_state_without_chunks(self):
+        cfg.CONF.set_override('sync_networks_chunk_size', 0)
+        mock_plugin = self._test_sync_state_networks(['1', '2'], None)
+        self.assertFalse(mock_plugin.get_active_network_ids.called)
+        self.assertFalse(mock_plugin.get_networks_info.called)
+
+    def test_sync_state_get_networks_info_unsupported(self):
+        mock_plugin = self._test_sync_state_networks(
+            ['1', '2'], common.RemoteError('UnsupportedRpcVersion'))
+        mock_plugin.get_active_networks_info.assert_called_once_with()
+
+    def test_sync_state_chunk_error(self):
+        cfg.CONF.set_override('sync_networks_chunk_size', 1)
+        with mock.patch(DHCP_PLUGIN) as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_network_ids.return_value = ['1', '2']
+            mock_plugin.get_networks_info.side_effect = [
+                [dhcp.NetModel(True, dict(id='1', admin_state_up=True,
+                                          subnets=[], ports=[]))],
+                common.RemoteError('NetworkNotFound')]
+            plug.return_value = mock_plugin
+
+            agent = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(agent, 'safe_configure_dhcp_for_network'):
+                agent.sync_state()
+            self.assertEqual(2, mock_plugin.get_networks_info.call_count)
+            self.assertTrue(agent.needs_resync)
+
     def test_sync_state_plugin_error(self):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
-            mock_plugin.get_active_networks_info.side_effect = Exception
+            mock_plugin.get_active_network_ids.side_effect = Exception
             plug.return_value = mock_plugin
 
             with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
@@ -795,14 +863,45 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         payload = dict(port=vars(fake_port2))
         self.cache.get_network_by_id.return_value = fake_network
         self.cache.get_port_by_id.return_value = fake_port2
-        self.dhcp.port_update_end(None, payload)
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, payload)
+            self.dhcp.port_update_end(None, payload)
         self.cache.assert_has_calls(
             [mock.call.get_network_by_id(fake_port2.network_id),
+             mock.call.put_port(mock.ANY),
+             mock.call.get_network_by_id(fake_port2.network_id),
              mock.call.put_port(mock.ANY)])
+        # The events are merged into a single delayed reload
+        self.assertFalse(self.call_driver.called)
+        spawn_after.assert_called_once_with(
+            1.0, self.dhcp._delayed_reload_allocations, fake_network.id)
+
+        self.dhcp._delayed_reload_allocations(fake_network.id)
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+        self.assertFalse(self.dhcp.pending_reloads)
+
+    def test_port_update_end_without_delay(self):
+        cfg.CONF.set_override('reload_allocations_delay', 0)
+        payload = dict(port=vars(fake_port2))
+        self.cache.get_network_by_id.return_value = fake_network
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, payload)
+        self.assertFalse(spawn_after.called)
         self.call_driver.assert_called_once_with('reload_allocations',
                                                  fake_network)
 
+    def test_delayed_reload_allocations_network_removed(self):
+        self.dhcp.pending_reloads.add(fake_network.id)
+        self.cache.get_network_by_id.return_value = None
+        self.dhcp._delayed_reload_allocations(fake_network.id)
+        self.assertFalse(self.call_driver.called)
+        self.assertFalse(self.dhcp.pending_reloads)
+
     def test_port_update_change_ip_on_port(self):
+        cfg.CONF.set_override('reload_allocations_delay', 0)
         payload = dict(port=vars(fake_port1))
         self.cache.get_network_by_id.return_value = fake_network
         updated_fake_port1 = copy.deepcopy(fake_port1)
@@ -816,6 +915,7 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
             [mock.call.call_driver('reload_allocations', fake_network)])
 
     def test_port_delete_end(self):
+        cfg.CONF.set_override('reload_allocations_delay', 0)
         payload = dict(port_id=fake_port2.id)
         self.cache.get_network_by_id.return_value = fake_network
         self.cache.get_port_by_id.return_value = fake_port2
@@ -823,8 +923,8 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.dhcp.port_delete_end(None, payload)
         self.cache.assert_has_calls(
             [mock.call.get_port_by_id(fake_port2.id),
-             mock.call.get_network_by_id(fake_network.id),
-             mock.call.remove_port(fake_port2)])
+             mock.call.remove_port(fake_port2),
+             mock.call.get_network_by_id(fake_network.id)])
         self.call_driver.assert_has_calls(
             [mock.call.call_driver('reload_allocations', fake_network)])
 
@@ -882,6 +982,21 @@ class TestDhcpPluginApiProxy(base.BaseTestCase):
         self.make_msg.assert_called_once_with('get_active_networks_info',
                                               host='foo')
 
+    def test_get_active_network_ids(self):
+        self.call.return_value = ['a']
+        self.assertEqual(['a'], self.proxy.get_active_network_ids())
+        self.make_msg.assert_called_once_with('get_active_networks',
+                                              host='foo')
+
+    def test_get_networks_info(self):
+        self.call.return_value = [dict(id='a', subnets=[], ports=[])]
+        networks = self.proxy.get_networks_info(['a'])
+        self.assertEqual('a', networks[0].id)
+        self.make_msg.assert_called_once_with('get_networks_info',
+                                              network_ids=['a'],
+                                              host='foo')
+        self.assertEqual('1.2', self.call.call_args[1]['version'])
+
     def test_create_dhcp_port(self):
         port_body = (
             {'port':
@@ -1050,6 +1165,56 @@ class TestNetworkCache(base.BaseTestCase):
         nc.put(fake_network)
         self.assertEqual(nc.get_port_by_id(fake_port1.id), fake_port1)
 
+    def test_put_port_keeps_order(self):
+        fake_net = dhcp.NetModel(
+            True, dict(id='12345678-1234-5678-1234567890ab',
+                       tenant_id='aaaaaaaa-aaaa-aaaa-aaaaaaaaaaaa',
+                       subnets=[fake_subnet1],
+                       ports=[fake_port1, fake_port2]))
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_net)
+        new_port1 = dhcp.DictModel(dict(id=fake_port1.id,
+                                        network_id=fake_port1.network_id))
+        nc.put_port(new_port1)
+
+        self.assertEqual([new_port1, fake_port2], list(fake_net.ports))
+        self.assertEqual(new_port1, nc.get_port_by_id(fake_port1.id))
+
+    def test_remove_port_other_port_object(self):
+        fake_net = dhcp.NetModel(
+            True, dict(id='12345678-1234-5678-1234567890ab',
+                       tenant_id='aaaaaaaa-aaaa-aaaa-aaaaaaaaaaaa',
+                       subnets=[fake_subnet1],
+                       ports=[fake_port1, fake_port2]))
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_net)
+        nc.remove_port(dhcp.DictModel(dict(id=fake_port2.id)))
+
+        self.assertIn(fake_port2, fake_net.ports)
+        self.assertEqual(2, len(nc.port_lookup))
+
+    def test_get_state(self):
+        fake_net = dhcp.NetModel(
+            True, dict(id='12345678-1234-5678-1234567890ab',
+                       tenant_id='aaaaaaaa-aaaa-aaaa-aaaaaaaaaaaa',
+                       subnets=[fake_subnet1],
+                       ports=[fake_port1]))
+        nc = dhcp_agent.NetworkCache()
+        nc.put(fake_net)
+        nc.put_port(fake_port2)
+        nc.put_port(fake_port2)
+        self.assertEqual({'networks': 1, 'subnets': 1, 'ports': 2},
+                         nc.get_state())
+
+        nc.remove_port(fake_port1)
+        self.assertEqual({'networks': 1, 'subnets': 1, 'ports': 1},
+                         nc.get_state())
+
+        nc.put(fake_net)
+        nc.remove(fake_net)
+        self.assertEqual({'networks': 0, 'subnets': 0, 'ports': 0},
+                         nc.get_state())
+
 
 class FakePort1:
     id = 'eeeeeeee-eeee-eeee-eeee-eeeeeeeeeeee'
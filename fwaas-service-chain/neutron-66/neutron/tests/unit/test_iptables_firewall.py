@@ -35,9 +35,9 @@ FAKE_IP = {'IPv4': '10.0.0.1',
            'IPv6': 'fe80::1'}
 
 
-class IptablesFirewallTestCase(base.BaseTestCase):
+class BaseIptablesFirewallTestCase(base.BaseTestCase):
     def setUp(self):
-        super(IptablesFirewallTestCase, self).setUp()
+        super(BaseIptablesFirewallTestCase, self).setUp()
         cfg.CONF.register_opts(a_cfg.ROOT_HELPER_OPTS, 'AGENT')
         self.utils_exec_p = mock.patch(
             'neutron.agent.linux.utils.execute')
@@ -63,6 +63,9 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                 'fixed_ips': [FAKE_IP['IPv4'],
                               FAKE_IP['IPv6']]}
 
+
+class IptablesFirewallTestCase(BaseIptablesFirewallTestCase):
+
     def test_prepare_port_filter_with_no_sg(self):
         port = self._fake_port()
         self.firewall.prepare_port_filter(port)
@@ -1217,3 +1220,180 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                  call.add_rule('ofake_dev', '-j $sg-fallback'),
                  call.add_rule('sg-chain', '-j ACCEPT')]
         self.v4filter_inst.assert_has_calls(calls)
+
+
+class IptablesFirewallIpsetTestCase(BaseIptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        super(IptablesFirewallIpsetTestCase, self).setUp()
+        self.ipset = mock.Mock()
+        self.ipset.ipset_sets = {}
+        self.firewall.ipset = self.ipset
+
+    def _fake_remote_group_rules(self, ips):
+        return [{'ethertype': 'IPv4',
+                 'direction': 'ingress',
+                 'protocol': 'tcp',
+                 'port_range_min': 22,
+                 'port_range_max': 22,
+                 'remote_group_id': 'fake_sgid',
+                 'source_ip_prefix': ip} for ip in ips]
+
+    def test_prepare_port_filter_with_remote_group(self):
+        port = self._fake_port()
+        port['security_group_rules'] = self._fake_remote_group_rules(
+            ['10.0.0.2/32', '10.0.0.3/32'])
+        self.firewall.prepare_port_filter(port)
+        set_name = 'NIPv4fake_sgid'
+        self.ipset.set_members.assert_called_once_with(
+            set_name, 'IPv4', set(['10.0.0.2/32', '10.0.0.3/32']))
+        rule = ('-p tcp -m tcp --dport 22 -m set --match-set %s src '
+                '-j RETURN' % set_name)
+        self.v4filter_inst.add_rule.assert_any_call('ifake_dev', rule)
+        added = [c[0][1] for c in self.v4filter_inst.add_rule.call_args_list
+                 if c[0][0] == 'ifake_dev']
+        self.assertEqual(1, added.count(rule))
+        self.assertFalse([r for r in added if '-s 10.0.0.' in r])
+
+    def test_remove_port_filter_destroys_unused_set(self):
+        port = self._fake_port()
+        port['security_group_rules'] = self._fake_remote_group_rules(
+            ['10.0.0.2/32'])
+        self.firewall.prepare_port_filter(port)
+        self.ipset.ipset_sets = {'NIPv4fake_sgid': set(['10.0.0.2/32'])}
+        self.assertFalse(self.ipset.destroy.called)
+        self.firewall.remove_port_filter(port)
+        self.ipset.destroy.assert_called_once_with('NIPv4fake_sgid')
+
+    def test_unused_set_not_destroyed_while_deferred(self):
+        port = self._fake_port()
+        port['security_group_rules'] = self._fake_remote_group_rules(
+            ['10.0.0.2/32'])
+        self.firewall.prepare_port_filter(port)
+        self.ipset.ipset_sets = {'NIPv4fake_sgid': set(['10.0.0.2/32'])}
+        with self.firewall.defer_apply():
+            self.firewall.remove_port_filter(port)
+            self.assertFalse(self.ipset.destroy.called)
+        self.ipset.destroy.assert_called_once_with('NIPv4fake_sgid')
+
+
+class IptablesFirewallSharedChainsTestCase(BaseIptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('shared_sg_chains', True, 'SECURITYGROUP')
+        super(IptablesFirewallSharedChainsTestCase, self).setUp()
+
+    def _fake_sg_port(self, device, ip):
+        return {'device': device,
+                'mac_address': 'ff:ff:ff:ff:ff:ff',
+                'fixed_ips': [ip],
+                'security_groups': ['fake_sgid'],
+                'security_group_rules': [
+                    {'ethertype': 'IPv4',
+                     'direction': 'ingress',
+                     'security_group_id': 'fake_sgid',
+                     'protocol': 'tcp',
+                     'port_range_min': 22,
+                     'port_range_max': 22},
+                    {'ethertype': 'IPv4',
+                     'direction': 'ingress',
+                     'protocol': 'udp',
+                     'port_range_min': 68,
+                     'port_range_max': 68,
+                     'source_port_range_min': 67,
+                     'source_port_range_max': 67,
+                     'source_ip_prefix': '10.0.0.254/32'}]}
+
+    def _rules_of_chain(self, chain_name):
+        return [c[0][1] for c in self.v4filter_inst.add_rule.call_args_list
+                if c[0][0] == chain_name]
+
+    def test_ports_share_security_group_chain(self):
+        port1 = self._fake_sg_port('tapfake_dev1', '10.0.0.1')
+        port2 = self._fake_sg_port('tapfake_dev2', '10.0.0.2')
+        with self.firewall.defer_apply():
+            self.firewall.prepare_port_filter(port1)
+            self.firewall.prepare_port_filter(port2)
+        chain_name = self.firewall._sg_chain_name(port1, 'ingress')
+        self.assertEqual(chain_name,
+                         self.firewall._sg_chain_name(port2, 'ingress'))
+        self.assertTrue(chain_name.startswith('gi'))
+        self.assertEqual(['-p tcp -m tcp --dport 22 -j RETURN',
+                          '-j $sg-fallback'],
+                         self._rules_of_chain(chain_name))
+        for port_chain in ('ifake_dev1', 'ifake_dev2'):
+            rules = self._rules_of_chain(port_chain)
+            self.assertEqual('-j $%s' % chain_name, rules[-1])
+            self.assertIn('-s 10.0.0.254/32 -p udp -m udp --sport 67 '
+                          '--dport 68 -j RETURN', rules)
+            self.assertNotIn('-p tcp -m tcp --dport 22 -j RETURN', rules)
+
+    def test_remove_port_filter_removes_security_group_chain(self):
+        port = self._fake_sg_port('tapfake_dev', '10.0.0.1')
+        self.firewall.prepare_port_filter(port)
+        chain_name = self.firewall._sg_chain_name(port, 'ingress')
+        self.firewall.remove_port_filter(port)
+        self.v4filter_inst.ensure_remove_chain.assert_any_call(chain_name)
+        self.assertEqual(set(), self.firewall._sg_chains)
+
+
+class IptablesFirewallSecurityGroupInfoTestCase(BaseIptablesFirewallTestCase):
+    def setUp(self):
+        super(IptablesFirewallSecurityGroupInfoTestCase, self).setUp()
+        self.firewall.update_security_group_rules('fake_sgid', [
+            {'ethertype': 'IPv4',
+             'direction': 'ingress',
+             'security_group_id': 'fake_sgid',
+             'protocol': 'tcp',
+             'port_range_min': 22,
+             'port_range_max': 22,
+             'remote_group_id': 'fake_sgid'},
+            {'ethertype': 'IPv4',
+             'direction': 'egress',
+             'security_group_id': 'fake_sgid'}])
+        self.firewall.update_security_group_members(
+            'fake_sgid', [FAKE_IP['IPv4'], '10.0.0.2', 'fe80::2'])
+
+    def _rules_of_chain(self, chain_name):
+        return [c[0][1] for c in self.v4filter_inst.add_rule.call_args_list
+                if c[0][0] == chain_name]
+
+    def test_prepare_port_filter_expands_security_group_rules(self):
+        port = self._fake_port()
+        port['security_groups'] = ['fake_sgid']
+        port['security_group_rules'] = []
+        self.firewall.prepare_port_filter(port)
+        ingress = self._rules_of_chain('ifake_dev')
+        self.assertIn('-s 10.0.0.2/32 -p tcp -m tcp --dport 22 -j RETURN',
+                      ingress)
+        # the port's own address is not a remote member for itself
+        self.assertFalse([r for r in ingress if FAKE_IP['IPv4'] in r])
+        self.assertIn('-j RETURN', self._rules_of_chain('ofake_dev'))
+        # the port kept by the driver is the one given by the agent
+        self.assertEqual([], self.firewall.ports['tapfake_dev'][
+            'security_group_rules'])
+
+    def test_update_security_group_members(self):
+        port = self._fake_port()
+        port['security_groups'] = ['fake_sgid']
+        port['security_group_rules'] = []
+        self.firewall.prepare_port_filter(port)
+        self.firewall.update_security_group_members(
+            'fake_sgid', ['10.0.0.3'])
+        self.v4filter_inst.reset_mock()
+        self.firewall.update_port_filter(port)
+        ingress = self._rules_of_chain('ifake_dev')
+        self.assertIn('-s 10.0.0.3/32 -p tcp -m tcp --dport 22 -j RETURN',
+                      ingress)
+        self.assertFalse([r for r in ingress if '10.0.0.2' in r])
+
+    def test_remove_port_filter_forgets_unused_security_groups(self):
+        self.firewall.update_security_group_rules('other_sgid', [])
+        port = self._fake_port()
+        port['security_groups'] = ['fake_sgid']
+        port['security_group_rules'] = []
+        self.firewall.prepare_port_filter(port)
+        self.assertEqual(['fake_sgid'], self.firewall.sg_rules.keys())
+        self.assertEqual(['fake_sgid'], self.firewall.sg_members.keys())
+        self.firewall.remove_port_filter(port)
+        self.assertEqual({}, self.firewall.sg_rules)
+        self.assertEqual({}, self.firewall.sg_members)
@@ -21,6 +21,7 @@ import inspect
 import os
 
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import iptables_manager
 from neutron.tests import base
@@ -608,6 +609,94 @@ class IptablesManagerStateFulTestCase(base.BaseTestCase):
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
 
+class IptablesManagerDifferentialTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerDifferentialTestCase, self).setUp()
+        cfg.CONF.set_override('iptables_differential_apply', True, 'AGENT')
+        self.iptables = iptables_manager.IptablesManager(root_helper='sudo')
+        self.execute = mock.patch.object(self.iptables, "execute").start()
+        self.execute.return_value = NAT_DUMP + FILTER_DUMP
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.ipv4['filter'].add_chain('other')
+        self.iptables.apply()
+        self.assertEqual(2, self.execute.call_count)
+        self.execute.reset_mock()
+
+    def _assert_restored(self, lines):
+        self.execute.assert_called_once_with(
+            ['iptables-restore', '-n'],
+            process_input='\n'.join(lines) % IPTABLES_ARG + '\n',
+            root_helper='sudo')
+
+    def test_apply_without_change_runs_nothing(self):
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+    def test_apply_rewrites_changed_chain_only(self):
+        self.iptables.ipv4['filter'].add_rule('filter', '-j DROP')
+        self.iptables.ipv4['filter'].add_rule('filter', '-j ACCEPT',
+                                              top=True)
+        self.iptables.apply()
+        self._assert_restored(['*filter',
+                               ':%(bn)s-filter - [0:0]',
+                               '-A %(bn)s-filter -j ACCEPT',
+                               '-A %(bn)s-filter -j DROP',
+                               'COMMIT'])
+
+    def test_apply_weeds_out_duplicate_rules(self):
+        self.iptables.ipv4['filter'].add_rule('filter', '-j DROP')
+        self.iptables.ipv4['filter'].add_rule('filter', '-j ACCEPT',
+                                              top=True)
+        self.iptables.ipv4['filter'].add_rule('filter', '-j ACCEPT',
+                                              top=True)
+        self.iptables.ipv4['filter'].add_rule('filter', '-j DROP',
+                                              top=True)
+        self.iptables.apply()
+        self._assert_restored(['*filter',
+                               ':%(bn)s-filter - [0:0]',
+                               '-A %(bn)s-filter -j ACCEPT',
+                               '-A %(bn)s-filter -j DROP',
+                               'COMMIT'])
+
+    def test_apply_removes_chain(self):
+        self.iptables.ipv4['filter'].remove_chain('other')
+        self.iptables.apply()
+        self._assert_restored(['*filter',
+                               ':%(bn)s-other - [0:0]',
+                               '-X %(bn)s-other',
+                               'COMMIT'])
+
+    def test_apply_new_chain(self):
+        self.iptables.ipv4['nat'].add_chain('nat')
+        self.iptables.ipv4['nat'].add_rule('nat', '-j RETURN')
+        self.iptables.apply()
+        self._assert_restored(['*nat',
+                               ':%(bn)s-nat - [0:0]',
+                               '-A %(bn)s-nat -j RETURN',
+                               'COMMIT'])
+
+    def test_unwrapped_change_needs_full_apply(self):
+        self.iptables.ipv4['filter'].add_rule('FORWARD', '-j DROP',
+                                              wrap=False)
+        self.iptables.apply()
+        self.assertEqual(self.execute.call_args_list[0],
+                         mock.call(['iptables-save', '-c'],
+                                   root_helper='sudo'))
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_failed_apply_needs_full_apply(self):
+        self.iptables.ipv4['filter'].add_rule('filter', '-j DROP')
+        self.execute.side_effect = RuntimeError()
+        self.assertRaises(RuntimeError, self.iptables.apply)
+        self.execute.side_effect = None
+        self.execute.reset_mock()
+        self.iptables.apply()
+        self.assertEqual(self.execute.call_args_list[0],
+                         mock.call(['iptables-save', '-c'],
+                                   root_helper='sudo'))
+
+
 class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def setUp(self):
@@ -15,7 +15,9 @@
 
 import contextlib
 import copy
+import datetime
 
+from eventlet import queue
 import mock
 from oslo.config import cfg
 from testtools import matchers
@@ -23,10 +25,12 @@ from testtools import matchers
 from neutron.agent.common import config as agent_config
 from neutron.agent import l3_agent
 from neutron.agent.linux import interface
+from neutron.agent.linux import ip_lib
 from neutron.common import config as base_config
 from neutron.common import constants as l3_constants
 from neutron.common import exceptions as n_exc
-from neutron.openstack.common import processutils
+from neutron.openstack.common.rpc import common as rpc_common
+from neutron.openstack.common import timeutils
 from neutron.openstack.common import uuidutils
 from neutron.tests import base
 
@@ -36,6 +40,77 @@ HOSTNAME = 'myhost'
 FAKE_ID = _uuid()
 
 
+class TestRouterUpdateQueue(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRouterUpdateQueue, self).setUp()
+        self.queue = l3_agent.RouterUpdateQueue()
+
+    def _add(self, router_id, priority=l3_agent.PRIORITY_RPC, **kwargs):
+        update = l3_agent.RouterUpdate(router_id, priority, **kwargs)
+        self.queue.add(update)
+        return update
+
+    def _get_ids(self):
+        ids = []
+        while True:
+            try:
+                update = self.queue.get(block=False)
+            except queue.Empty:
+                return ids
+            ids.append(update.id)
+            self.queue.done(update)
+
+    def test_updates_are_coalesced(self):
+        self._add('r1')
+        last = self._add('r1', action=l3_agent.DELETE_ROUTER)
+        self.assertEqual(1, len(self.queue))
+        self.assertIs(last, self.queue.get(block=False))
+        self.assertRaises(queue.Empty, self.queue.get, block=False)
+
+    def test_rpc_updates_go_first(self):
+        self._add('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        self._add('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        self._add('r3')
+        self.assertEqual(['r3', 'r1', 'r2'], self._get_ids())
+
+    def test_coalesced_update_keeps_highest_priority(self):
+        self._add('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        self._add('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        self._add('r2')
+        self._add('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        self.assertEqual(l3_agent.PRIORITY_RPC,
+                         self.queue.get_pending('r2').priority)
+        self.assertEqual(['r2', 'r1'], self._get_ids())
+
+    def test_older_state_does_not_replace_pending_update(self):
+        now = timeutils.utcnow()
+        pending = self._add('r1', action=l3_agent.DELETE_ROUTER,
+                            timestamp=now)
+        self._add('r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                  router={'id': 'r1'},
+                  timestamp=now - datetime.timedelta(seconds=1))
+        self.assertIs(pending, self.queue.get_pending('r1'))
+
+    def test_older_state_than_processed_is_ignored(self):
+        now = timeutils.utcnow()
+        self._add('r1', timestamp=now)
+        self.queue.done(self.queue.get(block=False))
+        self._add('r1', router={'id': 'r1'},
+                  timestamp=now - datetime.timedelta(seconds=1))
+        self.assertNotIn('r1', self.queue)
+
+    def test_router_in_progress_is_not_returned(self):
+        self._add('r1')
+        update = self.queue.get(block=False)
+        self._add('r1')
+        self._add('r2', l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        self.assertEqual('r2', self.queue.get(block=False).id)
+        self.assertRaises(queue.Empty, self.queue.get, block=False)
+        self.queue.done(update)
+        self.assertEqual('r1', self.queue.get(block=False).id)
+
+
 class TestBasicRouterOperations(base.BaseTestCase):
 
     def setUp(self):
@@ -438,6 +513,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
 
         ri = mock.MagicMock()
         ri.router.get.return_value = [fip]
+        ri.floating_ip_cidrs = None
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
 
@@ -456,16 +532,18 @@ class TestBasicRouterOperations(base.BaseTestCase):
 
         ri = mock.MagicMock()
         ri.router.get.return_value = [fip]
+        ri.floating_ip_nat = {}
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
 
         agent.process_router_floating_ip_nat_rules(ri)
 
         nat = ri.iptables_manager.ipv4['nat']
-        nat.clear_rules_by_tag.assert_called_once_with('floating_ip')
+        self.assertFalse(nat.remove_rule.called)
         rules = agent.floating_forward_rules('15.1.2.3', '192.168.0.1')
         for chain, rule in rules:
             nat.add_rule.assert_any_call(chain, rule, tag='floating_ip')
+        self.assertEqual({'15.1.2.3': '192.168.0.1'}, ri.floating_ip_nat)
 
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_addresses_remove(self, IPDevice):
@@ -474,6 +552,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
 
         ri = mock.MagicMock()
         ri.router.get.return_value = []
+        ri.floating_ip_cidrs = None
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
 
@@ -485,14 +564,48 @@ class TestBasicRouterOperations(base.BaseTestCase):
     def test_process_router_floating_ip_nat_rules_remove(self):
         ri = mock.MagicMock()
         ri.router.get.return_value = []
+        ri.floating_ip_nat = {'15.1.2.3': '192.168.0.1'}
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
 
         agent.process_router_floating_ip_nat_rules(ri)
 
         nat = ri.iptables_manager.ipv4['nat']
-        nat = ri.iptables_manager.ipv4['nat`']
-        nat.clear_rules_by_tag.assert_called_once_with('floating_ip')
+        self.assertFalse(nat.add_rule.called)
+        rules = agent.floating_forward_rules('15.1.2.3', '192.168.0.1')
+        for chain, rule in rules:
+            nat.remove_rule.assert_any_call(chain, rule)
+        self.assertEqual({}, ri.floating_ip_nat)
+
+    def test_process_router_floating_ip_nat_rules_only_changes(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_router_data()
+        router[l3_constants.FLOATINGIP_KEY] = [
+            {'id': _uuid(),
+             'floating_ip_address': '15.1.2.%d' % i,
+             'fixed_ip_address': '192.168.0.%d' % i} for i in range(3)]
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent.process_router_floating_ip_nat_rules(ri)
+        nat = ri.iptables_manager.ipv4['nat']
+        orig_nat_rules = nat.rules[:]
+
+        # remap the first floating IP and remove the last one
+        router[l3_constants.FLOATINGIP_KEY][0]['fixed_ip_address'] = (
+            '192.168.0.10')
+        del router[l3_constants.FLOATINGIP_KEY][2]
+        with mock.patch.object(nat, 'add_rule',
+                               wraps=nat.add_rule) as add_rule:
+            agent.process_router_floating_ip_nat_rules(ri)
+
+        rules = agent.floating_forward_rules('15.1.2.0', '192.168.0.10')
+        self.assertEqual([mock.call(chain, rule, tag='floating_ip')
+                          for chain, rule in rules],
+                         add_rule.call_args_list)
+        removed_rules = [r for r in orig_nat_rules if r not in nat.rules]
+        self.assertEqual(len(rules) * 2, len(removed_rules))
+        self.assertEqual({'15.1.2.0': '192.168.0.10',
+                          '15.1.2.1': '192.168.0.1'}, ri.floating_ip_nat)
 
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_addresses_remap(self, IPDevice):
@@ -508,6 +621,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         ri = mock.MagicMock()
 
         ri.router.get.return_value = [fip]
+        ri.floating_ip_cidrs = None
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
 
@@ -531,6 +645,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         ri = mock.MagicMock()
         ri.floating_ips = [fip]
         ri.router.get.return_value = []
+        ri.floating_ip_cidrs = None
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
 
@@ -542,24 +657,36 @@ class TestBasicRouterOperations(base.BaseTestCase):
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_with_device_add_error(self, IPDevice):
         IPDevice.return_value = device = mock.Mock()
-        device.addr.add.side_effect = processutils.ProcessExecutionError
-        device.addr.list.return_value = []
+        device.addr.list.return_value = [{'cidr': '15.1.2.4/32'}]
         fip_id = _uuid()
         fip = {
             'id': fip_id, 'port_id': _uuid(),
             'floating_ip_address': '15.1.2.3',
             'fixed_ip_address': '192.168.0.2'
         }
+        fip_ok_id = _uuid()
+        fip_ok = {
+            'id': fip_ok_id, 'port_id': _uuid(),
+            'floating_ip_address': '15.1.2.4',
+            'fixed_ip_address': '192.168.0.3'
+        }
         ri = mock.MagicMock()
-        ri.router.get.return_value = [fip]
+        ri.router.get.return_value = [fip, fip_ok]
+        ri.floating_ip_cidrs = set()
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
 
-        fip_statuses = agent.process_router_floating_ip_addresses(
-            ri, {'id': _uuid()})
+        with mock.patch.object(ip_lib.IPBatch, 'execute',
+                               side_effect=RuntimeError):
+            fip_statuses = agent.process_router_floating_ip_addresses(
+                ri, {'id': _uuid()})
 
-        self.assertEqual({fip_id: l3_constants.FLOATINGIP_STATUS_ERROR},
+        self.assertEqual({fip_id: l3_constants.FLOATINGIP_STATUS_ERROR,
+                          fip_ok_id: l3_constants.FLOATINGIP_STATUS_ACTIVE},
                          fip_statuses)
+        # The addresses are read again to find the configured ones
+        device.addr.list.assert_called_once_with()
+        self.assertEqual(set(['15.1.2.4/32']), ri.floating_ip_cidrs)
 
     def test_process_router_snat_disabled(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -676,8 +803,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
             # The unexpected exception has been fixed manually
             internal_network_added.side_effect = None
 
-            # _sync_routers_task finds out that _rpc_loop failed to process the
-            # router last time, it will retry in the next run.
+            # _sync_routers_task finds out that the router update failed
+            # last time, it will retry in the next run.
             agent.process_router(ri)
             # We were able to add the port to ri.internal_ports
             self.assertIn(
@@ -707,8 +834,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
             # The unexpected exception has been fixed manually
             internal_net_removed.side_effect = None
 
-            # _sync_routers_task finds out that _rpc_loop failed to process the
-            # router last time, it will retry in the next run.
+            # _sync_routers_task finds out that the router update failed
+            # last time, it will retry in the next run.
             agent.process_router(ri)
             # We were able to remove the port from ri.internal_ports
             self.assertNotIn(
@@ -745,6 +872,68 @@ class TestBasicRouterOperations(base.BaseTestCase):
                 mock.ANY, ri.router_id,
                 {fip_id: l3_constants.FLOATINGIP_STATUS_DOWN})
 
+    def test_process_router_reports_changed_floatingip_statuses(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        with mock.patch.object(
+            agent.plugin_rpc,
+            'update_floatingip_statuses') as mock_update_fip_status:
+            fip_id = _uuid()
+            router = self._prepare_router_data(num_internal_ports=1)
+            router[l3_constants.FLOATINGIP_KEY] = [
+                {'id': fip_id,
+                 'floating_ip_address': '8.8.8.8',
+                 'fixed_ip_address': '7.7.7.7',
+                 'port_id': router[l3_constants.INTERFACE_KEY][0]['id']}]
+
+            ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                     self.conf.use_namespaces, router=router)
+            agent.external_gateway_added = mock.Mock()
+            agent.process_router(ri)
+            mock_update_fip_status.reset_mock()
+            # Add a floating IP: only its status is reported
+            fip_id2 = _uuid()
+            router[l3_constants.FLOATINGIP_KEY].append(
+                {'id': fip_id2,
+                 'floating_ip_address': '8.8.8.9',
+                 'fixed_ip_address': '7.7.7.8',
+                 'port_id': router[l3_constants.INTERFACE_KEY][0]['id']})
+            ri.router = router
+            agent.process_router(ri)
+            mock_update_fip_status.assert_called_once_with(
+                mock.ANY, ri.router_id,
+                {fip_id2: l3_constants.FLOATINGIP_STATUS_ACTIVE})
+            mock_update_fip_status.reset_mock()
+            # Nothing changed: nothing is reported
+            agent.process_router(ri)
+            self.assertFalse(mock_update_fip_status.called)
+
+    def test_process_router_floatingip_update_does_not_read_devices(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._prepare_router_data(num_internal_ports=1)
+        router[l3_constants.FLOATINGIP_KEY] = []
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent.external_gateway_added = mock.Mock()
+        with mock.patch('neutron.agent.linux.ip_lib.IPDevice') as IPDevice:
+            device = IPDevice.return_value
+            device.addr.list.return_value = []
+            agent.process_router(ri)
+            self.assertEqual(1, self.mock_ip.get_devices.call_count)
+            self.assertEqual(1, device.addr.list.call_count)
+
+            router[l3_constants.FLOATINGIP_KEY].append(
+                {'id': _uuid(),
+                 'floating_ip_address': '8.8.8.8',
+                 'fixed_ip_address': '7.7.7.7',
+                 'port_id': router[l3_constants.INTERFACE_KEY][0]['id']})
+            ri.router = router
+            agent.process_router(ri)
+
+        self.assertEqual(1, self.mock_ip.get_devices.call_count)
+        self.assertEqual(1, device.addr.list.call_count)
+        device.addr.add.assert_called_once_with(4, '8.8.8.8/32', '8.8.8.8')
+        self.assertEqual(set(['8.8.8.8/32']), ri.floating_ip_cidrs)
+
     def test_process_router_floatingip_exception(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.process_router_floating_ip_addresses = mock.Mock()
@@ -770,22 +959,37 @@ class TestBasicRouterOperations(base.BaseTestCase):
                 mock.ANY, ri.router_id,
                 {fip_id: l3_constants.FLOATINGIP_STATUS_ERROR})
 
-    def test_handle_router_snat_rules_add_back_jump(self):
+    def test_handle_router_snat_rules_keep_jump_first(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        ri = l3_agent.RouterInfo(_uuid(), self.conf.root_helper,
+                                 self.conf.use_namespaces, None)
+        port = {'fixed_ips': [{'ip_address': '192.168.1.4'}]}
+
+        agent._handle_router_snat_rules(ri, port, ['10.0.0.0/24'],
+                                        "iface", "add_rules")
+        agent._handle_router_snat_rules(ri, port, ['10.0.1.0/24'],
+                                        "iface", "add_rules")
+
+        wrap_name = ri.iptables_manager.wrap_name
+        snat_rules = [str(r) for r in ri.iptables_manager.ipv4['nat'].rules
+                      if r.chain == 'snat']
+        self.assertEqual(
+            ["-A %s-snat -j %s-float-snat" % (wrap_name, wrap_name),
+             "-A %s-snat -s 10.0.1.0/24 -j SNAT --to-source 192.168.1.4" %
+             wrap_name], snat_rules)
+
+    def test_handle_router_snat_rules_unchanged(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         ri = mock.MagicMock()
         port = {'fixed_ips': [{'ip_address': '192.168.1.4'}]}
+        ri.snat_rules = agent.external_gateway_nat_rules(
+            '192.168.1.4', ['10.0.0.0/24'], "iface")
 
-        agent._handle_router_snat_rules(ri, port, [], "iface", "add_rules")
+        agent._handle_router_snat_rules(ri, port, ['10.0.0.0/24'],
+                                        "iface", "add_rules")
 
-        nat = ri.iptables_manager.ipv4['nat']
-        nat.empty_chain.assert_any_call('snat')
-        nat.add_rule.assert_any_call('snat', '-j $float-snat')
-        for call in nat.mock_calls:
-            name, args, kwargs = call
-            if name == 'add_rule':
-                self.assertEqual(args, ('snat', '-j $float-snat'))
-                self.assertEqual(kwargs, {})
-                break
+        self.assertFalse(ri.iptables_manager.ipv4['nat'].mock_calls)
+        self.assertFalse(ri.iptables_manager.apply.called)
 
     def test_handle_router_snat_rules_add_rules(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -909,26 +1113,27 @@ class TestBasicRouterOperations(base.BaseTestCase):
     def test_router_deleted(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.router_deleted(None, FAKE_ID)
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.removed_routers)
+        update = agent._queue.get_pending(FAKE_ID)
+        self.assertEqual(l3_agent.DELETE_ROUTER, update.action)
+        self.assertEqual(l3_agent.PRIORITY_RPC, update.priority)
 
     def test_routers_updated(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.routers_updated(None, [FAKE_ID])
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.updated_routers)
+        update = agent._queue.get_pending(FAKE_ID)
+        self.assertIsNone(update.action)
+        self.assertEqual(l3_agent.PRIORITY_RPC, update.priority)
 
     def test_removed_from_agent(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.router_removed_from_agent(None, {'router_id': FAKE_ID})
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.removed_routers)
+        update = agent._queue.get_pending(FAKE_ID)
+        self.assertEqual(l3_agent.DELETE_ROUTER, update.action)
 
     def test_added_to_agent(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.router_added_to_agent(None, [FAKE_ID])
-        # verify that will set fullsync
-        self.assertIn(FAKE_ID, agent.updated_routers)
+        self.assertIn(FAKE_ID, agent._queue)
 
     def test_process_router_delete(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -945,8 +1150,145 @@ class TestBasicRouterOperations(base.BaseTestCase):
             'gw_port': ex_gw_port}
         agent._router_added(router['id'], router)
         agent.router_deleted(None, router['id'])
-        agent._process_router_delete()
-        self.assertFalse(list(agent.removed_routers))
+        agent._process_next_router_update()
+        self.assertNotIn(router['id'], agent.router_info)
+        self.assertFalse(len(agent._queue))
+        self.assertFalse(self.plugin_api.get_routers.called)
+
+    def test_process_router_update_fetches_router(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': FAKE_ID, 'admin_state_up': True,
+                  'external_gateway_info': {}}
+        self.plugin_api.get_routers.return_value = [router]
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_next_router_update()
+        self.plugin_api.get_routers.assert_called_once_with(
+            agent.context, [FAKE_ID])
+        process.assert_called_once_with([router])
+
+    def test_process_router_update_router_gone(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.router_info[FAKE_ID] = mock.Mock()
+        self.plugin_api.get_routers.return_value = []
+        agent.routers_updated(None, [FAKE_ID])
+        with mock.patch.object(agent, '_router_removed') as removed:
+            agent._process_next_router_update()
+        removed.assert_called_once_with(FAKE_ID)
+
+    def test_process_router_update_error_sets_fullsync(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.fullsync = False
+        self.plugin_api.get_routers.side_effect = Exception()
+        agent.routers_updated(None, [FAKE_ID])
+        agent._process_next_router_update()
+        self.assertTrue(agent.fullsync)
+        # the router is not left in progress
+        agent.routers_updated(None, [FAKE_ID])
+        self.assertEqual(FAKE_ID, agent._queue.get(block=False).id)
+
+    def test_sync_routers_task_queues_routers(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': _uuid()}
+        stale_router_id = _uuid()
+        agent.router_info[stale_router_id] = mock.Mock()
+        self.plugin_api.get_router_ids.return_value = [router['id']]
+        self.plugin_api.get_routers.return_value = [router]
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._sync_routers_task(agent.context)
+            self.assertFalse(process.called)
+        self.assertFalse(agent.fullsync)
+        update = agent._queue.get_pending(router['id'])
+        self.assertEqual(router, update.router)
+        self.assertEqual(l3_agent.PRIORITY_SYNC_ROUTERS_TASK,
+                         update.priority)
+        update = agent._queue.get_pending(stale_router_id)
+        self.assertEqual(l3_agent.DELETE_ROUTER, update.action)
+
+    def test_rpc_update_not_delayed_by_sync(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        routers = [{'id': _uuid()} for i in range(3)]
+        self.plugin_api.get_router_ids.return_value = [r['id']
+                                                       for r in routers]
+        self.plugin_api.get_routers.return_value = routers
+        agent._sync_routers_task(agent.context)
+        agent.routers_updated(None, [FAKE_ID])
+        self.assertEqual(FAKE_ID, agent._queue.get(block=False).id)
+
+    def test_sync_routers_task_fetches_routers_in_chunks(self):
+        self.conf.set_override('sync_routers_chunk_size', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router_ids = [_uuid() for i in range(5)]
+        self.plugin_api.get_router_ids.return_value = router_ids
+        self.plugin_api.get_routers.side_effect = (
+            lambda context, ids: [{'id': router_id} for router_id in ids])
+        agent._sync_routers_task(agent.context)
+        self.assertEqual([mock.call(agent.context, router_ids[0:2]),
+                          mock.call(agent.context, router_ids[2:4]),
+                          mock.call(agent.context, router_ids[4:])],
+                         self.plugin_api.get_routers.call_args_list)
+        for router_id in router_ids:
+            self.assertEqual({'id': router_id},
+                             agent._queue.get_pending(router_id).router)
+        self.assertFalse(agent.fullsync)
+
+    def test_sync_routers_task_failed_chunk(self):
+        self.conf.set_override('sync_routers_chunk_size', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router_ids = [_uuid() for i in range(4)]
+        self.plugin_api.get_router_ids.return_value = router_ids
+
+        def get_routers(context, ids):
+            if router_ids[2] in ids:
+                raise rpc_common.Timeout()
+            return [{'id': router_id} for router_id in ids]
+
+        self.plugin_api.get_routers.side_effect = get_routers
+        agent._sync_routers_task(agent.context)
+        # The routers of the other chunks are kept, the ones of the failed
+        # chunk are fetched again one by one
+        for router_id in router_ids[:2]:
+            self.assertEqual({'id': router_id},
+                             agent._queue.get_pending(router_id).router)
+        for router_id in router_ids[2:]:
+            update = agent._queue.get_pending(router_id)
+            self.assertIsNone(update.router)
+            self.assertIsNone(update.action)
+        self.assertFalse(agent.fullsync)
+
+    def test_sync_routers_task_missing_routers(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router_ids = [_uuid() for i in range(3)]
+        # router_ids[1] is admin down, router_ids[2] was never processed
+        agent.router_info[router_ids[1]] = mock.Mock()
+        self.plugin_api.get_router_ids.return_value = router_ids
+        self.plugin_api.get_routers.return_value = [{'id': router_ids[0]}]
+        agent._sync_routers_task(agent.context)
+        self.assertEqual({'id': router_ids[0]},
+                         agent._queue.get_pending(router_ids[0]).router)
+        self.assertEqual(l3_agent.DELETE_ROUTER,
+                         agent._queue.get_pending(router_ids[1]).action)
+        self.assertIsNone(agent._queue.get_pending(router_ids[2]))
+        self.assertFalse(agent.fullsync)
+
+    def test_sync_routers_task_without_get_router_ids(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': _uuid()}
+        self.plugin_api.get_router_ids.side_effect = rpc_common.RemoteError(
+            'UnsupportedRpcVersion')
+        self.plugin_api.get_routers.return_value = [router]
+        agent._sync_routers_task(agent.context)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context)
+        self.assertEqual(router,
+                         agent._queue.get_pending(router['id']).router)
+        self.assertFalse(agent.fullsync)
+
+    def test_sync_routers_task_get_router_ids_error(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.side_effect = rpc_common.Timeout()
+        agent._sync_routers_task(agent.context)
+        self.assertFalse(self.plugin_api.get_routers.called)
+        self.assertTrue(agent.fullsync)
 
     def test_destroy_router_namespace_skips_ns_removal(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -1161,7 +1503,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         pm.reset_mock()
 
         agent._destroy_router_namespace = mock.MagicMock()
-        agent._cleanup_namespaces(router_list)
+        agent._cleanup_namespaces([r['id'] for r in router_list])
 
         self.assertEqual(pm.disable.call_count, len(stale_namespace_list))
         self.assertEqual(agent._destroy_router_namespace.call_count,
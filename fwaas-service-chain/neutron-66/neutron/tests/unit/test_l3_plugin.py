@@ -20,6 +20,7 @@ import copy
 import mock
 import netaddr
 from oslo.config import cfg
+import sqlalchemy as sa
 from webob import exc
 
 from neutron.api.v2 import attributes
@@ -1702,6 +1703,61 @@ class L3AgentDbTestCaseBase(L3NatTestCaseMixin):
             self.assertIsNotNone(floatingips[0]['fixed_ip_address'])
             self.assertIsNotNone(floatingips[0]['router_id'])
 
+    def _add_synced_router(self, ext_net_id, cidr):
+        """Add a router with a gateway, an interface and a floating IP."""
+        router_id = self._make_router(self.fmt, _uuid())['router']['id']
+        self._add_external_gateway_to_router(router_id, ext_net_id)
+        network = self._make_network(self.fmt, 'net', True)
+        subnet = self._make_subnet(self.fmt, network,
+                                   str(netaddr.IPNetwork(cidr)[1]), cidr)
+        self._router_interface_action('add', router_id,
+                                      subnet['subnet']['id'], None)
+        port = self._make_port(self.fmt, network['network']['id'])
+        fip = self._make_floatingip(self.fmt, ext_net_id,
+                                    port_id=port['port']['id'])
+        return router_id, (subnet['subnet']['id'], fip['floatingip']['id'])
+
+    def _count_sync_data_queries(self):
+        queries = []
+
+        def count_query(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        engine = qdbapi.get_session().bind
+        sa.event.listen(engine, 'before_cursor_execute', count_query)
+        try:
+            routers = self.plugin.get_sync_data(context.get_admin_context())
+        finally:
+            sa.event.remove(engine, 'before_cursor_execute', count_query)
+        return routers, len(queries)
+
+    def test_l3_agent_routers_query_constant_queries(self):
+        ext_net = self._make_network(self.fmt, 'ext', True)
+        ext_net_id = ext_net['network']['id']
+        ext_subnet_id = self._make_subnet(self.fmt, ext_net, '10.0.0.1',
+                                          '10.0.0.0/24')['subnet']['id']
+        self._set_net_external(ext_net_id)
+        expected = dict([self._add_synced_router(ext_net_id,
+                                                 '20.0.0.0/24')])
+        routers, num_queries = self._count_sync_data_queries()
+        self.assertEqual(1, len(routers))
+        expected.update(self._add_synced_router(ext_net_id,
+                                                '20.0.%d.0/24' % i)
+                        for i in range(1, 4))
+        routers, more_routers_num_queries = self._count_sync_data_queries()
+
+        self.assertEqual(num_queries, more_routers_num_queries)
+        self.assertEqual(4, len(routers))
+        for router in routers:
+            subnet_id, fip_id = expected[router['id']]
+            self.assertEqual(ext_subnet_id, router['gw_port']['subnet']['id'])
+            self.assertEqual([subnet_id],
+                             [i['subnet']['id'] for i in
+                              router[l3_constants.INTERFACE_KEY]])
+            self.assertEqual([fip_id],
+                             [f['id'] for f in
+                              router[l3_constants.FLOATINGIP_KEY]])
+
     def _test_notify_op_agent(self, target_func, *args):
         l3_rpc_agent_api_str = (
             'neutron.api.rpc.agentnotifiers.l3_rpc_agent_api.L3AgentNotifyAPI')
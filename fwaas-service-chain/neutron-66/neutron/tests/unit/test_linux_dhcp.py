@@ -15,6 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import io
 import os
 
 import mock
@@ -1037,6 +1039,52 @@ tag:tag1,249,%s,%s""".lstrip() % (fake_v6,
                                     mock.call(exp_opt_name, exp_opt_data)])
         self.execute.assert_called_once_with(exp_args, 'sudo')
 
+    def _test_reload_allocations_with_files(self, conf_files):
+        def fake_open(filename, *args):
+            return io.BytesIO(conf_files[filename])
+
+        with contextlib.nested(
+            mock.patch('os.path.isdir', return_value=True),
+            mock.patch('os.path.exists',
+                       side_effect=lambda f: f in conf_files),
+            mock.patch('__builtin__.open', side_effect=fake_open),
+            mock.patch.object(dhcp.Dnsmasq, 'active'),
+            mock.patch.object(dhcp.Dnsmasq, 'pid'),
+            mock.patch.object(dhcp.Dnsmasq, '_make_subnet_interface_ip_map',
+                              return_value={}),
+            mock.patch.object(dhcp.Dnsmasq, '_release_unused_leases')
+        ) as (isdir, exists, open, active, pid, ip_map, release):
+            active.__get__ = mock.Mock(return_value=True)
+            pid.__get__ = mock.Mock(return_value=5)
+            dm = dhcp.Dnsmasq(self.conf, FakeDualNetwork(),
+                              version=float(2.59))
+            dm.reload_allocations()
+        self.assertTrue(dm.device_manager.update.called)
+
+    def test_reload_allocations_unchanged(self):
+        (exp_host_name, exp_host_data,
+         exp_addn_name, exp_addn_data,
+         exp_opt_name, exp_opt_data,) = self._test_reload_allocation_data
+
+        self._test_reload_allocations_with_files(
+            {exp_host_name: exp_host_data,
+             exp_addn_name: exp_addn_data,
+             exp_opt_name: exp_opt_data})
+        self.assertFalse(self.safe.called)
+        self.assertFalse(self.execute.called)
+
+    def test_reload_allocations_one_file_changed(self):
+        (exp_host_name, exp_host_data,
+         exp_addn_name, exp_addn_data,
+         exp_opt_name, exp_opt_data,) = self._test_reload_allocation_data
+
+        self._test_reload_allocations_with_files(
+            {exp_host_name: exp_host_data,
+             exp_addn_name: exp_addn_data,
+             exp_opt_name: 'tag:tag0,option:router'})
+        self.safe.assert_called_once_with(exp_opt_name, exp_opt_data)
+        self.execute.assert_called_once_with(['kill', '-HUP', 5], 'sudo')
+
     def test_reload_allocations_stale_pid(self):
         (exp_host_name, exp_host_data,
          exp_addn_name, exp_addn_data,
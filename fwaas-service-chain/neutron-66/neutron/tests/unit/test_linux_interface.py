@@ -15,6 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron.agent.common import config
@@ -91,6 +93,7 @@ class TestABCDriver(TestBase):
         self.ip_dev.assert_has_calls(
             [mock.call('tap0', 'sudo', namespace=ns),
              mock.call().addr.list(scope='global', filters=['permanent']),
+             mock.call('tap0', 'sudo', ns, batch=mock.ANY),
              mock.call().addr.add(4, '192.168.1.2/24', '192.168.1.255'),
              mock.call().addr.delete(4, '172.16.77.240/24')])
 
@@ -106,6 +109,7 @@ class TestABCDriver(TestBase):
         self.ip_dev.assert_has_calls(
             [mock.call('tap0', 'sudo', namespace=ns),
              mock.call().addr.list(scope='global', filters=['permanent']),
+             mock.call('tap0', 'sudo', ns, batch=mock.ANY),
              mock.call().addr.add(4, '192.168.1.2/24', '192.168.1.255')])
         self.assertFalse(self.ip_dev().addr.delete.called)
 
@@ -170,7 +174,13 @@ class TestOVSInterfaceDriver(TestBase):
                      'Interface', 'tap0',
                      'external-ids:attached-mac=aa:bb:cc:dd:ee:ff']
 
-        with mock.patch.object(utils, 'execute') as execute:
+        root_batch = mock.Mock()
+        ns_batch = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(utils, 'execute'),
+            mock.patch.object(ip_lib, 'IPBatch',
+                              side_effect=[root_batch, ns_batch])
+        ) as (execute, batch):
             ovs = interface.OVSInterfaceDriver(self.conf)
             self.device_exists.side_effect = device_exists
             ovs.plug('01234567-1234-1234-99',
@@ -181,18 +191,28 @@ class TestOVSInterfaceDriver(TestBase):
                      namespace=namespace)
             execute.assert_called_once_with(vsctl_cmd, 'sudo')
 
-        expected = [mock.call('sudo'),
-                    mock.call().device('tap0'),
-                    mock.call().device().link.set_address('aa:bb:cc:dd:ee:ff')]
-        expected.extend(additional_expectation)
+        expected = [mock.call('sudo')]
         if namespace:
-            expected.extend(
-                [mock.call().ensure_namespace(namespace),
-                 mock.call().ensure_namespace().add_device_to_namespace(
-                     mock.ANY)])
-        expected.extend([mock.call().device().link.set_up()])
-
+            expected.append(mock.call().ensure_namespace(namespace))
         self.ip.assert_has_calls(expected)
+        batch.assert_has_calls([mock.call('sudo'),
+                                mock.call('sudo', namespace)])
+
+        # The device is configured in the root namespace, then moved to
+        # its namespace and set up there
+        expected = [mock.call.device('tap0'),
+                    mock.call.device().link.set_address('aa:bb:cc:dd:ee:ff')]
+        expected.extend(additional_expectation)
+        if namespace:
+            expected.append(mock.call.device().link.set_netns(namespace))
+            ns_batch.assert_has_calls(
+                [mock.call.device('tap0'),
+                 mock.call.device().link.set_up(),
+                 mock.call.execute()])
+        else:
+            expected.append(mock.call.device().link.set_up())
+        expected.append(mock.call.execute())
+        root_batch.assert_has_calls(expected)
 
     def test_mtu_int(self):
         self.assertIsNone(self.conf.network_device_mtu)
@@ -201,7 +221,7 @@ class TestOVSInterfaceDriver(TestBase):
 
     def test_plug_mtu(self):
         self.conf.set_override('network_device_mtu', 9000)
-        self._test_plug([mock.call().device().link.set_mtu(9000)])
+        self._test_plug([mock.call.device().link.set_mtu(9000)])
 
     def test_unplug(self, bridge=None):
         if not bridge:
@@ -241,9 +261,10 @@ class TestOVSInterfaceDriverWithVeth(TestOVSInterfaceDriver):
         ovs = interface.OVSInterfaceDriver(self.conf)
         self.device_exists.side_effect = device_exists
 
-        root_dev = mock.Mock()
-        ns_dev = mock.Mock()
-        self.ip().add_veth = mock.Mock(return_value=(root_dev, ns_dev))
+        root_batch = mock.Mock()
+        ns_batch = mock.Mock()
+        root_dev = root_batch.device.return_value
+        ns_dev = ns_batch.device.return_value
         expected = [mock.call('sudo'),
                     mock.call().add_veth('tap0', devname,
                                          namespace2=namespace)]
@@ -256,7 +277,11 @@ class TestOVSInterfaceDriverWithVeth(TestOVSInterfaceDriver):
                      'external-ids:iface-status=active', '--', 'set',
                      'Interface', 'tap0',
                      'external-ids:attached-mac=aa:bb:cc:dd:ee:ff']
-        with mock.patch.object(utils, 'execute') as execute:
+        with contextlib.nested(
+            mock.patch.object(utils, 'execute'),
+            mock.patch.object(ip_lib, 'IPBatch',
+                              side_effect=[root_batch, ns_batch])
+        ) as (execute, batch):
             ovs.plug('01234567-1234-1234-99',
                      'port-1234',
                      devname,
@@ -266,6 +291,11 @@ class TestOVSInterfaceDriverWithVeth(TestOVSInterfaceDriver):
                      prefix=prefix)
             execute.assert_called_once_with(vsctl_cmd, 'sudo')
 
+        batch.assert_has_calls([mock.call('sudo'),
+                                mock.call('sudo', namespace)])
+        root_batch.device.assert_called_once_with('tap0')
+        ns_batch.device.assert_called_once_with(devname)
+
         ns_dev.assert_has_calls(
             [mock.call.link.set_address('aa:bb:cc:dd:ee:ff')])
         if mtu:
@@ -275,6 +305,8 @@ class TestOVSInterfaceDriverWithVeth(TestOVSInterfaceDriver):
         self.ip.assert_has_calls(expected)
         root_dev.assert_has_calls([mock.call.link.set_up()])
         ns_dev.assert_has_calls([mock.call.link.set_up()])
+        root_batch.execute.assert_called_once_with()
+        ns_batch.execute.assert_called_once_with()
 
     def test_plug_mtu(self):
         self.conf.set_override('network_device_mtu', 9000)
@@ -16,6 +16,7 @@
 #    under the License.
 
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
 from neutron.common import exceptions
@@ -779,6 +780,150 @@ class TestIpNetnsCommand(TestIPCmdBase):
                 root_helper='sudo', check_exit_code=True)
 
 
+class TestIpNeighCommand(TestIPCmdBase):
+    def setUp(self):
+        super(TestIpNeighCommand, self).setUp()
+        self.parent.name = 'tap0'
+        self.command = 'neigh'
+        self.neigh_cmd = ip_lib.IpNeighCommand(self.parent)
+
+    def test_add_entry(self):
+        self.neigh_cmd.add(4, '192.168.45.100', 'cc:dd:ee:ff:ab:cd')
+        self._assert_sudo([4], ('replace', '192.168.45.100', 'lladdr',
+                                'cc:dd:ee:ff:ab:cd', 'nud', 'permanent',
+                                'dev', 'tap0'))
+
+    def test_delete_entry(self):
+        self.neigh_cmd.delete(4, '192.168.45.100', 'cc:dd:ee:ff:ab:cd')
+        self._assert_sudo([4], ('del', '192.168.45.100', 'lladdr',
+                                'cc:dd:ee:ff:ab:cd', 'dev', 'tap0'))
+
+
+class TestIPBatch(base.BaseTestCase):
+    def setUp(self):
+        super(TestIPBatch, self).setUp()
+        cfg.CONF.set_override('use_ip_batch', True, 'AGENT')
+        self.execute_p = mock.patch('neutron.agent.linux.utils.execute')
+        self.execute = self.execute_p.start()
+        self.addCleanup(self.execute_p.stop)
+
+    def test_execute_queued_commands(self):
+        with ip_lib.IPBatch('sudo', 'ns') as batch:
+            device = batch.device('tap0')
+            device.link.set_address('aa:bb:cc:dd:ee:ff')
+            device.addr.add(4, '192.168.1.2/24', '192.168.1.255')
+            device.route.add_gateway('192.168.1.1')
+            device.neigh.add(4, '192.168.1.3', 'aa:bb:cc:dd:ee:00')
+            device.link.set_up()
+            self.assertFalse(self.execute.called)
+        self.execute.assert_called_once_with(
+            ['ip', 'netns', 'exec', 'ns', 'ip', '-batch', '-'],
+            root_helper='sudo',
+            process_input='link set tap0 address aa:bb:cc:dd:ee:ff\n'
+                          'addr add 192.168.1.2/24 brd 192.168.1.255 '
+                          'scope global dev tap0\n'
+                          'route replace default via 192.168.1.1 '
+                          'dev tap0\n'
+                          'neigh replace 192.168.1.3 lladdr '
+                          'aa:bb:cc:dd:ee:00 nud permanent dev tap0\n'
+                          'link set tap0 up\n')
+
+    def test_execute_one_by_one(self):
+        cfg.CONF.set_override('use_ip_batch', False, 'AGENT')
+        with ip_lib.IPBatch('sudo', 'ns') as batch:
+            device = batch.device('tap0')
+            device.addr.add(6, 'fd00::2/64', 'fd00::ffff')
+            device.link.set_up()
+            self.assertFalse(self.execute.called)
+        self.assertEqual(
+            [mock.call(['ip', 'netns', 'exec', 'ns', 'ip', '-6', 'addr',
+                        'add', 'fd00::2/64', 'brd', 'fd00::ffff', 'scope',
+                        'global', 'dev', 'tap0'], root_helper='sudo'),
+             mock.call(['ip', 'netns', 'exec', 'ns', 'ip', 'link', 'set',
+                        'tap0', 'up'], root_helper='sudo')],
+            self.execute.call_args_list)
+
+    def test_execute_root_namespace(self):
+        batch = ip_lib.IPBatch('sudo')
+        batch.device('tap0').link.set_up()
+        batch.execute()
+        self.execute.assert_called_once_with(
+            ['ip', '-batch', '-'], root_helper='sudo',
+            process_input='link set tap0 up\n')
+
+    def test_execute_nothing_queued(self):
+        with ip_lib.IPBatch('sudo', 'ns') as batch:
+            batch.device('tap0')
+        self.assertFalse(self.execute.called)
+
+    def test_reads_are_not_queued(self):
+        self.execute.return_value = LINK_SAMPLE[1]
+        with ip_lib.IPBatch('sudo', 'ns') as batch:
+            self.assertEqual('cc:dd:ee:ff:ab:cd',
+                             batch.device('eth0').link.address)
+        self.assertEqual(1, self.execute.call_count)
+        self.assertNotIn('-batch', self.execute.call_args[0][0])
+
+    def test_commands_dropped_on_error(self):
+        def configure():
+            with ip_lib.IPBatch('sudo', 'ns') as batch:
+                batch.device('tap0').link.set_up()
+                raise ValueError()
+
+        self.assertRaises(ValueError, configure)
+        self.assertFalse(self.execute.called)
+
+    def test_execute_without_root_helper(self):
+        batch = ip_lib.IPBatch(None, 'ns')
+        batch.device('tap0').link.set_up()
+        self.assertRaises(exceptions.SudoRequired, batch.execute)
+
+    def test_options_can_not_be_batched(self):
+        batch = ip_lib.IPBatch('sudo', 'ns')
+        self.assertRaises(ValueError, batch.add, 'link', ('show',), ['o'])
+
+    def test_ipv6_commands(self):
+        with ip_lib.IPBatch('sudo', 'ns') as batch:
+            device = batch.device('tap0')
+            device.addr.delete(6, 'fd00::2/64')
+            device.neigh.add(6, 'fd00::3', 'aa:bb:cc:dd:ee:00')
+        self.assertEqual('addr del fd00::2/64 dev tap0\n'
+                         'neigh replace fd00::3 lladdr aa:bb:cc:dd:ee:00 '
+                         'nud permanent dev tap0\n',
+                         self.execute.call_args[1]['process_input'])
+
+    def test_ip_version_without_address(self):
+        batch = ip_lib.IPBatch('sudo', 'ns')
+        self.assertRaises(ValueError, batch.add,
+                          'route', ('flush', 'dev', 'tap0'), [6])
+
+    def test_ip_version_of_other_address(self):
+        batch = ip_lib.IPBatch('sudo', 'ns')
+        self.assertRaises(ValueError,
+                          batch.device('tap0').addr.add,
+                          6, '192.168.1.2/24', '192.168.1.255')
+
+    def test_implicit_address_family(self):
+        batch = ip_lib.IPBatch('sudo', 'ns')
+        self.assertRaises(ValueError, batch.add,
+                          'route', ('del', 'default', 'dev', 'tap0'))
+        self.assertRaises(ValueError, batch.add,
+                          'neigh', ('flush', 'dev', 'tap0'))
+        self.assertEqual([], batch.commands)
+
+    def test_set_netns_runs_queued_commands(self):
+        batch = ip_lib.IPBatch('sudo')
+        device = batch.device('tap0')
+        device.link.set_address('aa:bb:cc:dd:ee:ff')
+        device.link.set_netns('ns')
+        self.execute.assert_called_once_with(
+            ['ip', '-batch', '-'], root_helper='sudo',
+            process_input='link set tap0 address aa:bb:cc:dd:ee:ff\n'
+                          'link set tap0 netns ns\n')
+        self.assertIsNone(device.batch)
+        self.assertEqual('ns', device.namespace)
+
+
 class TestDeviceExists(base.BaseTestCase):
     def test_device_exists(self):
         with mock.patch.object(ip_lib.IPDevice, '_execute') as _execute:
@@ -18,6 +18,7 @@
 
 import socket
 
+import eventlet
 import mock
 import testtools
 import webob
@@ -41,6 +42,11 @@ class FakeConf(object):
     nova_metadata_ip = '9.9.9.9'
     nova_metadata_port = 8775
     metadata_proxy_shared_secret = 'secret'
+    lookup_cache_size = 1024
+    lookup_cache_ttl = 5
+    nova_metadata_pool_size = 2
+    nova_metadata_max_requests_per_connection = 3
+    nova_metadata_idle_timeout = 30
 
 
 class TestMetadataProxyHandler(base.BaseTestCase):
@@ -195,6 +201,50 @@ class TestMetadataProxyHandler(base.BaseTestCase):
             (None, None)
         )
 
+    def _get_instance_and_tenant_id(self, headers):
+        headers['X-Forwarded-For'] = '192.168.1.1'
+        return self.handler._get_instance_and_tenant_id(
+            mock.Mock(headers=headers))
+
+    def test_get_instance_id_router_id_cached(self):
+        list_ports = self.qclient.return_value.list_ports
+        list_ports.side_effect = [
+            {'ports': [{'network_id': 'net1'}, {'network_id': 'net2'}]},
+            {'ports': [{'device_id': 'device_id', 'tenant_id': 'tenant_id'}]}]
+        headers = {'X-Neutron-Router-ID': 'the_id'}
+
+        for i in range(3):
+            self.assertEqual(('device_id', 'tenant_id'),
+                             self._get_instance_and_tenant_id(headers))
+        self.assertEqual(2, list_ports.call_count)
+        self.assertEqual(1, self.qclient.call_count)
+        self.assertEqual({'hits': 4, 'misses': 2, 'entries': 2},
+                         self.handler.cache.get_stats())
+
+    def test_get_instance_id_no_match_not_cached(self):
+        list_ports = self.qclient.return_value.list_ports
+        list_ports.side_effect = [
+            {'ports': []},
+            {'ports': [{'device_id': 'device_id', 'tenant_id': 'tenant_id'}]}]
+        headers = {'X-Neutron-Network-ID': 'the_id'}
+
+        self.assertEqual((None, None),
+                         self._get_instance_and_tenant_id(headers))
+        self.assertEqual(('device_id', 'tenant_id'),
+                         self._get_instance_and_tenant_id(headers))
+        self.assertEqual(2, list_ports.call_count)
+
+    def test_get_instance_id_reuses_auth_token(self):
+        self.qclient.return_value.list_ports.return_value = {'ports': []}
+        self.qclient.return_value.get_auth_info.return_value = {
+            'auth_token': 'token', 'endpoint_url': 'url'}
+        headers = {'X-Neutron-Network-ID': 'the_id'}
+
+        self._get_instance_and_tenant_id(headers)
+        self._get_instance_and_tenant_id(headers)
+        self.assertEqual('token', self.qclient.call_args[1]['token'])
+        self.assertEqual('url', self.qclient.call_args[1]['endpoint_url'])
+
     def _proxy_request_test_helper(self, response_code=200, method='GET'):
         hdrs = {'X-Forwarded-For': '8.8.8.8'}
         body = 'body'
@@ -329,6 +379,116 @@ class TestUnixDomainWSGIServer(base.BaseTestCase):
             self.assertTrue(len(logging.mock_calls))
 
 
+class TestLookupCache(base.BaseTestCase):
+    def setUp(self):
+        super(TestLookupCache, self).setUp()
+        self.time = mock.patch('time.time', return_value=100.0).start()
+        self.cache = agent.LookupCache(2, 5)
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', 1)
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'entries': 1},
+                         self.cache.get_stats())
+
+    def test_expired(self):
+        self.cache.put('a', 1)
+        self.time.return_value = 105.0
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(0, len(self.cache.entries))
+
+    def test_least_recently_used_evicted(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual(3, self.cache.get('c'))
+
+    def test_disabled(self):
+        cache = agent.LookupCache(0, 5)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class TestHttpConnectionPool(base.BaseTestCase):
+    def setUp(self):
+        super(TestHttpConnectionPool, self).setUp()
+        self.http = mock.patch('httplib2.Http').start()
+        self.http.side_effect = self._new_http
+        self.https = []
+        self.time = mock.patch('time.time', return_value=100.0).start()
+        self.pool = agent.HttpConnectionPool(2, 3, 30)
+
+    def _new_http(self):
+        http = mock.Mock(connections={'http:9.9.9.9:8775': mock.Mock()})
+        http.request.return_value = ({'status': '200'}, 'content')
+        self.https.append(http)
+        return http
+
+    def test_request_reuses_connection(self):
+        self.assertEqual(({'status': '200'}, 'content'),
+                         self.pool.request('url', method='GET'))
+        self.pool.request('url', method='GET')
+        self.assertEqual(1, len(self.https))
+        self.assertEqual(2, self.https[0].request.call_count)
+        self.https[0].request.assert_called_with('url', method='GET')
+
+    def test_max_requests_per_connection(self):
+        for i in range(4):
+            self.pool.request('url')
+        self.assertEqual(2, len(self.https))
+        self.assertEqual(3, self.https[0].request.call_count)
+        self.assertTrue(self.https[0].connections == {})
+
+    def test_connection_closed_by_server(self):
+        self.pool.request('url')
+        self.https[0].request.return_value = ({'connection': 'close'}, '')
+        self.pool.request('url')
+        self.pool.request('url')
+        self.assertEqual(2, len(self.https))
+
+    def test_failed_request_drops_connection(self):
+        self.pool.request('url')
+        conn = self.https[0].connections.values()[0]
+        self.https[0].request.side_effect = socket.error
+        self.assertRaises(socket.error, self.pool.request, 'url')
+        conn.close.assert_called_once_with()
+        self.pool.request('url')
+        self.assertEqual(2, len(self.https))
+        self.assertEqual(1, self.pool.current_size)
+
+    def test_idle_connection_closed(self):
+        self.pool.request('url')
+        conn = self.https[0].connections.values()[0]
+        self.time.return_value = 131.0
+        self.pool.request('url')
+        conn.close.assert_called_once_with()
+        self.assertEqual(1, len(self.https))
+
+    def test_pool_is_bounded(self):
+        running = []
+        max_running = []
+
+        def request(*args, **kwargs):
+            running.append(None)
+            max_running.append(len(running))
+            eventlet.sleep(0)
+            running.pop()
+            return {}, ''
+
+        self.http.side_effect = None
+        self.http.return_value.request.side_effect = request
+        pool = eventlet.GreenPool()
+        for i in range(5):
+            pool.spawn(self.pool.request, 'url')
+        pool.waitall()
+        self.assertEqual(5, len(max_running))
+        self.assertEqual(2, max(max_running))
+
+
 class TestUnixDomainMetadataProxy(base.BaseTestCase):
     def setUp(self):
         super(TestUnixDomainMetadataProxy, self).setUp()
@@ -440,3 +600,14 @@ class TestUnixDomainMetadataProxy(base.BaseTestCase):
                 state_api_inst = state_api.return_value
                 state_api_inst.report_state.assert_called_once_with(
                     proxy.context, proxy.agent_state, use_call=True)
+
+    def test_report_state_lookup_cache(self):
+        with mock.patch('neutron.agent.rpc.PluginReportStateAPI'):
+            with mock.patch('os.makedirs'):
+                proxy = agent.UnixDomainMetadataProxy(self.cfg.CONF)
+                proxy.handler = mock.Mock()
+                proxy.handler.cache.get_stats.return_value = {'hits': 1}
+                proxy._report_state()
+                self.assertEqual(
+                    {'hits': 1},
+                    proxy.agent_state['configurations']['lookup_cache'])
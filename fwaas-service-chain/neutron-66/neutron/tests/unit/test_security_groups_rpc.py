@@ -36,6 +36,7 @@ from neutron.db import securitygroups_rpc_base as sg_db_rpc
 from neutron.extensions import allowedaddresspairs as addr_pair
 from neutron.extensions import securitygroup as ext_sg
 from neutron.manager import NeutronManager
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.tests import base
 from neutron.tests.unit import test_extension_security_group as test_sg
@@ -298,6 +299,69 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def test_security_group_info_for_devices_ipv4_source_group(self):
+
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                rule1 = self._build_security_group_rule(
+                    sg1_id,
+                    'ingress', const.PROTO_NAME_TCP, '24',
+                    '25', remote_group_id=sg2['security_group']['id'])
+                rules = {
+                    'security_group_rules': [rule1['security_group_rule']]}
+                res = self._create_security_group_rule(self.fmt, rules)
+                self.deserialize(self.fmt, res)
+                self.assertEqual(res.status_int, webob.exc.HTTPCreated.code)
+
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                devices = [port_id1, 'no_exist_device']
+
+                res2 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg2_id])
+                ports_rest2 = self.deserialize(self.fmt, res2)
+                port_id2 = ports_rest2['port']['id']
+                ctx = context.get_admin_context()
+                sg_info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                expected = {
+                    'security_groups': {sg1_id: [
+                        {'direction': 'egress', 'ethertype': const.IPv4,
+                         'security_group_id': sg1_id},
+                        {'direction': 'egress', 'ethertype': const.IPv6,
+                         'security_group_id': sg1_id},
+                        {'direction': u'ingress',
+                         'protocol': const.PROTO_NAME_TCP,
+                         'ethertype': const.IPv4,
+                         'port_range_max': 25, 'port_range_min': 24,
+                         'remote_group_id': sg2_id,
+                         'security_group_id': sg1_id},
+                    ]},
+                    'sg_member_ips': {sg2_id: [u'10.0.0.3']}
+                }
+                self.assertEqual(expected['security_groups'],
+                                 sg_info['security_groups'])
+                self.assertEqual(expected['sg_member_ips'],
+                                 sg_info['sg_member_ips'])
+                port_rpc = sg_info['devices'][port_id1]
+                self.assertEqual([sg1_id], port_rpc['security_groups'])
+                self.assertEqual([sg2_id],
+                                 port_rpc['security_group_source_groups'])
+                self.assertEqual([], port_rpc['security_group_rules'])
+                self._delete('ports', port_id1)
+                self._delete('ports', port_id2)
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = FAKE_PREFIX[const.IPv6]
         fake_gateway = FAKE_IP[const.IPv6]
@@ -765,7 +829,15 @@ class SGAgentRpcCallBackMixinTestCase(base.BaseTestCase):
         self.rpc.security_groups_member_updated(None,
                                                 security_groups=['fake_sgid'])
         self.rpc.sg_agent.assert_has_calls(
-            [call.security_groups_member_updated(['fake_sgid'])])
+            [call.security_groups_member_updated(['fake_sgid'], None)])
+
+    def test_security_groups_member_updated_with_delta(self):
+        delta = {'fake_sgid': {'added': ['10.0.0.2']}}
+        self.rpc.security_groups_member_updated(None,
+                                                security_groups=['fake_sgid'],
+                                                sg_member_delta=delta)
+        self.rpc.sg_agent.assert_has_calls(
+            [call.security_groups_member_updated(['fake_sgid'], delta)])
 
     def test_security_groups_provider_updated(self):
         self.rpc.security_groups_provider_updated(None)
@@ -868,6 +940,119 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.firewall.assert_has_calls([])
 
 
+class SecurityGroupAgentEnhancedRpcTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(SecurityGroupAgentEnhancedRpcTestCase, self).setUp()
+        cfg.CONF.set_default('firewall_driver',
+                             'neutron.agent.firewall.NoopFirewallDriver',
+                             group='SECURITYGROUP')
+        self.agent = sg_rpc.SecurityGroupAgentRpcMixin()
+        self.agent.context = None
+        self.agent.root_helper = 'sudo'
+        self.agent.init_firewall()
+        self.firewall = mock.Mock()
+        firewall_object = firewall_base.FirewallDriver()
+        self.firewall.defer_apply.side_effect = firewall_object.defer_apply
+        self.agent.firewall = self.firewall
+        self.rpc = mock.Mock()
+        self.agent.plugin_rpc = self.rpc
+        self.fake_device = {'device': 'fake_device',
+                            'security_groups': ['fake_sgid1'],
+                            'security_group_source_groups': ['fake_sgid2'],
+                            'security_group_rules': []}
+        self.sg_rules = [{'direction': 'ingress',
+                          'ethertype': 'IPv4',
+                          'security_group_id': 'fake_sgid1',
+                          'remote_group_id': 'fake_sgid2'}]
+        self.sg_info = {'devices': {'fake_device': self.fake_device},
+                        'security_groups': {'fake_sgid1': self.sg_rules},
+                        'sg_member_ips': {'fake_sgid2': ['10.0.0.2']}}
+        self.firewall.ports = {'fake_device': self.fake_device}
+        self.rpc.security_group_info_for_devices.return_value = self.sg_info
+
+    def test_prepare_devices_filter(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.assertTrue(self.agent.use_enhanced_rpc)
+        self.firewall.assert_has_calls([
+            call.update_security_group_rules('fake_sgid1', self.sg_rules),
+            call.update_security_group_members('fake_sgid2', ['10.0.0.2']),
+            call.defer_apply(),
+            call.prepare_port_filter(self.fake_device)])
+        self.rpc.security_group_info_for_devices.assert_has_calls([
+            call(None, devices=[]),
+            call(None, ['fake_device'])])
+        self.assertFalse(self.rpc.security_group_rules_for_devices.called)
+
+    def test_refresh_firewall(self):
+        self.agent.refresh_firewall()
+        self.firewall.assert_has_calls([
+            call.update_security_group_rules('fake_sgid1', self.sg_rules),
+            call.update_security_group_members('fake_sgid2', ['10.0.0.2']),
+            call.defer_apply(),
+            call.update_port_filter(self.fake_device)])
+
+    def test_fallback_to_rules_rpc(self):
+        self.rpc.security_group_info_for_devices.side_effect = (
+            rpc_common.RemoteError('UnsupportedRpcVersion'))
+        self.rpc.security_group_rules_for_devices.return_value = {
+            'fake_device': self.fake_device}
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.assertFalse(self.agent.use_enhanced_rpc)
+        self.assertEqual(
+            1, self.rpc.security_group_info_for_devices.call_count)
+        self.assertEqual(
+            2, self.rpc.security_group_rules_for_devices.call_count)
+        self.assertFalse(self.firewall.update_security_group_rules.called)
+
+    def test_security_groups_member_updated_with_delta(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.reset_mock()
+        self.agent.security_groups_member_updated(
+            ['fake_sgid2'],
+            {'fake_sgid2': {'added': ['10.0.0.3'], 'removed': ['10.0.0.2']}})
+        self.firewall.assert_has_calls([
+            call.update_security_group_members('fake_sgid2', ['10.0.0.3']),
+            call.defer_apply(),
+            call.update_port_filter(self.fake_device)])
+        # only the probe and prepare_devices_filter
+        self.assertEqual(
+            2, self.rpc.security_group_info_for_devices.call_count)
+
+    def test_security_groups_member_updated_with_delta_unknown_group(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.reset_mock()
+        self.agent.security_groups_member_updated(
+            ['fake_sgid3'], {'fake_sgid3': {'added': ['10.0.0.3']}})
+        self.assertFalse(self.firewall.update_security_group_members.called)
+        self.assertFalse(self.firewall.update_port_filter.called)
+
+    def test_security_groups_member_updated_with_delta_deferred(self):
+        self.agent.defer_refresh_firewall = True
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.reset_mock()
+        self.agent.security_groups_member_updated(
+            ['fake_sgid2'], {'fake_sgid2': {'added': ['10.0.0.3']}})
+        self.assertEqual(set(['fake_device']), self.agent.devices_to_reapply)
+        self.assertFalse(self.firewall.update_port_filter.called)
+        self.assertTrue(self.agent.firewall_refresh_needed())
+        self.agent.setup_port_filters(set(), set())
+        self.firewall.update_port_filter.assert_called_once_with(
+            self.fake_device)
+        self.assertEqual(set(), self.agent.devices_to_reapply)
+        # only the probe and the first prepare_devices_filter
+        self.assertEqual(
+            2, self.rpc.security_group_info_for_devices.call_count)
+
+    def test_remove_devices_filter_forgets_unused_members(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.assertEqual(['fake_sgid2'], self.agent.sg_members.keys())
+        self.firewall.remove_port_filter.side_effect = (
+            lambda device: self.firewall.ports.pop(device['device']))
+        self.agent.remove_devices_filter(['fake_device'])
+        self.assertEqual({}, self.agent.sg_members)
+
+
 class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
     SecurityGroupAgentRpcTestCase):
 
@@ -1092,6 +1277,17 @@ class SecurityGroupServerRpcApiTestCase(base.BaseTestCase):
              version=sg_rpc.SG_RPC_VERSION,
              topic='fake_topic')])
 
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+              'method': 'security_group_info_for_devices',
+              'namespace': None},
+             version=sg_rpc.SG_INFO_RPC_VERSION,
+             topic='fake_topic')])
+
 
 class FakeSGNotifierAPI(proxy.RpcProxy,
                         sg_rpc.SecurityGroupAgentRpcApiMixin):
@@ -1129,6 +1325,20 @@ class SecurityGroupAgentRpcApiTestCase(base.BaseTestCase):
                   version=sg_rpc.SG_RPC_VERSION,
                   topic='fake-security_group-update')])
 
+    def test_security_groups_member_updated_with_delta(self):
+        delta = {'fake_sgid': {'removed': ['10.0.0.2']}}
+        self.notifier.security_groups_member_updated(
+            None, security_groups=['fake_sgid'], sg_member_delta=delta)
+        self.notifier.fanout_cast.assert_has_calls(
+            [call(None,
+                  {'args':
+                      {'security_groups': ['fake_sgid'],
+                       'sg_member_delta': delta},
+                      'method': 'security_groups_member_updated',
+                      'namespace': None},
+                  version=sg_rpc.SG_RPC_VERSION,
+                  topic='fake-security_group-update')])
+
     def test_security_groups_rule_not_updated(self):
         self.notifier.security_groups_rule_updated(
             None, security_groups=[])
@@ -1937,7 +2147,7 @@ class SGNotificationTestMixin():
                     self._delete('ports', port['port']['id'])
                     self.notifier.assert_has_calls(
                         [call.security_groups_member_updated(
-                            mock.ANY, [mock.ANY])])
+                            mock.ANY, [mock.ANY], sg_member_delta=mock.ANY)])
 
 
 class TestSecurityGroupAgentWithOVSIptables(
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Replay port events against the DHCP agent network cache.
+
+The events are those handled by port_update_end and port_delete_end: a
+lookup of the port followed by an update or a removal, on a network which
+already holds a large number of ports.
+
+    tools/with_venv.sh python tools/benchmark_dhcp_cache.py --ports 8000
+"""
+
+import argparse
+import random
+import time
+
+from neutron.agent import dhcp_agent
+from neutron.agent.linux import dhcp
+
+
+NETWORK_ID = 'bench-network'
+
+
+def make_port(index):
+    return dhcp.DictModel(dict(id='port-%d' % index,
+                               network_id=NETWORK_ID,
+                               mac_address='fa:16:3e:%02x:%02x:%02x' % (
+                                   index >> 16 & 0xff, index >> 8 & 0xff,
+                                   index & 0xff),
+                               fixed_ips=[]))
+
+
+def replay(num_ports, num_events, seed):
+    rand = random.Random(seed)
+    cache = dhcp_agent.NetworkCache()
+    cache.put(dhcp.NetModel(False, dict(
+        id=NETWORK_ID, tenant_id='bench', admin_state_up=True, subnets=[],
+        ports=[make_port(i) for i in range(num_ports)])))
+    next_index = num_ports
+
+    start = time.time()
+    for _i in xrange(num_events):
+        event = rand.random()
+        if event < 0.6:
+            # port_update_end of an existing port
+            index = rand.randrange(next_index)
+            cache.get_port_by_id('port-%d' % index)
+            cache.put_port(make_port(index))
+        elif event < 0.8:
+            # port_update_end of a new port
+            cache.put_port(make_port(next_index))
+            next_index += 1
+        else:
+            # port_delete_end
+            port = cache.get_port_by_id(
+                'port-%d' % rand.randrange(next_index))
+            if port:
+                cache.remove_port(port)
+        cache.get_state()
+    return time.time() - start, cache.get_state()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ports', type=int, default=8000,
+                        help='number of ports of the network')
+    parser.add_argument('--events', type=int, default=10000,
+                        help='number of port events to replay')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    elapsed, state = replay(args.ports, args.events, args.seed)
+    print('%d events on %d ports: %.3fs (%.1f us/event), final state %s' %
+          (args.events, args.ports, elapsed,
+           elapsed * 1000000 / args.events, state))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Load the metadata proxy connections with a local stub metadata server.
+
+Concurrent green threads send requests to a local eventlet WSGI server,
+either with a new httplib2.Http object for each request, as the metadata
+proxy used to, or through the keep-alive pool of the metadata agent.
+
+    tools/with_venv.sh python tools/benchmark_metadata_proxy.py
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import time
+
+import eventlet.wsgi
+import httplib2
+
+from neutron.agent.metadata import agent
+
+
+class NullLogger(object):
+    def write(self, msg):
+        pass
+
+
+def stub_metadata_server(environ, start_response):
+    body = 'instance-id: %s\n' % environ.get('HTTP_X_INSTANCE_ID')
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def new_http_request(url, **kwargs):
+    return httplib2.Http().request(url, **kwargs)
+
+
+def run(request, url, num_requests, concurrency):
+    def send(i):
+        resp, content = request(url, method='GET',
+                                headers={'X-Instance-ID': 'vm-%d' % i})
+        if resp.status != 200:
+            raise Exception('Unexpected response %s' % resp.status)
+
+    pool = eventlet.GreenPool(concurrency)
+    start = time.time()
+    for i in xrange(num_requests):
+        pool.spawn_n(send, i)
+    pool.waitall()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000,
+                        help='number of requests sent by each run')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='number of requests sent concurrently')
+    parser.add_argument('--pool-size', type=int, default=32)
+    parser.add_argument('--max-requests-per-connection', type=int,
+                        default=100)
+    args = parser.parse_args()
+
+    sock = eventlet.listen(('127.0.0.1', 0), backlog=1024)
+    eventlet.spawn_n(eventlet.wsgi.server, sock, stub_metadata_server,
+                     log=NullLogger(), max_size=args.concurrency * 2)
+    url = 'http://127.0.0.1:%d/latest/meta-data' % sock.getsockname()[1]
+
+    http_pool = agent.HttpConnectionPool(args.pool_size,
+                                         args.max_requests_per_connection,
+                                         30)
+    for name, request in (('new connection per request', new_http_request),
+                          ('keep-alive pool', http_pool.request)):
+        elapsed = run(request, url, args.requests, args.concurrency)
+        print('%-28s %d requests: %.2fs (%.0f requests/s)' %
+              (name, args.requests, elapsed, args.requests / elapsed))
+
+
+if __name__ == '__main__':
+    main()